@@ -8,12 +8,15 @@ from . import HydrusPaths
 from . import HydrusSerialisable
 from . import HydrusTags
 from . import HydrusThreading
+import concurrent.futures
 import os
 import re
 import stat
 
 MAX_PATH_LENGTH = 245 # bit of padding from 255 for .txt neigbouring and other surprises
 
+EXPORT_FOLDER_NUM_COPY_THREADS = 4
+
 def GenerateExportFilename( destination_directory, media, terms ):
     
     def clean_tag_text( t ):
@@ -235,7 +238,7 @@ class ExportFolder( HydrusSerialisable.SerialisableBaseNamed ):
     
     SERIALISABLE_TYPE = HydrusSerialisable.SERIALISABLE_TYPE_EXPORT_FOLDER
     SERIALISABLE_NAME = 'Export Folder'
-    SERIALISABLE_VERSION = 3
+    SERIALISABLE_VERSION = 4
     
     def __init__( self, name, path = '', export_type = HC.EXPORT_FOLDER_TYPE_REGULAR, delete_from_client_after_export = False, file_search_context = None, period = 3600, phrase = None ):
         
@@ -264,17 +267,75 @@ class ExportFolder( HydrusSerialisable.SerialisableBaseNamed ):
         self._phrase = phrase
         self._last_checked = 0
         
+        # the db keeps a record of what we have exported under this key. a new or edited folder gets a new key and so starts afresh
+        self._manifest_key = HydrusData.GenerateKey()
+        
+    
+    def _DeleteEmptyDirectories( self, dirs ):
+        
+        # only the dirs we just deleted from can have become empty, so there is no need to walk the whole export folder
+        
+        num_deleted = 0
+        
+        dirs = set( dirs )
+        
+        while len( dirs ) > 0:
+            
+            parent_dirs = set()
+            
+            for dir_path in dirs:
+                
+                if dir_path == self._path or not dir_path.startswith( self._path ) or not os.path.isdir( dir_path ):
+                    
+                    continue
+                    
+                
+                if len( os.listdir( dir_path ) ) == 0:
+                    
+                    HydrusPaths.DeletePath( dir_path )
+                    
+                    num_deleted += 1
+                    
+                    parent_dirs.add( os.path.dirname( dir_path ) )
+                    
+                
+            
+            dirs = parent_dirs
+            
+        
+        return num_deleted
+        
+    
+    def _ExportFile( self, media_result, dest_path ):
+        
+        hash = media_result.GetHash()
+        mime = media_result.GetMime()
+        
+        source_path = HG.client_controller.client_files_manager.GetFilePath( hash, mime )
+        
+        copied = HydrusPaths.MirrorFile( source_path, dest_path )
+        
+        if copied:
+            
+            HydrusPaths.MakeFileWritable( dest_path )
+            
+        
+        return copied
+        
     
     def _GetSerialisableInfo( self ):
         
         serialisable_file_search_context = self._file_search_context.GetSerialisableTuple()
+        serialisable_manifest_key = self._manifest_key.hex()
         
-        return ( self._path, self._export_type, self._delete_from_client_after_export, serialisable_file_search_context, self._period, self._phrase, self._last_checked )
+        return ( self._path, self._export_type, self._delete_from_client_after_export, serialisable_file_search_context, self._period, self._phrase, self._last_checked, serialisable_manifest_key )
         
     
     def _InitialiseFromSerialisableInfo( self, serialisable_info ):
         
-        ( self._path, self._export_type, self._delete_from_client_after_export, serialisable_file_search_context, self._period, self._phrase, self._last_checked ) = serialisable_info
+        ( self._path, self._export_type, self._delete_from_client_after_export, serialisable_file_search_context, self._period, self._phrase, self._last_checked, serialisable_manifest_key ) = serialisable_info
+        
+        self._manifest_key = bytes.fromhex( serialisable_manifest_key )
         
         if self._export_type == HC.EXPORT_FOLDER_TYPE_SYNCHRONISE:
             
@@ -308,6 +369,17 @@ class ExportFolder( HydrusSerialisable.SerialisableBaseNamed ):
             return ( 3, new_serialisable_info )
             
         
+        if version == 3:
+            
+            ( path, export_type, delete_from_client_after_export, serialisable_file_search_context, period, phrase, last_checked ) = old_serialisable_info
+            
+            serialisable_manifest_key = HydrusData.GenerateKey().hex()
+            
+            new_serialisable_info = ( path, export_type, delete_from_client_after_export, serialisable_file_search_context, period, phrase, last_checked, serialisable_manifest_key )
+            
+            return ( 4, new_serialisable_info )
+            
+        
     
     def DoWork( self ):
         
@@ -322,141 +394,134 @@ class ExportFolder( HydrusSerialisable.SerialisableBaseNamed ):
                 
                 query_hash_ids = HG.client_controller.Read( 'file_query_ids', self._file_search_context )
                 
-                media_results = []
+                # the manifest remembers where each matching file went, so we only load, copy, or delete what changed since the last run
                 
-                i = 0
+                ( new_hash_ids, vanished_rows, manifest_was_empty ) = HG.client_controller.Read( 'export_folder_manifest_delta', self._manifest_key, query_hash_ids )
                 
-                base = 256
+                # vanished files go first, so a new file can take a filename one of them was using
                 
-                while i < len( query_hash_ids ):
+                if len( vanished_rows ) > 0:
                     
-                    if HC.options[ 'pause_export_folders_sync' ] or HydrusThreading.IsThreadShuttingDown():
+                    if self._export_type == HC.EXPORT_FOLDER_TYPE_SYNCHRONISE:
                         
-                        return
+                        deletee_paths = { path for ( hash_id, path ) in vanished_rows }
+                        
+                        for deletee_path in deletee_paths:
+                            
+                            ClientPaths.DeletePath( deletee_path )
+                            
+                        
+                        num_dirs_deleted = self._DeleteEmptyDirectories( { os.path.dirname( deletee_path ) for deletee_path in deletee_paths } )
+                        
+                        HydrusData.Print( 'Export folder {} deleted {} files and {} folders.'.format( self._name, HydrusData.ToHumanInt( len( deletee_paths ) ), HydrusData.ToHumanInt( num_dirs_deleted ) ) )
                         
                     
-                    if i == 0: ( last_i, i ) = ( 0, base )
-                    else: ( last_i, i ) = ( i, i + base )
-                    
-                    sub_query_hash_ids = query_hash_ids[ last_i : i ]
-                    
-                    more_media_results = HG.client_controller.Read( 'media_results_from_ids', sub_query_hash_ids )
-                    
-                    media_results.extend( more_media_results )
+                    HG.client_controller.WriteSynchronous( 'export_folder_manifest', self._manifest_key, (), [ hash_id for ( hash_id, path ) in vanished_rows ] )
                     
                 
-                media_results.sort( key = lambda mr: mr.GetHashId() )
-                
-                #
-                
                 terms = ParseExportPhrase( self._phrase )
                 
-                previous_paths = set()
+                exported_hashes = set()
+                exported_paths = set()
                 
-                for ( root, dirnames, filenames ) in os.walk( self._path ):
-                    
-                    previous_paths.update( ( os.path.join( root, filename ) for filename in filenames ) )
+                with concurrent.futures.ThreadPoolExecutor( max_workers = EXPORT_FOLDER_NUM_COPY_THREADS ) as executor:
                     
-                
-                sync_paths = set()
-                
-                client_files_manager = HG.client_controller.client_files_manager
-                
-                num_copied = 0
-                
-                for media_result in media_results:
-                    
-                    if HC.options[ 'pause_export_folders_sync' ] or HydrusThreading.IsThreadShuttingDown():
+                    for sub_query_hash_ids in HydrusData.SplitListIntoChunks( new_hash_ids, 256 ):
                         
-                        return
+                        if HC.options[ 'pause_export_folders_sync' ] or HydrusThreading.IsThreadShuttingDown():
+                            
+                            return
+                            
                         
-                    
-                    hash = media_result.GetHash()
-                    mime = media_result.GetMime()
-                    size = media_result.GetSize()
-                    
-                    source_path = client_files_manager.GetFilePath( hash, mime )
-                    
-                    filename = GenerateExportFilename( self._path, media_result, terms )
-                    
-                    dest_path = os.path.normpath( os.path.join( self._path, filename ) )
-                    
-                    if not dest_path.startswith( self._path ):
+                        media_results = HG.client_controller.Read( 'media_results_from_ids', sub_query_hash_ids )
                         
-                        raise Exception( 'It seems a destination path for export folder "{}" was above the main export directory! The file was "{}" and its destination path was "{}".'.format( self._path, hash.hex(), dest_path ) )
+                        dest_paths_to_media_results = {}
                         
-                    
-                    dest_path_dir = os.path.dirname( dest_path )
-                    
-                    HydrusPaths.MakeSureDirectoryExists( dest_path_dir )
-                    
-                    if dest_path not in sync_paths:
+                        for media_result in media_results:
+                            
+                            filename = GenerateExportFilename( self._path, media_result, terms )
+                            
+                            dest_path = os.path.normpath( os.path.join( self._path, filename ) )
+                            
+                            if not dest_path.startswith( self._path ):
+                                
+                                raise Exception( 'It seems a destination path for export folder "{}" was above the main export directory! The file was "{}" and its destination path was "{}".'.format( self._path, media_result.GetHash().hex(), dest_path ) )
+                                
+                            
+                            # if two files want the same filename, the first one gets it. the other is tried again next run
+                            
+                            if dest_path not in dest_paths_to_media_results:
+                                
+                                dest_paths_to_media_results[ dest_path ] = media_result
+                                
+                            
                         
-                        copied = HydrusPaths.MirrorFile( source_path, dest_path )
+                        claimed_paths = HG.client_controller.Read( 'export_folder_manifest_claimed_paths', self._manifest_key, list( dest_paths_to_media_results.keys() ) )
                         
-                        if copied:
+                        dest_paths_and_media_results = [ ( dest_path, media_result ) for ( dest_path, media_result ) in dest_paths_to_media_results.items() if dest_path not in claimed_paths ]
+                        
+                        for dest_path_dir in { os.path.dirname( dest_path ) for ( dest_path, media_result ) in dest_paths_and_media_results }:
+                            
+                            HydrusPaths.MakeSureDirectoryExists( dest_path_dir )
                             
-                            num_copied += 1
+                        
+                        results = executor.map( self._ExportFile, [ media_result for ( dest_path, media_result ) in dest_paths_and_media_results ], [ dest_path for ( dest_path, media_result ) in dest_paths_and_media_results ] )
+                        
+                        rows_to_add = []
+                        
+                        for ( ( dest_path, media_result ), copied ) in zip( dest_paths_and_media_results, results ):
                             
-                            HydrusPaths.MakeFileWritable( dest_path )
+                            if copied:
+                                
+                                rows_to_add.append( ( media_result.GetHashId(), dest_path ) )
+                                
+                                exported_hashes.add( media_result.GetHash() )
+                                
+                                if manifest_was_empty:
+                                    
+                                    exported_paths.add( dest_path )
+                                    
+                                
                             
                         
-                    
-                    sync_paths.add( dest_path )
+                        HG.client_controller.WriteSynchronous( 'export_folder_manifest', self._manifest_key, rows_to_add, () )
+                        
                     
                 
-                if num_copied > 0:
+                if len( exported_hashes ) > 0:
                     
-                    HydrusData.Print( 'Export folder ' + self._name + ' exported ' + HydrusData.ToHumanInt( num_copied ) + ' files.' )
+                    HydrusData.Print( 'Export folder ' + self._name + ' exported ' + HydrusData.ToHumanInt( len( exported_hashes ) ) + ' files.' )
                     
                 
-                if self._export_type == HC.EXPORT_FOLDER_TYPE_SYNCHRONISE:
+                if self._export_type == HC.EXPORT_FOLDER_TYPE_SYNCHRONISE and manifest_was_empty:
                     
-                    deletee_paths = previous_paths.difference( sync_paths )
+                    # a fresh manifest does not know what an earlier run may have left here, so we check the whole folder this one time
                     
-                    for deletee_path in deletee_paths:
+                    deletee_paths = set()
+                    
+                    for ( root, dirnames, filenames ) in os.walk( self._path ):
                         
-                        ClientPaths.DeletePath( deletee_path )
+                        deletee_paths.update( ( os.path.join( root, filename ) for filename in filenames ) )
                         
                     
-                    deletee_dirs = set()
+                    deletee_paths.difference_update( exported_paths )
                     
-                    for ( root, dirnames, filenames ) in os.walk( self._path, topdown = False ):
-                        
-                        if root == self._path:
-                            
-                            continue
-                            
-                        
-                        no_files = len( filenames ) == 0
-                        
-                        useful_dirnames = [ dirname for dirname in dirnames if os.path.join( root, dirname ) not in deletee_dirs ]
-                        
-                        no_useful_dirs = len( useful_dirnames ) == 0
+                    for deletee_path in deletee_paths:
                         
-                        if no_useful_dirs and no_files:
-                            
-                            deletee_dirs.add( root )
-                            
+                        ClientPaths.DeletePath( deletee_path )
                         
                     
-                    for deletee_dir in deletee_dirs:
-                        
-                        if os.path.exists( deletee_dir ):
-                            
-                            HydrusPaths.DeletePath( deletee_dir )
-                            
-                        
+                    num_dirs_deleted = self._DeleteEmptyDirectories( { os.path.dirname( deletee_path ) for deletee_path in deletee_paths } )
                     
                     if len( deletee_paths ) > 0:
                         
-                        HydrusData.Print( 'Export folder {} deleted {} files and {} folders.'.format( self._name, HydrusData.ToHumanInt( len( deletee_paths ) ), HydrusData.ToHumanInt( len( deletee_dirs ) ) ) )
+                        HydrusData.Print( 'Export folder {} deleted {} files and {} folders.'.format( self._name, HydrusData.ToHumanInt( len( deletee_paths ) ), HydrusData.ToHumanInt( num_dirs_deleted ) ) )
                         
                     
                 
                 if self._delete_from_client_after_export:
                     
-                    deletee_hashes = { media_result.GetHash() for media_result in media_results }
+                    deletee_hashes = exported_hashes
                     
                     chunks_of_hashes = HydrusData.SplitListIntoChunks( deletee_hashes, 64 )
                     
@@ -485,6 +550,11 @@ class ExportFolder( HydrusSerialisable.SerialisableBaseNamed ):
         HG.client_controller.WriteSynchronous( 'serialisable', self )
         
     
+    def GetManifestKey( self ):
+        
+        return self._manifest_key
+        
+    
     def ToTuple( self ):
         
         return ( self._name, self._path, self._export_type, self._delete_from_client_after_export, self._file_search_context, self._period, self._phrase )
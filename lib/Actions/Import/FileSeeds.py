@@ -6,6 +6,7 @@ from . import ClientNetworkingDomain
 from . import ClientParsing
 from . import ClientPaths
 from . import ClientTags
+import bisect
 import collections
 from . import HydrusConstants as HC
 from . import HydrusData
@@ -16,12 +17,15 @@ from . import HydrusGlobals as HG
 from . import HydrusPaths
 from . import HydrusSerialisable
 from . import HydrusTags
+from . import HydrusThreading
 import os
 import threading
 import time
 import traceback
 import urllib.parse
 
+PREPARED_PATH_IMPORT_BATCH_SIZE = 16
+
 def GenerateFileSeedCacheStatus( file_seed_cache ):
     
     statuses_to_counts = file_seed_cache.GetStatusesToCounts()
@@ -154,9 +158,180 @@ def GenerateStatusesToCountsStatus( statuses_to_counts ):
     
     return ( status, simple_status, ( total_processed, total ) )
     
+def CleanUpPreparedPathImport( prepared_path_import ):
+    
+    ( os_file_handle, temp_path, file_import_job, prepare_exception ) = prepared_path_import
+    
+    if temp_path is not None:
+        
+        HydrusPaths.CleanUpTempPath( os_file_handle, temp_path )
+        
+    
+def ImportFileSeedPaths( file_seeds, file_seed_cache, file_import_options, limited_mimes = None ):
+    
+    # hashing, ffmpeg probing, thumbnailing and phashing do not need the db, so up to num_import_workers files are prepared at once on the thread pool
+    # the imports themselves then happen here, in the original order, with each run of ready files going to the db in one transaction
+    # each imported batch of file seeds is yielded, so the caller can do its per-file work as it goes and stop early between batches
+    
+    file_seeds = list( file_seeds )
+    
+    num_workers = max( 1, HG.client_controller.new_options.GetInteger( 'num_import_workers' ) )
+    
+    max_num_read_ahead = num_workers + PREPARED_PATH_IMPORT_BATCH_SIZE
+    
+    condition = threading.Condition()
+    indices_to_prepared_path_imports = {}
+    num_preparing = [ 0 ]
+    abandoned = [ False ]
+    
+    def do_prepare( index, file_seed ):
+        
+        prepared_path_import = file_seed.PrepareImportPath( file_import_options, limited_mimes = limited_mimes )
+        
+        with condition:
+            
+            num_preparing[0] -= 1
+            
+            if abandoned[0]:
+                
+                CleanUpPreparedPathImport( prepared_path_import )
+                
+            else:
+                
+                indices_to_prepared_path_imports[ index ] = prepared_path_import
+                
+            
+            condition.notify_all()
+            
+        
+    
+    next_index_to_prepare = 0
+    next_index_to_import = 0
+    
+    try:
+        
+        while next_index_to_import < len( file_seeds ):
+            
+            with condition:
+                
+                while next_index_to_prepare < len( file_seeds ) and num_preparing[0] < num_workers and next_index_to_prepare - next_index_to_import < max_num_read_ahead:
+                    
+                    num_preparing[0] += 1
+                    
+                    HG.client_controller.CallToThreadWithPriority( HydrusThreading.THREAD_POOL_PRIORITY_IMPORT, do_prepare, next_index_to_prepare, file_seeds[ next_index_to_prepare ] )
+                    
+                    next_index_to_prepare += 1
+                    
+                
+                if next_index_to_import not in indices_to_prepared_path_imports:
+                    
+                    if HG.model_shutdown:
+                        
+                        raise HydrusExceptions.ShutdownException( 'Application shutting down!' )
+                        
+                    
+                    condition.wait( 1.0 )
+                    
+                    continue
+                    
+                
+                batch_indices = []
+                
+                index = next_index_to_import
+                
+                while index in indices_to_prepared_path_imports and len( batch_indices ) < PREPARED_PATH_IMPORT_BATCH_SIZE:
+                    
+                    batch_indices.append( index )
+                    
+                    index += 1
+                    
+                
+                prepared_path_imports = [ indices_to_prepared_path_imports.pop( index ) for index in batch_indices ]
+                
+                next_index_to_import = batch_indices[-1] + 1
+                
+            
+            batch_file_seeds = [ file_seeds[ index ] for index in batch_indices ]
+            
+            ImportPreparedPaths( batch_file_seeds, file_seed_cache, prepared_path_imports )
+            
+            yield batch_file_seeds
+            
+        
+    finally:
+        
+        with condition:
+            
+            abandoned[0] = True
+            
+            for prepared_path_import in indices_to_prepared_path_imports.values():
+                
+                CleanUpPreparedPathImport( prepared_path_import )
+                
+            
+            indices_to_prepared_path_imports.clear()
+            
+        
+    
+def ImportPreparedPaths( file_seeds, file_seed_cache, prepared_path_imports ):
+    
+    file_import_jobs = [ file_import_job for ( os_file_handle, temp_path, file_import_job, prepare_exception ) in prepared_path_imports if prepare_exception is None ]
+    
+    num_done = 0
+    
+    try:
+        
+        if len( file_import_jobs ) > 0:
+            
+            try:
+                
+                import_results = list( HG.client_controller.client_files_manager.ImportFiles( file_import_jobs ) )
+                
+            except HydrusExceptions.ShutdownException:
+                
+                raise
+                
+            except Exception as e:
+                
+                # the whole batch failed, so every file in it gets the error
+                
+                import_results = [ e for file_import_job in file_import_jobs ]
+                
+            
+            import_results = iter( import_results )
+            
+        
+        for ( file_seed, prepared_path_import ) in zip( file_seeds, prepared_path_imports ):
+            
+            ( os_file_handle, temp_path, file_import_job, prepare_exception ) = prepared_path_import
+            
+            if prepare_exception is None:
+                
+                import_result = next( import_results )
+                
+            else:
+                
+                import_result = None
+                
+            
+            file_seed.ImportPreparedPath( file_seed_cache, prepared_path_import, import_result = import_result )
+            
+            num_done += 1
+            
+        
+    finally:
+        
+        # ImportPreparedPath cleans up its own temp file, so this catches whatever we did not get to
+        
+        for prepared_path_import in prepared_path_imports[ num_done : ]:
+            
+            CleanUpPreparedPathImport( prepared_path_import )
+            
+        
+    
 class FileImportJob( object ):
     
-    def __init__( self, temp_path, file_import_options = None ):
+    def __init__( self, temp_path, file_import_options = None, temp_path_hashes = None ):
         
         if file_import_options is None:
             
@@ -165,6 +340,7 @@ class FileImportJob( object ):
         
         self._temp_path = temp_path
         self._file_import_options = file_import_options
+        self._temp_path_hashes = temp_path_hashes
         
         self._hash = None
         self._pre_import_status = None
@@ -257,9 +433,22 @@ class FileImportJob( object ):
     
     def GenerateHashAndStatus( self ):
         
-        HydrusImageHandling.ConvertToPngIfBmp( self._temp_path )
+        if self._hash is None:
+            
+            converted = HydrusImageHandling.ConvertToPngIfBmp( self._temp_path )
+            
+            if converted or self._temp_path_hashes is None:
+                
+                # one pass for all four hashes, rather than one for sha256 and another for the rest in GenerateInfo
+                self._temp_path_hashes = HydrusFileHandling.GetAllHashesFromPath( self._temp_path )
+                
+            
+            ( self._hash, md5, sha1, sha512 ) = self._temp_path_hashes
+            
+            self._extra_hashes = ( md5, sha1, sha512 )
+            
         
-        self._hash = HydrusFileHandling.GetHashFromPath( self._temp_path )
+        # the status is always fetched fresh, as a prepared job may have waited while an identical file was imported
         
         ( self._pre_import_status, hash, note ) = HG.client_controller.Read( 'hash_status', 'sha256', self._hash, prefix = 'file recognised' )
         
@@ -268,6 +457,11 @@ class FileImportJob( object ):
     
     def GenerateInfo( self ):
         
+        if self._file_info is not None:
+            
+            return
+            
+        
         mime = HydrusFileHandling.GetMime( self._temp_path )
         
         new_options = HG.client_controller.new_options
@@ -284,21 +478,50 @@ class FileImportJob( object ):
         
         ( size, mime, width, height, duration, num_frames, num_words ) = self._file_info
         
-        if mime in HC.MIMES_WITH_THUMBNAILS:
+        bounding_dimensions = HG.client_controller.options[ 'thumbnail_dimensions' ]
+        
+        if mime in HC.MIMES_WE_CAN_PHASH:
+            
+            # decode once and make the thumbnail and phash from the same buffer
+            
+            numpy_image = ClientImageHandling.GenerateNumpyImage( self._temp_path, mime )
+            
+            try:
+                
+                self._thumbnail = ClientImageHandling.GenerateThumbnailBytesFromNumpyImage( numpy_image, bounding_dimensions, mime )
+                
+            except HydrusExceptions.CantRenderWithCVException:
+                
+                self._thumbnail = HydrusFileHandling.GenerateThumbnailBytesFromStaticImagePathPIL( self._temp_path, bounding_dimensions, mime )
+                
+            
+            self._phashes = ClientImageHandling.GenerateShapePerceptualHashesFromNumpyImage( numpy_image )
             
-            bounding_dimensions = HG.client_controller.options[ 'thumbnail_dimensions' ]
+            del numpy_image
+            
+        elif mime in HC.MIMES_WITH_THUMBNAILS:
             
             percentage_in = HG.client_controller.new_options.GetInteger( 'video_thumbnail_percentage_in' )
             
             self._thumbnail = HydrusFileHandling.GenerateThumbnailBytes( self._temp_path, bounding_dimensions, mime, width, height, duration, num_frames, percentage_in = percentage_in )
             
         
-        if mime in HC.MIMES_WE_CAN_PHASH:
+        if self._extra_hashes is None:
             
-            self._phashes = ClientImageHandling.GenerateShapePerceptualHashes( self._temp_path, mime )
+            self._extra_hashes = HydrusFileHandling.GetExtraHashesFromPath( self._temp_path )
             
         
-        self._extra_hashes = HydrusFileHandling.GetExtraHashesFromPath( self._temp_path )
+    
+    def PrepareForImport( self ):
+        
+        # everything slow that does not need to write to the db, so it can run for several files at once
+        
+        self.GenerateHashAndStatus()
+        
+        if self.IsNewToDB():
+            
+            self.GenerateInfo()
+            
         
     
 FILE_SEED_TYPE_HDD = 0
@@ -568,7 +791,7 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
             
             status_hook( 'importing file' )
             
-            self.Import( temp_path, file_import_options )
+            self.Import( temp_path, file_import_options, temp_path_hashes = network_job.GetTempPathHashes() )
             
         finally:
             
@@ -783,9 +1006,9 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
         return self.GetHash() is not None
         
     
-    def Import( self, temp_path, file_import_options ):
+    def Import( self, temp_path, file_import_options, temp_path_hashes = None ):
         
-        file_import_job = FileImportJob( temp_path, file_import_options )
+        file_import_job = FileImportJob( temp_path, file_import_options, temp_path_hashes = temp_path_hashes )
         
         ( status, hash, note ) = HG.client_controller.client_files_manager.ImportFile( file_import_job )
         
@@ -795,46 +1018,43 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
     
     def ImportPath( self, file_seed_cache, file_import_options, limited_mimes = None ):
         
+        prepared_path_import = self.PrepareImportPath( file_import_options, limited_mimes = limited_mimes )
+        
+        self.ImportPreparedPath( file_seed_cache, prepared_path_import )
+        
+    
+    def ImportPreparedPath( self, file_seed_cache, prepared_path_import, import_result = None ):
+        
+        # import_result is the matching slot from a ClientFilesManager.ImportFiles batch, if this file went in with others
+        
+        ( os_file_handle, temp_path, file_import_job, prepare_exception ) = prepared_path_import
+        
         try:
             
-            if self.file_seed_type != FILE_SEED_TYPE_HDD:
-                
-                raise HydrusExceptions.VetoException( 'Attempted to import as a path, but I do not think I am a path!' )
-                
-            
-            path = self.file_seed_data
-            
-            if not os.path.exists( path ):
-                
-                raise HydrusExceptions.VetoException( 'Source file does not exist!' )
-                
-            
-            if limited_mimes is not None:
-                
-                mime = HydrusFileHandling.GetMime( path )
+            try:
                 
-                if mime not in limited_mimes:
+                if prepare_exception is not None:
                     
-                    raise HydrusExceptions.VetoException( 'Not in allowed mimes!' )
+                    raise prepare_exception
                     
                 
-            
-            ( os_file_handle, temp_path ) = ClientPaths.GetTempPath()
-            
-            try:
-                
-                copied = HydrusPaths.MirrorFile( path, temp_path )
-                
-                if not copied:
+                if import_result is None:
                     
-                    raise Exception( 'File failed to copy to temp path--see log for error.' )
+                    import_result = HG.client_controller.client_files_manager.ImportFile( file_import_job )
+                    
+                elif isinstance( import_result, Exception ):
+                    
+                    raise import_result
                     
                 
-                self.Import( temp_path, file_import_options )
+                ( status, hash, note ) = import_result
+                
+                self.SetStatus( status, note = note )
+                self.SetHash( hash )
                 
             finally:
                 
-                HydrusPaths.CleanUpTempPath( os_file_handle, temp_path )
+                CleanUpPreparedPathImport( prepared_path_import )
                 
             
             self.WriteContentUpdates()
@@ -883,6 +1103,59 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
             
         
     
+    def PrepareImportPath( self, file_import_options, limited_mimes = None ):
+        
+        # this never raises--any problem is stored and raised again at import time, so the seed gets the right status
+        
+        os_file_handle = None
+        temp_path = None
+        file_import_job = None
+        
+        try:
+            
+            if self.file_seed_type != FILE_SEED_TYPE_HDD:
+                
+                raise HydrusExceptions.VetoException( 'Attempted to import as a path, but I do not think I am a path!' )
+                
+            
+            path = self.file_seed_data
+            
+            if not os.path.exists( path ):
+                
+                raise HydrusExceptions.VetoException( 'Source file does not exist!' )
+                
+            
+            if limited_mimes is not None:
+                
+                mime = HydrusFileHandling.GetMime( path )
+                
+                if mime not in limited_mimes:
+                    
+                    raise HydrusExceptions.VetoException( 'Not in allowed mimes!' )
+                    
+                
+            
+            ( os_file_handle, temp_path ) = ClientPaths.GetTempPath()
+            
+            copied = HydrusPaths.MirrorFile( path, temp_path )
+            
+            if not copied:
+                
+                raise Exception( 'File failed to copy to temp path--see log for error.' )
+                
+            
+            file_import_job = FileImportJob( temp_path, file_import_options )
+            
+            file_import_job.PrepareForImport()
+            
+        except Exception as e:
+            
+            return ( os_file_handle, temp_path, file_import_job, e )
+            
+        
+        return ( os_file_handle, temp_path, file_import_job, None )
+        
+    
     def PredictPreImportStatus( self, file_import_options, tag_import_options, file_url = None ):
         
         ( url_status, url_hash, url_note ) = self.GetPreImportStatusPredictionURL( file_import_options, file_url = file_url )
@@ -1381,7 +1654,7 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
     
     SERIALISABLE_TYPE = HydrusSerialisable.SERIALISABLE_TYPE_FILE_SEED_CACHE
     SERIALISABLE_NAME = 'Import File Status Cache'
-    SERIALISABLE_VERSION = 8
+    SERIALISABLE_VERSION = 9
     
     COMPACT_NUMBER = 250
     
@@ -1389,9 +1662,18 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         
         HydrusSerialisable.SerialisableBase.__init__( self )
         
+        # None means our file seeds are journaled in the db and have not been asked for yet
         self._file_seeds = HydrusSerialisable.SerialisableList()
         
+        # indices into the list, kept up to date as file seeds change so we never have to scan
+        
         self._file_seeds_to_indices = {}
+        self._file_seeds_to_statuses = {}
+        self._file_seeds_to_source_timestamps = {}
+        
+        self._statuses_to_counts = collections.Counter()
+        self._statuses_to_indices = collections.defaultdict( list )
+        self._sorted_source_timestamps = []
         
         self._file_seed_cache_key = HydrusData.GenerateKey()
         
@@ -1400,11 +1682,23 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         
         self._status_dirty = True
         
+        self._serialise_by_reference = False
+        
+        self._journal_rewrite_all = True
+        self._journal_dirty_file_seeds = set()
+        self._journal_deleted_file_seed_rows = set()
+        self._journal_reindex_from = None
+        
         self._lock = threading.Lock()
         
     
     def __len__( self ):
         
+        if self._file_seeds is None:
+            
+            return sum( self._statuses_to_counts.values() )
+            
+        
         return len( self._file_seeds )
         
     
@@ -1424,13 +1718,70 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
             
         else:
             
-            return [ file_seed for file_seed in self._file_seeds if file_seed.status == status ]
+            return self._GetIndexedFileSeeds( status )
+            
+        
+    
+    def _GetIndexedFileSeeds( self, status, num_to_get = None ):
+        
+        # file seeds can change status before anyone notifies us, so check what we pull and fix up anything stale
+        
+        while True:
+            
+            indices = self._statuses_to_indices.get( status, [] )
+            
+            if num_to_get is not None:
+                
+                indices = indices[ : num_to_get ]
+                
+            
+            file_seeds = [ self._file_seeds[ index ] for index in indices ]
+            
+            stale_file_seeds = [ file_seed for file_seed in file_seeds if file_seed.status != status ]
+            
+            if len( stale_file_seeds ) > 0:
+                
+                for file_seed in stale_file_seeds:
+                    
+                    self._ReindexFileSeed( file_seed )
+                    
+                
+                continue
+                
+            
+            if num_to_get is not None and len( file_seeds ) == num_to_get:
+                
+                return file_seeds
+                
+            
+            # we came up short, which may be because something moved to this status without telling us
+            
+            if not self._ReindexStaleFileSeeds():
+                
+                return file_seeds
+                
             
         
     
     def _GetSerialisableInfo( self ):
         
-        return self._file_seeds.GetSerialisableTuple()
+        serialisable_file_seed_cache_key = self._file_seed_cache_key.hex()
+        serialisable_statuses_to_counts = list( self._GetStatusesToCounts().items() )
+        
+        if self._serialise_by_reference:
+            
+            # the db holds the file seeds themselves, so we only need to say where they are
+            
+            serialisable_file_seeds = None
+            
+        else:
+            
+            self._LoadFileSeedsIfNeeded()
+            
+            serialisable_file_seeds = self._file_seeds.GetSerialisableTuple()
+            
+        
+        return ( serialisable_file_seed_cache_key, serialisable_file_seeds, serialisable_statuses_to_counts )
         
     
     def _GetSourceTimestamp( self, file_seed ):
@@ -1450,14 +1801,7 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
     
     def _GetStatusesToCounts( self ):
         
-        statuses_to_counts = collections.Counter()
-        
-        for file_seed in self._file_seeds:
-            
-            statuses_to_counts[ file_seed.status ] += 1
-            
-        
-        return statuses_to_counts
+        return collections.Counter( { status : count for ( status, count ) in self._statuses_to_counts.items() if count > 0 } )
         
     
     def _HasFileSeed( self, file_seed ):
@@ -1469,22 +1813,279 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         return has_file_seed
         
     
-    def _InitialiseFromSerialisableInfo( self, serialisable_info ):
+    def _IndexFileSeed( self, file_seed ):
         
-        with self._lock:
-            
-            self._file_seeds = HydrusSerialisable.CreateFromSerialisableTuple( serialisable_info )
-            
-            self._file_seeds_to_indices = { file_seed : index for ( index, file_seed ) in enumerate( self._file_seeds ) }
-            
+        status = file_seed.status
+        source_timestamp = self._GetSourceTimestamp( file_seed )
         
-    
-    def _SetStatusDirty( self ):
+        self._file_seeds_to_statuses[ file_seed ] = status
+        self._file_seeds_to_source_timestamps[ file_seed ] = source_timestamp
         
-        self._status_dirty = True
+        self._statuses_to_counts[ status ] += 1
+        
+        bisect.insort( self._statuses_to_indices[ status ], self._file_seeds_to_indices[ file_seed ] )
+        bisect.insort( self._sorted_source_timestamps, source_timestamp )
         
     
-    def _UpdateSerialisableInfo( self, version, old_serialisable_info ):
+    def _InitialiseFromSerialisableInfo( self, serialisable_info ):
+        
+        ( serialisable_file_seed_cache_key, serialisable_file_seeds, serialisable_statuses_to_counts ) = serialisable_info
+        
+        with self._lock:
+            
+            if serialisable_file_seeds is None:
+                
+                # we are a reference to a journaled cache, so keep its key and wait until someone needs the file seeds
+                
+                self._file_seed_cache_key = bytes.fromhex( serialisable_file_seed_cache_key )
+                
+                self._file_seeds = None
+                
+                self._statuses_to_counts = collections.Counter( dict( serialisable_statuses_to_counts ) )
+                
+                self._journal_rewrite_all = False
+                
+            else:
+                
+                # a full dump is a copy, so it must not share its journaled rows with the cache it came from
+                
+                self._file_seed_cache_key = HydrusData.GenerateKey()
+                
+                self._SetFileSeeds( HydrusSerialisable.CreateFromSerialisableTuple( serialisable_file_seeds ) )
+                
+            
+        
+    
+    def _InsertFileSeedsAt( self, index, file_seeds ):
+        
+        if len( file_seeds ) == 0:
+            
+            return
+            
+        
+        self._file_seeds[ index : index ] = file_seeds
+        
+        self._RepositionFileSeedsFrom( index )
+        
+        for file_seed in file_seeds:
+            
+            self._IndexFileSeed( file_seed )
+            
+        
+        self._JournalFileSeedsMoved( index )
+        
+    
+    def _JournalFileSeedDeleted( self, file_seed ):
+        
+        # until our first journaled save, everything is written anyway, so there is nothing to track
+        
+        if not self._journal_rewrite_all:
+            
+            self._journal_dirty_file_seeds.discard( file_seed )
+            self._journal_deleted_file_seed_rows.add( ( file_seed.file_seed_type, file_seed.file_seed_data ) )
+            
+        
+    
+    def _JournalFileSeedDirty( self, file_seed ):
+        
+        if not self._journal_rewrite_all:
+            
+            self._journal_dirty_file_seeds.add( file_seed )
+            
+        
+    
+    def _JournalFileSeedsMoved( self, index ):
+        
+        # everything from here on has a new position
+        
+        if self._journal_reindex_from is None:
+            
+            self._journal_reindex_from = index
+            
+        else:
+            
+            self._journal_reindex_from = min( index, self._journal_reindex_from )
+            
+        
+    
+    def _LoadFileSeedsIfNeeded( self ):
+        
+        if self._file_seeds is not None:
+            
+            return
+            
+        
+        if threading.current_thread() is threading.main_thread():
+            
+            raise Exception( 'The file seeds of a journaled file import cache were asked for on the ui thread before they were loaded!' )
+            
+        
+        # don't hold the lock while we wait on the db
+        
+        file_seeds = HG.client_controller.Read( 'file_seed_cache_file_seeds', self._file_seed_cache_key )
+        
+        with self._lock:
+            
+            if self._file_seeds is None:
+                
+                self._SetFileSeeds( HydrusSerialisable.SerialisableList( file_seeds ) )
+                
+            
+        
+    
+    def _RebuildIndices( self ):
+        
+        self._file_seeds_to_indices = {}
+        self._file_seeds_to_statuses = {}
+        self._file_seeds_to_source_timestamps = {}
+        
+        self._statuses_to_counts = collections.Counter()
+        self._statuses_to_indices = collections.defaultdict( list )
+        
+        for ( index, file_seed ) in enumerate( self._file_seeds ):
+            
+            status = file_seed.status
+            
+            self._file_seeds_to_indices[ file_seed ] = index
+            self._file_seeds_to_statuses[ file_seed ] = status
+            self._file_seeds_to_source_timestamps[ file_seed ] = self._GetSourceTimestamp( file_seed )
+            
+            self._statuses_to_counts[ status ] += 1
+            self._statuses_to_indices[ status ].append( index )
+            
+        
+        self._sorted_source_timestamps = sorted( self._file_seeds_to_source_timestamps.values() )
+        
+    
+    def _ReindexFileSeed( self, file_seed ):
+        
+        # file seeds change their own status and source time, so we remember what we last indexed them as
+        
+        self._UnindexFileSeed( file_seed )
+        self._IndexFileSeed( file_seed )
+        
+    
+    def _ReindexStaleFileSeeds( self ):
+        
+        stale_file_seeds = [ file_seed for file_seed in self._file_seeds if file_seed.status != self._file_seeds_to_statuses[ file_seed ] ]
+        
+        for file_seed in stale_file_seeds:
+            
+            self._ReindexFileSeed( file_seed )
+            
+        
+        if len( stale_file_seeds ) > 0:
+            
+            self._SetStatusDirty()
+            
+        
+        return len( stale_file_seeds ) > 0
+        
+    
+    def _RemoveFileSeeds( self, file_seeds_to_delete ):
+        
+        file_seeds_to_delete = { file_seed for file_seed in file_seeds_to_delete if file_seed in self._file_seeds_to_indices }
+        
+        if len( file_seeds_to_delete ) == 0:
+            
+            return
+            
+        
+        first_index = min( ( self._file_seeds_to_indices[ file_seed ] for file_seed in file_seeds_to_delete ) )
+        
+        for file_seed in file_seeds_to_delete:
+            
+            self._UnindexFileSeed( file_seed )
+            
+            del self._file_seeds_to_indices[ file_seed ]
+            
+            self._JournalFileSeedDeleted( file_seed )
+            
+        
+        self._file_seeds[ first_index : ] = [ file_seed for file_seed in self._file_seeds[ first_index : ] if file_seed not in file_seeds_to_delete ]
+        
+        self._RepositionFileSeedsFrom( first_index )
+        
+        self._JournalFileSeedsMoved( first_index )
+        
+    
+    def _RepositionFileSeedsFrom( self, index ):
+        
+        # the list has changed from here on, so only the tail needs its positions redone, and in order, so the per-status lists stay sorted
+        
+        for indices in self._statuses_to_indices.values():
+            
+            del indices[ bisect.bisect_left( indices, index ) : ]
+            
+        
+        for ( file_seed_index, file_seed ) in enumerate( self._file_seeds[ index : ], index ):
+            
+            self._file_seeds_to_indices[ file_seed ] = file_seed_index
+            
+            if file_seed in self._file_seeds_to_statuses:
+                
+                self._statuses_to_indices[ self._file_seeds_to_statuses[ file_seed ] ].append( file_seed_index )
+                
+            
+        
+    
+    def _SetFileSeeds( self, file_seeds ):
+        
+        self._file_seeds = file_seeds
+        
+        self._RebuildIndices()
+        
+        self._SetStatusDirty()
+        
+    
+    def _SetStatusDirty( self ):
+        
+        self._status_dirty = True
+        
+    
+    def _SwapFileSeeds( self, index_a, index_b ):
+        
+        file_seed_a = self._file_seeds[ index_a ]
+        file_seed_b = self._file_seeds[ index_b ]
+        
+        self._UnindexFileSeed( file_seed_a )
+        self._UnindexFileSeed( file_seed_b )
+        
+        self._file_seeds[ index_a ] = file_seed_b
+        self._file_seeds[ index_b ] = file_seed_a
+        
+        self._file_seeds_to_indices[ file_seed_a ] = index_b
+        self._file_seeds_to_indices[ file_seed_b ] = index_a
+        
+        self._IndexFileSeed( file_seed_a )
+        self._IndexFileSeed( file_seed_b )
+        
+        # only these two rows have moved
+        
+        self._JournalFileSeedDirty( file_seed_a )
+        self._JournalFileSeedDirty( file_seed_b )
+        
+    
+    def _UnindexFileSeed( self, file_seed ):
+        
+        if file_seed not in self._file_seeds_to_statuses:
+            
+            return
+            
+        
+        status = self._file_seeds_to_statuses.pop( file_seed )
+        source_timestamp = self._file_seeds_to_source_timestamps.pop( file_seed )
+        
+        self._statuses_to_counts[ status ] -= 1
+        
+        indices = self._statuses_to_indices[ status ]
+        
+        del indices[ bisect.bisect_left( indices, self._file_seeds_to_indices[ file_seed ] ) ]
+        
+        del self._sorted_source_timestamps[ bisect.bisect_left( self._sorted_source_timestamps, source_timestamp ) ]
+        
+    
+    def _UpdateSerialisableInfo( self, version, old_serialisable_info ):
         
         if version == 1:
             
@@ -1689,6 +2290,17 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
             return ( 8, new_serialisable_info )
             
         
+        if version == 8:
+            
+            serialisable_file_seeds = old_serialisable_info
+            
+            serialisable_file_seed_cache_key = HydrusData.GenerateKey().hex()
+            
+            new_serialisable_info = ( serialisable_file_seed_cache_key, serialisable_file_seeds, [] )
+            
+            return ( 9, new_serialisable_info )
+            
+        
     
     def AddFileSeeds( self, file_seeds ):
         
@@ -1697,6 +2309,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
             return 0 
             
         
+        self._LoadFileSeedsIfNeeded()
+        
         new_file_seeds = []
         
         with self._lock:
@@ -1716,6 +2330,10 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
                 
                 self._file_seeds_to_indices[ file_seed ] = len( self._file_seeds ) - 1
                 
+                self._IndexFileSeed( file_seed )
+                
+                self._JournalFileSeedDirty( file_seed )
+                
             
             self._SetStatusDirty()
             
@@ -1727,6 +2345,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
     
     def AdvanceFileSeed( self, file_seed ):
         
+        self._LoadFileSeedsIfNeeded()
+        
         with self._lock:
             
             if file_seed in self._file_seeds_to_indices:
@@ -1735,12 +2355,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
                 
                 if index > 0:
                     
-                    self._file_seeds.remove( file_seed )
+                    self._SwapFileSeeds( index - 1, index )
                     
-                    self._file_seeds.insert( index - 1, file_seed )
-                    
-                
-                self._file_seeds_to_indices = { file_seed : index for ( index, file_seed ) in enumerate( self._file_seeds ) }
                 
             
         
@@ -1749,6 +2365,13 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
     
     def CanCompact( self, compact_before_this_source_time ):
         
+        if len( self ) <= self.COMPACT_NUMBER:
+            
+            return False
+            
+        
+        self._LoadFileSeedsIfNeeded()
+        
         with self._lock:
             
             if len( self._file_seeds ) <= self.COMPACT_NUMBER:
@@ -1775,6 +2398,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
     
     def Compact( self, compact_before_this_source_time ):
         
+        self._LoadFileSeedsIfNeeded()
+        
         with self._lock:
             
             if len( self._file_seeds ) <= self.COMPACT_NUMBER:
@@ -1782,23 +2407,20 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
                 return
                 
             
-            new_file_seeds = HydrusSerialisable.SerialisableList()
+            file_seeds_to_delete = []
             
             for file_seed in self._file_seeds[:-self.COMPACT_NUMBER]:
                 
                 still_to_do = file_seed.status == CC.STATUS_UNKNOWN
                 still_relevant = self._GetSourceTimestamp( file_seed ) > compact_before_this_source_time
                 
-                if still_to_do or still_relevant:
+                if not ( still_to_do or still_relevant ):
                     
-                    new_file_seeds.append( file_seed )
+                    file_seeds_to_delete.append( file_seed )
                     
                 
             
-            new_file_seeds.extend( self._file_seeds[-self.COMPACT_NUMBER:] )
-            
-            self._file_seeds = new_file_seeds
-            self._file_seeds_to_indices = { file_seed : index for ( index, file_seed ) in enumerate( self._file_seeds ) }
+            self._RemoveFileSeeds( file_seeds_to_delete )
             
             self._SetStatusDirty()
             
@@ -1806,6 +2428,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
     
     def DelayFileSeed( self, file_seed ):
         
+        self._LoadFileSeedsIfNeeded()
+        
         with self._lock:
             
             if file_seed in self._file_seeds_to_indices:
@@ -1814,13 +2438,9 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
                 
                 if index < len( self._file_seeds ) - 1:
                     
-                    self._file_seeds.remove( file_seed )
-                    
-                    self._file_seeds.insert( index + 1, file_seed )
+                    self._SwapFileSeeds( index, index + 1 )
                     
                 
-                self._file_seeds_to_indices = { file_seed : index for ( index, file_seed ) in enumerate( self._file_seeds ) }
-                
             
         
         self.NotifyFileSeedsUpdated( ( file_seed, ) )
@@ -1828,6 +2448,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
     
     def GetEarliestSourceTime( self ):
         
+        self._LoadFileSeedsIfNeeded()
+        
         with self._lock:
             
             if len( self._file_seeds ) == 0:
@@ -1835,7 +2457,7 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
                 return None
                 
             
-            earliest_timestamp = min( ( self._GetSourceTimestamp( file_seed ) for file_seed in self._file_seeds ) )
+            earliest_timestamp = self._sorted_source_timestamps[0]
             
         
         return earliest_timestamp
@@ -1848,31 +2470,23 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
     
     def GetFileSeedCount( self, status = None ):
         
-        result = 0
-        
         with self._lock:
             
             if status is None:
                 
-                result = len( self._file_seeds )
+                return sum( self._statuses_to_counts.values() )
                 
             else:
                 
-                for file_seed in self._file_seeds:
-                    
-                    if file_seed.status == status:
-                        
-                        result += 1
-                        
-                    
+                return self._statuses_to_counts[ status ]
                 
             
         
-        return result
-        
     
     def GetFileSeeds( self, status = None ):
         
+        self._LoadFileSeedsIfNeeded()
+        
         with self._lock:
             
             return self._GetFileSeeds( status )
@@ -1881,6 +2495,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
     
     def GetFileSeedIndex( self, file_seed ):
         
+        self._LoadFileSeedsIfNeeded()
+        
         with self._lock:
             
             return self._file_seeds_to_indices[ file_seed ]
@@ -1889,6 +2505,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
     
     def GetHashes( self ):
         
+        self._LoadFileSeedsIfNeeded()
+        
         with self._lock:
             
             hashes = [ file_seed.GetHash() for file_seed in self._file_seeds if file_seed.HasHash() ]
@@ -1897,8 +2515,57 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         return hashes
         
     
+    def GetJournal( self ):
+        
+        # what has changed since the last time we were saved, for the db to write row by row
+        # the journal is handed over here, so if the db's job fails, it must give it back with RestoreJournal
+        
+        with self._lock:
+            
+            file_seed_cache_key = self._file_seed_cache_key
+            
+            if self._file_seeds is None:
+                
+                return ( file_seed_cache_key, False, [], [], [] )
+                
+            
+            rewrite_all = self._journal_rewrite_all
+            
+            if rewrite_all:
+                
+                upsertee_file_seeds = list( self._file_seeds )
+                
+            else:
+                
+                upsertee_file_seeds = list( self._journal_dirty_file_seeds )
+                
+            
+            upsertee_rows = [ ( self._file_seeds_to_indices[ file_seed ], file_seed ) for file_seed in upsertee_file_seeds ]
+            
+            deletee_rows = list( self._journal_deleted_file_seed_rows )
+            
+            if self._journal_reindex_from is not None and not rewrite_all:
+                
+                reindex_rows = [ ( index, file_seed.file_seed_type, file_seed.file_seed_data ) for ( index, file_seed ) in enumerate( self._file_seeds[ self._journal_reindex_from : ], self._journal_reindex_from ) ]
+                
+            else:
+                
+                reindex_rows = []
+                
+            
+            self._journal_rewrite_all = False
+            self._journal_dirty_file_seeds = set()
+            self._journal_deleted_file_seed_rows = set()
+            self._journal_reindex_from = None
+            
+        
+        return ( file_seed_cache_key, rewrite_all, upsertee_rows, deletee_rows, reindex_rows )
+        
+    
     def GetLatestAddedTime( self ):
         
+        self._LoadFileSeedsIfNeeded()
+        
         with self._lock:
             
             if len( self._file_seeds ) == 0:
@@ -1914,6 +2581,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
     
     def GetLatestSourceTime( self ):
         
+        self._LoadFileSeedsIfNeeded()
+        
         with self._lock:
             
             if len( self._file_seeds ) == 0:
@@ -1921,7 +2590,7 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
                 return 0
                 
             
-            latest_timestamp = max( ( self._GetSourceTimestamp( file_seed ) for file_seed in self._file_seeds ) )
+            latest_timestamp = self._sorted_source_timestamps[-1]
             
         
         return latest_timestamp
@@ -1929,35 +2598,47 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
     
     def GetNextFileSeed( self, status ):
         
+        file_seeds = self.GetNextFileSeeds( status, 1 )
+        
+        if len( file_seeds ) == 0:
+            
+            return None
+            
+        
+        return file_seeds[0]
+        
+    
+    def GetNextFileSeeds( self, status, num_to_get ):
+        
+        file_seeds = []
+        
         with self._lock:
             
-            for file_seed in self._file_seeds:
+            # a journaled cache knows its counts, so no need to load it just to find nothing
+            
+            if self._file_seeds is None and self._statuses_to_counts[ status ] == 0:
                 
-                if file_seed.status == status:
-                    
-                    return file_seed
-                    
+                return file_seeds
                 
             
         
-        return None
+        self._LoadFileSeedsIfNeeded()
+        
+        with self._lock:
+            
+            file_seeds = self._GetIndexedFileSeeds( status, num_to_get = num_to_get )
+            
+        
+        return file_seeds
         
     
     def GetNumNewFilesSince( self, since ):
         
-        num_files = 0
+        self._LoadFileSeedsIfNeeded()
         
         with self._lock:
             
-            for file_seed in self._file_seeds:
-                
-                source_timestamp = self._GetSourceTimestamp( file_seed )
-                
-                if source_timestamp >= since:
-                    
-                    num_files += 1
-                    
-                
+            num_files = len( self._sorted_source_timestamps ) - bisect.bisect_left( self._sorted_source_timestamps, since )
             
         
         return num_files
@@ -1965,6 +2646,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
     
     def GetPresentedHashes( self, file_import_options ):
         
+        self._LoadFileSeedsIfNeeded()
+        
         with self._lock:
             
             eligible_file_seeds = [ file_seed for file_seed in self._file_seeds if file_seed.HasHash() ]
@@ -2042,6 +2725,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
     
     def HasFileSeed( self, file_seed ):
         
+        self._LoadFileSeedsIfNeeded()
+        
         with self._lock:
             
             return self._HasFileSeed( file_seed )
@@ -2055,12 +2740,16 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
             return 0 
             
         
+        self._LoadFileSeedsIfNeeded()
+        
         new_file_seeds = set()
         
         with self._lock:
             
             index = min( index, len( self._file_seeds ) )
             
+            file_seeds_to_insert = []
+            
             for file_seed in file_seeds:
                 
                 if self._HasFileSeed( file_seed ) or file_seed in new_file_seeds:
@@ -2072,12 +2761,12 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
                 
                 new_file_seeds.add( file_seed )
                 
-                self._file_seeds.insert( index, file_seed )
+                file_seeds_to_insert.append( file_seed )
                 
-                index += 1
+                self._JournalFileSeedDirty( file_seed )
                 
             
-            self._file_seeds_to_indices = { file_seed : index for ( index, file_seed ) in enumerate( self._file_seeds ) }
+            self._InsertFileSeedsAt( index, file_seeds_to_insert )
             
             self._SetStatusDirty()
             
@@ -2087,10 +2776,28 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         return len( new_file_seeds )
         
     
+    def LoadFileSeeds( self ):
+        
+        self._LoadFileSeedsIfNeeded()
+        
+    
     def NotifyFileSeedsUpdated( self, file_seeds ):
         
         with self._lock:
             
+            if self._file_seeds is not None:
+                
+                for file_seed in file_seeds:
+                    
+                    if file_seed in self._file_seeds_to_indices:
+                        
+                        self._ReindexFileSeed( file_seed )
+                        
+                        self._JournalFileSeedDirty( file_seed )
+                        
+                    
+                
+            
             self._SetStatusDirty()
             
         
@@ -2099,13 +2806,13 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
     
     def RemoveFileSeeds( self, file_seeds ):
         
+        self._LoadFileSeedsIfNeeded()
+        
         with self._lock:
             
             file_seeds_to_delete = set( file_seeds )
             
-            self._file_seeds = HydrusSerialisable.SerialisableList( [ file_seed for file_seed in self._file_seeds if file_seed not in file_seeds_to_delete ] )
-            
-            self._file_seeds_to_indices = { file_seed : index for ( index, file_seed ) in enumerate( self._file_seeds ) }
+            self._RemoveFileSeeds( file_seeds_to_delete )
             
             self._SetStatusDirty()
             
@@ -2115,6 +2822,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
     
     def RemoveFileSeedsByStatus( self, statuses_to_remove ):
         
+        self._LoadFileSeedsIfNeeded()
+        
         with self._lock:
             
             file_seeds_to_delete = [ file_seed for file_seed in self._file_seeds if file_seed.status in statuses_to_remove ]
@@ -2125,6 +2834,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
     
     def RemoveAllButUnknownFileSeeds( self ):
         
+        self._LoadFileSeedsIfNeeded()
+        
         with self._lock:
             
             file_seeds_to_delete = [ file_seed for file_seed in self._file_seeds if file_seed.status != CC.STATUS_UNKNOWN ]
@@ -2133,8 +2844,46 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         self.RemoveFileSeeds( file_seeds_to_delete )
         
     
+    def RestoreJournal( self, journal ):
+        
+        ( file_seed_cache_key, rewrite_all, upsertee_rows, deletee_rows, reindex_rows ) = journal
+        
+        with self._lock:
+            
+            if self._file_seeds is None or file_seed_cache_key != self._file_seed_cache_key:
+                
+                return
+                
+            
+            if rewrite_all:
+                
+                self._journal_rewrite_all = True
+                
+            
+            if not self._journal_rewrite_all:
+                
+                # anything removed since is already journaled as deleted
+                
+                self._journal_dirty_file_seeds.update( ( file_seed for ( file_seed_index, file_seed ) in upsertee_rows if file_seed in self._file_seeds_to_indices ) )
+                
+                # the db deletes before it upserts, so a row that has since been re-added is still fine
+                
+                self._journal_deleted_file_seed_rows.update( deletee_rows )
+                
+                if len( reindex_rows ) > 0:
+                    
+                    ( file_seed_index, file_seed_type, file_seed_data ) = reindex_rows[0]
+                    
+                    self._JournalFileSeedsMoved( file_seed_index )
+                    
+                
+            
+        
+    
     def RetryFailures( self ):
         
+        self._LoadFileSeedsIfNeeded()
+        
         with self._lock:
             
             failed_file_seeds = self._GetFileSeeds( CC.STATUS_ERROR )
@@ -2150,6 +2899,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
     
     def RetryIgnored( self ):
         
+        self._LoadFileSeedsIfNeeded()
+        
         with self._lock:
             
             ignored_file_seeds = self._GetFileSeeds( CC.STATUS_VETOED )
@@ -2163,6 +2914,13 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         self.NotifyFileSeedsUpdated( ignored_file_seeds )
         
     
+    def SetSerialiseByReference( self, value ):
+        
+        # the db sets this while it saves us as part of a journaled object
+        
+        self._serialise_by_reference = value
+        
+    
     def WorkToDo( self ):
         
         with self._lock:
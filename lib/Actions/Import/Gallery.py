@@ -12,6 +12,7 @@ from . import HydrusExceptions
 from . import HydrusGlobals as HG
 from . import HydrusPaths
 from . import HydrusSerialisable
+from . import HydrusThreading
 import itertools
 import threading
 import time
@@ -730,6 +731,9 @@ class GalleryImport( HydrusSerialisable.SerialisableBase ):
         self._files_repeating_job.SetThreadSlotType( 'gallery_files' )
         self._gallery_repeating_job.SetThreadSlotType( 'gallery_search' )
         
+        self._files_repeating_job.SetThreadPoolPriority( HydrusThreading.THREAD_POOL_PRIORITY_IMPORT )
+        self._gallery_repeating_job.SetThreadPoolPriority( HydrusThreading.THREAD_POOL_PRIORITY_IMPORT )
+        
     
     def REPEATINGWorkOnFiles( self ):
         
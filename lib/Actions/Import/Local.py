@@ -123,63 +123,75 @@ class HDDImport( HydrusSerialisable.SerialisableBase ):
     
     def _WorkOnFiles( self, page_key ):
         
-        file_seed = self._file_seed_cache.GetNextFileSeed( CC.STATUS_UNKNOWN )
+        file_seeds = self._file_seed_cache.GetNextFileSeeds( CC.STATUS_UNKNOWN, ClientImporting.PATH_IMPORT_BATCH_SIZE )
         
-        if file_seed is None:
+        if len( file_seeds ) == 0:
             
             return
             
         
         did_substantial_work = False
         
-        path = file_seed.file_seed_data
-        
         with self._lock:
             
             self._current_action = 'importing'
             
         
-        file_seed.ImportPath( self._file_seed_cache, self._file_import_options )
-        
-        did_substantial_work = True
-        
-        if file_seed.status in CC.SUCCESSFUL_IMPORT_STATES:
+        for file_seeds_batch in ClientImportFileSeeds.ImportFileSeedPaths( file_seeds, self._file_seed_cache, self._file_import_options ):
             
-            if file_seed.ShouldPresent( self._file_import_options ):
-                
-                file_seed.PresentToPage( page_key )
+            for file_seed in file_seeds_batch:
                 
                 did_substantial_work = True
                 
-            
-            if self._delete_after_success:
+                path = file_seed.file_seed_data
                 
-                try:
-                    
-                    ClientPaths.DeletePath( path )
-                    
-                except Exception as e:
+                if file_seed.status in CC.SUCCESSFUL_IMPORT_STATES:
                     
-                    HydrusData.ShowText( 'While attempting to delete ' + path + ', the following error occurred:' )
-                    HydrusData.ShowException( e )
-                    
-                
-                txt_path = path + '.txt'
-                
-                if os.path.exists( txt_path ):
+                    if file_seed.ShouldPresent( self._file_import_options ):
+                        
+                        file_seed.PresentToPage( page_key )
+                        
                     
-                    try:
+                    if self._delete_after_success:
                         
-                        ClientPaths.DeletePath( txt_path )
+                        try:
+                            
+                            ClientPaths.DeletePath( path )
+                            
+                        except Exception as e:
+                            
+                            HydrusData.ShowText( 'While attempting to delete ' + path + ', the following error occurred:' )
+                            HydrusData.ShowException( e )
+                            
                         
-                    except Exception as e:
+                        txt_path = path + '.txt'
                         
-                        HydrusData.ShowText( 'While attempting to delete ' + txt_path + ', the following error occurred:' )
-                        HydrusData.ShowException( e )
+                        if os.path.exists( txt_path ):
+                            
+                            try:
+                                
+                                ClientPaths.DeletePath( txt_path )
+                                
+                            except Exception as e:
+                                
+                                HydrusData.ShowText( 'While attempting to delete ' + txt_path + ', the following error occurred:' )
+                                HydrusData.ShowException( e )
+                                
+                            
                         
                     
                 
             
+            with self._lock:
+                
+                paused = self._paused or HG.client_controller.new_options.GetBoolean( 'pause_all_file_queues' )
+                
+                if paused or ClientImporting.PageImporterShouldStopWorking( page_key ):
+                    
+                    break
+                    
+                
+            
         
         with self._lock:
             
@@ -263,6 +275,8 @@ class HDDImport( HydrusSerialisable.SerialisableBase ):
         
         self._files_repeating_job.SetThreadSlotType( 'misc' )
         
+        self._files_repeating_job.SetThreadPoolPriority( HydrusThreading.THREAD_POOL_PRIORITY_IMPORT )
+        
     
     def REPEATINGWorkOnFiles( self, page_key ):
         
@@ -566,111 +580,116 @@ class ImportFolder( HydrusSerialisable.SerialisableBaseNamed ):
         
         while True:
             
-            file_seed = self._file_seed_cache.GetNextFileSeed( CC.STATUS_UNKNOWN )
-            
-            p1 = HC.options[ 'pause_import_folders_sync' ] or self._paused
-            p2 = HydrusThreading.IsThreadShuttingDown()
-            p3 = job_key.IsCancelled()
+            file_seeds = self._file_seed_cache.GetNextFileSeeds( CC.STATUS_UNKNOWN, ClientImporting.PATH_IMPORT_BATCH_SIZE )
             
-            if file_seed is None or p1 or p2 or p3:
+            if len( file_seeds ) == 0 or self._ImportingShouldStop( job_key ):
                 
                 break
                 
             
             did_work = True
             
-            if HydrusData.TimeHasPassed( time_to_save ):
-                
-                HG.client_controller.WriteSynchronous( 'serialisable', self )
-                
-                time_to_save = HydrusData.GetNow() + 600
-                
-            
-            gauge_num_done = num_total_done + num_files_imported + 1
-            
-            job_key.SetVariable( 'popup_text_1', 'importing file ' + HydrusData.ConvertValueRangeToPrettyString( gauge_num_done, num_total ) )
-            job_key.SetVariable( 'popup_gauge_1', ( gauge_num_done, num_total ) )
-            
-            path = file_seed.file_seed_data
-            
-            file_seed.ImportPath( self._file_seed_cache, self._file_import_options, limited_mimes = self._mimes )
-            
-            if file_seed.status in CC.SUCCESSFUL_IMPORT_STATES:
+            for file_seeds_batch in ClientImportFileSeeds.ImportFileSeedPaths( file_seeds, self._file_seed_cache, self._file_import_options, limited_mimes = self._mimes ):
                 
-                if file_seed.HasHash():
-                    
-                    hash = file_seed.GetHash()
+                for file_seed in file_seeds_batch:
                     
-                    if self._tag_import_options.HasAdditionalTags():
+                    if HydrusData.TimeHasPassed( time_to_save ):
                         
-                        in_inbox = HG.client_controller.Read( 'in_inbox', hash )
+                        HG.client_controller.WriteSynchronous( 'serialisable', self )
                         
-                        downloaded_tags = []
-                        
-                        service_keys_to_content_updates = self._tag_import_options.GetServiceKeysToContentUpdates( file_seed.status, in_inbox, hash, downloaded_tags ) # additional tags
-                        
-                        if len( service_keys_to_content_updates ) > 0:
-                            
-                            HG.client_controller.WriteSynchronous( 'content_updates', service_keys_to_content_updates )
-                            
+                        time_to_save = HydrusData.GetNow() + 600
                         
                     
-                    service_keys_to_tags = ClientTags.ServiceKeysToTags()
+                    gauge_num_done = num_total_done + i + 1
+                    
+                    job_key.SetVariable( 'popup_text_1', 'importing file ' + HydrusData.ConvertValueRangeToPrettyString( gauge_num_done, num_total ) )
+                    job_key.SetVariable( 'popup_gauge_1', ( gauge_num_done, num_total ) )
+                    
+                    path = file_seed.file_seed_data
                     
-                    for ( tag_service_key, filename_tagging_options ) in list(self._tag_service_keys_to_filename_tagging_options.items()):
+                    if file_seed.status in CC.SUCCESSFUL_IMPORT_STATES:
                         
-                        if not HG.client_controller.services_manager.ServiceExists( tag_service_key ):
+                        if file_seed.HasHash():
                             
-                            continue
+                            hash = file_seed.GetHash()
                             
-                        
-                        try:
+                            if self._tag_import_options.HasAdditionalTags():
+                                
+                                in_inbox = HG.client_controller.Read( 'in_inbox', hash )
+                                
+                                downloaded_tags = []
+                                
+                                service_keys_to_content_updates = self._tag_import_options.GetServiceKeysToContentUpdates( file_seed.status, in_inbox, hash, downloaded_tags ) # additional tags
+                                
+                                if len( service_keys_to_content_updates ) > 0:
+                                    
+                                    HG.client_controller.WriteSynchronous( 'content_updates', service_keys_to_content_updates )
+                                    
+                                
                             
-                            tags = filename_tagging_options.GetTags( tag_service_key, path )
+                            service_keys_to_tags = ClientTags.ServiceKeysToTags()
                             
-                            if len( tags ) > 0:
+                            for ( tag_service_key, filename_tagging_options ) in list(self._tag_service_keys_to_filename_tagging_options.items()):
+                                
+                                if not HG.client_controller.services_manager.ServiceExists( tag_service_key ):
+                                    
+                                    continue
+                                    
                                 
-                                service_keys_to_tags[ tag_service_key ] = tags
+                                try:
+                                    
+                                    tags = filename_tagging_options.GetTags( tag_service_key, path )
+                                    
+                                    if len( tags ) > 0:
+                                        
+                                        service_keys_to_tags[ tag_service_key ] = tags
+                                        
+                                    
+                                except Exception as e:
+                                    
+                                    HydrusData.ShowText( 'Trying to parse filename tags in the import folder "' + self._name + '" threw an error!' )
+                                    
+                                    HydrusData.ShowException( e )
+                                    
                                 
                             
-                        except Exception as e:
+                            if len( service_keys_to_tags ) > 0:
+                                
+                                service_keys_to_content_updates = ClientData.ConvertServiceKeysToTagsToServiceKeysToContentUpdates( { hash }, service_keys_to_tags )
+                                
+                                HG.client_controller.WriteSynchronous( 'content_updates', service_keys_to_content_updates )
+                                
                             
-                            HydrusData.ShowText( 'Trying to parse filename tags in the import folder "' + self._name + '" threw an error!' )
+                        
+                        num_files_imported += 1
+                        
+                        if hash not in presentation_hashes_fast:
                             
-                            HydrusData.ShowException( e )
+                            if file_seed.ShouldPresent( self._file_import_options ):
+                                
+                                presentation_hashes.append( hash )
+                                
+                                presentation_hashes_fast.add( hash )
+                                
                             
                         
-                    
-                    if len( service_keys_to_tags ) > 0:
-                        
-                        service_keys_to_content_updates = ClientData.ConvertServiceKeysToTagsToServiceKeysToContentUpdates( { hash }, service_keys_to_tags )
+                    elif file_seed.status == CC.STATUS_ERROR:
                         
-                        HG.client_controller.WriteSynchronous( 'content_updates', service_keys_to_content_updates )
+                        HydrusData.Print( 'A file failed to import from import folder ' + self._name + ':' + path )
                         
                     
-                
-                num_files_imported += 1
-                
-                if hash not in presentation_hashes_fast:
+                    i += 1
                     
-                    if file_seed.ShouldPresent( self._file_import_options ):
+                    if i % 10 == 0:
                         
-                        presentation_hashes.append( hash )
-                        
-                        presentation_hashes_fast.add( hash )
+                        self._ActionPaths()
                         
                     
                 
-            elif file_seed.status == CC.STATUS_ERROR:
-                
-                HydrusData.Print( 'A file failed to import from import folder ' + self._name + ':' + path )
-                
-            
-            i += 1
-            
-            if i % 10 == 0:
-                
-                self._ActionPaths()
+                if self._ImportingShouldStop( job_key ):
+                    
+                    break
+                    
                 
             
         
@@ -689,6 +708,15 @@ class ImportFolder( HydrusSerialisable.SerialisableBaseNamed ):
         return did_work
         
     
+    def _ImportingShouldStop( self, job_key ):
+        
+        p1 = HC.options[ 'pause_import_folders_sync' ] or self._paused
+        p2 = HydrusThreading.IsThreadShuttingDown()
+        p3 = job_key.IsCancelled()
+        
+        return p1 or p2 or p3
+        
+    
     def _InitialiseFromSerialisableInfo( self, serialisable_info ):
         
         ( self._path, self._mimes, serialisable_file_import_options, serialisable_tag_import_options, serialisable_tag_service_keys_to_filename_tagging_options, action_pairs, action_location_pairs, self._period, self._check_regularly, serialisable_file_seed_cache, self._last_checked, self._paused, self._check_now, self._show_working_popup, self._publish_files_to_popup_button, self._publish_files_to_page ) = serialisable_info
@@ -11,6 +11,7 @@ from . import HydrusData
 from . import HydrusExceptions
 from . import HydrusGlobals as HG
 from . import HydrusSerialisable
+from . import HydrusThreading
 import os
 import threading
 import time
@@ -527,6 +528,9 @@ class SimpleDownloaderImport( HydrusSerialisable.SerialisableBase ):
         self._files_repeating_job.SetThreadSlotType( 'misc' )
         self._queue_repeating_job.SetThreadSlotType( 'misc' )
         
+        self._files_repeating_job.SetThreadPoolPriority( HydrusThreading.THREAD_POOL_PRIORITY_IMPORT )
+        self._queue_repeating_job.SetThreadPoolPriority( HydrusThreading.THREAD_POOL_PRIORITY_IMPORT )
+        
     
     def REPEATINGWorkOnFiles( self, page_key ):
         
@@ -1017,6 +1021,9 @@ class URLsImport( HydrusSerialisable.SerialisableBase ):
         self._files_repeating_job.SetThreadSlotType( 'misc' )
         self._gallery_repeating_job.SetThreadSlotType( 'misc' )
         
+        self._files_repeating_job.SetThreadPoolPriority( HydrusThreading.THREAD_POOL_PRIORITY_IMPORT )
+        self._gallery_repeating_job.SetThreadPoolPriority( HydrusThreading.THREAD_POOL_PRIORITY_IMPORT )
+        
     
     def REPEATINGWorkOnFiles( self, page_key ):
         
@@ -1096,6 +1096,11 @@ class Subscription( HydrusSerialisable.SerialisableBaseNamed ):
         return ( min_estimate, max_estimate )
         
     
+    def GetFileSeedCaches( self ):
+        
+        return [ query.GetFileSeedCache() for query in self._queries ]
+        
+    
     def GetGUGKeyAndName( self ):
         
         return self._gug_key_and_name
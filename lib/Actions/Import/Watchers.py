@@ -13,6 +13,7 @@ from . import HydrusData
 from . import HydrusExceptions
 from . import HydrusGlobals as HG
 from . import HydrusSerialisable
+from . import HydrusThreading
 import threading
 import time
 import wx
@@ -1323,6 +1324,9 @@ class WatcherImport( HydrusSerialisable.SerialisableBase ):
         self._files_repeating_job.SetThreadSlotType( 'watcher_files' )
         self._checker_repeating_job.SetThreadSlotType( 'watcher_check' )
         
+        self._files_repeating_job.SetThreadPoolPriority( HydrusThreading.THREAD_POOL_PRIORITY_IMPORT )
+        self._checker_repeating_job.SetThreadPoolPriority( HydrusThreading.THREAD_POOL_PRIORITY_IMPORT )
+        
     
     def REPEATINGWorkOnFiles( self ):
         
@@ -32,6 +32,8 @@ CHECKER_STATUS_404 = 2
 
 DID_SUBSTANTIAL_FILE_WORK_MINIMUM_SLEEP_TIME = 0.1
 
+PATH_IMPORT_BATCH_SIZE = 64
+
 REPEATING_JOB_TYPICAL_PERIOD = 30.0
 
 def ConvertAllParseResultsToFileSeeds( all_parse_results, source_url, file_import_options ):
@@ -4329,7 +4329,9 @@ class ManagementPanelQuery( ManagementPanel ):
                     
                     self._query_job_key = ClientThreading.JobKey()
                     
-                    self._controller.CallToThread( self.THREADDoQuery, self._controller, self._page_key, self._query_job_key, file_search_context )
+                    sort_by = self._sort_by.GetSort()
+                    
+                    self._controller.CallToThread( self.THREADDoQuery, self._controller, self._page_key, self._query_job_key, file_search_context, sort_by )
                     
                     panel = ClientGUIMedia.MediaPanelLoading( self._page, self._page_key, file_service_key )
                     
@@ -4448,7 +4450,7 @@ class ManagementPanelQuery( ManagementPanel ):
             
         
     
-    def ShowFinishedQuery( self, query_job_key, media_results ):
+    def ShowQueryResults( self, query_job_key, media_results ):
         
         if query_job_key == self._query_job_key:
             
@@ -4476,25 +4478,38 @@ class ManagementPanelQuery( ManagementPanel ):
             
         
     
-    def THREADDoQuery( self, controller, page_key, query_job_key, search_context ):
+    def THREADDoQuery( self, controller, page_key, query_job_key, search_context, sort_by ):
         
-        def wx_code():
+        def wx_code_show( media_results ):
             
-            query_job_key.Finish()
+            if not self:
+                
+                return
+                
+            
+            self.ShowQueryResults( query_job_key, media_results )
+            
+        
+        def wx_code_add( media_results ):
             
             if not self:
                 
                 return
                 
             
-            self.ShowFinishedQuery( query_job_key, media_results )
+            self.AddMediaResultsFromQuery( query_job_key, media_results )
+            
+        
+        def wx_code_finish():
+            
+            query_job_key.Finish()
             
         
         QUERY_CHUNK_SIZE = 256
         
         HG.client_controller.file_viewing_stats_manager.Flush()
         
-        query_hash_ids = controller.Read( 'file_query_ids', search_context, query_job_key )
+        query_hash_ids = controller.Read( 'file_query_ids', search_context, query_job_key, sort_by = sort_by )
         
         if query_job_key.IsCancelled():
             
@@ -4512,6 +4527,17 @@ class ManagementPanelQuery( ManagementPanel ):
             
             more_media_results = controller.Read( 'media_results_from_ids', sub_query_hash_ids )
             
+            # show the first chunk as soon as we have it and feed the rest in, rather than waiting on the whole query
+            
+            if len( media_results ) == 0:
+                
+                wx.CallAfter( wx_code_show, more_media_results )
+                
+            else:
+                
+                wx.CallAfter( wx_code_add, more_media_results )
+                
+            
             media_results.extend( more_media_results )
             
             controller.pub( 'set_num_query_results', page_key, len( media_results ), len( query_hash_ids ) )
@@ -4519,9 +4545,14 @@ class ManagementPanelQuery( ManagementPanel ):
             controller.WaitUntilViewFree()
             
         
+        if len( media_results ) == 0:
+            
+            wx.CallAfter( wx_code_show, media_results )
+            
+        
         search_context.SetComplete()
         
-        wx.CallAfter( wx_code )
+        wx.CallAfter( wx_code_finish )
         
     
     def REPEATINGPageUpdate( self ):
@@ -352,6 +352,7 @@ class Page( wx.SplitterWindow ):
         self._management_controller.SetKey( 'page', self._page_key )
         
         self._initialised = False
+        self._load_initial_media_results_when_shown = False
         
         self._pretty_status = ''
         
@@ -388,6 +389,13 @@ class Page( wx.SplitterWindow ):
         self._controller.sub( self, 'SetSplitterPositions', 'set_splitter_positions' )
         
     
+    def _LoadInitialMediaResults( self ):
+        
+        self._load_initial_media_results_when_shown = False
+        
+        self._controller.CallToThread( self.THREADLoadInitialMediaResults, self._controller, self._initial_hashes )
+        
+    
     def _SetPrettyStatus( self, status ):
         
         self._pretty_status = status
@@ -576,6 +584,11 @@ class Page( wx.SplitterWindow ):
     
     def PageShown( self ):
         
+        if self._load_initial_media_results_when_shown:
+            
+            self._LoadInitialMediaResults()
+            
+        
         self._management_panel.PageShown()
         self._media_panel.PageShown()
         
@@ -684,7 +697,16 @@ class Page( wx.SplitterWindow ):
         
         if self._initial_hashes is not None and len( self._initial_hashes ) > 0:
             
-            self._controller.CallToThread( self.THREADLoadInitialMediaResults, self._controller, self._initial_hashes )
+            if not self.IsImporter() and not self._controller.gui.IsCurrentPage( self._page_key ):
+                
+                # a big session may have many pages in the background, so we only load their files when they are first looked at
+                
+                self._load_initial_media_results_when_shown = True
+                
+            else:
+                
+                self._LoadInitialMediaResults()
+                
             
         else:
             
@@ -763,6 +785,11 @@ class Page( wx.SplitterWindow ):
     
     def REPEATINGPageUpdate( self ):
         
+        if self._load_initial_media_results_when_shown:
+            
+            self._LoadInitialMediaResults()
+            
+        
         self._management_panel.REPEATINGPageUpdate()
         
     
@@ -2838,7 +2865,7 @@ class GUISession( HydrusSerialisable.SerialisableBaseNamed ):
     
     SERIALISABLE_TYPE = HydrusSerialisable.SERIALISABLE_TYPE_GUI_SESSION
     SERIALISABLE_NAME = 'GUI Session'
-    SERIALISABLE_VERSION = 4
+    SERIALISABLE_VERSION = 5
     
     def __init__( self, name ):
         
@@ -2846,6 +2873,16 @@ class GUISession( HydrusSerialisable.SerialisableBaseNamed ):
         
         self._page_tuples = []
         
+        # when the db holds our hashes, pages are loaded with empty lists that it fills in afterwards
+        self._hashes_keys_to_unresolved_hash_lists = collections.defaultdict( list )
+        
+        self._serialise_by_reference = False
+        
+    
+    def _GetHashesKey( self, hashes ):
+        
+        return hashlib.sha256( b''.join( hashes ) ).digest()
+        
     
     def _GetPageTuple( self, page ):
         
@@ -2908,9 +2945,18 @@ class GUISession( HydrusSerialisable.SerialisableBaseNamed ):
                 
                 serialisable_management_controller = management_controller.GetSerialisableTuple()
                 
-                serialisable_hashes = [ hash.hex() for hash in hashes ]
+                serialisable_hashes_key = self._GetHashesKey( hashes ).hex()
                 
-                serialisable_page_data = ( serialisable_management_controller, serialisable_hashes )
+                if self._serialise_by_reference:
+                    
+                    serialisable_hashes = None
+                    
+                else:
+                    
+                    serialisable_hashes = [ hash.hex() for hash in hashes ]
+                    
+                
+                serialisable_page_data = ( serialisable_management_controller, serialisable_hashes_key, serialisable_hashes )
                 
             
             serialisable_tuple = ( page_type, serialisable_page_data )
@@ -2974,11 +3020,20 @@ class GUISession( HydrusSerialisable.SerialisableBaseNamed ):
                 
             elif page_type == 'page':
                 
-                ( serialisable_management_controller, serialisable_hashes ) = serialisable_page_data
+                ( serialisable_management_controller, serialisable_hashes_key, serialisable_hashes ) = serialisable_page_data
                 
                 management_controller = HydrusSerialisable.CreateFromSerialisableTuple( serialisable_management_controller )
                 
-                hashes = [ bytes.fromhex( hash ) for hash in serialisable_hashes ]
+                if serialisable_hashes is None:
+                    
+                    hashes = []
+                    
+                    self._hashes_keys_to_unresolved_hash_lists[ bytes.fromhex( serialisable_hashes_key ) ].append( hashes )
+                    
+                else:
+                    
+                    hashes = [ bytes.fromhex( hash ) for hash in serialisable_hashes ]
+                    
                 
                 page_data = ( management_controller, hashes )
                 
@@ -3074,6 +3129,35 @@ class GUISession( HydrusSerialisable.SerialisableBaseNamed ):
             return ( 4, new_serialisable_info )
             
         
+        if version == 4:
+            
+            def add_hashes_key( spt ):
+                
+                ( page_type, serialisable_page_data ) = spt
+                
+                if page_type == 'pages':
+                    
+                    ( name, pages_serialisable_page_tuples ) = serialisable_page_data
+                    
+                    pages_serialisable_page_tuples = [ add_hashes_key( pages_spt ) for pages_spt in pages_serialisable_page_tuples ]
+                    
+                    return ( 'pages', ( name, pages_serialisable_page_tuples ) )
+                    
+                else:
+                    
+                    ( serialisable_management_controller, serialisable_hashes ) = serialisable_page_data
+                    
+                    serialisable_hashes_key = self._GetHashesKey( [ bytes.fromhex( hash ) for hash in serialisable_hashes ] ).hex()
+                    
+                    return ( 'page', ( serialisable_management_controller, serialisable_hashes_key, serialisable_hashes ) )
+                    
+                
+            
+            new_serialisable_info = [ add_hashes_key( serialisable_page_tuple ) for serialisable_page_tuple in old_serialisable_info ]
+            
+            return ( 5, new_serialisable_info )
+            
+        
     
     def AddPageTuple( self, page ):
         
@@ -3082,9 +3166,57 @@ class GUISession( HydrusSerialisable.SerialisableBaseNamed ):
         self._page_tuples.append( page_tuple )
         
     
+    def GetHashesKeysToHashes( self ):
+        
+        hashes_keys_to_hashes = {}
+        
+        page_tuples = list( self._page_tuples )
+        
+        while len( page_tuples ) > 0:
+            
+            ( page_type, page_data ) = page_tuples.pop()
+            
+            if page_type == 'pages':
+                
+                ( name, subpage_tuples ) = page_data
+                
+                page_tuples.extend( subpage_tuples )
+                
+            elif page_type == 'page':
+                
+                ( management_controller, hashes ) = page_data
+                
+                hashes_keys_to_hashes[ self._GetHashesKey( hashes ) ] = hashes
+                
+            
+        
+        return hashes_keys_to_hashes
+        
+    
     def GetPageTuples( self ):
         
         return self._page_tuples
         
     
+    def GetUnresolvedHashesKeys( self ):
+        
+        return list( self._hashes_keys_to_unresolved_hash_lists.keys() )
+        
+    
+    def ResolveHashes( self, hashes_keys_to_hashes ):
+        
+        for ( hashes_key, hashes ) in hashes_keys_to_hashes.items():
+            
+            for unresolved_hash_list in self._hashes_keys_to_unresolved_hash_lists.pop( hashes_key, [] ):
+                
+                unresolved_hash_list.extend( hashes )
+                
+            
+        
+    
+    def SetSerialiseByReference( self, value ):
+        
+        self._serialise_by_reference = value
+        
+    
 HydrusSerialisable.SERIALISABLE_TYPES_TO_OBJECT_TYPES[ HydrusSerialisable.SERIALISABLE_TYPE_GUI_SESSION ] = GUISession
@@ -1709,6 +1709,9 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._show_new_on_file_seed_short_summary = wx.CheckBox( misc )
             self._show_deleted_on_file_seed_short_summary = wx.CheckBox( misc )
             
+            self._num_import_workers = wx.SpinCtrl( misc, min = 1, max = 64 )
+            self._num_import_workers.SetToolTip( 'Import folders and local file imports will hash, thumbnail and phash this many files at once. The actual imports still happen one at a time, in order.' )
+            
             self._subscription_network_error_delay = ClientGUITime.TimeDeltaButton( misc, min = 600, days = True, hours = True, minutes = True )
             self._subscription_other_error_delay = ClientGUITime.TimeDeltaButton( misc, min = 600, days = True, hours = True, minutes = True )
             self._downloader_network_error_delay = ClientGUITime.TimeDeltaButton( misc, min = 600, days = True, hours = True, minutes = True )
@@ -1742,6 +1745,7 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._stop_character.SetValue( self._new_options.GetString( 'stop_character' ) )
             self._show_new_on_file_seed_short_summary.SetValue( self._new_options.GetBoolean( 'show_new_on_file_seed_short_summary' ) )
             self._show_deleted_on_file_seed_short_summary.SetValue( self._new_options.GetBoolean( 'show_deleted_on_file_seed_short_summary' ) )
+            self._num_import_workers.SetValue( self._new_options.GetInteger( 'num_import_workers' ) )
             
             self._watcher_page_wait_period.SetValue( self._new_options.GetInteger( 'watcher_page_wait_period' ) )
             self._watcher_page_wait_period.SetToolTip( gallery_page_tt )
@@ -1797,6 +1801,7 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             rows.append( ( 'Stop character:', self._stop_character ) )
             rows.append( ( 'Show a \'N\' (for \'new\') count on short file import summaries:', self._show_new_on_file_seed_short_summary ) )
             rows.append( ( 'Show a \'D\' (for \'deleted\') count on short file import summaries:', self._show_deleted_on_file_seed_short_summary ) )
+            rows.append( ( 'Number of local files to prepare for import simultaneously:', self._num_import_workers ) )
             rows.append( ( 'Delay time on a gallery/watcher network error:', self._downloader_network_error_delay ) )
             rows.append( ( 'Delay time on a subscription network error:', self._subscription_network_error_delay ) )
             rows.append( ( 'Delay time on a subscription other error:', self._subscription_other_error_delay ) )
@@ -1839,6 +1844,7 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._new_options.SetString( 'stop_character', self._stop_character.GetValue() )
             self._new_options.SetBoolean( 'show_new_on_file_seed_short_summary', self._show_new_on_file_seed_short_summary.GetValue() )
             self._new_options.SetBoolean( 'show_deleted_on_file_seed_short_summary', self._show_deleted_on_file_seed_short_summary.GetValue() )
+            self._new_options.SetInteger( 'num_import_workers', self._num_import_workers.GetValue() )
             
             self._new_options.SetInteger( 'subscription_network_error_delay', self._subscription_network_error_delay.GetValue() )
             self._new_options.SetInteger( 'subscription_other_error_delay', self._subscription_other_error_delay.GetValue() )
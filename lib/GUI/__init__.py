@@ -1,4 +1,4 @@
-from . import HydrusConstants as HC, HydrusData, HydrusExceptions, HydrusPaths, HydrusGlobals as HG, HydrusNetwork, HydrusNetworking, HydrusSerialisable, HydrusTagArchive, HydrusVideoHandling
+from . import HydrusConstants as HC, HydrusData, HydrusExceptions, HydrusPaths, HydrusGlobals as HG, HydrusNetwork, HydrusNetworking, HydrusSerialisable, HydrusTagArchive, HydrusText, HydrusVideoHandling
 from . import ClientConstants as CC, ClientCaches, ClientData, ClientDragDrop, ClientExporting, ClientGUICommon, ClientGUIDialogs, ClientGUIDialogsManage, ClientGUIDialogsQuick, ClientGUIExport, ClientGUIFrames, ClientGUIImport, ClientGUILogin, ClientGUIManagement, ClientGUIMenus, ClientGUIPages, ClientGUIParsing, ClientGUIPopupMessages, ClientGUIPredicates, ClientGUIScrolledPanels, ClientGUIScrolledPanelsEdit, ClientGUIScrolledPanelsManagement, ClientGUIScrolledPanelsReview, ClientGUIShortcuts, ClientGUITags, ClientGUITopLevelWindows, ClientDownloading, ClientMedia, ClientNetworkingContexts, ClientNetworkingJobs, ClientParsing, ClientPaths, ClientRendering, ClientSearch, ClientServices, ClientTags, ClientThreading
 import collections, cv2, gc, hashlib, os, PIL, re, sqlite3, ssl, subprocess, sys, threading, time, traceback, types, wx, wx.adv
 
@@ -635,7 +635,15 @@ class FrameGUI( ClientGUITopLevelWindows.FrameThatResizes ):
         
         text = action + ' backup at "' + path + '"?'
         text += os.linesep * 2
-        text += 'The database will be locked while the backup occurs, which may lock up your gui as well.'
+        
+        if HG.no_wal:
+            
+            text += 'The database will be locked while the backup occurs, which may lock up your gui as well.'
+            
+        else:
+            
+            text += 'The client will keep working while the backup occurs, but it may be a little slower until it is done.'
+            
         
         with ClientGUIDialogs.DialogYesNo( self, text ) as dlg_yn:
             
@@ -683,7 +691,7 @@ class FrameGUI( ClientGUITopLevelWindows.FrameThatResizes ):
             HydrusData.ShowText( 'Server backup done in ' + HydrusData.TimeDeltaToPrettyTimeDelta( it_took ) + '!' )
             
         
-        message = 'This will tell the server to lock and copy its database files. It will probably take a few minutes to complete, during which time it will not be able to serve any requests.'
+        message = 'This will tell the server to copy its database files. It will probably take a few minutes to complete. Unless the server is running in no-wal mode, it will keep serving requests while it does so.'
         
         with ClientGUIDialogs.DialogYesNo( self, message, yes_label = 'do it', no_label = 'forget it' ) as dlg:
             
@@ -932,6 +940,103 @@ class FrameGUI( ClientGUITopLevelWindows.FrameThatResizes ):
             
         
     
+    def _DebugBenchmarkHTMLParsing( self ):
+        
+        def do_it( controller ):
+            
+            from . import ClientDefaults
+            from . import ClientNetworkingJobs
+            
+            job_key = ClientThreading.JobKey( cancellable = True )
+            
+            job_key.SetVariable( 'popup_title', 'benchmarking html parsing' )
+            
+            controller.pub( 'message', job_key )
+            
+            parsers = [ parser for parser in ClientDefaults.GetDefaultParsers() if len( parser.GetExampleURLs() ) > 0 ]
+            
+            parsers.sort( key = lambda p: p.GetName() )
+            
+            lines = []
+            
+            total_lxml_time = 0.0
+            total_bs4_time = 0.0
+            
+            try:
+                
+                for ( i, parser ) in enumerate( parsers ):
+                    
+                    if job_key.IsCancelled():
+                        
+                        break
+                        
+                    
+                    name = parser.GetName()
+                    
+                    job_key.SetVariable( 'popup_text_1', name )
+                    job_key.SetVariable( 'popup_gauge_1', ( i, len( parsers ) ) )
+                    
+                    url = parser.GetExampleURLs()[0]
+                    
+                    network_job = ClientNetworkingJobs.NetworkJob( 'GET', url )
+                    
+                    controller.network_engine.AddJob( network_job )
+                    
+                    try:
+                        
+                        network_job.WaitUntilDone()
+                        
+                        parsing_text = network_job.GetContentText()
+                        
+                    except Exception as e:
+                        
+                        lines.append( name + ': could not fetch example url: ' + str( e ) )
+                        
+                        continue
+                        
+                    
+                    if not HydrusText.LooksLikeHTML( parsing_text ):
+                        
+                        continue
+                        
+                    
+                    try:
+                        
+                        ( lxml_time, bs4_time, results_match ) = ClientParsing.BenchmarkHTMLParsingEngines( parser, parsing_text )
+                        
+                    except HydrusExceptions.ParseException as e:
+                        
+                        lines.append( name + ': could not parse: ' + str( e ) )
+                        
+                        continue
+                        
+                    
+                    total_lxml_time += lxml_time
+                    total_bs4_time += bs4_time
+                    
+                    line = name + ': lxml ' + HydrusData.TimeDeltaToPrettyTimeDelta( lxml_time ) + ', bs4 ' + HydrusData.TimeDeltaToPrettyTimeDelta( bs4_time )
+                    
+                    if not results_match:
+                        
+                        line += ' - RESULTS DIFFER'
+                        
+                    
+                    lines.append( line )
+                    
+                
+                lines.append( 'total: lxml ' + HydrusData.TimeDeltaToPrettyTimeDelta( total_lxml_time ) + ', bs4 ' + HydrusData.TimeDeltaToPrettyTimeDelta( total_bs4_time ) )
+                
+                HydrusData.ShowText( os.linesep.join( lines ) )
+                
+            finally:
+                
+                job_key.Delete()
+                
+            
+        
+        self._controller.CallToThread( do_it, self._controller )
+        
+    
     def _DebugFetchAURL( self ):
         
         def wx_code( network_job ):
@@ -1182,6 +1287,11 @@ class FrameGUI( ClientGUITopLevelWindows.FrameThatResizes ):
         HydrusData.DebugPrint( 'garbage printing finished' )
         
     
+    def _DebugShowCacheStats( self ):
+        
+        self._controller.DebugShowCacheStats()
+        
+    
     def _DebugShowScheduledJobs( self ):
         
         self._controller.DebugShowScheduledJobs()
@@ -2127,6 +2237,7 @@ class FrameGUI( ClientGUITopLevelWindows.FrameThatResizes ):
             ClientGUIMenus.AppendMenuCheckItem( self, debug_modes, 'force idle mode', 'Make the client consider itself idle and fire all maintenance routines right now. This may hang the gui for a while.', HG.force_idle_mode, self._SwitchBoolean, 'force_idle_mode' )
             ClientGUIMenus.AppendMenuCheckItem( self, debug_modes, 'no page limit mode', 'Let the user create as many pages as they want with no warnings or prohibitions.', HG.no_page_limit_mode, self._SwitchBoolean, 'no_page_limit_mode' )
             ClientGUIMenus.AppendMenuCheckItem( self, debug_modes, 'thumbnail debug mode', 'Show some thumbnail debug info.', HG.thumbnail_debug_mode, self._SwitchBoolean, 'thumbnail_debug_mode' )
+            ClientGUIMenus.AppendMenuCheckItem( self, debug_modes, 'bs4 html parsing mode', 'Parse html with the old bs4 engine instead of lxml, in case a parser gives different results.', HG.bs4_html_parsing_mode, self._SwitchBoolean, 'bs4_html_parsing_mode' )
             ClientGUIMenus.AppendMenuItem( self, debug_modes, 'simulate a wake from sleep', 'Tell the controller to pretend that it just woke up from sleep.', self._controller.SimulateWakeFromSleepEvent )
             
             ClientGUIMenus.AppendMenu( debug, debug_modes, 'debug modes' )
@@ -2177,6 +2288,7 @@ class FrameGUI( ClientGUITopLevelWindows.FrameThatResizes ):
             ClientGUIMenus.AppendMenuItem( self, data_actions, 'run fast memory maintenance', 'Tell all the fast caches to maintain themselves.', self._controller.MaintainMemoryFast )
             ClientGUIMenus.AppendMenuItem( self, data_actions, 'run slow memory maintenance', 'Tell all the slow caches to maintain themselves.', self._controller.MaintainMemorySlow )
             ClientGUIMenus.AppendMenuItem( self, data_actions, 'review threads', 'Show current threads and what they are doing.', self._ReviewThreads )
+            ClientGUIMenus.AppendMenuItem( self, data_actions, 'show cache stats', 'Print the size, hit rate and eviction counts of the image and thumbnail caches.', self._DebugShowCacheStats )
             ClientGUIMenus.AppendMenuItem( self, data_actions, 'show scheduled jobs', 'Print some information about the currently scheduled jobs log.', self._DebugShowScheduledJobs )
             ClientGUIMenus.AppendMenuItem( self, data_actions, 'flush log', 'Command the log to write any buffered contents to hard drive.', HydrusData.DebugPrint, 'Flushing log' )
             ClientGUIMenus.AppendMenuItem( self, data_actions, 'print garbage', 'Print some information about the python garbage to the log.', self._DebugPrintGarbage )
@@ -2189,6 +2301,7 @@ class FrameGUI( ClientGUITopLevelWindows.FrameThatResizes ):
             
             network_actions = wx.Menu()
             
+            ClientGUIMenus.AppendMenuItem( self, network_actions, 'benchmark html parsing', 'Fetch the example urls of the default parsers and time how long the lxml and bs4 html engines take to parse them.', self._DebugBenchmarkHTMLParsing )
             ClientGUIMenus.AppendMenuItem( self, network_actions, 'fetch a url', 'Fetch a URL using the network engine as per normal.', self._DebugFetchAURL )
             
             ClientGUIMenus.AppendMenu( debug, network_actions, 'network actions' )
@@ -3073,6 +3186,13 @@ class FrameGUI( ClientGUITopLevelWindows.FrameThatResizes ):
                         
                         subscription = HG.client_controller.Read( 'serialisable_named', HydrusSerialisable.SERIALISABLE_TYPE_SUBSCRIPTION, name )
                         
+                        # the dialog shows, copies and merges file seeds, and the ui thread cannot wait on the db for them
+                        
+                        for file_seed_cache in subscription.GetFileSeedCaches():
+                            
+                            file_seed_cache.LoadFileSeeds()
+                            
+                        
                         subscriptions.append( subscription )
                         
                     
@@ -3860,7 +3980,11 @@ The password is cleartext here but obscured in the entry dialog. Enter a blank p
     
     def _SwitchBoolean( self, name ):
         
-        if name == 'callto_report_mode':
+        if name == 'bs4_html_parsing_mode':
+            
+            HG.bs4_html_parsing_mode = not HG.bs4_html_parsing_mode
+            
+        elif name == 'callto_report_mode':
             
             HG.callto_report_mode = not HG.callto_report_mode
             
@@ -4023,11 +4147,6 @@ The password is cleartext here but obscured in the entry dialog. Enter a blank p
     
     def _THREADSyncToTagArchive( self, hta_path, tag_service_key, file_service_key, adding, namespaces, hashes = None ):
         
-        if hashes is not None:
-            
-            hashes = set( hashes )
-            
-        
         job_key = ClientThreading.JobKey( pausable = True, cancellable = True )
         
         try:
@@ -4037,95 +4156,28 @@ The password is cleartext here but obscured in the entry dialog. Enter a blank p
             job_key.SetVariable( 'popup_title', 'syncing to tag archive ' + hta.GetName() )
             job_key.SetVariable( 'popup_text_1', 'preparing' )
             
-            self._controller.pub( 'message', job_key )
-            
-            hydrus_hashes = []
-            
-            hash_type = hta.GetHashType()
+            del hta
             
-            total_num_hta_hashes = 0
+            self._controller.pub( 'message', job_key )
             
-            for chunk_of_hta_hashes in HydrusData.SplitIteratorIntoChunks( hta.IterateHashes(), 1000 ):
-                
-                while job_key.IsPaused() or job_key.IsCancelled():
-                    
-                    time.sleep( 0.1 )
-                    
-                    if job_key.IsCancelled():
-                        
-                        job_key.SetVariable( 'popup_text_1', 'cancelled' )
-                        
-                        HydrusData.Print( job_key.ToString() )
-                        
-                        return
-                        
-                    
-                
-                if hash_type == HydrusTagArchive.HASH_TYPE_SHA256:
-                    
-                    chunk_of_hydrus_hashes = chunk_of_hta_hashes
-                    
-                else:
-                    
-                    if hash_type == HydrusTagArchive.HASH_TYPE_MD5: given_hash_type = 'md5'
-                    elif hash_type == HydrusTagArchive.HASH_TYPE_SHA1: given_hash_type = 'sha1'
-                    elif hash_type == HydrusTagArchive.HASH_TYPE_SHA512: given_hash_type = 'sha512'
-                    
-                    chunk_of_hydrus_hashes = self._controller.Read( 'file_hashes', chunk_of_hta_hashes, given_hash_type, 'sha256' )
-                    
-                
-                if file_service_key != CC.COMBINED_FILE_SERVICE_KEY:
-                    
-                    chunk_of_hydrus_hashes = self._controller.Read( 'filter_hashes', chunk_of_hydrus_hashes, file_service_key )
-                    
-                
-                if hashes is not None:
-                    
-                    chunk_of_hydrus_hashes = [ hash for hash in chunk_of_hydrus_hashes if hash in hashes ]
-                    
-                
-                hydrus_hashes.extend( chunk_of_hydrus_hashes )
-                
-                total_num_hta_hashes += len( chunk_of_hta_hashes )
-                
-                job_key.SetVariable( 'popup_text_1', 'matched ' + HydrusData.ConvertValueRangeToPrettyString( len( hydrus_hashes ), total_num_hta_hashes ) + ' files' )
-                
-                HG.client_controller.WaitUntilViewFree()
-                
+            # the db attaches the archive and does the whole sync in one job, checking the job_key for pause and cancel as it goes
             
-            del hta
+            self._controller.WriteSynchronous( 'sync_to_tag_archive', hta_path, tag_service_key, file_service_key, adding, namespaces, hashes = hashes, job_key = job_key )
             
-            total_num_processed = 0
+            job_key.DeleteVariable( 'popup_gauge_1' )
+            job_key.DeleteVariable( 'popup_text_2' )
             
-            for chunk_of_hydrus_hashes in HydrusData.SplitListIntoChunks( hydrus_hashes, 50 ):
-        
-                while job_key.IsPaused() or job_key.IsCancelled():
-                    
-                    time.sleep( 0.1 )
-                    
-                    if job_key.IsCancelled():
-                        
-                        job_key.SetVariable( 'popup_text_1', 'cancelled' )
-                        
-                        HydrusData.Print( job_key.ToString() )
-                        
-                        return
-                        
-                    
+            if job_key.IsCancelled():
                 
-                self._controller.WriteSynchronous( 'sync_hashes_to_tag_archive', chunk_of_hydrus_hashes, hta_path, tag_service_key, adding, namespaces )
+                job_key.SetVariable( 'popup_text_1', 'cancelled' )
                 
-                total_num_processed += len( chunk_of_hydrus_hashes )
+                HydrusData.Print( job_key.ToString() )
                 
-                job_key.SetVariable( 'popup_text_1', 'synced ' + HydrusData.ConvertValueRangeToPrettyString( total_num_processed, len( hydrus_hashes ) ) + ' files' )
-                job_key.SetVariable( 'popup_gauge_1', ( total_num_processed, len( hydrus_hashes ) ) )
+            else:
                 
-                HG.client_controller.WaitUntilViewFree()
+                job_key.SetVariable( 'popup_text_1', 'done!' )
                 
             
-            job_key.DeleteVariable( 'popup_gauge_1' )
-            job_key.SetVariable( 'popup_text_1', 'done!' )
-            
             job_key.Finish()
             
         except Exception as e:
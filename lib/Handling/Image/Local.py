@@ -136,6 +136,10 @@ def GenerateShapePerceptualHashes( path, mime ):
     
     numpy_image = GenerateNumpyImage( path, mime )
     
+    return GenerateShapePerceptualHashesFromNumpyImage( numpy_image )
+    
+def GenerateShapePerceptualHashesFromNumpyImage( numpy_image ):
+    
     ( y, x, depth ) = numpy_image.shape
     
     if depth == 4:
@@ -285,6 +289,12 @@ def GenerateBytesFromCV( numpy_image, mime ):
         raise HydrusExceptions.CantRenderWithCVException( 'Thumb failed to encode!' )
         
     
+def GenerateThumbnailBytesFromNumpyImage( numpy_image, bounding_dimensions, mime ):
+    
+    thumbnail_numpy_image = ThumbnailNumpyImage( numpy_image, bounding_dimensions )
+    
+    return GenerateBytesFromCV( thumbnail_numpy_image, mime )
+    
 def GenerateThumbnailBytesFromStaticImagePathCV( path, bounding_dimensions, mime ):
     
     if mime == HC.IMAGE_GIF:
@@ -294,13 +304,9 @@ def GenerateThumbnailBytesFromStaticImagePathCV( path, bounding_dimensions, mime
     
     numpy_image = GenerateNumpyImage( path, mime )
     
-    thumbnail_numpy_image = ThumbnailNumpyImage( numpy_image, bounding_dimensions )
-    
     try:
         
-        thumbnail_bytes = GenerateBytesFromCV( thumbnail_numpy_image, mime )
-        
-        return thumbnail_bytes
+        return GenerateThumbnailBytesFromNumpyImage( numpy_image, bounding_dimensions, mime )
         
     except HydrusExceptions.CantRenderWithCVException:
         
@@ -66,6 +66,10 @@ def ConvertToPngIfBmp( path ):
             HydrusPaths.CleanUpTempPath( os_file_handle, temp_path )
             
         
+        return True
+        
+    
+    return False
     
 def Dequantize( pil_image ):
     
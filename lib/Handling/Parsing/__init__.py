@@ -18,6 +18,7 @@ import re
 import threading
 import time
 import urllib.parse
+import xml.sax.saxutils
 
 try:
     
@@ -32,6 +33,8 @@ except ImportError:
 try:
     
     import lxml
+    import lxml.etree
+    import lxml.html
     
     LXML_IS_OK = True
     
@@ -39,6 +42,50 @@ except ImportError:
     
     LXML_IS_OK = False
     
+HTML_VOID_ELEMENTS = { 'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen', 'link', 'meta', 'param', 'source', 'track', 'wbr' }
+HTML_RAW_TEXT_ELEMENTS = { 'script', 'style' }
+
+LXML_UNKNOWN_VOID_ELEMENTS = ( 'embed', 'keygen', 'source', 'track', 'wbr' )
+
+HTML_PARSING_ENGINE_BS4 = 0
+HTML_PARSING_ENGINE_LXML = 1
+
+def BenchmarkHTMLParsingEngines( parser, parsing_text, num_runs = 5 ):
+    
+    from . import ClientCaches
+    
+    # parses with the lxml engine and then the bs4 engine
+    # each run gets its own fresh cache, so tree construction is timed too and the shared cache is left alone
+    
+    engine_results = []
+    
+    for html_parsing_engine in ( HTML_PARSING_ENGINE_LXML, HTML_PARSING_ENGINE_BS4 ):
+        
+        total_time = 0.0
+        
+        for i in range( num_runs ):
+            
+            parsing_context = dict( parser.GetExampleParsingContext() )
+            
+            parsing_context[ 'html_parsing_engine' ] = html_parsing_engine
+            parsing_context[ 'parsing_cache' ] = ClientCaches.ParsingCache()
+            
+            started = HydrusData.GetNowPrecise()
+            
+            results = parser.Parse( parsing_context, parsing_text )
+            
+            total_time += HydrusData.GetNowPrecise() - started
+            
+        
+        engine_results.append( ( total_time / num_runs, results ) )
+        
+    
+    ( ( lxml_time, lxml_results ), ( bs4_time, bs4_results ) ) = engine_results
+    
+    results_match = lxml_results == bs4_results
+    
+    return ( lxml_time, bs4_time, results_match )
+    
 def ConvertParseResultToPrettyString( result ):
     
     ( ( name, content_type, additional_info ), parsed_text ) = result
@@ -273,6 +320,17 @@ def GetHTMLTagString( tag ):
     
     return result
     
+def GetDefaultHTMLParsingEngine():
+    
+    if LXML_IS_OK and not HG.bs4_html_parsing_mode:
+        
+        return HTML_PARSING_ENGINE_LXML
+        
+    else:
+        
+        return HTML_PARSING_ENGINE_BS4
+        
+    
 def GetNamespacesFromParsableContent( parsable_content ):
     
     content_type_to_additional_infos = HydrusData.BuildKeyToSetDict( ( ( content_type, additional_infos ) for ( name, content_type, additional_infos ) in parsable_content ) )
@@ -300,6 +358,186 @@ def GetSoup( html ):
     
     return bs4.BeautifulSoup( html, parser )
     
+def GetLXMLTagHTML( tag ):
+    
+    # lxml's html serialiser percent-encodes href and src attributes, which would change what any sub-parser sees, so we write it out ourselves
+    # the output copies str() of the equivalent bs4 tag, so a formula gets the same html whichever engine parsed it
+    
+    def quote_attribute( value ):
+        
+        value = xml.sax.saxutils.escape( value )
+        
+        if '"' not in value:
+            
+            return '"' + value + '"'
+            
+        elif "'" not in value:
+            
+            return "'" + value + "'"
+            
+        else:
+            
+            return '"' + value.replace( '"', '&quot;' ) + '"'
+            
+        
+    
+    def escape_text( parent, text ):
+        
+        if parent.tag in HTML_RAW_TEXT_ELEMENTS:
+            
+            return text
+            
+        else:
+            
+            return xml.sax.saxutils.escape( text )
+            
+        
+    
+    chunks = []
+    
+    for ( event, element ) in lxml.etree.iterwalk( tag, events = ( 'start', 'end', 'comment', 'pi' ) ):
+        
+        if event == 'start':
+            
+            # bs4 splits multi-valued attributes up and joins them back with single spaces
+            
+            items = [ ( key, ' '.join( value.split() ) if IsMultiValuedHTMLAttribute( element.tag, key ) else value ) for ( key, value ) in element.items() ]
+            
+            if HTML5LIB_IS_OK:
+                
+                # bs4's html5lib builder hands back attributes in sorted order
+                
+                items = sorted( items )
+                
+            
+            attributes = ''.join( ( ' ' + key + '=' + quote_attribute( value ) for ( key, value ) in items ) )
+            
+            if element.tag in HTML_VOID_ELEMENTS:
+                
+                chunks.append( '<' + element.tag + attributes + '/>' )
+                
+            else:
+                
+                chunks.append( '<' + element.tag + attributes + '>' )
+                
+            
+            if element.text is not None:
+                
+                chunks.append( escape_text( element, element.text ) )
+                
+            
+            continue
+            
+        
+        if event == 'end':
+            
+            if element.tag not in HTML_VOID_ELEMENTS:
+                
+                chunks.append( '</' + element.tag + '>' )
+                
+            
+        else:
+            
+            chunks.append( '<!--' + ( element.text or '' ) + '-->' )
+            
+        
+        if element is not tag and element.tail is not None:
+            
+            chunks.append( escape_text( element.getparent(), element.tail ) )
+            
+        
+    
+    return ''.join( chunks )
+    
+def GetLXMLTagString( tag ):
+    
+    all_strings = [ s for s in tag.itertext() if len( s ) > 0 ]
+    
+    if len( all_strings ) == 0:
+        
+        result = ''
+        
+    else:
+        
+        result = str( all_strings[0] )
+        
+    
+    return result
+    
+def GetLXMLTree( html ):
+    
+    if not LXML_IS_OK:
+        
+        raise HydrusExceptions.ParseException( 'This client does not have access to lxml!' )
+        
+    
+    root = lxml.html.document_fromstring( html )
+    
+    # libxml2 builds a slightly different tree to html5lib, so we patch up the differences parsers are most likely to trip on
+    
+    # html5lib wraps bare table rows in an implied <tbody>
+    
+    for table in list( root.iter( 'table' ) ):
+        
+        tbody = None
+        
+        for child in list( table ):
+            
+            if child.tag == 'tr':
+                
+                if tbody is None:
+                    
+                    tbody = lxml.etree.Element( 'tbody' )
+                    
+                    child.addprevious( tbody )
+                    
+                
+                tbody.append( child )
+                
+            elif child.tag == lxml.etree.Comment and tbody is not None:
+                
+                tbody.append( child )
+                
+            else:
+                
+                tbody = None
+                
+            
+        
+    
+    # libxml2 does not know some html5 void elements, and swallows everything after them as children
+    
+    for void_element in list( root.iter( *LXML_UNKNOWN_VOID_ELEMENTS ) ):
+        
+        children = list( void_element )
+        
+        if len( children ) == 0 and void_element.text is None:
+            
+            continue
+            
+        
+        original_tail = void_element.tail
+        
+        void_element.tail = void_element.text
+        void_element.text = None
+        
+        previous = void_element
+        
+        for child in children:
+            
+            previous.addnext( child )
+            
+            previous = child
+            
+        
+        if original_tail is not None:
+            
+            previous.tail = ( previous.tail or '' ) + original_tail
+            
+        
+    
+    return root
+    
 def GetTagsFromParseResults( results ):
     
     tag_results = []
@@ -810,6 +1048,9 @@ class ParseFormulaHTML( ParseFormula ):
         
         self._attribute_to_fetch = attribute_to_fetch
         
+        self._xpaths_compiled = False
+        self._xpaths = None
+        
     
     def _FindHTMLTags( self, root ):
         
@@ -823,6 +1064,47 @@ class ParseFormulaHTML( ParseFormula ):
         return tags
         
     
+    def _FindLXMLTags( self, root, xpaths ):
+        
+        tags = ( root, )
+        
+        for ( tag_rule, xpath ) in zip( self._tag_rules, xpaths ):
+            
+            tags = list( tag_rule.GetLXMLNodes( tags, xpath ) )
+            
+        
+        return tags
+        
+    
+    def _GetCompiledXPaths( self ):
+        
+        # we compile once per formula object. None means at least one rule needs bs4
+        
+        if not self._xpaths_compiled:
+            
+            xpaths = []
+            
+            for ( i, tag_rule ) in enumerate( self._tag_rules ):
+                
+                xpath = tag_rule.CompileXPath( from_document_root = i == 0 )
+                
+                if xpath is None:
+                    
+                    xpaths = None
+                    
+                    break
+                    
+                
+                xpaths.append( xpath )
+                
+            
+            self._xpaths = xpaths
+            self._xpaths_compiled = True
+            
+        
+        return self._xpaths
+        
+    
     def _GetParsePrettySeparator( self ):
         
         if self._content_to_fetch == HTML_CONTENT_HTML:
@@ -886,7 +1168,46 @@ class ParseFormulaHTML( ParseFormula ):
         return result
         
     
-    def _GetRawTextsFromTags( self, tags ):
+    def _GetRawTextFromLXMLTag( self, tag ):
+        
+        if self._content_to_fetch == HTML_CONTENT_ATTRIBUTE:
+            
+            result = tag.get( self._attribute_to_fetch )
+            
+            if result is None:
+                
+                raise HydrusExceptions.ParseException( 'Attribute ' + self._attribute_to_fetch + ' not found!' )
+                
+            
+            # bs4 splits these into a list, which we then join back up
+            if IsMultiValuedHTMLAttribute( tag.tag, self._attribute_to_fetch ):
+                
+                result = ' '.join( result.split() )
+                
+            
+        elif self._content_to_fetch == HTML_CONTENT_STRING:
+            
+            result = GetLXMLTagString( tag )
+            
+        elif self._content_to_fetch == HTML_CONTENT_HTML:
+            
+            result = GetLXMLTagHTML( tag )
+            
+        
+        if result is None or result == '':
+            
+            raise HydrusExceptions.ParseException( 'Empty/No results found!' )
+            
+        
+        return result
+        
+    
+    def _GetRawTextsFromTags( self, tags, raw_text_getter = None ):
+        
+        if raw_text_getter is None:
+            
+            raw_text_getter = self._GetRawTextFromTag
+            
         
         raw_texts = []
         
@@ -894,7 +1215,7 @@ class ParseFormulaHTML( ParseFormula ):
             
             try:
                 
-                raw_text = self._GetRawTextFromTag( tag )
+                raw_text = raw_text_getter( tag )
                 
                 raw_texts.append( raw_text )
                 
@@ -926,12 +1247,47 @@ class ParseFormulaHTML( ParseFormula ):
         self._string_match = HydrusSerialisable.CreateFromSerialisableTuple( serialisable_string_match )
         self._string_converter = HydrusSerialisable.CreateFromSerialisableTuple( serialisable_string_converter )
         
+        self._xpaths_compiled = False
+        self._xpaths = None
+        
     
     def _ParseRawTexts( self, parsing_context, parsing_text ):
         
+        # the parsing context may ask for an engine or a cache, which the benchmark and tests use to compare the engines
+        # otherwise we use lxml where we can and fall back to bs4 for whatever it cannot do
+        
+        html_parsing_engine = parsing_context.get( 'html_parsing_engine', GetDefaultHTMLParsingEngine() )
+        parsing_cache = parsing_context.get( 'parsing_cache', HG.client_controller.parsing_cache )
+        
+        if LXML_IS_OK and html_parsing_engine == HTML_PARSING_ENGINE_LXML:
+            
+            xpaths = self._GetCompiledXPaths()
+            
+            if xpaths is not None:
+                
+                try:
+                    
+                    root = parsing_cache.GetLXMLTree( parsing_text )
+                    
+                except:
+                    
+                    root = None # lxml could not handle it, so let bs4 have a go
+                    
+                
+                if root is not None:
+                    
+                    tags = self._FindLXMLTags( root, xpaths )
+                    
+                    raw_texts = self._GetRawTextsFromTags( tags, raw_text_getter = self._GetRawTextFromLXMLTag )
+                    
+                    return raw_texts
+                    
+                
+            
+        
         try:
             
-            root = HG.client_controller.parsing_cache.GetSoup( parsing_text )
+            root = parsing_cache.GetSoup( parsing_text )
             
         except Exception as e:
             
@@ -1102,6 +1458,56 @@ HydrusSerialisable.SERIALISABLE_TYPES_TO_OBJECT_TYPES[ HydrusSerialisable.SERIAL
 HTML_RULE_TYPE_DESCENDING = 0
 HTML_RULE_TYPE_ASCENDING = 1
 
+# these are the attributes bs4 treats as whitespace-separated lists of values, which changes how it matches and returns them
+HTML_MULTI_VALUED_ATTRIBUTES = {}
+
+HTML_MULTI_VALUED_ATTRIBUTES[ '*' ] = { 'class', 'accesskey', 'dropzone' }
+HTML_MULTI_VALUED_ATTRIBUTES[ 'a' ] = { 'rel', 'rev' }
+HTML_MULTI_VALUED_ATTRIBUTES[ 'link' ] = { 'rel', 'rev' }
+HTML_MULTI_VALUED_ATTRIBUTES[ 'td' ] = { 'headers' }
+HTML_MULTI_VALUED_ATTRIBUTES[ 'th' ] = { 'headers' }
+HTML_MULTI_VALUED_ATTRIBUTES[ 'form' ] = { 'accept-charset' }
+HTML_MULTI_VALUED_ATTRIBUTES[ 'object' ] = { 'archive' }
+HTML_MULTI_VALUED_ATTRIBUTES[ 'area' ] = { 'rel' }
+HTML_MULTI_VALUED_ATTRIBUTES[ 'icon' ] = { 'sizes' }
+HTML_MULTI_VALUED_ATTRIBUTES[ 'iframe' ] = { 'sandbox' }
+HTML_MULTI_VALUED_ATTRIBUTES[ 'output' ] = { 'for' }
+
+HTML_XPATH_NAME_RE = re.compile( r'^[A-Za-z_][A-Za-z0-9_\-\.]*$' )
+
+def ConvertToXPathLiteral( text ):
+    
+    if '"' not in text:
+        
+        return '"' + text + '"'
+        
+    elif "'" not in text:
+        
+        return "'" + text + "'"
+        
+    else:
+        
+        return None
+        
+    
+def IsMultiValuedHTMLAttribute( tag_name, attribute ):
+    
+    # a tag_name of None means any tag
+    
+    for ( multi_valued_tag_name, attributes ) in HTML_MULTI_VALUED_ATTRIBUTES.items():
+        
+        if tag_name is None or multi_valued_tag_name in ( '*', tag_name ):
+            
+            if attribute in attributes:
+                
+                return True
+                
+            
+        
+    
+    return False
+    
+
 class ParseRuleHTML( HydrusSerialisable.SerialisableBase ):
     
     SERIALISABLE_TYPE = HydrusSerialisable.SERIALISABLE_TYPE_PARSE_RULE_HTML
@@ -1184,6 +1590,132 @@ class ParseRuleHTML( HydrusSerialisable.SerialisableBase ):
             
         
     
+    def CompileXPath( self, from_document_root = False ):
+        
+        # returns an lxml XPath that finds the same nodes as GetNodes, or None if we can't express this rule safely
+        
+        if not LXML_IS_OK:
+            
+            return None
+            
+        
+        if self._tag_name is None:
+            
+            name = '*'
+            
+        elif HTML_XPATH_NAME_RE.match( self._tag_name ) is not None:
+            
+            name = self._tag_name
+            
+        else:
+            
+            return None
+            
+        
+        if self._rule_type == HTML_RULE_TYPE_DESCENDING:
+            
+            # bs4 searches the document object, which sits above <html>
+            if from_document_root:
+                
+                axis = 'descendant-or-self'
+                
+            else:
+                
+                axis = 'descendant'
+                
+            
+            predicates = []
+            
+            for ( key, value ) in self._tag_attributes.items():
+                
+                if not isinstance( key, str ) or not isinstance( value, str ) or value == '' or HTML_XPATH_NAME_RE.match( key ) is None:
+                    
+                    return None
+                    
+                
+                literal = ConvertToXPathLiteral( value )
+                
+                if literal is None:
+                    
+                    return None
+                    
+                
+                if IsMultiValuedHTMLAttribute( self._tag_name, key ):
+                    
+                    if self._tag_name is None and key not in HTML_MULTI_VALUED_ATTRIBUTES[ '*' ]:
+                        
+                        return None # whether bs4 splits this one up depends on the tag
+                        
+                    
+                    # bs4 matches against any single value or the whole list
+                    
+                    predicate = 'normalize-space( @' + key + ' ) = ' + literal
+                    
+                    if len( value.split() ) == 1:
+                        
+                        predicate += ' or contains( concat( " ", normalize-space( @' + key + ' ), " " ), concat( " ", ' + literal + ', " " ) )'
+                        
+                    
+                else:
+                    
+                    predicate = '@' + key + ' = ' + literal
+                    
+                
+                predicates.append( '[' + predicate + ']' )
+                
+            
+            xpath = axis + '::' + name + ''.join( predicates )
+            
+        elif self._rule_type == HTML_RULE_TYPE_ASCENDING:
+            
+            xpath = 'ancestor::' + name + '[' + str( int( self._tag_depth ) ) + ']'
+            
+        else:
+            
+            return None
+            
+        
+        try:
+            
+            return lxml.etree.XPath( xpath )
+            
+        except lxml.etree.XPathError:
+            
+            return None
+            
+        
+    
+    def GetLXMLNodes( self, nodes, xpath ):
+        
+        new_nodes = []
+        
+        for node in nodes:
+            
+            found_nodes = xpath( node )
+            
+            if self._rule_type == HTML_RULE_TYPE_DESCENDING and self._tag_index is not None:
+                
+                if len( found_nodes ) < self._tag_index + 1:
+                    
+                    found_nodes = []
+                    
+                else:
+                    
+                    found_nodes = [ found_nodes[ self._tag_index ] ]
+                    
+                
+            
+            new_nodes.extend( found_nodes )
+            
+        
+        if self._should_test_tag_string:
+            
+            new_nodes = [ node for node in new_nodes if self._tag_string_string_match.Matches( GetLXMLTagString( node ) ) ]
+            
+        
+        return new_nodes
+        
+    
     def GetNodes( self, nodes ):
         
         new_nodes = []
@@ -53,6 +53,39 @@ header_and_mime = [
     ( 0, b'\x30\x26\xB2\x75\x8E\x66\xCF\x11\xA6\xD9\x00\xAA\x00\x62\xCE\x6C', HC.UNDETERMINED_WM )
     ]
 
+class FileHashingStream( object ):
+    
+    # wraps a writeable file object so every block written is fed to all the hashes we store for a file
+    # this lets a download or copy generate sha256, md5, sha1 and sha512 without reading the file back again
+    
+    def __init__( self, f = None ):
+        
+        self._f = f
+        
+        self._h_sha256 = hashlib.sha256()
+        self._h_md5 = hashlib.md5()
+        self._h_sha1 = hashlib.sha1()
+        self._h_sha512 = hashlib.sha512()
+        
+    
+    def GetHashes( self ):
+        
+        return ( self._h_sha256.digest(), self._h_md5.digest(), self._h_sha1.digest(), self._h_sha512.digest() )
+        
+    
+    def write( self, block ):
+        
+        self._h_sha256.update( block )
+        self._h_md5.update( block )
+        self._h_sha1.update( block )
+        self._h_sha512.update( block )
+        
+        if self._f is not None:
+            
+            self._f.write( block )
+            
+        
+    
 def SaveThumbnailToStreamPIL( pil_image, bounding_dimensions, f ):
     
     # when the palette is limited, the thumbnail antialias won't add new colours, so you get nearest-neighbour-like behaviour
@@ -170,6 +203,20 @@ def GenerateThumbnailBytesFromStaticImagePathPIL( path, bounding_dimensions, mim
     
 GenerateThumbnailBytesFromStaticImagePath = GenerateThumbnailBytesFromStaticImagePathPIL
 
+def GetAllHashesFromPath( path ):
+    
+    hashing_stream = FileHashingStream()
+    
+    with open( path, 'rb' ) as f:
+        
+        for block in HydrusPaths.ReadFileLikeAsBlocks( f ):
+            
+            hashing_stream.write( block )
+            
+        
+    
+    return hashing_stream.GetHashes()
+    
 def GetExtraHashesFromPath( path ):
     
     h_md5 = hashlib.md5()
@@ -216,6 +216,26 @@ class APIPermissions( HydrusSerialisable.SerialisableBaseNamed ):
         self._search_tag_filter = HydrusSerialisable.CreateFromSerialisableTuple( serialisable_search_tag_filter )
         
     
+    def AddLastSearchResults( self, hash_ids ):
+        
+        with self._lock:
+            
+            if self._search_tag_filter.AllowsEverything():
+                
+                return
+                
+            
+            if self._last_search_results is None:
+                
+                self._last_search_results = set()
+                
+            
+            self._last_search_results.update( hash_ids )
+            
+            self._search_results_timeout = HydrusData.GetNow() + SEARCH_RESULTS_CACHE_TIMEOUT
+            
+        
+    
     def CheckCanSearchTags( self, tags ):
         
         with self._lock:
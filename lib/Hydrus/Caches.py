@@ -12,7 +12,9 @@ from . import HydrusImageHandling
 from . import HydrusPaths
 from . import HydrusSerialisable
 from . import HydrusThreading
+import concurrent.futures
 import json
+import multiprocessing
 import os
 import random
 import threading
@@ -413,6 +415,9 @@ class ClientFilesManager( object ):
         
         self._rwlock = ClientThreading.FileRWLock()
         
+        self._thumbnail_executor = None
+        self._thumbnail_executor_lock = threading.Lock()
+        
         self._prefixes_to_locations = {}
         
         self._bad_error_occurred = False
@@ -512,6 +517,68 @@ class ClientFilesManager( object ):
         self._AddThumbnailFromBytes( hash, thumbnail_bytes )
         
     
+    def _GenerateThumbnailBytesBatch( self, medias ):
+        
+        # thumbnailing is cpu bound, so a batch is spread over all our workers at once
+        
+        bounding_dimensions = self._controller.options[ 'thumbnail_dimensions' ]
+        
+        percentage_in = self._controller.new_options.GetInteger( 'video_thumbnail_percentage_in' )
+        
+        executor = self._GetThumbnailExecutor()
+        
+        successes = []
+        failures = []
+        
+        futures_to_medias = {}
+        
+        for media in medias:
+            
+            hash = media.GetHash()
+            mime = media.GetMime()
+            ( width, height ) = media.GetResolution()
+            duration = media.GetDuration()
+            num_frames = media.GetNumFrames()
+            
+            file_path = self._GenerateExpectedFilePath( hash, mime )
+            
+            if not os.path.exists( file_path ):
+                
+                failures.append( ( media, HydrusExceptions.FileMissingException( 'The thumbnail for file ' + hash.hex() + ' could not be regenerated from the original file because the original file is missing! This event could indicate hard drive corruption. Please check everything is ok.' ) ) )
+                
+                continue
+                
+            
+            future = executor.submit( HydrusFileHandling.GenerateThumbnailBytes, file_path, bounding_dimensions, mime, width, height, duration, num_frames, percentage_in = percentage_in )
+            
+            futures_to_medias[ future ] = media
+            
+        
+        for future in concurrent.futures.as_completed( futures_to_medias ):
+            
+            media = futures_to_medias[ future ]
+            
+            try:
+                
+                thumbnail_bytes = future.result()
+                
+            except Exception as e:
+                
+                HydrusData.PrintException( e, do_wait = False )
+                
+                hash = media.GetHash()
+                
+                failures.append( ( media, HydrusExceptions.FileMissingException( 'The thumbnail for file ' + hash.hex() + ' could not be regenerated from the original file for the above reason. This event could indicate hard drive corruption. Please check everything is ok.' ) ) )
+                
+                continue
+                
+            
+            successes.append( ( media, thumbnail_bytes ) )
+            
+        
+        return ( successes, failures )
+        
+    
     def _GenerateThumbnailBytes( self, file_path, media ):
         
         hash = media.GetHash()
@@ -536,6 +603,23 @@ class ClientFilesManager( object ):
         return thumbnail_bytes
         
     
+    def _GetThumbnailExecutor( self ):
+        
+        with self._thumbnail_executor_lock:
+            
+            if self._thumbnail_executor is None:
+                
+                num_workers = self.GetNumThumbnailWorkers()
+                
+                # forking a process that is running wx and a bunch of threads can deadlock the child, so we stick to threads. PIL and ffmpeg do their heavy work outside the GIL
+                
+                self._thumbnail_executor = concurrent.futures.ThreadPoolExecutor( max_workers = num_workers, thread_name_prefix = 'thumbnail generator' )
+                
+            
+            return self._thumbnail_executor
+            
+        
+    
     def _GetRecoverTuple( self ):
         
         all_locations = { location for location in list(self._prefixes_to_locations.values()) }
@@ -1132,43 +1216,100 @@ class ClientFilesManager( object ):
     
     def ImportFile( self, file_import_job ):
         
-        if HG.file_report_mode:
+        ( result, ) = self.ImportFiles( ( file_import_job, ) )
+        
+        if isinstance( result, Exception ):
             
-            HydrusData.ShowText( 'New file import job!' )
+            raise result
             
         
-        ( pre_import_status, hash, note ) = file_import_job.GenerateHashAndStatus()
+        return result
+        
+    
+    def ImportFiles( self, file_import_jobs ):
+        
+        # all the new files go to the db in one 'import_files' write
+        # results line up with the jobs--a job that fails gets its exception in its slot, so one bad file does not spoil the batch
+        
+        results = [ None for file_import_job in file_import_jobs ]
         
-        if file_import_job.IsNewToDB():
+        indices_to_write = []
+        
+        for ( index, file_import_job ) in enumerate( file_import_jobs ):
             
-            file_import_job.GenerateInfo()
+            if HG.file_report_mode:
+                
+                HydrusData.ShowText( 'New file import job!' )
+                
             
-            file_import_job.CheckIsGoodToImport()
+            try:
+                
+                ( pre_import_status, hash, note ) = file_import_job.GenerateHashAndStatus()
+                
+                if file_import_job.IsNewToDB():
+                    
+                    file_import_job.GenerateInfo()
+                    
+                    file_import_job.CheckIsGoodToImport()
+                    
+                    ( temp_path, thumbnail ) = file_import_job.GetTempPathAndThumbnail()
+                    
+                    mime = file_import_job.GetMime()
+                    
+                    with self._rwlock.write:
+                        
+                        self._AddFile( hash, mime, temp_path )
+                        
+                        if thumbnail is not None:
+                            
+                            self._AddThumbnailFromBytes( hash, thumbnail )
+                            
+                        
+                    
+                    indices_to_write.append( index )
+                    
+                else:
+                    
+                    results[ index ] = ( pre_import_status, hash, note )
+                    
+                
+            except Exception as e:
+                
+                results[ index ] = e
+                
             
-            ( temp_path, thumbnail ) = file_import_job.GetTempPathAndThumbnail()
+        
+        if len( indices_to_write ) > 0:
             
-            mime = file_import_job.GetMime()
+            jobs_to_write = [ file_import_jobs[ index ] for index in indices_to_write ]
             
-            with self._rwlock.write:
+            try:
                 
-                self._AddFile( hash, mime, temp_path )
+                write_results = self._controller.WriteSynchronous( 'import_files', jobs_to_write )
                 
-                if thumbnail is not None:
+                for ( index, file_import_job, ( import_status, note ) ) in zip( indices_to_write, jobs_to_write, write_results ):
                     
-                    self._AddThumbnailFromBytes( hash, thumbnail )
+                    results[ index ] = ( import_status, file_import_job.GetHash(), note )
+                    
+                
+            except Exception as e:
+                
+                for index in indices_to_write:
+                    
+                    results[ index ] = e
                     
                 
             
-            ( import_status, note ) = self._controller.WriteSynchronous( 'import_file', file_import_job )
-            
-        else:
+        
+        for ( file_import_job, result ) in zip( file_import_jobs, results ):
             
-            import_status = pre_import_status
+            if not isinstance( result, Exception ):
+                
+                file_import_job.PubsubContentUpdates()
+                
             
         
-        file_import_job.PubsubContentUpdates()
-        
-        return ( import_status, hash, note )
+        return results
         
     
     def LocklessChangeFileExt( self, hash, old_mime, mime ):
@@ -1367,6 +1508,11 @@ class ClientFilesManager( object ):
             
         
     
+    def GetNumThumbnailWorkers( self ):
+        
+        return max( 1, multiprocessing.cpu_count() - 1 )
+        
+    
     def RegenerateThumbnail( self, media ):
         
         hash = media.GetHash()
@@ -1390,6 +1536,44 @@ class ClientFilesManager( object ):
             
         
     
+    def RegenerateThumbnails( self, medias ):
+        
+        with self._rwlock.read:
+            
+            ( successes, failures ) = self._GenerateThumbnailBytesBatch( medias )
+            
+        
+        with self._rwlock.write:
+            
+            for ( media, thumbnail_bytes ) in successes:
+                
+                try:
+                    
+                    self._AddThumbnailFromBytes( media.GetHash(), thumbnail_bytes )
+                    
+                except Exception as e:
+                    
+                    failures.append( ( media, e ) )
+                    
+                
+            
+        
+        return failures
+        
+    
+    def Shutdown( self ):
+        
+        with self._thumbnail_executor_lock:
+            
+            if self._thumbnail_executor is not None:
+                
+                self._thumbnail_executor.shutdown( wait = True )
+                
+                self._thumbnail_executor = None
+                
+            
+        
+    
     def LocklessRegenerateThumbnail( self, media ):
         
         if HG.file_report_mode:
@@ -1403,7 +1587,26 @@ class ClientFilesManager( object ):
         self._GenerateAndSaveThumbnail( media )
         
     
-    def LocklessRegenerateThumbnailIfWrongSize( self, media ):
+    def LocklessRegenerateThumbnails( self, medias ):
+        
+        ( successes, failures ) = self._GenerateThumbnailBytesBatch( medias )
+        
+        for ( media, thumbnail_bytes ) in successes:
+            
+            try:
+                
+                self._AddThumbnailFromBytes( media.GetHash(), thumbnail_bytes )
+                
+            except Exception as e:
+                
+                failures.append( ( media, e ) )
+                
+            
+        
+        return failures
+        
+    
+    def LocklessThumbnailIsWrongSize( self, media ):
         
         do_it = False
         
@@ -1433,26 +1636,39 @@ class ClientFilesManager( object ):
             do_it = True
             
         
-        if do_it:
-            
-            self.LocklessRegenerateThumbnail( media )
-            
-        
         return do_it
         
     
 class DataCache( object ):
     
-    def __init__( self, controller, cache_size, timeout = 1200 ):
+    # a byte-budgeted lru with a running memory total
+    # if segmented, new data goes into a probationary segment and is only promoted to the protected segment on a second hit
+    # new data only ever evicts probationary items, so a single large one-off item cannot flush the whole working set
+    
+    PROTECTED_SEGMENT_FRACTION = 0.8
+    
+    def __init__( self, controller, cache_size, timeout = 1200, name = 'data cache', segmented = False ):
         
         self._controller = controller
         self._cache_size = cache_size
         self._timeout = timeout
+        self._name = name
+        self._segmented = segmented
         
         self._keys_to_data = {}
-        self._keys_fifo = collections.OrderedDict()
+        self._keys_to_sizes = {}
+        
+        # both of these are key -> last access time, least recently used first
+        self._probationary_keys_fifo = collections.OrderedDict()
+        self._protected_keys_fifo = collections.OrderedDict()
         
         self._total_estimated_memory_footprint = 0
+        self._protected_estimated_memory_footprint = 0
+        
+        self._num_hits = 0
+        self._num_misses = 0
+        self._num_evictions = 0
+        self._num_rejections = 0
         
         self._lock = threading.Lock()
         
@@ -1466,34 +1682,83 @@ class DataCache( object ):
             return
             
         
-        deletee_data = self._keys_to_data[ key ]
-        
         del self._keys_to_data[ key ]
         
-        self._RecalcMemoryUsage()
+        size = self._keys_to_sizes.pop( key )
+        
+        self._total_estimated_memory_footprint -= size
+        
+        if key in self._protected_keys_fifo:
+            
+            del self._protected_keys_fifo[ key ]
+            
+            self._protected_estimated_memory_footprint -= size
+            
+        else:
+            
+            del self._probationary_keys_fifo[ key ]
+            
         
     
     def _DeleteItem( self ):
         
-        ( deletee_key, last_access_time ) = self._keys_fifo.popitem( last = False )
+        # least recently used probationary item. protected items only leave by being demoted back to probationary
+        
+        if len( self._probationary_keys_fifo ) == 0:
+            
+            return False
+            
+        
+        deletee_key = next( iter( self._probationary_keys_fifo ) )
         
         self._Delete( deletee_key )
         
+        self._num_evictions += 1
+        
+        return True
+        
     
-    def _RecalcMemoryUsage( self ):
+    def _GetProbationaryBudget( self ):
+        
+        # whatever the protected segment is not using, which is always at least ( 1 - PROTECTED_SEGMENT_FRACTION ) of the cache
         
-        self._total_estimated_memory_footprint = sum( ( data.GetEstimatedMemoryFootprint() for data in list(self._keys_to_data.values()) ) )
+        return self._cache_size - self._protected_estimated_memory_footprint
         
     
     def _TouchKey( self, key ):
         
-        # have to delete first, rather than overwriting, so the ordereddict updates its internal order
-        if key in self._keys_fifo:
+        now = HydrusData.GetNow()
+        
+        if key in self._protected_keys_fifo:
             
-            del self._keys_fifo[ key ]
+            self._protected_keys_fifo[ key ] = now
+            self._protected_keys_fifo.move_to_end( key )
+            
+        elif self._segmented:
+            
+            # second hit, so promote to protected, demoting the protected lru items back to probationary if that segment is now too big
+            
+            del self._probationary_keys_fifo[ key ]
+            
+            self._protected_keys_fifo[ key ] = now
+            self._protected_estimated_memory_footprint += self._keys_to_sizes[ key ]
+            
+            max_protected_size = self._cache_size * self.PROTECTED_SEGMENT_FRACTION
+            
+            while self._protected_estimated_memory_footprint > max_protected_size and len( self._protected_keys_fifo ) > 1:
+                
+                ( demotee_key, last_access_time ) = self._protected_keys_fifo.popitem( last = False )
+                
+                self._protected_estimated_memory_footprint -= self._keys_to_sizes[ demotee_key ]
+                
+                self._probationary_keys_fifo[ demotee_key ] = last_access_time
+                
+            
+        else:
+            
+            self._probationary_keys_fifo[ key ] = now
+            self._probationary_keys_fifo.move_to_end( key )
             
-        
-        self._keys_fifo[ key ] = HydrusData.GetNow()
         
     
     def Clear( self ):
@@ -1501,9 +1766,13 @@ class DataCache( object ):
         with self._lock:
             
             self._keys_to_data = {}
-            self._keys_fifo = collections.OrderedDict()
+            self._keys_to_sizes = {}
+            
+            self._probationary_keys_fifo = collections.OrderedDict()
+            self._protected_keys_fifo = collections.OrderedDict()
             
             self._total_estimated_memory_footprint = 0
+            self._protected_estimated_memory_footprint = 0
             
         
     
@@ -1513,16 +1782,31 @@ class DataCache( object ):
             
             if key not in self._keys_to_data:
                 
-                while self._total_estimated_memory_footprint > self._cache_size:
+                size = data.GetEstimatedMemoryFootprint()
+                
+                if size > self._GetProbationaryBudget():
+                    
+                    # this would flush all of probationary and still not fit, so don't bother
                     
-                    self._DeleteItem()
+                    self._num_rejections += 1
+                    
+                    return
+                    
+                
+                while self._total_estimated_memory_footprint + size > self._cache_size:
+                    
+                    if not self._DeleteItem():
+                        
+                        break
+                        
                     
                 
                 self._keys_to_data[ key ] = data
+                self._keys_to_sizes[ key ] = size
                 
-                self._TouchKey( key )
+                self._probationary_keys_fifo[ key ] = HydrusData.GetNow()
                 
-                self._RecalcMemoryUsage()
+                self._total_estimated_memory_footprint += size
                 
             
         
@@ -1541,9 +1825,13 @@ class DataCache( object ):
             
             if key not in self._keys_to_data:
                 
+                self._num_misses += 1
+                
                 raise Exception( 'Cache error! Looking for ' + str( key ) + ', but it was missing.' )
                 
             
+            self._num_hits += 1
+            
             self._TouchKey( key )
             
             return self._keys_to_data[ key ]
@@ -1556,17 +1844,59 @@ class DataCache( object ):
             
             if key in self._keys_to_data:
                 
+                self._num_hits += 1
+                
                 self._TouchKey( key )
                 
                 return self._keys_to_data[ key ]
                 
             else:
                 
+                self._num_misses += 1
+                
                 return None
                 
             
         
     
+    def GetPrettyStats( self ):
+        
+        with self._lock:
+            
+            num_lookups = self._num_hits + self._num_misses
+            
+            if num_lookups == 0:
+                
+                hit_rate = 0.0
+                
+            else:
+                
+                hit_rate = self._num_hits / num_lookups
+                
+            
+            text = self._name + ': '
+            text += HydrusData.ToHumanInt( len( self._keys_to_data ) ) + ' items using ' + HydrusData.ConvertValueRangeToBytes( self._total_estimated_memory_footprint, self._cache_size )
+            
+            if self._segmented:
+                
+                text += ' (' + HydrusData.ToHumanBytes( self._protected_estimated_memory_footprint ) + ' protected)'
+                
+            
+            text += ', ' + HydrusData.ToHumanInt( self._num_hits ) + ' hits, ' + HydrusData.ToHumanInt( self._num_misses ) + ' misses (' + HydrusData.ConvertFloatToPercentage( hit_rate ) + ' hit rate), '
+            text += HydrusData.ToHumanInt( self._num_evictions ) + ' evictions, ' + HydrusData.ToHumanInt( self._num_rejections ) + ' rejections'
+            
+            return text
+            
+        
+    
+    def GetStats( self ):
+        
+        with self._lock:
+            
+            return ( self._num_hits, self._num_misses, self._num_evictions, self._num_rejections )
+            
+        
+    
     def HasData( self, key ):
         
         with self._lock:
@@ -1579,19 +1909,15 @@ class DataCache( object ):
         
         with self._lock:
             
-            while True:
+            for keys_fifo in ( self._probationary_keys_fifo, self._protected_keys_fifo ):
                 
-                if len( self._keys_fifo ) == 0:
-                    
-                    break
+                while len( keys_fifo ) > 0:
                     
-                else:
-                    
-                    ( key, last_access_time ) = next( iter(self._keys_fifo.items()) )
+                    ( key, last_access_time ) = next( iter( keys_fifo.items() ) )
                     
                     if HydrusData.TimeHasPassed( last_access_time + self._timeout ):
                         
-                        self._DeleteItem()
+                        self._Delete( key )
                         
                     else:
                         
@@ -2112,6 +2438,7 @@ class ParsingCache( object ):
         self._next_clean_cache_time = HydrusData.GetNow()
         
         self._html_to_soups = {}
+        self._html_to_lxml_trees = {}
         self._json_to_jsons = {}
         
         self._lock = threading.Lock()
@@ -2121,7 +2448,7 @@ class ParsingCache( object ):
         
         if HydrusData.TimeHasPassed( self._next_clean_cache_time ):
             
-            for cache in ( self._html_to_soups, self._json_to_jsons ):
+            for cache in ( self._html_to_soups, self._html_to_lxml_trees, self._json_to_jsons ):
                 
                 dead_datas = set()
                 
@@ -2151,6 +2478,16 @@ class ParsingCache( object ):
             
         
     
+    def Clear( self ):
+        
+        with self._lock:
+            
+            self._html_to_soups = {}
+            self._html_to_lxml_trees = {}
+            self._json_to_jsons = {}
+            
+        
+    
     def GetJSON( self, json_text ):
         
         with self._lock:
@@ -2180,6 +2517,35 @@ class ParsingCache( object ):
             
         
     
+    def GetLXMLTree( self, html ):
+        
+        with self._lock:
+            
+            now = HydrusData.GetNow()
+            
+            if html not in self._html_to_lxml_trees:
+                
+                lxml_tree = ClientParsing.GetLXMLTree( html )
+                
+                self._html_to_lxml_trees[ html ] = ( now, lxml_tree )
+                
+            
+            ( last_accessed, lxml_tree ) = self._html_to_lxml_trees[ html ]
+            
+            if last_accessed != now:
+                
+                self._html_to_lxml_trees[ html ] = ( now, lxml_tree )
+                
+            
+            if len( self._html_to_lxml_trees ) > 10:
+                
+                self._CleanCache()
+                
+            
+            return lxml_tree
+            
+        
+    
     def GetSoup( self, html ):
         
         with self._lock:
@@ -2218,7 +2584,7 @@ class RenderedImageCache( object ):
         cache_size = self._controller.options[ 'fullscreen_cache_size' ]
         cache_timeout = self._controller.new_options.GetInteger( 'image_cache_timeout' )
         
-        self._data_cache = DataCache( self._controller, cache_size, timeout = cache_timeout )
+        self._data_cache = DataCache( self._controller, cache_size, timeout = cache_timeout, name = 'rendered image cache', segmented = True )
         
     
     def Clear( self ):
@@ -2248,6 +2614,11 @@ class RenderedImageCache( object ):
         return image_renderer
         
     
+    def GetPrettyStats( self ):
+        
+        return self._data_cache.GetPrettyStats()
+        
+    
     def HasImageRenderer( self, hash ):
         
         key = hash
@@ -2772,6 +3143,7 @@ class TagSiblingsManager( object ):
         self._refresh_job = None
         
         self._service_keys_to_siblings = collections.defaultdict( dict )
+        self._service_keys_to_sibling_ids = collections.defaultdict( dict )
         self._service_keys_to_reverse_lookup = collections.defaultdict( dict )
         
         self._RefreshSiblings()
@@ -2791,6 +3163,7 @@ class TagSiblingsManager( object ):
     def _RefreshSiblings( self ):
         
         self._service_keys_to_siblings = collections.defaultdict( dict )
+        self._service_keys_to_sibling_ids = collections.defaultdict( dict )
         self._service_keys_to_reverse_lookup = collections.defaultdict( dict )
         
         local_tags_pairs = set()
@@ -2839,6 +3212,13 @@ class TagSiblingsManager( object ):
         
         self._service_keys_to_reverse_lookup[ CC.COMBINED_TAG_SERVICE_KEY ] = combined_reverse_lookup
         
+        # tags managers hold interned ids, so they collapse with this rather than round-tripping through strings
+        
+        for ( service_key, siblings ) in list( self._service_keys_to_siblings.items() ):
+            
+            self._service_keys_to_sibling_ids[ service_key ] = { HydrusTags.InternTag( bad ) : HydrusTags.InternTag( good ) for ( bad, good ) in siblings.items() }
+            
+        
         self._controller.pub( 'new_siblings_gui' )
         
     
@@ -2953,6 +3333,26 @@ class TagSiblingsManager( object ):
             
         
     
+    def CollapseStatusesToTagIds( self, service_key, statuses_to_tag_ids ):
+        
+        if self._controller.new_options.GetBoolean( 'apply_all_siblings_to_all_services' ):
+            
+            service_key = CC.COMBINED_TAG_SERVICE_KEY
+            
+        
+        with self._lock:
+            
+            sibling_ids = self._service_keys_to_sibling_ids[ service_key ]
+            
+            if len( sibling_ids ) == 0:
+                
+                return statuses_to_tag_ids
+                
+            
+            return { status : { sibling_ids.get( tag_id, tag_id ) for tag_id in tag_ids } for ( status, tag_ids ) in statuses_to_tag_ids.items() }
+            
+        
+    
     def CollapseTag( self, service_key, tag ):
         
         if self._controller.new_options.GetBoolean( 'apply_all_siblings_to_all_services' ):
@@ -3109,7 +3509,7 @@ class ThumbnailCache( object ):
         cache_size = self._controller.options[ 'thumbnail_cache_size' ]
         cache_timeout = self._controller.new_options.GetInteger( 'thumbnail_cache_timeout' )
         
-        self._data_cache = DataCache( self._controller, cache_size, timeout = cache_timeout )
+        self._data_cache = DataCache( self._controller, cache_size, timeout = cache_timeout, name = 'thumbnail cache', segmented = True )
         
         self._magic_mime_thumbnail_ease_score_lookup = {}
         
@@ -3496,6 +3896,11 @@ class ThumbnailCache( object ):
             
         
     
+    def GetPrettyStats( self ):
+        
+        return self._data_cache.GetPrettyStats()
+        
+    
     def GetThumbnail( self, media ):
         
         try:
@@ -3653,27 +4058,47 @@ class ThumbnailCache( object ):
                     continue
                     
                 
-                media_result = self._delayed_regeneration_queue.pop()
+                # one for each thumbnail worker, so they all stay busy without holding up the waterfall for long
                 
-                self._delayed_regeneration_queue_quick.discard( media_result )
+                num_to_regen = self._controller.client_files_manager.GetNumThumbnailWorkers()
+                
+                media_results = []
+                
+                while len( self._delayed_regeneration_queue ) > 0 and len( media_results ) < num_to_regen:
+                    
+                    media_result = self._delayed_regeneration_queue.pop()
+                    
+                    self._delayed_regeneration_queue_quick.discard( media_result )
+                    
+                    media_results.append( media_result )
+                    
                 
             
             if HG.file_report_mode:
                 
-                hash = media_result.GetHash()
-                
-                HydrusData.ShowText( 'Thumbnail {} now regenerating from source.'.format( hash.hex() ) )
+                for media_result in media_results:
+                    
+                    hash = media_result.GetHash()
+                    
+                    HydrusData.ShowText( 'Thumbnail {} now regenerating from source.'.format( hash.hex() ) )
+                    
                 
             
             try:
                 
-                self._controller.client_files_manager.RegenerateThumbnail( media_result )
+                failures = self._controller.client_files_manager.RegenerateThumbnails( media_results )
                 
-            except HydrusExceptions.FileMissingException:
+            except Exception as e:
                 
-                pass
+                failures = [ ( media_result, e ) for media_result in media_results ]
                 
-            except Exception as e:
+            
+            for ( media_result, e ) in failures:
+                
+                if isinstance( e, HydrusExceptions.FileMissingException ):
+                    
+                    continue
+                    
                 
                 hash = media_result.GetHash()
                 
@@ -67,7 +67,7 @@ options = {}
 # Misc
 
 NETWORK_VERSION = 18
-SOFTWARE_VERSION = 349
+SOFTWARE_VERSION = 352
 CLIENT_API_VERSION = 6
 
 SERVER_THUMBNAIL_DIMENSIONS = ( 200, 200 )
@@ -1,5 +1,5 @@
 ### IMPORTS ###
-import collections, os, random, sys, threading, time, traceback, requests, gc
+import collections, os, sys, threading, time, traceback, requests, gc
 
 from lib.Hydrus import Constants as HC, Data, DB, Exceptions, Globals as HG, NATPunch, Paths, PubSub, Threading, Networking, Serialisable, VideoHandling
 
@@ -42,7 +42,7 @@ class HydrusController( object ):
         self._thread_slots[ 'misc' ] = ( 0, 10 )
         self._thread_slot_lock = threading.Lock()
         
-        self._call_to_threads = []
+        self._thread_pool = HydrusThreading.ThreadPool( self, 'CallToThread' )
         self._long_running_call_to_threads = []
         
         self._thread_pool_busy_status_text = ''
@@ -62,32 +62,6 @@ class HydrusController( object ):
         self.CallToThreadLongRunning( self.DAEMONPubSub )
         
     
-    def _GetCallToThread( self ):
-        with self._call_to_thread_lock:
-            for call_to_thread in self._call_to_threads:
-                if not call_to_thread.CurrentlyWorking():
-                    return call_to_thread
-                    
-                
-            # all the threads in the pool are currently busy
-            
-            calling_from_the_thread_pool = threading.current_thread() in self._call_to_threads
-            
-            if calling_from_the_thread_pool or len( self._call_to_threads ) < 200:
-                call_to_thread = HydrusThreading.THREADCallToThread( self, 'CallToThread' )
-                
-                self._call_to_threads.append( call_to_thread )
-                
-                call_to_thread.start()
-                
-            else:
-                call_to_thread = random.choice( self._call_to_threads )
-                
-            
-            return call_to_thread
-            
-        
-    
     def _GetCallToThreadLongRunning( self ):
         with self._call_to_thread_lock:
             for call_to_thread in self._long_running_call_to_threads:
@@ -127,6 +101,7 @@ class HydrusController( object ):
     def _MaintainCallToThreads( self ):
         # we don't really want to hang on to threads that are done as event.wait() has a bit of idle cpu
         # so, any that are in the pools that aren't doing anything can be killed and sent to garbage
+        # the main thread pool retires its own idle workers
         
         with self._call_to_thread_lock:
             def filter_call_to_threads( t ):
@@ -140,8 +115,6 @@ class HydrusController( object ):
                     
                 
             
-            self._call_to_threads = list(filter( filter_call_to_threads, self._call_to_threads ))
-            
             self._long_running_call_to_threads = list(filter( filter_call_to_threads, self._long_running_call_to_threads ))
             
     
@@ -241,6 +214,10 @@ class HydrusController( object ):
         
     
     def CallToThread( self, callable, *args, **kwargs ):
+        self.CallToThreadWithPriority( HydrusThreading.THREAD_POOL_PRIORITY_UI, callable, *args, **kwargs )
+        
+    
+    def CallToThreadLongRunning( self, callable, *args, **kwargs ):
         if HG.callto_report_mode:
             what_to_report = [ callable ]
             
@@ -255,12 +232,12 @@ class HydrusController( object ):
             HydrusData.ShowText( tuple( what_to_report ) )
             
         
-        call_to_thread = self._GetCallToThread()
+        call_to_thread = self._GetCallToThreadLongRunning()
         
         call_to_thread.put( callable, *args, **kwargs )
         
     
-    def CallToThreadLongRunning( self, callable, *args, **kwargs ):
+    def CallToThreadWithPriority( self, priority, callable, *args, **kwargs ):
         if HG.callto_report_mode:
             what_to_report = [ callable ]
             
@@ -275,9 +252,7 @@ class HydrusController( object ):
             HydrusData.ShowText( tuple( what_to_report ) )
             
         
-        call_to_thread = self._GetCallToThreadLongRunning()
-        
-        call_to_thread.put( callable, *args, **kwargs )
+        self._thread_pool.Put( priority, callable, *args, **kwargs )
         
     
     def ClearCaches( self ):
@@ -301,6 +276,12 @@ class HydrusController( object ):
             
         
     
+    def DebugShowCacheStats( self ):
+        for cache in list(self._caches.values()):
+            HydrusData.ShowText( cache.GetPrettyStats() )
+            
+        
+    
     def DebugShowScheduledJobs( self ):
         summary = self._fast_job_scheduler.GetPrettyJobSummary()
         
@@ -312,6 +293,11 @@ class HydrusController( object ):
         HydrusData.ShowText( 'slow scheduler:' )
         HydrusData.ShowText( summary )
         
+        summary = self._thread_pool.GetPrettyJobSummary()
+        
+        HydrusData.ShowText( 'thread pool:' )
+        HydrusData.ShowText( summary )
+        
     
     def GetBootTime( self ):
         return self._timestamps[ 'boot' ]
@@ -335,9 +321,7 @@ class HydrusController( object ):
     
     def GetThreadPoolBusyStatus( self ):
         if HydrusData.TimeHasPassed( self._thread_pool_busy_status_text_new_check_time ):
-            with self._call_to_thread_lock:
-                num_threads = sum( ( 1 for t in self._call_to_threads if t.CurrentlyWorking() ) )
-                
+            num_threads = self._thread_pool.GetNumWorking()
             
             if num_threads < 4:
                 self._thread_pool_busy_status_text = ''
@@ -362,7 +346,7 @@ class HydrusController( object ):
         threads = []
         
         threads.extend( self._daemons )
-        threads.extend( self._call_to_threads )
+        threads.extend( self._thread_pool.GetWorkers() )
         threads.extend( self._long_running_call_to_threads )
         
         threads.append( self._slow_job_scheduler )
@@ -406,6 +390,7 @@ class HydrusController( object ):
         job = self.CallRepeating( 60.0, 300.0, self.MaintainDB )
         
         job.ShouldDelayOnWakeup( True )
+        job.SetThreadPoolPriority( HydrusThreading.THREAD_POOL_PRIORITY_MAINTENANCE )
         
         self._daemon_jobs[ 'maintain_db' ] = job
         
@@ -788,6 +773,7 @@ class ServerController( HydrusController ):
         self._daemon_jobs[ 'save_dirty_objects' ] = job
         
         job = self.CallRepeating( 0.0, 86400.0, self.DeleteOrphans )
+        job.SetThreadPoolPriority( HydrusThreading.THREAD_POOL_PRIORITY_MAINTENANCE )
         self._daemon_jobs[ 'delete_orphans' ] = job
         
     
@@ -1483,12 +1469,14 @@ class ClientController( HydrusController ):
         job.WakeOnPubSub( 'notify_restart_import_folders_daemon' )
         job.WakeOnPubSub( 'notify_new_import_folders' )
         job.ShouldDelayOnWakeup( True )
+        job.SetThreadPoolPriority( HydrusThreading.THREAD_POOL_PRIORITY_IMPORT )
         self._daemon_jobs[ 'import_folders' ] = job
         
         job = self.CallRepeating( 5.0, 180.0, ClientDaemons.DAEMONCheckExportFolders )
         job.WakeOnPubSub( 'notify_restart_export_folders_daemon' )
         job.WakeOnPubSub( 'notify_new_export_folders' )
         job.ShouldDelayOnWakeup( True )
+        job.SetThreadPoolPriority( HydrusThreading.THREAD_POOL_PRIORITY_MAINTENANCE )
         self._daemon_jobs[ 'export_folders' ] = job
         
         job = self.CallRepeating( 0.0, 30.0, self.SaveDirtyObjects )
@@ -1852,6 +1840,10 @@ class ClientController( HydrusController ):
         
         HydrusController.HydrusController.ShutdownModel( self )
         
+        if hasattr( self, 'client_files_manager' ):
+            self.client_files_manager.Shutdown()
+            
+        
     
     def ShutdownView( self ):
         if not HG.emergency_exit:
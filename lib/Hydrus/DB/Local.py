@@ -1,8 +1,8 @@
-import os, psutil, random, re, sqlite3, stat, time, traceback, wx, collections, gc, hashlib, itertools, json
+import os, psutil, random, re, sqlite3, stat, threading, time, traceback, wx, array, bisect, collections, gc, hashlib, heapq, itertools, json
 
-from . import ClientAPI, ClientCaches, ClientData, ClientDefaults, ClientFiles, ClientGUIShortcuts, ClientImageHandling, ClientMedia, ClientNetworkingBandwidth, ClientNetworkingContexts, ClientNetworkingDomain, ClientNetworkingLogin, ClientNetworkingSessions, ClientOptions, ClientRatings, ClientSearch, ClientServices, ClientThreading, ClientConstants as CC
+from . import ClientAPI, ClientCaches, ClientData, ClientDefaults, ClientDuplicates, ClientFiles, ClientGUIShortcuts, ClientImageHandling, ClientMedia, ClientNetworkingBandwidth, ClientNetworkingContexts, ClientNetworkingDomain, ClientNetworkingLogin, ClientNetworkingSessions, ClientOptions, ClientRatings, ClientSearch, ClientServices, ClientThreading, ClientConstants as CC
 
-from . import HydrusConstants as HC, HydrusData, HydrusDB, HydrusExceptions, HydrusFileHandling, HydrusGlobals as HG, HydrusImageHandling, HydrusNetwork, HydrusNetworking, HydrusPaths, HydrusSerialisable, HydrusTagArchive, HydrusTags, HydrusVideoHandling
+from . import HydrusConstants as HC, HydrusData, HydrusDB, HydrusExceptions, HydrusFileHandling, HydrusGlobals as HG, HydrusImageHandling, HydrusNetwork, HydrusNetworking, HydrusPaths, HydrusSerialisable, HydrusTagArchive, HydrusTags, HydrusThreading, HydrusVideoHandling
 
 YAML_DUMP_ID_SINGLE = 0
 YAML_DUMP_ID_REMOTE_BOORU = 1
@@ -18,9 +18,45 @@ YAML_DUMP_ID_LOCAL_BOORU = 8
 MIN_CACHED_INTEGER = -99999999
 MAX_CACHED_INTEGER = 99999999
 
+TAG_ARCHIVE_SYNC_CHUNK_SIZE = 10000
+
 def CanCacheInteger( num ):
     return MIN_CACHED_INTEGER <= num and num <= MAX_CACHED_INTEGER
     
+def ConvertMediaSortToSQLOrderColumn( sort_by ):
+    
+    # returns the files_info/current_files expression a media sort orders by, or None if the sort can only be done on full media results
+    
+    if sort_by is None:
+        
+        return None
+        
+    
+    ( sort_metatype, sort_data ) = sort_by.sort_type
+    
+    if sort_metatype != 'system':
+        
+        return None
+        
+    
+    sort_data_to_columns = {}
+    
+    sort_data_to_columns[ CC.SORT_FILES_BY_FILESIZE ] = 'size'
+    sort_data_to_columns[ CC.SORT_FILES_BY_DURATION ] = 'duration'
+    sort_data_to_columns[ CC.SORT_FILES_BY_IMPORT_TIME ] = 'timestamp'
+    sort_data_to_columns[ CC.SORT_FILES_BY_RANDOM ] = 'random()'
+    sort_data_to_columns[ CC.SORT_FILES_BY_WIDTH ] = 'width'
+    sort_data_to_columns[ CC.SORT_FILES_BY_HEIGHT ] = 'height'
+    sort_data_to_columns[ CC.SORT_FILES_BY_RATIO ] = '( width * 1.0 ) / height'
+    sort_data_to_columns[ CC.SORT_FILES_BY_NUM_PIXELS ] = 'width * height'
+    
+    if sort_data in sort_data_to_columns:
+        
+        return sort_data_to_columns[ sort_data ]
+        
+    
+    return None
+    
 def ConvertWildcardToSQLiteLikeParameter( wildcard ):
     
     like_param = wildcard.replace( '*', '%' )
@@ -143,6 +179,13 @@ class DB( HydrusDB.HydrusDB ):
     
     READ_WRITE_ACTIONS = [ 'service_info', 'system_predicates', 'missing_thumbnail_hashes' ]
     
+    BULK_MAPPINGS_THRESHOLD = 10000
+    QUERY_PAGE_RESULTS_MAX_ENTRIES = 16
+    QUERY_PAGE_RESULTS_TIMEOUT = 300
+    
+    READ_POOL_ACTIONS = [ 'autocomplete_predicates', 'file_duplicate_hashes', 'file_duplicate_types_to_counts', 'file_hashes', 'file_notes', 'file_query_ids', 'file_query_ids_page', 'filter_existing_tags', 'filter_hashes', 'force_refresh_tags_managers', 'hash_ids_to_hashes', 'hash_status', 'in_inbox', 'media_results', 'media_results_from_ids', 'related_tags', 'tag_parents', 'tag_siblings', 'url_statuses' ]
+    READ_POOL_SIZE = 2
+    
     def __init__( self, controller, db_dir, db_name ):
         
         self._initial_messages = []
@@ -433,7 +476,18 @@ class DB( HydrusDB.HydrusDB ):
             
             self._c.executemany( 'UPDATE service_info SET info = info - ? WHERE service_id = ? AND info_type = ?;', [ ( count, service_id, HC.SERVICE_INFO_NUM_INBOX ) for ( service_id, count ) in updates ] )
             
-            self._inbox_hash_ids.difference_update( valid_hash_ids )
+            with self._read_pool_lock:
+                
+                if self._read_pool_num_jobs_running == 0:
+                    
+                    self._inbox_hash_ids.difference_update( valid_hash_ids )
+                    
+                else:
+                    
+                    # a read pool job may be iterating over the set, so it keeps the one it has
+                    self._inbox_hash_ids = self._inbox_hash_ids.difference( valid_hash_ids )
+                    
+                
             
         
     
@@ -462,6 +516,88 @@ class DB( HydrusDB.HydrusDB ):
     
     def _Backup( self, path ):
         
+        if not self._CanBackupOnline():
+            
+            self._BackupOffline( path )
+            
+            return
+            
+        
+        job_key = ClientThreading.JobKey( cancellable = True )
+        
+        job_key.SetVariable( 'popup_title', 'backing up db' )
+        
+        self._controller.pub( 'modal_message', job_key )
+        
+        job_key.SetVariable( 'popup_text_1', 'taking a snapshot of the db' )
+        
+        HydrusPaths.MakeSureDirectoryExists( path )
+        
+        try:
+            
+            snapshot_db = self._OpenBackupSnapshot()
+            
+        except:
+            
+            job_key.SetVariable( 'popup_text_1', 'could not take a snapshot of the db!' )
+            
+            job_key.Finish()
+            
+            raise
+            
+        
+        def is_cancelled_hook():
+            
+            return job_key.IsCancelled()
+            
+        
+        def text_update_hook( text ):
+            
+            job_key.SetVariable( 'popup_text_1', text )
+            
+        
+        def do_it():
+            
+            # the db carries on as normal while the snapshot is copied
+            
+            try:
+                
+                HydrusDB.BackupDBSnapshot( snapshot_db, self._db_filenames, path, text_update_hook = text_update_hook, is_cancelled_hook = is_cancelled_hook )
+                
+                client_files_default = os.path.join( self._db_dir, 'client_files' )
+                
+                if os.path.exists( client_files_default ):
+                    
+                    ClientFiles.BackupClientFiles( snapshot_db, self._combined_local_file_service_id, client_files_default, path, text_update_hook = text_update_hook, is_cancelled_hook = is_cancelled_hook )
+                    
+                
+                job_key.SetVariable( 'popup_text_1', 'done!' )
+                
+            except HydrusExceptions.CancelledException:
+                
+                job_key.SetVariable( 'popup_text_1', 'cancelled!' )
+                
+            except Exception as e:
+                
+                job_key.SetVariable( 'popup_text_1', 'failed!' )
+                
+                HydrusData.ShowException( e )
+                
+            finally:
+                
+                snapshot_db.close()
+                
+                job_key.Finish()
+                
+                job_key.Delete( 5 )
+                
+            
+        
+        self._controller.CallToThreadLongRunning( do_it )
+        
+    
+    def _BackupOffline( self, path ):
+        
         self._CloseDBCursor()
         
         try:
@@ -677,6 +813,32 @@ class DB( HydrusDB.HydrusDB ):
         return hash_ids
         
     
+    def _CacheRepositoryNormaliseServiceMappingsIntoTable( self, service_id, service_mappings_ids, table_name ):
+        
+        # stages the raw rows and lets sqlite do the id lookups with a join, rather than a select per tag
+        
+        ( hash_id_map_table_name, tag_id_map_table_name ) = GenerateRepositoryMasterCacheTableNames( service_id )
+        
+        self._c.execute( 'CREATE TABLE mem.temp_service_mappings ( service_tag_id INTEGER, service_hash_id INTEGER );' )
+        
+        self._c.executemany( 'INSERT INTO temp_service_mappings ( service_tag_id, service_hash_id ) VALUES ( ?, ? );', ( ( service_tag_id, service_hash_id ) for ( service_tag_id, service_hash_ids ) in service_mappings_ids for service_hash_id in service_hash_ids ) )
+        
+        result = self._c.execute( 'SELECT 1 FROM temp_service_mappings LEFT JOIN ' + tag_id_map_table_name + ' USING ( service_tag_id ) LEFT JOIN ' + hash_id_map_table_name + ' USING ( service_hash_id ) WHERE tag_id IS NULL OR hash_id IS NULL LIMIT 1;' ).fetchone()
+        
+        if result is not None:
+            
+            self._c.execute( 'DROP TABLE temp_service_mappings;' )
+            
+            self._HandleCriticalRepositoryError( service_id )
+            
+            raise HydrusExceptions.DataMissing( 'Service tag or file hash map error in database' )
+            
+        
+        self._c.execute( 'INSERT OR IGNORE INTO ' + table_name + ' ( tag_id, hash_id ) SELECT tag_id, hash_id FROM temp_service_mappings CROSS JOIN ' + tag_id_map_table_name + ' USING ( service_tag_id ) CROSS JOIN ' + hash_id_map_table_name + ' USING ( service_hash_id );' )
+        
+        self._c.execute( 'DROP TABLE temp_service_mappings;' )
+        
+    
     def _CacheRepositoryNormaliseServiceTagId( self, service_id, service_tag_id ):
         
         ( hash_id_map_table_name, tag_id_map_table_name ) = GenerateRepositoryMasterCacheTableNames( service_id )
@@ -796,15 +958,19 @@ class DB( HydrusDB.HydrusDB ):
     
     def _CacheSimilarFilesAssociatePHashes( self, hash_id, phashes ):
         
-        phash_ids = set()
+        phash_ids_to_phashes = {}
         
         for phash in phashes:
             
             phash_id = self._CacheSimilarFilesGetPHashId( phash )
             
-            phash_ids.add( phash_id )
+            phash_ids_to_phashes[ phash_id ] = phash
             
         
+        phash_ids = set( phash_ids_to_phashes.keys() )
+        
+        newly_useful_phash_ids = [ phash_id for phash_id in phash_ids if self._c.execute( 'SELECT 1 FROM shape_perceptual_hash_map WHERE phash_id = ?;', ( phash_id, ) ).fetchone() is None ]
+        
         self._c.executemany( 'INSERT OR IGNORE INTO shape_perceptual_hash_map ( phash_id, hash_id ) VALUES ( ?, ? );', ( ( phash_id, hash_id ) for phash_id in phash_ids ) )
         
         if self._GetRowCount() > 0:
@@ -812,6 +978,8 @@ class DB( HydrusDB.HydrusDB ):
             self._c.execute( 'REPLACE INTO shape_search_cache ( hash_id, searched_distance ) VALUES ( ?, ? );', ( hash_id, None ) )
             
         
+        self._similar_files_phash_index.AddPHashes( [ ( phash_id, phash_ids_to_phashes[ phash_id ] ) for phash_id in newly_useful_phash_ids ] )
+        
         return phash_ids
         
     
@@ -840,6 +1008,62 @@ class DB( HydrusDB.HydrusDB ):
         self._c.executemany( 'UPDATE shape_search_cache SET searched_distance = NULL WHERE hash_id = ?;', ( ( hash_id, ) for hash_id in hash_ids ) )
         
     
+    def _CacheSimilarFilesDiscoverDuplicatePairs( self, hash_ids, search_distance ):
+        
+        phash_index = self._CacheSimilarFilesGetPHashIndex()
+        
+        pairs = set()
+        
+        if phash_index is None:
+            
+            for hash_id in hash_ids:
+                
+                for duplicate_hash_id in self._CacheSimilarFilesSearch( hash_id, search_distance ):
+                    
+                    if duplicate_hash_id != hash_id:
+                        
+                        pairs.add( ( min( hash_id, duplicate_hash_id ), max( hash_id, duplicate_hash_id ) ) )
+                        
+                    
+                
+            
+        else:
+            
+            select_statement = 'SELECT hash_id, phash FROM shape_perceptual_hash_map NATURAL JOIN shape_perceptual_hashes WHERE hash_id IN %s;'
+            
+            search_rows = self._SelectFromListFetchAll( select_statement, hash_ids )
+            
+            if len( search_rows ) > 0:
+                
+                similar_phash_ids_lists = phash_index.SearchMany( [ phash for ( hash_id, phash ) in search_rows ], search_distance )
+                
+                all_similar_phash_ids = set( itertools.chain.from_iterable( similar_phash_ids_lists ) )
+                
+                select_statement = 'SELECT phash_id, hash_id FROM shape_perceptual_hash_map WHERE phash_id IN %s;'
+                
+                similar_phash_ids_to_hash_ids = HydrusData.BuildKeyToListDict( self._SelectFromList( select_statement, all_similar_phash_ids ) )
+                
+                for ( ( hash_id, search_phash ), similar_phash_ids ) in zip( search_rows, similar_phash_ids_lists ):
+                    
+                    for similar_phash_id in similar_phash_ids:
+                        
+                        for duplicate_hash_id in similar_phash_ids_to_hash_ids[ similar_phash_id ]:
+                            
+                            if duplicate_hash_id != hash_id:
+                                
+                                pairs.add( ( min( hash_id, duplicate_hash_id ), max( hash_id, duplicate_hash_id ) ) )
+                                
+                            
+                        
+                    
+                
+            
+        
+        self._c.executemany( 'INSERT OR IGNORE INTO duplicate_pairs ( smaller_hash_id, larger_hash_id, duplicate_type ) VALUES ( ?, ?, ? );', ( ( smaller_hash_id, larger_hash_id, HC.DUPLICATE_UNKNOWN ) for ( smaller_hash_id, larger_hash_id ) in pairs ) )
+        
+        self._c.executemany( 'UPDATE shape_search_cache SET searched_distance = ? WHERE hash_id = ?;', ( ( search_distance, hash_id ) for hash_id in hash_ids ) )
+        
+    
     def _CacheSimilarFilesDisassociatePHashes( self, hash_id, phash_ids ):
         
         self._c.executemany( 'DELETE FROM shape_perceptual_hash_map WHERE phash_id = ? AND hash_id = ?;', ( ( phash_id, hash_id ) for phash_id in phash_ids ) )
@@ -850,6 +1074,8 @@ class DB( HydrusDB.HydrusDB ):
         
         self._c.executemany( 'INSERT OR IGNORE INTO shape_maintenance_branch_regen ( phash_id ) VALUES ( ? );', ( ( phash_id, ) for phash_id in useless_phash_ids ) )
         
+        self._similar_files_phash_index.RemovePHashIds( useless_phash_ids )
+        
     
     def _CacheSimilarFilesGenerateBranch( self, job_key, parent_id, phash_id, phash, children ):
         
@@ -1169,6 +1395,30 @@ class DB( HydrusDB.HydrusDB ):
         return ( num_phashes_to_regen, num_branches_to_regen, searched_distances_to_count )
         
     
+    def _CacheSimilarFilesGetPHashIndex( self ):
+        
+        if not ClientDuplicates.NUMPY_OK:
+            
+            return None
+            
+        
+        if not self._similar_files_phash_index.IsLoaded():
+            
+            # only the writer fills the index, as a read pool snapshot might not see the writer's latest associations
+            
+            if self._IsReadPoolReader():
+                
+                return None
+                
+            
+            rows = self._c.execute( 'SELECT phash_id, phash FROM shape_perceptual_hashes WHERE phash_id IN ( SELECT phash_id FROM shape_perceptual_hash_map );' ).fetchall()
+            
+            self._similar_files_phash_index.SetPHashes( rows )
+            
+        
+        return self._similar_files_phash_index
+        
+    
     def _CacheSimilarFilesGetPHashId( self, phash ):
         
         result = self._c.execute( 'SELECT phash_id FROM shape_perceptual_hashes WHERE phash = ?;', ( sqlite3.Binary( phash ), ) ).fetchone()
@@ -1428,7 +1678,20 @@ class DB( HydrusDB.HydrusDB ):
             
             total_done_previously = total_num_hash_ids_in_cache - len( hash_ids )
             
-            for ( i, hash_id ) in enumerate( hash_ids ):
+            # with the phash index in memory, we can search a whole block of files in one go
+            
+            if self._CacheSimilarFilesGetPHashIndex() is None:
+                
+                block_size = 1
+                
+            else:
+                
+                block_size = 1024
+                
+            
+            i = 0
+            
+            for block_of_hash_ids in HydrusData.SplitListIntoChunks( hash_ids, block_size ):
                 
                 job_key.SetVariable( 'popup_title', 'similar files duplicate pair discovery' )
                 
@@ -1448,7 +1711,7 @@ class DB( HydrusDB.HydrusDB ):
                     return
                     
                 
-                if i % 25 == 0:
+                if i % 25 < block_size:
                     
                     text = 'searched ' + HydrusData.ConvertValueRangeToPrettyString( total_done_previously + i, total_num_hash_ids_in_cache ) + ' files'
                     
@@ -1458,13 +1721,9 @@ class DB( HydrusDB.HydrusDB ):
                     HG.client_controller.pub( 'splash_set_status_subtext', text )
                     
                 
-                duplicate_hash_ids = [ duplicate_hash_id for duplicate_hash_id in self._CacheSimilarFilesSearch( hash_id, search_distance ) if duplicate_hash_id != hash_id ]
-                
-                # double-check the files exist in shape_search_cache, as I think stale branches are producing deleted file pairs here
-                
-                self._c.executemany( 'INSERT OR IGNORE INTO duplicate_pairs ( smaller_hash_id, larger_hash_id, duplicate_type ) VALUES ( ?, ?, ? );', ( ( min( hash_id, duplicate_hash_id ), max( hash_id, duplicate_hash_id ), HC.DUPLICATE_UNKNOWN ) for duplicate_hash_id in duplicate_hash_ids ) )
+                self._CacheSimilarFilesDiscoverDuplicatePairs( block_of_hash_ids, search_distance )
                 
-                self._c.execute( 'UPDATE shape_search_cache SET searched_distance = ? WHERE hash_id = ?;', ( search_distance, hash_id ) )
+                i += len( block_of_hash_ids )
                 
             
         finally:
@@ -1877,6 +2136,8 @@ class DB( HydrusDB.HydrusDB ):
             
             self._c.execute( 'DELETE FROM shape_perceptual_hash_map WHERE hash_id NOT IN ( SELECT hash_id FROM current_files );' )
             
+            self._similar_files_phash_index.Reset()
+            
             job_key.SetVariable( 'popup_text_1', 'gathering all leaves' )
             
             self._c.execute( 'DELETE FROM shape_vptree;' )
@@ -1920,23 +2181,37 @@ class DB( HydrusDB.HydrusDB ):
             
             search_radius = max_hamming_distance
             
-            top_node_result = self._c.execute( 'SELECT phash_id FROM shape_vptree WHERE parent_id IS NULL;' ).fetchone()
+            search_phashes = self._STL( self._c.execute( 'SELECT phash FROM shape_perceptual_hashes NATURAL JOIN shape_perceptual_hash_map WHERE hash_id = ?;', ( hash_id, ) ) )
             
-            if top_node_result is None:
+            if len( search_phashes ) == 0:
                 
                 return []
                 
             
-            ( root_node_phash_id, ) = top_node_result
+            similar_phash_ids = set()
             
-            search_phashes = self._STL( self._c.execute( 'SELECT phash FROM shape_perceptual_hashes NATURAL JOIN shape_perceptual_hash_map WHERE hash_id = ?;', ( hash_id, ) ) )
+            phash_index = self._CacheSimilarFilesGetPHashIndex()
             
-            if len( search_phashes ) == 0:
+            if phash_index is not None:
+                
+                for search_phash in search_phashes:
+                    
+                    similar_phash_ids.update( phash_index.Search( search_phash, search_radius ) )
+                    
+                
+                select_statement = 'SELECT hash_id FROM shape_perceptual_hash_map WHERE phash_id IN %s;'
+                
+                return self._STL( self._SelectFromList( select_statement, similar_phash_ids ) )
+                
+            
+            top_node_result = self._c.execute( 'SELECT phash_id FROM shape_vptree WHERE parent_id IS NULL;' ).fetchone()
+            
+            if top_node_result is None:
                 
                 return []
                 
             
-            similar_phash_ids = set()
+            ( root_node_phash_id, ) = top_node_result
             
             num_cycles = 0
             
@@ -2345,6 +2620,44 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
+    def _CacheSpecificMappingsAddMappingsFromTable( self, file_service_id, tag_service_id, table_name ):
+        
+        # the set-based version of _CacheSpecificMappingsAddMappings. table_name holds ( tag_id, hash_id ) rows that are all new to the tag service's current mappings
+        
+        ( cache_files_table_name, cache_current_mappings_table_name, cache_deleted_mappings_table_name, cache_pending_mappings_table_name, ac_cache_table_name ) = GenerateSpecificMappingsCacheTableNames( file_service_id, tag_service_id )
+        
+        cache_rows_select = 'SELECT hash_id, tag_id FROM ' + table_name + ' CROSS JOIN ' + cache_files_table_name + ' USING ( hash_id )'
+        
+        # pending and deleted rows are rare, so look them up from our side and delete just those
+        
+        pending_rows = self._c.execute( cache_rows_select + ' CROSS JOIN ' + cache_pending_mappings_table_name + ' USING ( hash_id, tag_id );' ).fetchall()
+        
+        self._c.executemany( 'DELETE FROM ' + cache_pending_mappings_table_name + ' WHERE hash_id = ? AND tag_id = ?;', pending_rows )
+        
+        deleted_rows = self._c.execute( cache_rows_select + ' CROSS JOIN ' + cache_deleted_mappings_table_name + ' USING ( hash_id, tag_id );' ).fetchall()
+        
+        self._c.executemany( 'DELETE FROM ' + cache_deleted_mappings_table_name + ' WHERE hash_id = ? AND tag_id = ?;', deleted_rows )
+        
+        #
+        
+        current_counter = collections.Counter( dict( self._c.execute( 'SELECT tag_id, COUNT( * ) FROM ' + table_name + ' CROSS JOIN ' + cache_files_table_name + ' USING ( hash_id ) WHERE NOT EXISTS ( SELECT 1 FROM ' + cache_current_mappings_table_name + ' WHERE ' + cache_current_mappings_table_name + '.hash_id = ' + table_name + '.hash_id AND ' + cache_current_mappings_table_name + '.tag_id = ' + table_name + '.tag_id ) GROUP BY tag_id;' ) ) )
+        
+        self._c.execute( 'INSERT OR IGNORE INTO ' + cache_current_mappings_table_name + ' ( hash_id, tag_id ) ' + cache_rows_select + ';' )
+        
+        pending_counter = collections.Counter( ( tag_id for ( hash_id, tag_id ) in pending_rows ) )
+        
+        tag_ids = set( current_counter.keys() ).union( pending_counter.keys() )
+        
+        if len( tag_ids ) > 0:
+            
+            self._c.executemany( 'INSERT OR IGNORE INTO ' + ac_cache_table_name + ' ( tag_id, current_count, pending_count ) VALUES ( ?, ?, ? );', ( ( tag_id, 0, 0 ) for tag_id in tag_ids ) )
+            
+            self._c.executemany( 'UPDATE ' + ac_cache_table_name + ' SET current_count = current_count + ?, pending_count = pending_count - ? WHERE tag_id = ?;', ( ( current_counter[ tag_id ], pending_counter[ tag_id ], tag_id ) for tag_id in tag_ids ) )
+            
+            self._c.executemany( 'DELETE FROM ' + ac_cache_table_name + ' WHERE tag_id = ? AND current_count = ? AND pending_count = ?;', ( ( tag_id, 0, 0 ) for tag_id in tag_ids ) )
+            
+        
+    
     def _CacheSpecificMappingsDrop( self, file_service_id, tag_service_id ):
         
         ( cache_files_table_name, cache_current_mappings_table_name, cache_deleted_mappings_table_name, cache_pending_mappings_table_name, ac_cache_table_name ) = GenerateSpecificMappingsCacheTableNames( file_service_id, tag_service_id )
@@ -2930,6 +3243,22 @@ class DB( HydrusDB.HydrusDB ):
         self._c.execute( 'CREATE TABLE json_dumps ( dump_type INTEGER PRIMARY KEY, version INTEGER, dump BLOB_BYTES );' )
         self._c.execute( 'CREATE TABLE json_dumps_named ( dump_type INTEGER, dump_name TEXT, version INTEGER, timestamp INTEGER, dump BLOB_BYTES, PRIMARY KEY ( dump_type, dump_name, timestamp ) );' )
         
+        self._c.execute( 'CREATE TABLE json_dumps_file_seed_caches ( dump_type INTEGER, dump_name TEXT, file_seed_cache_key BLOB_BYTES, PRIMARY KEY ( dump_type, dump_name, file_seed_cache_key ) );' )
+        self._CreateIndex( 'json_dumps_file_seed_caches', [ 'file_seed_cache_key' ] )
+        
+        self._c.execute( 'CREATE TABLE json_dumps_file_seeds ( file_seed_cache_key BLOB_BYTES, file_seed_type INTEGER, file_seed_data TEXT, file_seed_index INTEGER, dump BLOB_BYTES, PRIMARY KEY ( file_seed_cache_key, file_seed_type, file_seed_data ) );' )
+        self._CreateIndex( 'json_dumps_file_seeds', [ 'file_seed_cache_key', 'file_seed_index' ] )
+        
+        self._c.execute( 'CREATE TABLE json_dumps_named_hash_lists ( dump_type INTEGER, dump_name TEXT, timestamp INTEGER, hashes_key BLOB_BYTES, PRIMARY KEY ( dump_type, dump_name, timestamp, hashes_key ) );' )
+        self._CreateIndex( 'json_dumps_named_hash_lists', [ 'hashes_key' ] )
+        
+        self._c.execute( 'CREATE TABLE json_dumps_hash_lists ( hashes_key BLOB_BYTES PRIMARY KEY, hash_ids BLOB_BYTES );' )
+        
+        self._c.execute( 'CREATE TABLE json_dumps_export_folder_manifests ( dump_name TEXT PRIMARY KEY, manifest_key BLOB_BYTES );' )
+        
+        self._c.execute( 'CREATE TABLE export_folder_manifests ( manifest_key BLOB_BYTES, hash_id INTEGER, path TEXT, PRIMARY KEY ( manifest_key, hash_id ) );' )
+        self._CreateIndex( 'export_folder_manifests', [ 'manifest_key', 'path' ] )
+        
         self._c.execute( 'CREATE TABLE last_shutdown_work_time ( last_shutdown_work_time INTEGER );' )
         
         self._c.execute( 'CREATE TABLE local_ratings ( service_id INTEGER REFERENCES services ON DELETE CASCADE, hash_id INTEGER, rating REAL, PRIMARY KEY ( service_id, hash_id ) );' )
@@ -3231,45 +3560,134 @@ class DB( HydrusDB.HydrusDB ):
         self._c.execute( 'DELETE FROM json_dumps WHERE dump_type = ?;', ( dump_type, ) )
         
     
-    def _DeleteJSONDumpNamed( self, dump_type, dump_name = None, timestamp = None ):
+    def _DeleteJSONDumpExportFolderManifestKeys( self, manifest_keys ):
         
-        if dump_name is None:
+        for manifest_key in manifest_keys:
             
-            self._c.execute( 'DELETE FROM json_dumps_named WHERE dump_type = ?;', ( dump_type, ) )
+            result = self._c.execute( 'SELECT 1 FROM json_dumps_export_folder_manifests WHERE manifest_key = ?;', ( manifest_key, ) ).fetchone()
             
-        elif timestamp is None:
+            if result is None:
+                
+                self._c.execute( 'DELETE FROM export_folder_manifests WHERE manifest_key = ?;', ( manifest_key, ) )
+                
             
-            self._c.execute( 'DELETE FROM json_dumps_named WHERE dump_type = ? AND dump_name = ?;', ( dump_type, dump_name ) )
+        
+    
+    def _DeleteJSONDumpExportFolderManifests( self, dump_name = None ):
+        
+        if dump_name is None:
+            
+            manifest_keys = self._STL( self._c.execute( 'SELECT manifest_key FROM json_dumps_export_folder_manifests;' ) )
+            
+            self._c.execute( 'DELETE FROM json_dumps_export_folder_manifests;' )
             
         else:
             
-            self._c.execute( 'DELETE FROM json_dumps_named WHERE dump_type = ? AND dump_name = ? AND timestamp = ?;', ( dump_type, dump_name, timestamp ) )
+            manifest_keys = self._STL( self._c.execute( 'SELECT manifest_key FROM json_dumps_export_folder_manifests WHERE dump_name = ?;', ( dump_name, ) ) )
+            
+            self._c.execute( 'DELETE FROM json_dumps_export_folder_manifests WHERE dump_name = ?;', ( dump_name, ) )
             
         
-    
-    def _DeletePending( self, service_key ):
+        self._DeleteJSONDumpExportFolderManifestKeys( manifest_keys )
         
-        service_id = self._GetServiceId( service_key )
+    
+    def _DeleteJSONDumpFileSeedCacheKeys( self, file_seed_cache_keys ):
         
-        service = self._GetService( service_id )
+        # a cache's rows are only dropped once no dump refers to it, so a renamed subscription keeps its file seeds
         
-        if service.GetServiceType() == HC.TAG_REPOSITORY:
+        for file_seed_cache_key in file_seed_cache_keys:
             
-            ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = GenerateMappingsTableNames( service_id )
+            result = self._c.execute( 'SELECT 1 FROM json_dumps_file_seed_caches WHERE file_seed_cache_key = ?;', ( file_seed_cache_key, ) ).fetchone()
             
-            pending_rescinded_mappings_ids = list(HydrusData.BuildKeyToListDict( self._c.execute( 'SELECT tag_id, hash_id FROM ' + pending_mappings_table_name + ';' ) ).items())
+            if result is None:
+                
+                self._c.execute( 'DELETE FROM json_dumps_file_seeds WHERE file_seed_cache_key = ?;', ( file_seed_cache_key, ) )
+                
             
-            petitioned_rescinded_mappings_ids = list(HydrusData.BuildKeyToListDict( self._c.execute( 'SELECT tag_id, hash_id FROM ' + petitioned_mappings_table_name + ';' ) ).items())
+        
+    
+    def _DeleteJSONDumpFileSeedCaches( self, dump_type, dump_name = None ):
+        
+        if dump_name is None:
             
-            self._UpdateMappings( service_id, pending_rescinded_mappings_ids = pending_rescinded_mappings_ids, petitioned_rescinded_mappings_ids = petitioned_rescinded_mappings_ids )
+            file_seed_cache_keys = self._STL( self._c.execute( 'SELECT file_seed_cache_key FROM json_dumps_file_seed_caches WHERE dump_type = ?;', ( dump_type, ) ) )
             
-            self._c.execute( 'DELETE FROM tag_sibling_petitions WHERE service_id = ?;', ( service_id, ) )
-            self._c.execute( 'DELETE FROM tag_parent_petitions WHERE service_id = ?;', ( service_id, ) )
+            self._c.execute( 'DELETE FROM json_dumps_file_seed_caches WHERE dump_type = ?;', ( dump_type, ) )
             
-        elif service.GetServiceType() in ( HC.FILE_REPOSITORY, HC.IPFS ):
+        else:
             
-            self._c.execute( 'DELETE FROM file_transfers WHERE service_id = ?;', ( service_id, ) )
-            self._c.execute( 'DELETE FROM file_petitions WHERE service_id = ?;', ( service_id, ) )
+            result = self._c.execute( 'SELECT 1 FROM json_dumps_named WHERE dump_type = ? AND dump_name = ?;', ( dump_type, dump_name ) ).fetchone()
+            
+            if result is not None:
+                
+                return
+                
+            
+            file_seed_cache_keys = self._STL( self._c.execute( 'SELECT file_seed_cache_key FROM json_dumps_file_seed_caches WHERE dump_type = ? AND dump_name = ?;', ( dump_type, dump_name ) ) )
+            
+            self._c.execute( 'DELETE FROM json_dumps_file_seed_caches WHERE dump_type = ? AND dump_name = ?;', ( dump_type, dump_name ) )
+            
+        
+        self._DeleteJSONDumpFileSeedCacheKeys( file_seed_cache_keys )
+        
+    
+    def _DeleteJSONDumpHashListOrphans( self ):
+        
+        self._c.execute( 'DELETE FROM json_dumps_named_hash_lists WHERE NOT EXISTS ( SELECT 1 FROM json_dumps_named WHERE json_dumps_named.dump_type = json_dumps_named_hash_lists.dump_type AND json_dumps_named.dump_name = json_dumps_named_hash_lists.dump_name AND json_dumps_named.timestamp = json_dumps_named_hash_lists.timestamp );' )
+        
+        self._c.execute( 'DELETE FROM json_dumps_hash_lists WHERE hashes_key NOT IN ( SELECT hashes_key FROM json_dumps_named_hash_lists );' )
+        
+    
+    def _DeleteJSONDumpNamed( self, dump_type, dump_name = None, timestamp = None ):
+        
+        if dump_name is None:
+            
+            self._c.execute( 'DELETE FROM json_dumps_named WHERE dump_type = ?;', ( dump_type, ) )
+            
+        elif timestamp is None:
+            
+            self._c.execute( 'DELETE FROM json_dumps_named WHERE dump_type = ? AND dump_name = ?;', ( dump_type, dump_name ) )
+            
+        else:
+            
+            self._c.execute( 'DELETE FROM json_dumps_named WHERE dump_type = ? AND dump_name = ? AND timestamp = ?;', ( dump_type, dump_name, timestamp ) )
+            
+        
+        if dump_type == HydrusSerialisable.SERIALISABLE_TYPE_EXPORT_FOLDER:
+            
+            self._DeleteJSONDumpExportFolderManifests( dump_name = dump_name )
+            
+        elif dump_type == HydrusSerialisable.SERIALISABLE_TYPE_SUBSCRIPTION:
+            
+            self._DeleteJSONDumpFileSeedCaches( dump_type, dump_name = dump_name )
+            
+        
+        self._DeleteJSONDumpHashListOrphans()
+        
+    
+    def _DeletePending( self, service_key ):
+        
+        service_id = self._GetServiceId( service_key )
+        
+        service = self._GetService( service_id )
+        
+        if service.GetServiceType() == HC.TAG_REPOSITORY:
+            
+            ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = GenerateMappingsTableNames( service_id )
+            
+            pending_rescinded_mappings_ids = list(HydrusData.BuildKeyToListDict( self._c.execute( 'SELECT tag_id, hash_id FROM ' + pending_mappings_table_name + ';' ) ).items())
+            
+            petitioned_rescinded_mappings_ids = list(HydrusData.BuildKeyToListDict( self._c.execute( 'SELECT tag_id, hash_id FROM ' + petitioned_mappings_table_name + ';' ) ).items())
+            
+            self._UpdateMappings( service_id, pending_rescinded_mappings_ids = pending_rescinded_mappings_ids, petitioned_rescinded_mappings_ids = petitioned_rescinded_mappings_ids )
+            
+            self._c.execute( 'DELETE FROM tag_sibling_petitions WHERE service_id = ?;', ( service_id, ) )
+            self._c.execute( 'DELETE FROM tag_parent_petitions WHERE service_id = ?;', ( service_id, ) )
+            
+        elif service.GetServiceType() in ( HC.FILE_REPOSITORY, HC.IPFS ):
+            
+            self._c.execute( 'DELETE FROM file_transfers WHERE service_id = ?;', ( service_id, ) )
+            self._c.execute( 'DELETE FROM file_petitions WHERE service_id = ?;', ( service_id, ) )
             
         
         self.pub_after_job( 'notify_new_pending' )
@@ -3295,7 +3713,7 @@ class DB( HydrusDB.HydrusDB ):
             
             file_hashes = self._GetHashes( deletable_file_hash_ids )
             
-            self._controller.CallToThread( client_files_manager.DelayedDeleteFiles, file_hashes )
+            self._controller.CallToThreadWithPriority( HydrusThreading.THREAD_POOL_PRIORITY_MAINTENANCE, client_files_manager.DelayedDeleteFiles, file_hashes )
             
         
         useful_thumbnail_hash_ids = self._STS( self._c.execute( 'SELECT hash_id FROM current_files WHERE hash_id IN ' + HydrusData.SplayListForDB( hash_ids ) + ';' ) )
@@ -3306,7 +3724,7 @@ class DB( HydrusDB.HydrusDB ):
             
             thumbnail_hashes = self._GetHashes( deletable_thumbnail_hash_ids )
             
-            self._controller.CallToThread( client_files_manager.DelayedDeleteThumbnails, thumbnail_hashes )
+            self._controller.CallToThreadWithPriority( HydrusThreading.THREAD_POOL_PRIORITY_MAINTENANCE, client_files_manager.DelayedDeleteThumbnails, thumbnail_hashes )
             
         
         for hash_id in hash_ids:
@@ -3713,6 +4131,17 @@ class DB( HydrusDB.HydrusDB ):
         self._CreateIndex( petitioned_mappings_table_name, [ 'hash_id', 'tag_id' ], unique = True )
         
     
+    def _GenerateReadPoolReaderCaches( self ):
+        
+        reader_caches = {}
+        
+        reader_caches[ '_service_cache' ] = {}
+        reader_caches[ '_hash_ids_to_hashes_cache' ] = {}
+        reader_caches[ '_tag_ids_to_tags_cache' ] = {}
+        
+        return reader_caches
+        
+    
     def _GetAutocompleteCounts( self, tag_service_id, file_service_id, tag_ids, include_current, include_pending ):
         
         if tag_service_id == self._combined_tag_service_id:
@@ -3772,6 +4201,74 @@ class DB( HydrusDB.HydrusDB ):
         return ids_to_count
         
     
+    def _GetAutocompleteCountEstimates( self, file_service_id, tag_service_id, tags, include_current, include_pending ):
+        
+        # a quick estimate of how many files each tag search will hit, for ordering a query's predicates
+        # a tag search covers its siblings, and an unnamespaced one covers every namespace, so we total all those a/c counts
+        
+        tag_service_key = self._GetService( tag_service_id ).GetServiceKey()
+        
+        if tag_service_id == self._combined_tag_service_id:
+            
+            search_tag_service_ids = self._GetServiceIds( HC.TAG_SERVICES )
+            
+        else:
+            
+            search_tag_service_ids = [ tag_service_id ]
+            
+        
+        siblings_manager = self._controller.tag_siblings_manager
+        
+        tags_to_tag_ids = {}
+        
+        for tag in tags:
+            
+            tag_ids = set()
+            
+            for sibling in siblings_manager.GetAllSiblings( tag_service_key, tag ):
+                
+                ( namespace, subtag ) = HydrusTags.SplitTag( sibling )
+                
+                if namespace != '':
+                    
+                    if self._TagExists( sibling ):
+                        
+                        tag_ids.add( self._GetTagId( sibling ) )
+                        
+                    
+                elif self._SubtagExists( subtag ):
+                    
+                    subtag_id = self._GetSubtagId( subtag )
+                    
+                    tag_ids.update( self._STI( self._c.execute( 'SELECT tag_id FROM tags WHERE subtag_id = ?;', ( subtag_id, ) ) ) )
+                    
+                
+            
+            tags_to_tag_ids[ tag ] = tag_ids
+            
+        
+        all_tag_ids = set()
+        
+        for tag_ids in tags_to_tag_ids.values():
+            
+            all_tag_ids.update( tag_ids )
+            
+        
+        tag_ids_to_counts = collections.Counter()
+        
+        for search_tag_service_id in search_tag_service_ids:
+            
+            ids_to_count = self._GetAutocompleteCounts( search_tag_service_id, file_service_id, all_tag_ids, include_current, include_pending )
+            
+            for ( tag_id, ( current_min, current_max, pending_min, pending_max ) ) in ids_to_count.items():
+                
+                tag_ids_to_counts[ tag_id ] += current_min + pending_min
+                
+            
+        
+        return { tag : sum( ( tag_ids_to_counts[ tag_id ] for tag_id in tag_ids ) ) for ( tag, tag_ids ) in tags_to_tag_ids.items() }
+        
+    
     def _GetAutocompleteTagIds( self, service_key, search_text, exact_match, job_key = None ):
         
         if exact_match:
@@ -4104,6 +4601,52 @@ class DB( HydrusDB.HydrusDB ):
         return { hash for ( hash, ) in self._c.execute( 'SELECT hash FROM file_transfers NATURAL JOIN hashes WHERE service_id = ?;', ( self._combined_local_file_service_id, ) ) }
         
     
+    def _GetFileSeedCacheFileSeeds( self, file_seed_cache_key ):
+        
+        dumps = self._STL( self._c.execute( 'SELECT dump FROM json_dumps_file_seeds WHERE file_seed_cache_key = ? ORDER BY file_seed_index ASC;', ( sqlite3.Binary( file_seed_cache_key ), ) ) )
+        
+        file_seeds = []
+        
+        for dump in dumps:
+            
+            if isinstance( dump, bytes ):
+                
+                dump = str( dump, 'utf-8' )
+                
+            
+            file_seeds.append( HydrusSerialisable.CreateFromSerialisableTuple( json.loads( dump ) ) )
+            
+        
+        return file_seeds
+        
+    
+    def _GetExportFolderManifestClaimedPaths( self, manifest_key, paths ):
+        
+        manifest_key = sqlite3.Binary( manifest_key )
+        
+        return { path for path in paths if self._c.execute( 'SELECT 1 FROM export_folder_manifests WHERE manifest_key = ? AND path = ?;', ( manifest_key, path ) ).fetchone() is not None }
+        
+    
+    def _GetExportFolderManifestDelta( self, manifest_key, query_hash_ids ):
+        
+        # an export folder only has to deal with the files that have started or stopped matching since its last run
+        
+        manifest_key = sqlite3.Binary( manifest_key )
+        
+        manifest_was_empty = self._c.execute( 'SELECT 1 FROM export_folder_manifests WHERE manifest_key = ? LIMIT 1;', ( manifest_key, ) ).fetchone() is None
+        
+        with HydrusDB.TemporaryIntegerTable( self._c, query_hash_ids, 'hash_id' ) as temp_table_name:
+            
+            new_hash_ids = self._STL( self._c.execute( 'SELECT hash_id FROM ' + temp_table_name + ' WHERE NOT EXISTS ( SELECT 1 FROM export_folder_manifests WHERE manifest_key = ? AND export_folder_manifests.hash_id = ' + temp_table_name + '.hash_id );', ( manifest_key, ) ) )
+            
+            vanished_rows = self._c.execute( 'SELECT hash_id, path FROM export_folder_manifests WHERE manifest_key = ? AND hash_id NOT IN ( SELECT hash_id FROM ' + temp_table_name + ' );', ( manifest_key, ) ).fetchall()
+            
+        
+        new_hash_ids.sort()
+        
+        return ( new_hash_ids, vanished_rows, manifest_was_empty )
+        
+    
     def _GetFileHashes( self, given_hashes, given_hash_type, desired_hash_type ):
         
         if given_hash_type == 'sha256':
@@ -4392,6 +4935,28 @@ class DB( HydrusDB.HydrusDB ):
         return [ self._hash_ids_to_hashes_cache[ hash_id ] for hash_id in hash_ids ]
         
     
+    def _GetHashesToHashIds( self, hashes ):
+        
+        # looks up and allocates the whole list in a few queries rather than two per hash
+        
+        hashes = list( { hash for hash in hashes if hash is not None } )
+        
+        select_statement = 'SELECT hash, hash_id FROM hashes WHERE hash IN %s;'
+        
+        hashes_to_hash_ids = { bytes( hash ) : hash_id for ( hash, hash_id ) in self._SelectFromList( select_statement, [ sqlite3.Binary( hash ) for hash in hashes ] ) }
+        
+        hashes_not_in_db = [ hash for hash in hashes if hash not in hashes_to_hash_ids ]
+        
+        if len( hashes_not_in_db ) > 0:
+            
+            self._c.executemany( 'INSERT INTO hashes ( hash ) VALUES ( ? );', ( ( sqlite3.Binary( hash ), ) for hash in hashes_not_in_db ) )
+            
+            hashes_to_hash_ids.update( { bytes( hash ) : hash_id for ( hash, hash_id ) in self._SelectFromList( select_statement, [ sqlite3.Binary( hash ) for hash in hashes_not_in_db ] ) } )
+            
+        
+        return hashes_to_hash_ids
+        
+    
     def _GetHashId( self, hash ):
         
         result = self._c.execute( 'SELECT hash_id FROM hashes WHERE hash = ?;', ( sqlite3.Binary( hash ), ) ).fetchone()
@@ -4635,7 +5200,7 @@ class DB( HydrusDB.HydrusDB ):
         return hash_ids
         
     
-    def _GetHashIdsFromQuery( self, search_context, job_key = None, query_hash_ids = None ):
+    def _GetHashIdsFromQuery( self, search_context, job_key = None, query_hash_ids = None, sort_by = None ):
         
         if job_key is None:
             
@@ -4818,6 +5383,49 @@ class DB( HydrusDB.HydrusDB ):
             return query_hash_ids
             
         
+        limit = system_predicates.GetLimit()
+        
+        sort_column = ConvertMediaSortToSQLOrderColumn( sort_by )
+        
+        # a limited search that is only simple system preds on a specific domain can be answered entirely by sqlite
+        # this stops 'system:everything, limit=256, newest first' from loading every hash_id in the client
+        
+        SQL_LIMIT_PREDICATE_TYPES = { HC.PREDICATE_TYPE_SYSTEM_EVERYTHING, HC.PREDICATE_TYPE_SYSTEM_INBOX, HC.PREDICATE_TYPE_SYSTEM_ARCHIVE, HC.PREDICATE_TYPE_SYSTEM_LIMIT, HC.PREDICATE_TYPE_SYSTEM_SIZE, HC.PREDICATE_TYPE_SYSTEM_AGE, HC.PREDICATE_TYPE_SYSTEM_WIDTH, HC.PREDICATE_TYPE_SYSTEM_HEIGHT, HC.PREDICATE_TYPE_SYSTEM_RATIO, HC.PREDICATE_TYPE_SYSTEM_DURATION, HC.PREDICATE_TYPE_SYSTEM_MIME, HC.PREDICATE_TYPE_SYSTEM_NUM_WORDS, HC.PREDICATE_TYPE_SYSTEM_NUM_PIXELS, HC.PREDICATE_TYPE_SYSTEM_DIMENSIONS }
+        
+        can_limit_in_sql = limit is not None and sort_column is not None and query_hash_ids is None and file_service_key != CC.COMBINED_FILE_SERVICE_KEY
+        
+        if can_limit_in_sql and False not in ( predicate.GetType() in SQL_LIMIT_PREDICATE_TYPES for predicate in search_context.GetPredicates() ):
+            
+            where_phrases = [ 'service_id = ' + str( file_service_id ) ]
+            
+            where_phrases.extend( files_info_predicates )
+            
+            if system_predicates.MustBeInbox():
+                
+                where_phrases.append( 'hash_id IN ( SELECT hash_id FROM file_inbox )' )
+                
+            elif system_predicates.MustBeArchive():
+                
+                where_phrases.append( 'hash_id NOT IN ( SELECT hash_id FROM file_inbox )' )
+                
+            
+            if file_service_key == CC.COMBINED_LOCAL_FILE_SERVICE_KEY:
+                
+                where_phrases.append( 'hash_id NOT IN ( SELECT hash_id FROM current_files WHERE service_id = ' + str( self._local_update_service_id ) + ' )' )
+                
+            
+            order_phrase = sort_column
+            
+            if sort_by.sort_type != ( 'system', CC.SORT_FILES_BY_RANDOM ):
+                
+                order_phrase += ' DESC' if sort_by.sort_asc == CC.SORT_DESC else ' ASC'
+                
+            
+            query = 'SELECT hash_id FROM current_files NATURAL JOIN files_info WHERE ' + ' AND '.join( where_phrases ) + ' ORDER BY ' + order_phrase + ' LIMIT ' + str( limit ) + ';'
+            
+            return self._STL( self._c.execute( query ) )
+            
+        
         # start with some quick ways to populate query_hash_ids
         
         def update_qhi( query_hash_ids, some_hash_ids ):
@@ -5019,18 +5627,64 @@ class DB( HydrusDB.HydrusDB ):
                 
             
         
+        # now a little planning before the big fetches
+        # we estimate how many files each way of starting the search will hit and start with the smallest, so the later fetches only have to filter a small candidate set
+        
+        if len( tags_to_include ) > 0:
+            
+            tags_to_estimated_counts = self._GetAutocompleteCountEstimates( file_service_id, tag_service_id, tags_to_include, include_current_tags, include_pending_tags )
+            
+        else:
+            
+            tags_to_estimated_counts = {}
+            
+        
+        if query_hash_ids is None and system_predicates.MustBeInbox() and file_service_key != CC.COMBINED_FILE_SERVICE_KEY:
+            
+            num_inbox = len( self._inbox_hash_ids )
+            
+            if len( tags_to_estimated_counts ) > 0:
+                
+                start_with_inbox = num_inbox < min( tags_to_estimated_counts.values() )
+                
+            else:
+                
+                # otherwise we would scan the whole file domain. checking candidates one by one is a few times slower per row than a scan, so only do it if the inbox is comfortably smaller
+                
+                result = self._c.execute( 'SELECT info FROM service_info WHERE service_id = ? AND info_type = ?;', ( file_service_id, HC.SERVICE_INFO_NUM_FILES ) ).fetchone()
+                
+                if result is None:
+                    
+                    start_with_inbox = True
+                    
+                else:
+                    
+                    ( num_files_in_domain, ) = result
+                    
+                    start_with_inbox = num_inbox * 4 < num_files_in_domain
+                    
+                
+            
+            if start_with_inbox:
+                
+                query_hash_ids = set( self._inbox_hash_ids )
+                
+            
+        
         # first tags
         
         if there_are_tags_to_search:
             
-            def sort_longest_first_key( s ):
+            # rarest first, so every later tag is searched only within the files the rarer ones matched
+            
+            def sort_rarest_first_key( tag ):
                 
-                return -len( s )
+                return ( tags_to_estimated_counts.get( tag, 0 ), -len( tag ) )
                 
             
             tags_to_include = list( tags_to_include )
             
-            tags_to_include.sort( key = sort_longest_first_key )
+            tags_to_include.sort( key = sort_rarest_first_key )
             
             for tag in tags_to_include:
                 
@@ -5427,7 +6081,63 @@ class DB( HydrusDB.HydrusDB ):
         
         #
         
-        limit = system_predicates.GetLimit()
+        if limit is not None and limit < len( query_hash_ids ) and sort_column is not None and sort_by.sort_type != ( 'system', CC.SORT_FILES_BY_RANDOM ):
+            
+            # the caller is going to sort these, so the limit should be the first n in that sort, not a random sample
+            
+            if file_service_key == CC.COMBINED_FILE_SERVICE_KEY:
+                
+                if sort_column == 'timestamp':
+                    
+                    select_statement = None
+                    
+                else:
+                    
+                    select_statement = 'SELECT hash_id, ' + sort_column + ' FROM files_info WHERE hash_id IN %s;'
+                    
+                
+            else:
+                
+                select_statement = 'SELECT hash_id, ' + sort_column + ' FROM current_files NATURAL JOIN files_info WHERE service_id = ' + str( file_service_id ) + ' AND hash_id IN %s;'
+                
+            
+            if select_statement is not None:
+                
+                def sort_key( row ):
+                    
+                    ( hash_id, value ) = row
+                    
+                    if value is None:
+                        
+                        return -1
+                        
+                    
+                    return value
+                    
+                
+                rows = self._SelectFromListFetchAll( select_statement, query_hash_ids )
+                
+                # files we know nothing about still count, they just sort like a missing value
+                
+                if len( rows ) < len( query_hash_ids ):
+                    
+                    hash_ids_with_info = { hash_id for ( hash_id, value ) in rows }
+                    
+                    rows.extend( ( ( hash_id, None ) for hash_id in query_hash_ids if hash_id not in hash_ids_with_info ) )
+                    
+                
+                if sort_by.sort_asc == CC.SORT_DESC:
+                    
+                    rows = heapq.nlargest( limit, rows, key = sort_key )
+                    
+                else:
+                    
+                    rows = heapq.nsmallest( limit, rows, key = sort_key )
+                    
+                
+                return [ hash_id for ( hash_id, value ) in rows ]
+                
+            
         
         if limit is not None and limit <= len( query_hash_ids ):
             
@@ -5438,7 +6148,147 @@ class DB( HydrusDB.HydrusDB ):
             query_hash_ids = list( query_hash_ids )
             
         
-        return query_hash_ids
+        return query_hash_ids
+        
+    
+    def _GetHashIdsFromQueryPage( self, search_context, file_id_cursor = None, num_file_ids = None, job_key = None ):
+        
+        # results come in file id order, so file_id_cursor (the last id of the previous page) is a stable continuation even if files are imported or deleted between pages
+        # a system:limit is applied in the same order, or a random sample would give each page a different result set
+        # the first page runs the whole query and keeps the sorted result, so continuing pages are a bisect, not another full search
+        # continuing pages are hence a snapshot of the first. files imported since do not appear, and files that have left the file domain are filtered out
+        
+        search_key = search_context.DumpToString()
+        
+        sorted_hash_ids = None
+        
+        if file_id_cursor is not None:
+            
+            # read pool readers share this cache with the writer
+            
+            with self._query_page_results_cache_lock:
+                
+                if search_key in self._query_page_results_cache:
+                    
+                    ( sorted_hash_ids, timestamp ) = self._query_page_results_cache[ search_key ]
+                    
+                    if HydrusData.TimeHasPassed( timestamp + self.QUERY_PAGE_RESULTS_TIMEOUT ):
+                        
+                        del self._query_page_results_cache[ search_key ]
+                        
+                        sorted_hash_ids = None
+                        
+                    else:
+                        
+                        # a search that is still being scrolled through stays alive and goes to the back of the eviction queue
+                        
+                        self._query_page_results_cache[ search_key ] = ( sorted_hash_ids, HydrusData.GetNow() )
+                        
+                        self._query_page_results_cache.move_to_end( search_key )
+                        
+                    
+                
+            
+        
+        from_cache = sorted_hash_ids is not None
+        
+        if not from_cache:
+            
+            limit = search_context.GetSystemPredicates().GetLimit()
+            
+            if limit is None:
+                
+                query_search_context = search_context
+                
+            else:
+                
+                query_search_context = search_context.Duplicate()
+                
+                query_search_context.SetPredicates( [ predicate for predicate in query_search_context.GetPredicates() if predicate.GetType() != HC.PREDICATE_TYPE_SYSTEM_LIMIT ] )
+                
+            
+            query_hash_ids = self._GetHashIdsFromQuery( query_search_context, job_key = job_key )
+            
+            if limit is None:
+                
+                sorted_hash_ids = sorted( query_hash_ids )
+                
+            else:
+                
+                sorted_hash_ids = heapq.nsmallest( limit, query_hash_ids )
+                
+            
+            if num_file_ids is not None:
+                
+                # a big search is millions of ids, so we hold them as four bytes each rather than as python ints
+                
+                sorted_hash_ids = array.array( 'I', sorted_hash_ids )
+                
+                with self._query_page_results_cache_lock:
+                    
+                    for ( key, ( cached_hash_ids, timestamp ) ) in list( self._query_page_results_cache.items() ):
+                        
+                        if HydrusData.TimeHasPassed( timestamp + self.QUERY_PAGE_RESULTS_TIMEOUT ):
+                            
+                            del self._query_page_results_cache[ key ]
+                            
+                        
+                    
+                    self._query_page_results_cache[ search_key ] = ( sorted_hash_ids, HydrusData.GetNow() )
+                    
+                    self._query_page_results_cache.move_to_end( search_key )
+                    
+                    while len( self._query_page_results_cache ) > self.QUERY_PAGE_RESULTS_MAX_ENTRIES:
+                        
+                        self._query_page_results_cache.popitem( last = False )
+                        
+                    
+                
+            
+        
+        if file_id_cursor is None:
+            
+            start_index = 0
+            
+        else:
+            
+            start_index = bisect.bisect_right( sorted_hash_ids, file_id_cursor )
+            
+        
+        if num_file_ids is None:
+            
+            page_hash_ids = list( sorted_hash_ids[ start_index : ] )
+            
+            next_file_id_cursor = None
+            
+        else:
+            
+            page_hash_ids = list( sorted_hash_ids[ start_index : start_index + num_file_ids ] )
+            
+            if start_index + num_file_ids < len( sorted_hash_ids ):
+                
+                next_file_id_cursor = page_hash_ids[ -1 ]
+                
+            else:
+                
+                next_file_id_cursor = None
+                
+            
+        
+        file_service_key = search_context.GetFileServiceKey()
+        
+        if from_cache and file_service_key != CC.COMBINED_FILE_SERVICE_KEY and len( page_hash_ids ) > 0:
+            
+            file_service_id = self._GetServiceId( file_service_key )
+            
+            select_statement = 'SELECT hash_id FROM current_files WHERE service_id = ' + str( file_service_id ) + ' AND hash_id IN %s;'
+            
+            current_hash_ids = self._STS( self._SelectFromList( select_statement, page_hash_ids ) )
+            
+            page_hash_ids = [ hash_id for hash_id in page_hash_ids if hash_id in current_hash_ids ]
+            
+        
+        return ( page_hash_ids, next_file_id_cursor )
         
     
     def _GetHashIdsFromSubtagIds( self, file_service_key, tag_service_key, subtag_ids, include_current_tags, include_pending_tags ):
@@ -5844,7 +6694,7 @@ class DB( HydrusDB.HydrusDB ):
             
         elif hashes is not None:
             
-            hash_ids_to_hashes = { self._GetHashId( hash ) : hash for hash in hashes }
+            hash_ids_to_hashes = { hash_id : hash for ( hash, hash_id ) in self._GetHashesToHashIds( hashes ).items() }
             
         
         return hash_ids_to_hashes
@@ -6112,6 +6962,31 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
+    def _GetJSONDumpHashLists( self, hashes_keys ):
+        
+        hashes_keys_to_hashes = {}
+        
+        for hashes_key in hashes_keys:
+            
+            result = self._c.execute( 'SELECT hash_ids FROM json_dumps_hash_lists WHERE hashes_key = ?;', ( sqlite3.Binary( hashes_key ), ) ).fetchone()
+            
+            if result is None:
+                
+                continue
+                
+            
+            ( hash_ids_blob, ) = result
+            
+            hash_ids = array.array( 'I' )
+            
+            hash_ids.frombytes( hash_ids_blob )
+            
+            hashes_keys_to_hashes[ hashes_key ] = self._GetHashes( hash_ids.tolist() )
+            
+        
+        return hashes_keys_to_hashes
+        
+    
     def _GetJSONDumpNamed( self, dump_type, dump_name = None, timestamp = None ):
         
         if dump_name is None:
@@ -6131,7 +7006,14 @@ class DB( HydrusDB.HydrusDB ):
                     
                     serialisable_info = json.loads( dump )
                     
-                    objs.append( HydrusSerialisable.CreateFromSerialisableTuple( ( dump_type, dump_name, version, serialisable_info ) ) )
+                    obj = HydrusSerialisable.CreateFromSerialisableTuple( ( dump_type, dump_name, version, serialisable_info ) )
+                    
+                    if dump_type == HydrusSerialisable.SERIALISABLE_TYPE_GUI_SESSION:
+                        
+                        obj.ResolveHashes( self._GetJSONDumpHashLists( obj.GetUnresolvedHashesKeys() ) )
+                        
+                    
+                    objs.append( obj )
                     
                 except:
                     
@@ -6184,7 +7066,14 @@ class DB( HydrusDB.HydrusDB ):
                 DealWithBrokenJSONDump( self._db_dir, dump, 'dump_type {} dump_name {} timestamp {}'.format( dump_type, dump_name[:10], object_timestamp ) )
                 
             
-            return HydrusSerialisable.CreateFromSerialisableTuple( ( dump_type, dump_name, version, serialisable_info ) )
+            obj = HydrusSerialisable.CreateFromSerialisableTuple( ( dump_type, dump_name, version, serialisable_info ) )
+            
+            if dump_type == HydrusSerialisable.SERIALISABLE_TYPE_GUI_SESSION:
+                
+                obj.ResolveHashes( self._GetJSONDumpHashLists( obj.GetUnresolvedHashesKeys() ) )
+                
+            
+            return obj
             
         
     
@@ -6348,6 +7237,13 @@ class DB( HydrusDB.HydrusDB ):
                 missing_media_results.append( ClientMedia.MediaResult( file_info_manager, tags_manager, locations_manager, ratings_manager, file_viewing_stats_manager ) )
                 
             
+            if self._ReadPoolSnapshotIsStale():
+                
+                # a write may have changed these files while we were building them, and it will have missed them in the cache
+                
+                raise HydrusExceptions.DBWriterRequiredException( 'A write job finished while media results were being built.' )
+                
+            
             self._weakref_media_result_cache.AddMediaResults( missing_media_results )
             
             cached_media_results.extend( missing_media_results )
@@ -6856,7 +7752,11 @@ class DB( HydrusDB.HydrusDB ):
             
             service = ClientServices.GenerateService( service_key, service_type, name, dictionary )
             
-            self._service_cache[ service_id ] = service
+            # a reader would never hear about the writer changing this service, so it does not keep it
+            if not self._IsReadPoolReader():
+                
+                self._service_cache[ service_id ] = service
+                
             
         
         return service
@@ -7577,52 +8477,107 @@ class DB( HydrusDB.HydrusDB ):
     
     def _ImportFile( self, file_import_job ):
         
-        hash = file_import_job.GetHash()
+        ( ( status, note ), ) = self._ImportFiles( ( file_import_job, ) )
         
-        hash_id = self._GetHashId( hash )
+        return ( status, note )
         
-        ( status, status_hash, note ) = self._GetHashIdStatus( hash_id, prefix = 'file recognised' )
+    
+    def _ImportFiles( self, file_import_jobs ):
         
-        if status != CC.STATUS_SUCCESSFUL_BUT_REDUNDANT:
-            
-            ( size, mime, width, height, duration, num_frames, num_words ) = file_import_job.GetFileInfo()
-            
-            timestamp = HydrusData.GetNow()
+        # one transaction for the whole batch, with the inserts and cache updates done as bulk operations
+        # results line up with the jobs
+        
+        hashes = [ file_import_job.GetHash() for file_import_job in file_import_jobs ]
+        
+        hashes_to_hash_ids = self._GetHashesToHashIds( hashes )
+        
+        results = []
+        
+        new_hash_ids = set()
+        
+        files_info_rows = []
+        files_rows = []
+        local_hashes_rows = []
+        content_updates = []
+        archive_hash_ids = []
+        inbox_hash_ids = []
+        
+        timestamp = HydrusData.GetNow()
+        
+        for ( file_import_job, hash ) in zip( file_import_jobs, hashes ):
             
-            phashes = file_import_job.GetPHashes()
+            hash_id = hashes_to_hash_ids[ hash ]
             
-            if phashes is not None:
+            if hash_id in new_hash_ids:
                 
-                self._CacheSimilarFilesAssociatePHashes( hash_id, phashes )
+                results.append( ( CC.STATUS_SUCCESSFUL_BUT_REDUNDANT, 'file recognised: Imported earlier in this batch.' ) )
+                
+                continue
                 
             
-            self._AddFilesInfo( [ ( hash_id, size, mime, width, height, duration, num_frames, num_words ) ], overwrite = True )
+            ( status, status_hash, note ) = self._GetHashIdStatus( hash_id, prefix = 'file recognised' )
             
-            self._AddFiles( self._local_file_service_id, [ ( hash_id, timestamp ) ] )
+            if status != CC.STATUS_SUCCESSFUL_BUT_REDUNDANT:
+                
+                new_hash_ids.add( hash_id )
+                
+                ( size, mime, width, height, duration, num_frames, num_words ) = file_import_job.GetFileInfo()
+                
+                phashes = file_import_job.GetPHashes()
+                
+                if phashes is not None:
+                    
+                    self._CacheSimilarFilesAssociatePHashes( hash_id, phashes )
+                    
+                
+                files_info_rows.append( ( hash_id, size, mime, width, height, duration, num_frames, num_words ) )
+                files_rows.append( ( hash_id, timestamp ) )
+                
+                file_info_manager = ClientMedia.FileInfoManager( hash_id, hash, size, mime, width, height, duration, num_frames, num_words )
+                
+                content_updates.append( HydrusData.ContentUpdate( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_ADD, ( file_info_manager, timestamp ) ) )
+                
+                ( md5, sha1, sha512 ) = file_import_job.GetExtraHashes()
+                
+                local_hashes_rows.append( ( hash_id, sqlite3.Binary( md5 ), sqlite3.Binary( sha1 ), sqlite3.Binary( sha512 ) ) )
+                
+                file_import_options = file_import_job.GetFileImportOptions()
+                
+                if file_import_options.AutomaticallyArchives():
+                    
+                    archive_hash_ids.append( hash_id )
+                    
+                else:
+                    
+                    inbox_hash_ids.append( hash_id )
+                    
+                
+                status = CC.STATUS_SUCCESSFUL_AND_NEW
+                
             
-            file_info_manager = ClientMedia.FileInfoManager( hash_id, hash, size, mime, width, height, duration, num_frames, num_words )
+            results.append( ( status, note ) )
             
-            content_update = HydrusData.ContentUpdate( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_ADD, ( file_info_manager, timestamp ) )
+        
+        if len( new_hash_ids ) > 0:
             
-            self.pub_content_updates_after_commit( { CC.LOCAL_FILE_SERVICE_KEY : [ content_update ] } )
+            self._AddFilesInfo( files_info_rows, overwrite = True )
             
-            ( md5, sha1, sha512 ) = file_import_job.GetExtraHashes()
+            self._AddFiles( self._local_file_service_id, files_rows )
             
-            self._c.execute( 'INSERT OR IGNORE INTO local_hashes ( hash_id, md5, sha1, sha512 ) VALUES ( ?, ?, ?, ? );', ( hash_id, sqlite3.Binary( md5 ), sqlite3.Binary( sha1 ), sqlite3.Binary( sha512 ) ) )
+            self.pub_content_updates_after_commit( { CC.LOCAL_FILE_SERVICE_KEY : content_updates } )
             
-            file_import_options = file_import_job.GetFileImportOptions()
+            self._c.executemany( 'INSERT OR IGNORE INTO local_hashes ( hash_id, md5, sha1, sha512 ) VALUES ( ?, ?, ?, ? );', local_hashes_rows )
             
-            if file_import_options.AutomaticallyArchives():
+            if len( archive_hash_ids ) > 0:
                 
-                self._ArchiveFiles( ( hash_id, ) )
+                self._ArchiveFiles( archive_hash_ids )
                 
-            else:
+            
+            if len( inbox_hash_ids ) > 0:
                 
-                self._InboxFiles( ( hash_id, ) )
+                self._InboxFiles( inbox_hash_ids )
                 
             
-            status = CC.STATUS_SUCCESSFUL_AND_NEW
-            
         
         tag_services = self._GetServices( HC.TAG_SERVICES )
         
@@ -7640,30 +8595,23 @@ class DB( HydrusDB.HydrusDB ):
                 
                 try:
                     
-                    self._SyncHashesToTagArchive( [ hash ], hta_path, service_key, adding, namespaces )
+                    self._SyncHashesToTagArchive( hashes_to_hash_ids, hta_path, service_key, adding, namespaces )
                     
-                except:
+                except Exception as e:
                     
-                    pass
+                    HydrusData.Print( 'Could not sync imported files to the tag archive "{}":'.format( hta_path ) )
+                    
+                    HydrusData.PrintException( e )
                     
                 
             
         
-        return ( status, note )
+        return results
         
     
     def _ImportUpdate( self, update_network_bytes, update_hash, mime ):
         
-        try:
-            
-            update = HydrusSerialisable.CreateFromNetworkBytes( update_network_bytes )
-            
-        except:
-            
-            HydrusData.ShowText( 'Was unable to parse an incoming update!' )
-            
-            raise
-            
+        # callers have already parsed the update to get its mime, so there is no need to hold up the db doing it again
         
         hash_id = self._GetHashId( update_hash )
         
@@ -7700,7 +8648,18 @@ class DB( HydrusDB.HydrusDB ):
             
             self._c.executemany( 'UPDATE service_info SET info = info + ? WHERE service_id = ? AND info_type = ?;', [ ( count, service_id, HC.SERVICE_INFO_NUM_INBOX ) for ( service_id, count ) in updates ] )
             
-            self._inbox_hash_ids.update( hash_ids )
+            with self._read_pool_lock:
+                
+                if self._read_pool_num_jobs_running == 0:
+                    
+                    self._inbox_hash_ids.update( hash_ids )
+                    
+                else:
+                    
+                    # a read pool job may be iterating over the set, so it keeps the one it has
+                    self._inbox_hash_ids = self._inbox_hash_ids.union( hash_ids )
+                    
+                
             
         
     
@@ -7722,8 +8681,11 @@ class DB( HydrusDB.HydrusDB ):
         self._service_cache = {}
         
         self._weakref_media_result_cache = ClientCaches.MediaResultCache()
+        self._similar_files_phash_index = ClientDuplicates.PHashIndex()
         self._hash_ids_to_hashes_cache = {}
         self._tag_ids_to_tags_cache = {}
+        self._query_page_results_cache = collections.OrderedDict()
+        self._query_page_results_cache_lock = threading.Lock()
         
         ( self._null_namespace_id, ) = self._c.execute( 'SELECT namespace_id FROM namespaces WHERE namespace = ?;', ( '', ) ).fetchone()
         
@@ -7999,9 +8961,27 @@ class DB( HydrusDB.HydrusDB ):
     
     def _OverwriteJSONDumps( self, dump_types, objs ):
         
+        # the file seeds and export manifests of objects that are coming straight back, maybe under a new name, should survive, so they are only cleared at the end
+        
+        manifest_keys = set()
+        file_seed_cache_keys = set()
+        
         for dump_type in dump_types:
             
-            self._DeleteJSONDumpNamed( dump_type )
+            if dump_type == HydrusSerialisable.SERIALISABLE_TYPE_EXPORT_FOLDER:
+                
+                manifest_keys.update( self._STI( self._c.execute( 'SELECT manifest_key FROM json_dumps_export_folder_manifests;' ) ) )
+                
+                self._c.execute( 'DELETE FROM json_dumps_export_folder_manifests;' )
+                
+            elif dump_type == HydrusSerialisable.SERIALISABLE_TYPE_SUBSCRIPTION:
+                
+                file_seed_cache_keys.update( self._STI( self._c.execute( 'SELECT file_seed_cache_key FROM json_dumps_file_seed_caches WHERE dump_type = ?;', ( dump_type, ) ) ) )
+                
+                self._c.execute( 'DELETE FROM json_dumps_file_seed_caches WHERE dump_type = ?;', ( dump_type, ) )
+                
+            
+            self._c.execute( 'DELETE FROM json_dumps_named WHERE dump_type = ?;', ( dump_type, ) )
             
         
         for obj in objs:
@@ -8009,6 +8989,10 @@ class DB( HydrusDB.HydrusDB ):
             self._SetJSONDump( obj )
             
         
+        self._DeleteJSONDumpExportFolderManifestKeys( manifest_keys )
+        self._DeleteJSONDumpFileSeedCacheKeys( file_seed_cache_keys )
+        self._DeleteJSONDumpHashListOrphans()
+        
     
     def _PopulateHashIdsToHashesCache( self, hash_ids, exception_on_error = False ):
         
@@ -8038,6 +9022,11 @@ class DB( HydrusDB.HydrusDB ):
                             raise HydrusExceptions.DataMissing( 'Did not find all entries for those hash ids!' )
                             
                         
+                        if self._IsReadPoolReader():
+                            
+                            raise HydrusExceptions.DBWriterRequiredException( 'A hash_id was missing from a read pool snapshot.' )
+                            
+                        
                         HydrusData.DebugPrint( 'Database hash error: hash_id ' + str( hash_id ) + ' was missing!' )
                         
                         if not pubbed_error:
@@ -8839,6 +9828,7 @@ class DB( HydrusDB.HydrusDB ):
         
         FILES_CHUNK_SIZE = 200
         MAPPINGS_CHUNK_SIZE = 50000
+        BULK_MAPPINGS_CHUNK_SIZE = 250000
         NEW_TAG_PARENTS_CHUNK_SIZE = 10
         
         total_rows = content_update.GetNumRows()
@@ -8909,7 +9899,24 @@ class DB( HydrusDB.HydrusDB ):
         
         #
         
-        for chunk in HydrusData.SplitMappingListIntoChunks( content_update.GetNewMappings(), MAPPINGS_CHUNK_SIZE ):
+        new_mappings = content_update.GetNewMappings()
+        
+        num_new_mappings = sum( ( len( service_hash_ids ) for ( service_tag_id, service_hash_ids ) in new_mappings ) )
+        
+        # big updates, like the first sync of a tag repo, go through temp tables and set-based sql
+        
+        bulk_mappings = num_new_mappings >= self.BULK_MAPPINGS_THRESHOLD
+        
+        if bulk_mappings:
+            
+            new_mappings_chunk_size = BULK_MAPPINGS_CHUNK_SIZE
+            
+        else:
+            
+            new_mappings_chunk_size = MAPPINGS_CHUNK_SIZE
+            
+        
+        for chunk in HydrusData.SplitMappingListIntoChunks( new_mappings, new_mappings_chunk_size ):
             
             ( i_paused, should_quit ) = job_key.WaitIfNeeded()
             
@@ -8920,21 +9927,32 @@ class DB( HydrusDB.HydrusDB ):
             
             precise_timestamp = HydrusData.GetNowPrecise()
             
-            mappings_ids = []
-            
-            num_rows = 0
+            num_rows = sum( ( len( service_hash_ids ) for ( service_tag_id, service_hash_ids ) in chunk ) )
             
-            for ( service_tag_id, service_hash_ids ) in chunk:
+            if bulk_mappings:
                 
-                tag_id = self._CacheRepositoryNormaliseServiceTagId( service_id, service_tag_id )
-                hash_ids = self._CacheRepositoryNormaliseServiceHashIds( service_id, service_hash_ids )
+                self._c.execute( 'CREATE TABLE mem.temp_bulk_mappings ( tag_id INTEGER, hash_id INTEGER, PRIMARY KEY ( tag_id, hash_id ) ) WITHOUT ROWID;' )
                 
-                mappings_ids.append( ( tag_id, hash_ids ) )
+                self._CacheRepositoryNormaliseServiceMappingsIntoTable( service_id, chunk, 'temp_bulk_mappings' )
                 
-                num_rows += len( service_hash_ids )
+                self._UpdateMappingsFromTable( service_id, 'temp_bulk_mappings' )
+                
+                self._c.execute( 'DROP TABLE temp_bulk_mappings;' )
+                
+            else:
+                
+                mappings_ids = []
+                
+                for ( service_tag_id, service_hash_ids ) in chunk:
+                    
+                    tag_id = self._CacheRepositoryNormaliseServiceTagId( service_id, service_tag_id )
+                    hash_ids = self._CacheRepositoryNormaliseServiceHashIds( service_id, service_hash_ids )
+                    
+                    mappings_ids.append( ( tag_id, hash_ids ) )
+                    
+                
+                self._UpdateMappings( service_id, mappings_ids = mappings_ids )
                 
-            
-            self._UpdateMappings( service_id, mappings_ids = mappings_ids )
             
             rows_processed += num_rows
             
@@ -9445,11 +10463,15 @@ class DB( HydrusDB.HydrusDB ):
         elif action == 'client_files_locations': result = self._GetClientFilesLocations( *args, **kwargs )
         elif action == 'downloads': result = self._GetDownloads( *args, **kwargs )
         elif action == 'duplicate_pairs_for_filtering': result = self._CacheSimilarFilesGetDuplicatePairsForFiltering( *args, **kwargs )
+        elif action == 'export_folder_manifest_claimed_paths': result = self._GetExportFolderManifestClaimedPaths( *args, **kwargs )
+        elif action == 'export_folder_manifest_delta': result = self._GetExportFolderManifestDelta( *args, **kwargs )
         elif action == 'file_duplicate_hashes': result = self._CacheSimilarFilesGetFileDuplicateHashes( *args, **kwargs )
         elif action == 'file_duplicate_types_to_counts': result = self._CacheSimilarFilesGetFileDuplicateCounts( *args, **kwargs )
         elif action == 'file_hashes': result = self._GetFileHashes( *args, **kwargs )
         elif action == 'file_notes': result = self._GetFileNotes( *args, **kwargs )
         elif action == 'file_query_ids': result = self._GetHashIdsFromQuery( *args, **kwargs )
+        elif action == 'file_seed_cache_file_seeds': result = self._GetFileSeedCacheFileSeeds( *args, **kwargs )
+        elif action == 'file_query_ids_page': result = self._GetHashIdsFromQueryPage( *args, **kwargs )
         elif action == 'file_system_predicates': result = self._GetFileSystemPredicates( *args, **kwargs )
         elif action == 'filter_existing_tags': result = self._FilterExistingTags( *args, **kwargs )
         elif action == 'filter_hashes': result = self._FilterHashes( *args, **kwargs )
@@ -9565,6 +10587,26 @@ class DB( HydrusDB.HydrusDB ):
             
             client_files_manager = self._controller.client_files_manager
             
+            # thumbnails are made in batches so the thumbnail workers can all be kept busy
+            
+            thumbnail_batch_size = client_files_manager.GetNumThumbnailWorkers() * 4
+            
+            def regenerate_thumbnails( medias ):
+                
+                failures = client_files_manager.LocklessRegenerateThumbnails( medias )
+                
+                for ( media, e ) in failures:
+                    
+                    message = 'There was a problem re-thumbnailing file ' + media.GetHash().hex() + '! A full traceback of this error should be written to the log!'
+                    message += os.linesep * 2
+                    message += str( e )
+                    
+                    HydrusData.ShowText( message )
+                    
+                
+            
+            thumbnail_medias = []
+            
             num_thumb_refits = 0
             
             num_to_do = len( hashes )
@@ -9642,13 +10684,13 @@ class DB( HydrusDB.HydrusDB ):
                         
                         if do_thumbnail or job_type == ClientFiles.REGENERATE_FILE_DATA_JOB_FORCE_THUMBNAIL:
                             
-                            client_files_manager.LocklessRegenerateThumbnail( media_result )
+                            thumbnail_medias.append( media_result )
                             
                         elif job_type == ClientFiles.REGENERATE_FILE_DATA_JOB_REFIT_THUMBNAIL:
                             
-                            was_regenerated = client_files_manager.LocklessRegenerateThumbnailIfWrongSize( media_result )
-                            
-                            if was_regenerated:
+                            if client_files_manager.LocklessThumbnailIsWrongSize( media_result ):
+                                
+                                thumbnail_medias.append( media_result )
                                 
                                 num_thumb_refits += 1
                                 
@@ -9668,6 +10710,18 @@ class DB( HydrusDB.HydrusDB ):
                     HydrusData.ShowText( message )
                     
                 
+                if len( thumbnail_medias ) >= thumbnail_batch_size:
+                    
+                    regenerate_thumbnails( thumbnail_medias )
+                    
+                    thumbnail_medias = []
+                    
+                
+            
+            if len( thumbnail_medias ) > 0:
+                
+                regenerate_thumbnails( thumbnail_medias )
+                
             
             if needed_to_dupe_some_files:
                 
@@ -9955,6 +11009,18 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
+    def _Rollback( self ):
+        
+        HydrusDB.HydrusDB._Rollback( self )
+        
+        # any phashes added or removed in the failed job are no longer true, so reload from the db next time
+        
+        if hasattr( self, '_similar_files_phash_index' ):
+            
+            self._similar_files_phash_index.Reset()
+            
+        
+    
     def _SaveDirtyServices( self, dirty_services ):
         
         # if allowed to save objects
@@ -10014,7 +11080,58 @@ class DB( HydrusDB.HydrusDB ):
         
         if isinstance( obj, HydrusSerialisable.SerialisableBaseNamed ):
             
-            ( dump_type, dump_name, version, serialisable_info ) = obj.GetSerialisableTuple()
+            if obj.SERIALISABLE_TYPE == HydrusSerialisable.SERIALISABLE_TYPE_SUBSCRIPTION:
+                
+                # subscription file seeds are journaled row by row, so the named dump only holds a reference to them
+                
+                file_seed_caches = obj.GetFileSeedCaches()
+                
+                self._SetJSONDumpFileSeedCaches( obj.SERIALISABLE_TYPE, obj.GetName(), file_seed_caches )
+                
+                for file_seed_cache in file_seed_caches:
+                    
+                    file_seed_cache.SetSerialiseByReference( True )
+                    
+                
+                try:
+                    
+                    ( dump_type, dump_name, version, serialisable_info ) = obj.GetSerialisableTuple()
+                    
+                finally:
+                    
+                    for file_seed_cache in file_seed_caches:
+                        
+                        file_seed_cache.SetSerialiseByReference( False )
+                        
+                    
+                
+            elif obj.SERIALISABLE_TYPE == HydrusSerialisable.SERIALISABLE_TYPE_EXPORT_FOLDER:
+                
+                self._SetJSONDumpExportFolderManifestKey( obj.GetName(), obj.GetManifestKey() )
+                
+                ( dump_type, dump_name, version, serialisable_info ) = obj.GetSerialisableTuple()
+                
+            elif obj.SERIALISABLE_TYPE == HydrusSerialisable.SERIALISABLE_TYPE_GUI_SESSION:
+                
+                # page hashes are stored as hash_id lists shared between sessions and backups, so the named dump only holds a reference to them
+                
+                hashes_keys_to_hashes = obj.GetHashesKeysToHashes()
+                
+                obj.SetSerialiseByReference( True )
+                
+                try:
+                    
+                    ( dump_type, dump_name, version, serialisable_info ) = obj.GetSerialisableTuple()
+                    
+                finally:
+                    
+                    obj.SetSerialiseByReference( False )
+                    
+                
+            else:
+                
+                ( dump_type, dump_name, version, serialisable_info ) = obj.GetSerialisableTuple()
+                
             
             try:
                 
@@ -10057,9 +11174,11 @@ class DB( HydrusDB.HydrusDB ):
             
             dump_buffer = sqlite3.Binary( bytes( dump, 'utf-8' ) )
             
+            timestamp = HydrusData.GetNow()
+            
             try:
                 
-                self._c.execute( 'INSERT INTO json_dumps_named ( dump_type, dump_name, version, timestamp, dump ) VALUES ( ?, ?, ?, ?, ? );', ( dump_type, dump_name, version, HydrusData.GetNow(), dump_buffer ) )
+                self._c.execute( 'INSERT INTO json_dumps_named ( dump_type, dump_name, version, timestamp, dump ) VALUES ( ?, ?, ?, ?, ? );', ( dump_type, dump_name, version, timestamp, dump_buffer ) )
                 
             except:
                 
@@ -10069,6 +11188,13 @@ class DB( HydrusDB.HydrusDB ):
                 raise
                 
             
+            if dump_type == HydrusSerialisable.SERIALISABLE_TYPE_GUI_SESSION:
+                
+                self._SetJSONDumpHashLists( dump_type, dump_name, timestamp, hashes_keys_to_hashes )
+                
+                self._DeleteJSONDumpHashListOrphans()
+                
+            
         else:
             
             ( dump_type, version, serialisable_info ) = obj.GetSerialisableTuple()
@@ -10086,20 +11212,106 @@ class DB( HydrusDB.HydrusDB ):
                 raise Exception( 'Trying to json dump the object ' + str( obj ) + ' caused an error. Its serialisable info has been dumped to the log.' )
                 
             
-            self._c.execute( 'DELETE FROM json_dumps WHERE dump_type = ?;', ( dump_type, ) )
+            self._c.execute( 'DELETE FROM json_dumps WHERE dump_type = ?;', ( dump_type, ) )
+            
+            dump_buffer = sqlite3.Binary( bytes( dump, 'utf-8' ) )
+            
+            try:
+                
+                self._c.execute( 'INSERT INTO json_dumps ( dump_type, version, dump ) VALUES ( ?, ?, ? );', ( dump_type, version, dump_buffer ) )
+                
+            except:
+                
+                HydrusData.DebugPrint( dump )
+                HydrusData.ShowText( 'Had a problem saving a JSON object. The dump has been printed to the log.' )
+                
+                raise
+                
+            
+        
+    
+    def _SetJSONDumpExportFolderManifestKey( self, dump_name, manifest_key ):
+        
+        # an edited export folder starts a fresh manifest, so the old one can go straight away
+        
+        manifest_key = sqlite3.Binary( manifest_key )
+        
+        old_manifest_keys = self._STL( self._c.execute( 'SELECT manifest_key FROM json_dumps_export_folder_manifests WHERE dump_name = ? AND manifest_key != ?;', ( dump_name, manifest_key ) ) )
+        
+        self._c.execute( 'REPLACE INTO json_dumps_export_folder_manifests ( dump_name, manifest_key ) VALUES ( ?, ? );', ( dump_name, manifest_key ) )
+        
+        for old_manifest_key in old_manifest_keys:
+            
+            if self._c.execute( 'SELECT 1 FROM json_dumps_export_folder_manifests WHERE manifest_key = ?;', ( old_manifest_key, ) ).fetchone() is None:
+                
+                self._c.execute( 'DELETE FROM export_folder_manifests WHERE manifest_key = ?;', ( old_manifest_key, ) )
+                
+            
+        
+    
+    def _SetJSONDumpFileSeedCaches( self, dump_type, dump_name, file_seed_caches ):
+        
+        old_file_seed_cache_keys = self._STS( self._c.execute( 'SELECT file_seed_cache_key FROM json_dumps_file_seed_caches WHERE dump_type = ? AND dump_name = ?;', ( dump_type, dump_name ) ) )
+        
+        self._c.execute( 'DELETE FROM json_dumps_file_seed_caches WHERE dump_type = ? AND dump_name = ?;', ( dump_type, dump_name ) )
+        
+        for file_seed_cache in file_seed_caches:
+            
+            journal = file_seed_cache.GetJournal()
+            
+            self.call_after_rollback( file_seed_cache.RestoreJournal, journal )
+            
+            ( file_seed_cache_key, rewrite_all, upsertee_rows, deletee_rows, reindex_rows ) = journal
+            
+            old_file_seed_cache_keys.discard( file_seed_cache_key )
+            
+            file_seed_cache_key = sqlite3.Binary( file_seed_cache_key )
+            
+            self._c.execute( 'INSERT OR IGNORE INTO json_dumps_file_seed_caches ( dump_type, dump_name, file_seed_cache_key ) VALUES ( ?, ?, ? );', ( dump_type, dump_name, file_seed_cache_key ) )
+            
+            if rewrite_all:
+                
+                self._c.execute( 'DELETE FROM json_dumps_file_seeds WHERE file_seed_cache_key = ?;', ( file_seed_cache_key, ) )
+                
+            
+            self._c.executemany( 'DELETE FROM json_dumps_file_seeds WHERE file_seed_cache_key = ? AND file_seed_type = ? AND file_seed_data = ?;', ( ( file_seed_cache_key, file_seed_type, file_seed_data ) for ( file_seed_type, file_seed_data ) in deletee_rows ) )
+            
+            self._c.executemany( 'UPDATE json_dumps_file_seeds SET file_seed_index = ? WHERE file_seed_cache_key = ? AND file_seed_type = ? AND file_seed_data = ?;', ( ( file_seed_index, file_seed_cache_key, file_seed_type, file_seed_data ) for ( file_seed_index, file_seed_type, file_seed_data ) in reindex_rows ) )
+            
+            inserts = []
+            
+            for ( file_seed_index, file_seed ) in upsertee_rows:
+                
+                dump = json.dumps( file_seed.GetSerialisableTuple() )
+                
+                inserts.append( ( file_seed_cache_key, file_seed.file_seed_type, file_seed.file_seed_data, file_seed_index, sqlite3.Binary( bytes( dump, 'utf-8' ) ) ) )
+                
+            
+            self._c.executemany( 'REPLACE INTO json_dumps_file_seeds ( file_seed_cache_key, file_seed_type, file_seed_data, file_seed_index, dump ) VALUES ( ?, ?, ?, ?, ? );', inserts )
+            
+        
+        # queries that were removed or replaced by a copy
+        
+        self._DeleteJSONDumpFileSeedCacheKeys( old_file_seed_cache_keys )
+        
+    
+    def _SetJSONDumpHashLists( self, dump_type, dump_name, timestamp, hashes_keys_to_hashes ):
+        
+        for ( hashes_key, hashes ) in hashes_keys_to_hashes.items():
+            
+            hashes_key = sqlite3.Binary( hashes_key )
             
-            dump_buffer = sqlite3.Binary( bytes( dump, 'utf-8' ) )
+            self._c.execute( 'INSERT OR IGNORE INTO json_dumps_named_hash_lists ( dump_type, dump_name, timestamp, hashes_key ) VALUES ( ?, ?, ?, ? );', ( dump_type, dump_name, timestamp, hashes_key ) )
             
-            try:
-                
-                self._c.execute( 'INSERT INTO json_dumps ( dump_type, version, dump ) VALUES ( ?, ?, ? );', ( dump_type, version, dump_buffer ) )
-                
-            except:
+            # a page that has not changed since the last save is already stored, so most saves only write the references
+            
+            result = self._c.execute( 'SELECT 1 FROM json_dumps_hash_lists WHERE hashes_key = ?;', ( hashes_key, ) ).fetchone()
+            
+            if result is None:
                 
-                HydrusData.DebugPrint( dump )
-                HydrusData.ShowText( 'Had a problem saving a JSON object. The dump has been printed to the log.' )
+                hash_ids = array.array( 'I', ( self._GetHashId( hash ) for hash in hashes ) )
                 
-                raise
+                self._c.execute( 'INSERT INTO json_dumps_hash_lists ( hashes_key, hash_ids ) VALUES ( ?, ? );', ( hashes_key, sqlite3.Binary( hash_ids.tobytes() ) ) )
                 
             
         
@@ -10253,73 +11465,334 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
-    def _SyncHashesToTagArchive( self, hashes, hta_path, tag_service_key, adding, namespaces ):
+    def _SyncHashesToTagArchive( self, hashes_to_hash_ids, hta_path, tag_service_key, adding, namespaces ):
+        
+        # this runs inside other jobs, like an import, so it reads the archive over its own connection rather than attaching it and committing like _SyncToTagArchive
+        
+        if not os.path.exists( hta_path ):
+            
+            raise HydrusExceptions.DataMissing( 'The tag archive "{}" does not exist!'.format( hta_path ) )
+            
         
         hta = HydrusTagArchive.HydrusTagArchive( hta_path )
         
         hash_type = hta.GetHashType()
         
+        if hash_type == HydrusTagArchive.HASH_TYPE_SHA256:
+            
+            hashes_to_archive_hashes = { hash : hash for hash in hashes_to_hash_ids.keys() }
+            
+        else:
+            
+            if hash_type == HydrusTagArchive.HASH_TYPE_MD5: h = 'md5'
+            elif hash_type == HydrusTagArchive.HASH_TYPE_SHA1: h = 'sha1'
+            elif hash_type == HydrusTagArchive.HASH_TYPE_SHA512: h = 'sha512'
+            
+            hash_ids_to_hashes = { hash_id : hash for ( hash, hash_id ) in hashes_to_hash_ids.items() }
+            
+            hashes_to_archive_hashes = { hash_ids_to_hashes[ hash_id ] : archive_hash for ( hash_id, archive_hash ) in self._c.execute( 'SELECT hash_id, ' + h + ' FROM local_hashes WHERE hash_id IN ' + HydrusData.SplayListForDB( hash_ids_to_hashes.keys() ) + ';' ) }
+            
+        
+        reason = None
+        
+        if tag_service_key == CC.LOCAL_TAG_SERVICE_KEY:
+            
+            action = HC.CONTENT_UPDATE_ADD if adding else HC.CONTENT_UPDATE_DELETE
+            
+        elif adding:
+            
+            action = HC.CONTENT_UPDATE_PEND
+            
+        else:
+            
+            action = HC.CONTENT_UPDATE_PETITION
+            
+            reason = 'admin: tag archive desync'
+            
+        
         content_updates = []
         
-        for hash in hashes:
+        for ( hash, archive_hash ) in hashes_to_archive_hashes.items():
+            
+            tags = HydrusTags.CleanTags( hta.GetTags( archive_hash ) )
+            
+            desired_tags = HydrusTags.FilterNamespaces( tags, namespaces )
+            
+            content_updates.extend( ( HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, action, ( tag, ( hash, ) ), reason = reason ) for tag in desired_tags ) )
+            
+        
+        if len( content_updates ) > 0:
+            
+            self._ProcessContentUpdates( { tag_service_key : content_updates } )
+            
+        
+    
+    def _SyncToTagArchive( self, hta_path, tag_service_key, file_service_key, adding, namespaces, hashes = None, job_key = None ):
+        
+        # the archive is attached to our connection, so matching its hashes to ours and reading its mappings are joins rather than a lookup per file
+        # each archive tag is cleaned and given a tag_id once, and the mappings go straight to _UpdateMappings a chunk of archive files at a time
+        
+        if job_key is None:
+            
+            job_key = ClientThreading.JobKey()
+            
+        
+        if not os.path.exists( hta_path ):
+            
+            raise HydrusExceptions.DataMissing( 'The tag archive "{}" does not exist!'.format( hta_path ) )
+            
+        
+        tag_service_id = self._GetServiceId( tag_service_key )
+        
+        if tag_service_key == CC.LOCAL_TAG_SERVICE_KEY:
             
-            if hash_type == HydrusTagArchive.HASH_TYPE_SHA256: archive_hash = hash
+            kwarg = 'mappings_ids' if adding else 'deleted_mappings_ids'
+            
+        else:
+            
+            kwarg = 'pending_mappings_ids' if adding else 'petitioned_mappings_ids'
+            
+        
+        if kwarg == 'petitioned_mappings_ids':
+            
+            reason_id = self._GetTextId( 'admin: tag archive desync' )
+            
+        
+        namespaces = { '' if namespace is None else namespace for namespace in namespaces }
+        
+        self._Commit()
+        
+        try:
+            
+            self._c.execute( 'ATTACH ? AS tag_archive;', ( hta_path, ) )
+            
+        finally:
+            
+            self._BeginImmediate()
+            
+        
+        try:
+            
+            result = self._c.execute( 'SELECT hash_type FROM tag_archive.hash_type;' ).fetchone()
+            
+            if result is None:
+                
+                # same guess as the archive makes for itself
+                
+                result = self._c.execute( 'SELECT hash FROM tag_archive.hashes LIMIT 1;' ).fetchone()
+                
+                if result is None:
+                    
+                    return
+                    
+                
+                ( hash, ) = result
+                
+                len_to_hash_type = { 16 : HydrusTagArchive.HASH_TYPE_MD5, 20 : HydrusTagArchive.HASH_TYPE_SHA1, 32 : HydrusTagArchive.HASH_TYPE_SHA256, 64 : HydrusTagArchive.HASH_TYPE_SHA512 }
+                
+                if len( hash ) not in len_to_hash_type:
+                    
+                    raise Exception( 'Could not figure out the hash type of the tag archive "{}"!'.format( hta_path ) )
+                    
+                
+                hash_type = len_to_hash_type[ len( hash ) ]
+                
             else:
                 
-                hash_id = self._GetHashId( hash )
+                ( hash_type, ) = result
+                
+            
+            if hash_type == HydrusTagArchive.HASH_TYPE_SHA256:
+                
+                our_hashes_table_name = 'external_master.hashes'
+                our_hash_column = 'external_master.hashes.hash'
+                
+            else:
                 
                 if hash_type == HydrusTagArchive.HASH_TYPE_MD5: h = 'md5'
                 elif hash_type == HydrusTagArchive.HASH_TYPE_SHA1: h = 'sha1'
                 elif hash_type == HydrusTagArchive.HASH_TYPE_SHA512: h = 'sha512'
                 
-                try: ( archive_hash, ) = self._c.execute( 'SELECT ' + h + ' FROM local_hashes WHERE hash_id = ?;', ( hash_id, ) ).fetchone()
-                except: return
+                our_hashes_table_name = 'external_master.local_hashes'
+                our_hash_column = 'external_master.local_hashes.' + h
                 
             
-            tags = HydrusTags.CleanTags( hta.GetTags( archive_hash ) )
+            our_hash_id_column = our_hashes_table_name + '.hash_id'
             
-            desired_tags = HydrusTags.FilterNamespaces( tags, namespaces )
+            predicates = []
+            select_args = []
+            
+            if file_service_key != CC.COMBINED_FILE_SERVICE_KEY:
+                
+                predicates.append( 'EXISTS ( SELECT 1 FROM current_files WHERE service_id = ? AND hash_id = ' + our_hash_id_column + ' )' )
+                select_args.append( self._GetServiceId( file_service_key ) )
+                
             
-            if len( desired_tags ) > 0:
+            if hashes is None:
+                
+                # walk the whole archive in hash_id ranges
                 
-                reason = None
+                ( max_archive_hash_id, ) = self._c.execute( 'SELECT MAX( hash_id ) FROM tag_archive.hashes;' ).fetchone()
                 
-                if tag_service_key != CC.LOCAL_TAG_SERVICE_KEY and not adding:
+                if max_archive_hash_id is None:
                     
-                    action = HC.CONTENT_UPDATE_PETITION
+                    return
                     
-                    reason = 'admin: tag archive desync'
+                
+                predicates.insert( 0, 'tag_archive.hashes.hash_id BETWEEN ? AND ?' )
+                
+                select = 'SELECT tag_archive.hashes.hash_id, ' + our_hash_id_column + ' FROM tag_archive.hashes CROSS JOIN ' + our_hashes_table_name + ' ON ( ' + our_hash_column + ' = tag_archive.hashes.hash ) WHERE ' + ' AND '.join( predicates ) + ';'
+                
+                def iterate_chunks():
                     
-                else:
+                    for start in range( 1, max_archive_hash_id + 1, TAG_ARCHIVE_SYNC_CHUNK_SIZE ):
+                        
+                        end = start + TAG_ARCHIVE_SYNC_CHUNK_SIZE - 1
+                        
+                        archive_hash_ids_to_hash_ids = dict( self._c.execute( select, [ start, end ] + select_args ) )
+                        
+                        yield ( archive_hash_ids_to_hash_ids, min( end, max_archive_hash_id ), max_archive_hash_id )
+                        
+                    
+                
+            else:
+                
+                # go from our few hashes to the archive's through its hash index, so we never walk the rest of it
+                
+                with HydrusDB.TemporaryIntegerTable( self._c, self._GetHashIds( hashes ), 'hash_id' ) as temp_table_name:
                     
-                    if adding:
+                    select = 'SELECT tag_archive.hashes.hash_id, ' + our_hash_id_column + ' FROM ' + temp_table_name + ' CROSS JOIN ' + our_hashes_table_name + ' USING ( hash_id ) CROSS JOIN tag_archive.hashes ON ( tag_archive.hashes.hash = ' + our_hash_column + ' )'
+                    
+                    if len( predicates ) > 0:
+                        
+                        select += ' WHERE ' + ' AND '.join( predicates )
+                        
+                    
+                    select += ';'
+                    
+                    all_archive_hash_ids_to_hash_ids = sorted( self._c.execute( select, select_args ) )
+                    
+                
+                def iterate_chunks():
+                    
+                    num_done = 0
+                    
+                    for chunk in HydrusData.SplitListIntoChunks( all_archive_hash_ids_to_hash_ids, TAG_ARCHIVE_SYNC_CHUNK_SIZE ):
+                        
+                        num_done += len( chunk )
+                        
+                        yield ( dict( chunk ), num_done, len( all_archive_hash_ids_to_hash_ids ) )
+                        
+                    
+                
+            
+            archive_tag_ids_to_tag_ids = {}
+            
+            num_mappings_done = 0
+            transaction_rows = 0
+            
+            for ( archive_hash_ids_to_hash_ids, num_done, num_to_do ) in iterate_chunks():
+                
+                ( i_paused, should_quit ) = job_key.WaitIfNeeded()
+                
+                if should_quit:
+                    
+                    return
+                    
+                
+                precise_timestamp = HydrusData.GetNowPrecise()
+                
+                if len( archive_hash_ids_to_hash_ids ) == 0:
+                    
+                    continue
+                    
+                
+                archive_mappings = self._c.execute( 'SELECT hash_id, tag_id FROM tag_archive.mappings WHERE hash_id IN ' + HydrusData.SplayListForDB( archive_hash_ids_to_hash_ids.keys() ) + ';' ).fetchall()
+                
+                unknown_archive_tag_ids = { archive_tag_id for ( archive_hash_id, archive_tag_id ) in archive_mappings if archive_tag_id not in archive_tag_ids_to_tag_ids }
+                
+                if len( unknown_archive_tag_ids ) > 0:
+                    
+                    for ( archive_tag_id, tag ) in self._c.execute( 'SELECT tag_id, tag FROM tag_archive.tags WHERE tag_id IN ' + HydrusData.SplayListForDB( unknown_archive_tag_ids ) + ';' ).fetchall():
+                        
+                        tag_id = None
                         
-                        if tag_service_key == CC.LOCAL_TAG_SERVICE_KEY:
+                        try:
                             
-                            action = HC.CONTENT_UPDATE_ADD
+                            tag = HydrusTags.CleanTag( tag )
                             
-                        else:
+                            HydrusTags.CheckTagNotEmpty( tag )
                             
-                            action = HC.CONTENT_UPDATE_PEND
+                            ( namespace, subtag ) = HydrusTags.SplitTag( tag )
+                            
+                            if namespace in namespaces:
+                                
+                                tag_id = self._GetTagId( tag )
+                                
+                            
+                        except HydrusExceptions.SizeException:
+                            
+                            pass
                             
                         
-                    else:
-                        
-                        action = HC.CONTENT_UPDATE_DELETE
+                        archive_tag_ids_to_tag_ids[ archive_tag_id ] = tag_id
                         
                     
                 
-                rows = [ ( tag, ( hash, ) ) for tag in desired_tags ]
+                tag_ids_to_hash_ids = HydrusData.BuildKeyToSetDict( ( ( archive_tag_ids_to_tag_ids.get( archive_tag_id ), archive_hash_ids_to_hash_ids[ archive_hash_id ] ) for ( archive_hash_id, archive_tag_id ) in archive_mappings if archive_hash_id in archive_hash_ids_to_hash_ids ) )
+                
+                if None in tag_ids_to_hash_ids:
+                    
+                    del tag_ids_to_hash_ids[ None ]
+                    
+                
+                if kwarg == 'petitioned_mappings_ids':
+                    
+                    mappings_ids = [ ( tag_id, list( hash_ids ), reason_id ) for ( tag_id, hash_ids ) in tag_ids_to_hash_ids.items() ]
+                    
+                else:
+                    
+                    mappings_ids = [ ( tag_id, list( hash_ids ) ) for ( tag_id, hash_ids ) in tag_ids_to_hash_ids.items() ]
+                    
+                
+                if len( mappings_ids ) > 0:
+                    
+                    self._UpdateMappings( tag_service_id, **{ kwarg : mappings_ids } )
+                    
+                    num_rows = sum( ( len( hash_ids ) for hash_ids in tag_ids_to_hash_ids.values() ) )
+                    
+                    num_mappings_done += num_rows
+                    transaction_rows += num_rows
+                    
+                    report_speed_to_job_key( job_key, precise_timestamp, num_rows, 'mappings' )
+                    
+                
+                job_key.SetVariable( 'popup_text_1', 'synced ' + HydrusData.ToHumanInt( num_mappings_done ) + ' mappings' )
+                job_key.SetVariable( 'popup_gauge_1', ( num_done, num_to_do ) )
+                
+                been_a_minute = HydrusData.TimeHasPassed( self._transaction_started + 60 )
+                been_a_hundred_k = transaction_rows > 100000
                 
-                content_updates.extend( [ HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, action, row, reason = reason ) for row in rows ] )
+                if been_a_minute or been_a_hundred_k:
+                    
+                    self._Commit()
+                    
+                    self._BeginImmediate()
+                    
+                    transaction_rows = 0
+                    
                 
             
-        
-        if len( content_updates ) > 0:
-        
-            service_keys_to_content_updates = { tag_service_key : content_updates }
+        finally:
+            
+            self._Commit()
+            
+            self._c.execute( 'DETACH tag_archive;' )
+            
+            self._BeginImmediate()
             
-            self._ProcessContentUpdates( service_keys_to_content_updates )
+            self.pub_after_job( 'notify_new_pending' )
+            self.pub_after_job( 'notify_new_force_refresh_tags_data' )
             
         
     
@@ -12318,11 +13791,51 @@ class DB( HydrusDB.HydrusDB ):
                 
             
         
+        if version == 349:
+            
+            # subscriptions move their file seeds to these tables the next time they are saved
+            
+            self._c.execute( 'CREATE TABLE IF NOT EXISTS json_dumps_file_seed_caches ( dump_type INTEGER, dump_name TEXT, file_seed_cache_key BLOB_BYTES, PRIMARY KEY ( dump_type, dump_name, file_seed_cache_key ) );' )
+            self._CreateIndex( 'json_dumps_file_seed_caches', [ 'file_seed_cache_key' ] )
+            
+            self._c.execute( 'CREATE TABLE IF NOT EXISTS json_dumps_file_seeds ( file_seed_cache_key BLOB_BYTES, file_seed_type INTEGER, file_seed_data TEXT, file_seed_index INTEGER, dump BLOB_BYTES, PRIMARY KEY ( file_seed_cache_key, file_seed_type, file_seed_data ) );' )
+            self._CreateIndex( 'json_dumps_file_seeds', [ 'file_seed_cache_key', 'file_seed_index' ] )
+            
+        
+        if version == 350:
+            
+            # gui sessions move their page hashes to these tables the next time they are saved
+            
+            self._c.execute( 'CREATE TABLE IF NOT EXISTS json_dumps_named_hash_lists ( dump_type INTEGER, dump_name TEXT, timestamp INTEGER, hashes_key BLOB_BYTES, PRIMARY KEY ( dump_type, dump_name, timestamp, hashes_key ) );' )
+            self._CreateIndex( 'json_dumps_named_hash_lists', [ 'hashes_key' ] )
+            
+            self._c.execute( 'CREATE TABLE IF NOT EXISTS json_dumps_hash_lists ( hashes_key BLOB_BYTES PRIMARY KEY, hash_ids BLOB_BYTES );' )
+            
+        
+        if version == 351:
+            
+            # export folders build their manifests on their next run
+            
+            self._c.execute( 'CREATE TABLE IF NOT EXISTS json_dumps_export_folder_manifests ( dump_name TEXT PRIMARY KEY, manifest_key BLOB_BYTES );' )
+            
+            self._c.execute( 'CREATE TABLE IF NOT EXISTS export_folder_manifests ( manifest_key BLOB_BYTES, hash_id INTEGER, path TEXT, PRIMARY KEY ( manifest_key, hash_id ) );' )
+            self._CreateIndex( 'export_folder_manifests', [ 'manifest_key', 'path' ] )
+            
+        
         self._controller.pub( 'splash_set_title_text', 'updated db to v' + str( version + 1 ) )
         
         self._c.execute( 'UPDATE version SET version = ?;', ( version + 1, ) )
         
     
+    def _UpdateExportFolderManifest( self, manifest_key, rows_to_add, hash_ids_to_remove ):
+        
+        manifest_key = sqlite3.Binary( manifest_key )
+        
+        self._c.executemany( 'DELETE FROM export_folder_manifests WHERE manifest_key = ? AND hash_id = ?;', ( ( manifest_key, hash_id ) for hash_id in hash_ids_to_remove ) )
+        
+        self._c.executemany( 'REPLACE INTO export_folder_manifests ( manifest_key, hash_id, path ) VALUES ( ?, ?, ? );', ( ( manifest_key, hash_id, path ) for ( hash_id, path ) in rows_to_add ) )
+        
+    
     def _UpdateMappings( self, tag_service_id, mappings_ids = None, deleted_mappings_ids = None, pending_mappings_ids = None, pending_rescinded_mappings_ids = None, petitioned_mappings_ids = None, petitioned_rescinded_mappings_ids = None ):
         
         ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = GenerateMappingsTableNames( tag_service_id )
@@ -12541,6 +14054,61 @@ class DB( HydrusDB.HydrusDB ):
         if len( service_info_updates ) > 0: self._c.executemany( 'UPDATE service_info SET info = info + ? WHERE service_id = ? AND info_type = ?;', service_info_updates )
         
     
+    def _UpdateMappingsFromTable( self, tag_service_id, table_name ):
+        
+        # the set-based version of _UpdateMappings( tag_service_id, mappings_ids = ... ) for big repository updates
+        # table_name holds the ( tag_id, hash_id ) rows to add. rows that are already current are removed from it
+        
+        ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = GenerateMappingsTableNames( tag_service_id )
+        
+        file_service_ids = self._GetServiceIds( HC.AUTOCOMPLETE_CACHE_SPECIFIC_FILE_SERVICES )
+        
+        # deleted and pending rows are rare, so look them up from our side and delete just those
+        
+        deleted_rows = self._c.execute( 'SELECT tag_id, hash_id FROM ' + table_name + ' CROSS JOIN ' + deleted_mappings_table_name + ' USING ( tag_id, hash_id );' ).fetchall()
+        
+        self._c.executemany( 'DELETE FROM ' + deleted_mappings_table_name + ' WHERE tag_id = ? AND hash_id = ?;', deleted_rows )
+        
+        pending_rows = self._c.execute( 'SELECT tag_id, hash_id FROM ' + table_name + ' CROSS JOIN ' + pending_mappings_table_name + ' USING ( tag_id, hash_id );' ).fetchall()
+        
+        self._c.executemany( 'DELETE FROM ' + pending_mappings_table_name + ' WHERE tag_id = ? AND hash_id = ?;', pending_rows )
+        
+        self._c.execute( 'DELETE FROM ' + table_name + ' WHERE EXISTS ( SELECT 1 FROM ' + current_mappings_table_name + ' WHERE ' + current_mappings_table_name + '.tag_id = ' + table_name + '.tag_id AND ' + current_mappings_table_name + '.hash_id = ' + table_name + '.hash_id );' )
+        
+        ( num_tags_added, ) = self._c.execute( 'SELECT COUNT( * ) FROM ( SELECT DISTINCT tag_id AS t FROM ' + table_name + ' ) WHERE NOT EXISTS ( SELECT 1 FROM ' + current_mappings_table_name + ' WHERE tag_id = t );' ).fetchone()
+        ( num_files_added, ) = self._c.execute( 'SELECT COUNT( * ) FROM ( SELECT DISTINCT hash_id AS h FROM ' + table_name + ' ) WHERE NOT EXISTS ( SELECT 1 FROM ' + current_mappings_table_name + ' WHERE hash_id = h );' ).fetchone()
+        
+        combined_files_current_counter = collections.Counter( dict( self._c.execute( 'SELECT tag_id, COUNT( * ) FROM ' + table_name + ' GROUP BY tag_id;' ) ) )
+        combined_files_pending_counter = collections.Counter( ( tag_id for ( tag_id, hash_id ) in pending_rows ) )
+        
+        self._c.execute( 'INSERT OR IGNORE INTO ' + current_mappings_table_name + ' ( tag_id, hash_id ) SELECT tag_id, hash_id FROM ' + table_name + ';' )
+        
+        num_current_inserted = self._GetRowCount()
+        
+        for file_service_id in file_service_ids:
+            
+            self._CacheSpecificMappingsAddMappingsFromTable( file_service_id, tag_service_id, table_name )
+            
+        
+        combined_files_seen_ids = set( combined_files_current_counter.keys() ).union( combined_files_pending_counter.keys() )
+        
+        combined_files_counts = [ ( tag_id, combined_files_current_counter[ tag_id ], - combined_files_pending_counter[ tag_id ] ) for tag_id in combined_files_seen_ids ]
+        
+        self._CacheCombinedFilesMappingsUpdate( tag_service_id, combined_files_counts )
+        
+        #
+        
+        service_info_updates = []
+        
+        if num_current_inserted != 0: service_info_updates.append( ( num_current_inserted, tag_service_id, HC.SERVICE_INFO_NUM_MAPPINGS ) )
+        if len( deleted_rows ) != 0: service_info_updates.append( ( - len( deleted_rows ), tag_service_id, HC.SERVICE_INFO_NUM_DELETED_MAPPINGS ) )
+        if len( pending_rows ) != 0: service_info_updates.append( ( - len( pending_rows ), tag_service_id, HC.SERVICE_INFO_NUM_PENDING_MAPPINGS ) )
+        if num_tags_added != 0: service_info_updates.append( ( num_tags_added, tag_service_id, HC.SERVICE_INFO_NUM_TAGS ) )
+        if num_files_added != 0: service_info_updates.append( ( num_files_added, tag_service_id, HC.SERVICE_INFO_NUM_FILES ) )
+        
+        if len( service_info_updates ) > 0: self._c.executemany( 'UPDATE service_info SET info = info + ? WHERE service_id = ? AND info_type = ?;', service_info_updates )
+        
+    
     def _UpdateServerServices( self, admin_service_key, serverside_services, service_keys_to_access_keys, deletee_service_keys ):
         
         admin_service_id = self._GetServiceId( admin_service_key )
@@ -12883,11 +14451,13 @@ class DB( HydrusDB.HydrusDB ):
         elif action == 'delete_unknown_duplicate_pairs': self._CacheSimilarFilesDeleteUnknownDuplicatePairs( *args, **kwargs )
         elif action == 'dirty_services': self._SaveDirtyServices( *args, **kwargs )
         elif action == 'duplicate_pair_status': self._CacheSimilarFilesSetDuplicatePairStatus( *args, **kwargs )
+        elif action == 'export_folder_manifest': self._UpdateExportFolderManifest( *args, **kwargs )
         elif action == 'export_mappings': self._ExportToTagArchive( *args, **kwargs )
         elif action == 'file_integrity': self._CheckFileIntegrity( *args, **kwargs )
         elif action == 'imageboard': self._SetYAMLDump( YAML_DUMP_ID_IMAGEBOARD, *args, **kwargs )
         elif action == 'ideal_client_files_locations': self._SetIdealClientFilesLocations( *args, **kwargs )
         elif action == 'import_file': result = self._ImportFile( *args, **kwargs )
+        elif action == 'import_files': result = self._ImportFiles( *args, **kwargs )
         elif action == 'import_update': self._ImportUpdate( *args, **kwargs )
         elif action == 'last_shutdown_work_time': self._SetLastShutdownWorkTime( *args, **kwargs )
         elif action == 'local_booru_share': self._SetYAMLDump( YAML_DUMP_ID_LOCAL_BOORU, *args, **kwargs )
@@ -12909,7 +14479,7 @@ class DB( HydrusDB.HydrusDB ):
         elif action == 'serialisable': self._SetJSONDump( *args, **kwargs )
         elif action == 'serialisables_overwrite': self._OverwriteJSONDumps( *args, **kwargs )
         elif action == 'set_password': self._SetPassword( *args, **kwargs )
-        elif action == 'sync_hashes_to_tag_archive': self._SyncHashesToTagArchive( *args, **kwargs )
+        elif action == 'sync_to_tag_archive': self._SyncToTagArchive( *args, **kwargs )
         elif action == 'tag_censorship': self._SetTagCensorship( *args, **kwargs )
         elif action == 'update_server_services': self._UpdateServerServices( *args, **kwargs )
         elif action == 'update_services': self._UpdateServices( *args, **kwargs )
@@ -1,3 +1,4 @@
+import copy
 import distutils.version
 from . import HydrusConstants as HC
 from . import HydrusData
@@ -6,12 +7,57 @@ from . import HydrusGlobals as HG
 from . import HydrusPaths
 from . import HydrusText
 import os
+import pathlib
 import queue
 import sqlite3
+import threading
 import traceback
 import time
 
 CONNECTION_REFRESH_TIME = 60 * 30
+READ_POOL_ACTIVE_PERIOD = 10
+READ_POOL_COMMIT_PERIOD = 1
+READ_POOL_COMMIT_WAIT_PERIOD = 1
+BACKUP_PAGES_PER_STEP = 4096
+
+def GetReadOnlyDBURI( db_path ):
+    
+    return pathlib.Path( os.path.abspath( db_path ) ).as_uri() + '?mode=ro'
+    
+
+def BackupDBSnapshot( snapshot_db, db_filenames, dest_dir, text_update_hook = None, is_cancelled_hook = None ):
+    
+    # each file is copied a few thousand pages at a time, so we can report progress and cancel between steps
+    # the destination is only committed when its copy finishes, so a cancelled backup leaves the previous one intact
+    # the caller closes the snapshot, which it may still want to read from
+    
+    for ( name, filename ) in db_filenames.items():
+        
+        dest_db = sqlite3.connect( os.path.join( dest_dir, filename ) )
+        
+        def progress( status, remaining, total ):
+            
+            if is_cancelled_hook is not None and is_cancelled_hook():
+                
+                raise HydrusExceptions.CancelledException( 'Backup cancelled!' )
+                
+            
+            if text_update_hook is not None:
+                
+                text_update_hook( 'copying ' + filename + ': ' + HydrusData.ConvertValueRangeToPrettyString( total - remaining, total ) + ' pages' )
+                
+            
+        
+        try:
+            
+            snapshot_db.backup( dest_db, pages = BACKUP_PAGES_PER_STEP, progress = progress, name = name )
+            
+        finally:
+            
+            dest_db.close()
+            
+        
+    
 
 def CanVacuum( db_path, stop_time = None ):
     
@@ -128,6 +174,11 @@ def VacuumDB( db_path ):
 class HydrusDB( object ):
     
     READ_WRITE_ACTIONS = []
+    
+    # pure reads that are safe to serve from a read-only WAL connection while the writer is busy
+    READ_POOL_ACTIONS = []
+    READ_POOL_SIZE = 0
+    
     UPDATE_WAIT = 2
     
     TRANSACTION_COMMIT_TIME = 10
@@ -180,6 +231,32 @@ class HydrusDB( object ):
         
         self._jobs = queue.Queue()
         self._pubsubs = []
+        self._rollback_calls = []
+        
+        if HG.no_wal or len( self.READ_POOL_ACTIONS ) == 0:
+            
+            self._read_pool_size = 0
+            
+        else:
+            
+            self._read_pool_size = self.READ_POOL_SIZE
+            
+        
+        self._read_jobs = queue.Queue()
+        self._read_pool_lock = threading.Lock()
+        self._read_pool_commit_condition = threading.Condition( self._read_pool_lock )
+        self._read_pool_paused = False
+        self._read_pool_num_connections = 0
+        self._read_pool_num_loops_running = 0
+        self._read_pool_num_jobs_running = 0
+        
+        self._write_generation = 0
+        self._num_pending_write_jobs = 0
+        self._finished_job_writes_uncommitted = False
+        self._num_reads_waiting_for_commit = 0
+        self._read_pool_last_used_time = 0
+        self._read_pool_writer = None
+        self._read_pool_job_write_generation = None
         
         self._currently_doing_job = False
         self._current_status = ''
@@ -301,6 +378,13 @@ class HydrusDB( object ):
             
         
     
+    def _CanBackupOnline( self ):
+        
+        # in rollback journal mode, a reader holding a snapshot would block every commit for the length of the backup
+        
+        return not HG.no_wal
+        
+    
     def _CleanUpCaches( self ):
         
         pass
@@ -308,6 +392,8 @@ class HydrusDB( object ):
     
     def _CloseDBCursor( self ):
         
+        self._PauseReadPool()
+        
         if self._db is not None:
             
             if self._in_transaction:
@@ -334,12 +420,40 @@ class HydrusDB( object ):
             
             self._in_transaction = False
             
+            with self._read_pool_commit_condition:
+                
+                self._finished_job_writes_uncommitted = False
+                
+                self._read_pool_commit_condition.notify_all()
+                
+            
         else:
             
             HydrusData.Print( 'Received a call to commit, but was not in a transaction!' )
             
         
     
+    def _CommitForReadPool( self ):
+        
+        # the read pool can only see committed data, so if reads are waiting on work we have finished, or are likely to be soon, let them have it now
+        # otherwise, we keep batching writes into the one transaction
+        
+        read_pool_active = not HydrusData.TimeHasPassed( self._read_pool_last_used_time + READ_POOL_ACTIVE_PERIOD )
+        
+        if self._finished_job_writes_uncommitted and ( self._num_reads_waiting_for_commit > 0 or read_pool_active ):
+            
+            self._current_status = 'db committing'
+            
+            self.publish_status_update()
+            
+            self._Commit()
+            
+            self._BeginImmediate()
+            
+            self._transaction_contains_writes = False
+            
+        
+    
     def _CreateDB( self ):
         
         raise NotImplementedError()
@@ -515,22 +629,124 @@ class HydrusDB( object ):
             raise HydrusExceptions.DBAccessException( str( e ) )
             
         
+        self._ResumeReadPool()
+        
     
     def _InitDiskCache( self ):
         
         pass
         
     
+    def _InitReadPoolCursor( self, check_same_thread = True ):
+        
+        db_path = os.path.join( self._db_dir, self._db_filenames[ 'main' ] )
+        
+        db = sqlite3.connect( GetReadOnlyDBURI( db_path ), uri = True, isolation_level = None, detect_types = sqlite3.PARSE_DECLTYPES, check_same_thread = check_same_thread )
+        
+        c = db.cursor()
+        
+        if HG.no_db_temp_files:
+            
+            c.execute( 'PRAGMA temp_store = 2;' ) # use memory for temp store exclusively
+            
+        
+        c.execute( 'PRAGMA main.cache_size = -10000;' )
+        
+        # mem stays writeable, so reads that use temporary integer tables still work
+        c.execute( 'ATTACH ":memory:" AS mem;' )
+        
+        for ( name, filename ) in list(self._db_filenames.items()):
+            
+            if name == 'main':
+                
+                continue
+                
+            
+            db_path = os.path.join( self._db_dir, filename )
+            
+            c.execute( 'ATTACH ? AS ' + name + ';', ( GetReadOnlyDBURI( db_path ), ) )
+            
+            c.execute( 'PRAGMA ' + name + '.cache_size = -10000;' )
+            
+        
+        return ( db, c )
+        
+    
     def _InitExternalDatabases( self ):
         
         pass
         
     
+    def _GenerateReadPoolReaderCaches( self ):
+        
+        # the mutable caches a read pool reader keeps to itself rather than sharing with the writer, by attribute name
+        
+        return {}
+        
+    
+    def _IsReadPoolReader( self ):
+        
+        return self._read_pool_writer is not None
+        
+    
     def _ManageDBError( self, job, e ):
         
         raise NotImplementedError()
         
     
+    def _OpenBackupSnapshot( self ):
+        
+        # a separate connection holding one read transaction sees every file as of our last commit, and we can keep writing to the wal while it is copied
+        # we take it between jobs, so none of our own transactions are half visible across the files
+        
+        if self._in_transaction:
+            
+            self._Commit()
+            
+        
+        try:
+            
+            ( db, c ) = self._InitReadPoolCursor( check_same_thread = False )
+            
+            try:
+                
+                c.execute( 'BEGIN;' )
+                
+                for name in self._db_filenames:
+                    
+                    c.execute( 'SELECT 1 FROM ' + name + '.sqlite_master LIMIT 1;' ).fetchall()
+                    
+                
+            except:
+                
+                db.close()
+                
+                raise
+                
+            
+        finally:
+            
+            self._BeginImmediate()
+            
+        
+        return db
+        
+    
+    def _PauseReadPool( self ):
+        
+        # the read pool connections stop the wal from being checkpointed and truncated when we close, which backup and vacuum rely on
+        
+        with self._read_pool_lock:
+            
+            self._read_pool_paused = True
+            
+        
+        while self._read_pool_num_connections > 0:
+            
+            time.sleep( 0.02 )
+            
+        
+    
     def _ProcessJob( self, job ):
         
         job_type = job.GetType()
@@ -541,6 +757,19 @@ class HydrusDB( object ):
             
             if job_type in ( 'read_write', 'write' ):
                 
+                if self._read_pool_size > 0 and self._finished_job_writes_uncommitted and HydrusData.TimeHasPassed( self._transaction_started + READ_POOL_COMMIT_PERIOD ):
+                    
+                    # the read pool can only see committed data, so let's not hide earlier jobs' work behind what might be a long write
+                    
+                    self._Commit()
+                    
+                    self._BeginImmediate()
+                    
+                else:
+                    
+                    self._CommitForReadPool()
+                    
+                
                 self._current_status = 'db write locked'
                 
                 self._transaction_contains_writes = True
@@ -578,6 +807,18 @@ class HydrusDB( object ):
                 self._Save()
                 
             
+            if job_type in ( 'read_write', 'write' ):
+                
+                self._write_generation += 1
+                
+                if self._transaction_contains_writes:
+                    
+                    self._finished_job_writes_uncommitted = True
+                    
+                    self._CommitForReadPool()
+                    
+                
+            
             for ( topic, args, kwargs ) in self._pubsubs:
                 
                 self._controller.pub( topic, *args, **kwargs )
@@ -609,9 +850,15 @@ class HydrusDB( object ):
                 HydrusData.PrintException( rollback_e )
                 
             
+            for ( func, args, kwargs ) in self._rollback_calls:
+                
+                func( *args, **kwargs )
+                
+            
         finally:
             
             self._pubsubs = []
+            self._rollback_calls = []
             
             self._current_status = ''
             
@@ -619,11 +866,123 @@ class HydrusDB( object ):
             
         
     
+    def _ProcessReadPoolJob( self, reader, reader_caches, db, c, job ):
+        
+        # the reader is a shallow copy of us that talks to its own read-only connection
+        # it shares our state, but never our mutable caches, which we may change in the middle of its job
+        # while it runs, we replace rather than change any other shared containers, so the count is taken with the same lock we hold when changing them
+        
+        with self._read_pool_lock:
+            
+            self._read_pool_num_jobs_running += 1
+            
+            reader.__dict__.update( self.__dict__ )
+            
+        
+        reader.__dict__.update( reader_caches )
+        
+        reader._db = db
+        reader._c = c
+        reader._pubsubs = []
+        reader._in_transaction = False
+        reader._read_pool_writer = self
+        reader._read_pool_job_write_generation = self._write_generation
+        
+        ( action, args, kwargs ) = job.GetCallableTuple()
+        
+        try:
+            
+            if HG.db_report_mode:
+                
+                summary = 'Running ' + job.ToString() + ' (read pool)'
+                
+                HydrusData.ShowText( summary )
+                
+            
+            # a deferred transaction gives us a consistent snapshot for the whole job
+            c.execute( 'BEGIN DEFERRED;' )
+            
+            try:
+                
+                result = reader._Read( action, *args, **kwargs )
+                
+            finally:
+                
+                c.execute( 'COMMIT;' )
+                
+            
+            for ( topic, pub_args, pub_kwargs ) in reader._pubsubs:
+                
+                self._controller.pub( topic, *pub_args, **pub_kwargs )
+                
+            
+            if job.IsSynchronous():
+                
+                job.PutResult( result )
+                
+            
+        except Exception as e:
+            
+            writer_required = isinstance( e, HydrusExceptions.DBWriterRequiredException ) or ( isinstance( e, sqlite3.OperationalError ) and 'readonly' in str( e ) )
+            
+            if writer_required:
+                
+                # this read turned out to need to write something or could not guarantee a fresh result, so the writer will do it
+                
+                self._jobs.put( job )
+                
+            else:
+                
+                reader._ManageDBError( job, e )
+                
+            
+        finally:
+            
+            with self._read_pool_lock:
+                
+                self._read_pool_num_jobs_running -= 1
+                
+            
+            # the reader may have replaced a cache that got too big
+            
+            for name in list( reader_caches.keys() ):
+                
+                reader_caches[ name ] = getattr( reader, name )
+                
+            
+        
+    
+    def _PutWriterJob( self, job ):
+        
+        if job.GetType() in ( 'read_write', 'write' ):
+            
+            with self._read_pool_lock:
+                
+                self._num_pending_write_jobs += 1
+                
+            
+        
+        self._jobs.put( job )
+        
+    
     def _Read( self, action, *args, **kwargs ):
         
         raise NotImplementedError()
         
     
+    def _ReadPoolSnapshotIsStale( self ):
+        
+        # when called during a read pool job, says whether a write job has finished since this job started
+        # anything we put in a shared cache in that case may have missed that write's updates
+        
+        if not self._IsReadPoolReader():
+            
+            return False
+            
+        
+        return self._read_pool_writer._write_generation != self._read_pool_job_write_generation
+        
+    
     def _RepairDB( self ):
         
         pass
@@ -639,6 +998,14 @@ class HydrusDB( object ):
         pass
         
     
+    def _ResumeReadPool( self ):
+        
+        with self._read_pool_lock:
+            
+            self._read_pool_paused = False
+            
+        
+    
     def _ReportStatus( self, text ):
         
         HydrusData.Print( text )
@@ -737,11 +1104,59 @@ class HydrusDB( object ):
         raise NotImplementedError()
         
     
+    def _WaitForReadPoolCommit( self ):
+        
+        # a write job finished before this read was made, but is still in the writer's open transaction, so the read pool cannot see it
+        # we ask the writer to commit, which it will do straight away if it is idle or as soon as its current job is done
+        
+        with self._read_pool_commit_condition:
+            
+            if not self._finished_job_writes_uncommitted:
+                
+                return
+                
+            
+            self._num_reads_waiting_for_commit += 1
+            
+        
+        try:
+            
+            self._jobs.put( None )
+            
+            with self._read_pool_commit_condition:
+                
+                while self._finished_job_writes_uncommitted:
+                    
+                    if self._local_shutdown or self._controller.ModelIsShutdown():
+                        
+                        raise HydrusExceptions.ShutdownException( 'Application has shut down!' )
+                        
+                    
+                    self._read_pool_commit_condition.wait( READ_POOL_COMMIT_WAIT_PERIOD )
+                    
+                
+            
+        finally:
+            
+            with self._read_pool_commit_condition:
+                
+                self._num_reads_waiting_for_commit -= 1
+                
+            
+        
+    
     def _Write( self, action, *args, **kwargs ):
         
         raise NotImplementedError()
         
     
+    def call_after_rollback( self, func, *args, **kwargs ):
+        
+        # for anything outside the db that handed its state over to this job and needs it back if the job's writes are lost
+        
+        self._rollback_calls.append( ( func, args, kwargs ) )
+        
+    
     def pub_after_job( self, topic, *args, **kwargs ):
         
         if len( args ) == 0 and len( kwargs ) == 0:
@@ -796,12 +1211,12 @@ class HydrusDB( object ):
     
     def LoopIsFinished( self ):
         
-        return self._loop_finished
+        return self._loop_finished and self._read_pool_num_loops_running == 0
         
     
     def JobsQueueEmpty( self ):
         
-        return self._jobs.empty()
+        return self._jobs.empty() and self._read_jobs.empty()
         
     
     def MainLoop( self ):
@@ -823,6 +1238,11 @@ class HydrusDB( object ):
             return
             
         
+        for i in range( self._read_pool_size ):
+            
+            self._controller.CallToThreadLongRunning( self.ReadPoolLoop )
+            
+        
         self._ready_to_serve_requests = True
         
         error_count = 0
@@ -833,6 +1253,25 @@ class HydrusDB( object ):
                 
                 job = self._jobs.get( timeout = 1 )
                 
+                if job is None:
+                    
+                    # a read is waiting for us to commit before it goes to the read pool
+                    
+                    self._CommitForReadPool()
+                    
+                    continue
+                    
+                
+                if job.GetType() in ( 'read_write', 'write' ):
+                    
+                    # the job is no longer queued, so reads can go back to the pool, which will serve them the last committed snapshot while we work
+                    
+                    with self._read_pool_lock:
+                        
+                        self._num_pending_write_jobs -= 1
+                        
+                    
+                
                 self._currently_doing_job = True
                 self._current_job_name = job.ToString()
                 
@@ -871,7 +1310,7 @@ class HydrusDB( object ):
                         raise
                         
                     
-                    self._jobs.put( job ) # couldn't lock db; put job back on queue
+                    self._PutWriterJob( job ) # couldn't lock db; put job back on queue
                     
                     time.sleep( 5 )
                     
@@ -926,11 +1365,132 @@ class HydrusDB( object ):
             raise HydrusExceptions.ShutdownException( 'Application has shut down!' )
             
         
-        self._jobs.put( job )
+        # a read submitted after a write should see it, so while a write job is still queued, the writer has to serve this
+        # while a write job is running, the pool serves the last committed snapshot, which the writer keeps up to date for as long as the pool is in use
+        
+        if self._read_pool_size > 0 and action in self.READ_POOL_ACTIONS and self._num_pending_write_jobs == 0:
+            
+            self._read_pool_last_used_time = HydrusData.GetNow()
+            
+            self._WaitForReadPoolCommit()
+            
+            self._read_jobs.put( job )
+            
+        else:
+            
+            self._PutWriterJob( job )
+            
         
         return job.GetResult()
         
     
+    def ReadPoolLoop( self ):
+        
+        reader = copy.copy( self )
+        
+        reader_caches = self._GenerateReadPoolReaderCaches()
+        
+        db = None
+        c = None
+        
+        connection_timestamp = 0
+        
+        with self._read_pool_lock:
+            
+            self._read_pool_num_loops_running += 1
+            
+        
+        try:
+            
+            while not ( ( self._local_shutdown or self._controller.ModelIsShutdown() ) and self._read_jobs.empty() ):
+                
+                if db is not None and ( self._read_pool_paused or HydrusData.TimeHasPassed( connection_timestamp + CONNECTION_REFRESH_TIME ) ):
+                    
+                    c.close()
+                    db.close()
+                    
+                    db = None
+                    c = None
+                    
+                    with self._read_pool_lock:
+                        
+                        self._read_pool_num_connections -= 1
+                        
+                    
+                
+                if db is None:
+                    
+                    with self._read_pool_lock:
+                        
+                        if not self._read_pool_paused:
+                            
+                            try:
+                                
+                                ( db, c ) = self._InitReadPoolCursor()
+                                
+                                self._read_pool_num_connections += 1
+                                
+                            except Exception as e:
+                                
+                                HydrusData.Print( 'A db read pool connection could not be created:' )
+                                
+                                HydrusData.PrintException( e )
+                                
+                            
+                        
+                    
+                    if db is None:
+                        
+                        if self._local_shutdown or self._controller.ModelIsShutdown():
+                            
+                            while not self._read_jobs.empty():
+                                
+                                job = self._read_jobs.get()
+                                
+                                if job.IsSynchronous():
+                                    
+                                    job.PutResult( HydrusExceptions.ShutdownException( 'Application has shut down!' ) )
+                                    
+                                
+                            
+                        
+                        time.sleep( 0.1 )
+                        
+                        continue
+                        
+                    
+                    connection_timestamp = HydrusData.GetNow()
+                    
+                
+                try:
+                    
+                    job = self._read_jobs.get( timeout = 0.5 )
+                    
+                except queue.Empty:
+                    
+                    continue
+                    
+                
+                self._ProcessReadPoolJob( reader, reader_caches, db, c, job )
+                
+            
+        finally:
+            
+            with self._read_pool_lock:
+                
+                if db is not None:
+                    
+                    c.close()
+                    db.close()
+                    
+                    self._read_pool_num_connections -= 1
+                    
+                
+                self._read_pool_num_loops_running -= 1
+                
+            
+        
+    
     def ReadyToServeRequests( self ):
         
         return self._ready_to_serve_requests
@@ -952,7 +1512,7 @@ class HydrusDB( object ):
             raise HydrusExceptions.ShutdownException( 'Application has shut down!' )
             
         
-        self._jobs.put( job )
+        self._PutWriterJob( job )
         
         if synchronous: return job.GetResult()
         
@@ -1203,6 +1763,57 @@ class DB( DB.HydrusDB ):
         
     
     def _Backup( self ):
+        if not self._CanBackupOnline():
+            self._BackupOffline()
+            
+            return
+            
+        
+        backup_path = os.path.join( self._db_dir, 'server_backup' )
+        
+        Paths.MakeSureDirectoryExists( backup_path )
+        
+        Data.Print( 'backing up: taking a snapshot of the db' )
+        
+        snapshot_db = self._OpenBackupSnapshot()
+        
+        # we keep serving requests, but report busy so clients polling for the end of the backup wait
+        HG.server_backup_running = True
+        
+        def do_it():
+            try:
+                Data.Print( 'backing up: copying db' )
+                
+                DB.BackupDBSnapshot( snapshot_db, self._db_filenames, backup_path )
+                
+                for filename in [ self._ssl_cert_filename, self._ssl_key_filename ]:
+                    Data.Print( 'backing up: copying ' + filename )
+                    
+                    source = os.path.join( self._db_dir, filename )
+                    dest = os.path.join( backup_path, filename )
+                    
+                    Paths.MirrorFile( source, dest )
+                    
+                Data.Print( 'backing up: copying files' )
+                Paths.MirrorTree( self._files_dir, os.path.join( backup_path, 'server_files' ) )
+                
+                Data.Print( 'backing up: done!' )
+                
+            except Exception as e:
+                Data.Print( 'backing up: failed!' )
+                Data.PrintException( e )
+                
+            finally:
+                snapshot_db.close()
+                
+                HG.server_backup_running = False
+                
+            
+        
+        self._controller.CallToThreadLongRunning( do_it )
+        
+    
+    def _BackupOffline( self ):
         self._CloseDBCursor()
         
         HG.server_busy = True
@@ -2250,6 +2861,7 @@ class DB( DB.HydrusDB ):
         updates = self._RepositoryGenerateUpdates( service_id, begin, end )
         
         update_hashes = []
+        binary_update_hashes = []
         
         total_definition_rows = 0
         total_content_rows = 0
@@ -2265,29 +2877,36 @@ class DB( DB.HydrusDB ):
                     total_content_rows += num_rows
                     
                 
-                update_bytes = update.DumpToNetworkBytes()
+                # we only store the compact binary format. clients that do not ask for it are sent a json conversion, so we hash that too
                 
-                update_hash = hashlib.sha256( update_bytes ).digest()
+                binary_update_bytes = update.DumpToBinaryNetworkBytes()
+                
+                binary_update_hash = hashlib.sha256( binary_update_bytes ).digest()
                 
-                dest_path = ServerFiles.GetExpectedFilePath( update_hash )
+                dest_path = ServerFiles.GetExpectedFilePath( binary_update_hash )
                 
                 with open( dest_path, 'wb' ) as f:
-                    f.write( update_bytes )
+                    f.write( binary_update_bytes )
                     
                 
+                update_bytes = Network.ConvertBinaryUpdateToNetworkBytes( binary_update_bytes )
+                
+                update_hash = hashlib.sha256( update_bytes ).digest()
+                
                 update_hashes.append( update_hash )
+                binary_update_hashes.append( binary_update_hash )
                 
             
             ( update_table_name ) = GenerateRepositoryUpdateTableName( service_id )
             
-            master_hash_ids = self._GetMasterHashIds( update_hashes )
+            master_hash_ids = self._GetMasterHashIds( binary_update_hashes )
             
             self._c.executemany( 'INSERT OR IGNORE INTO ' + update_table_name + ' ( master_hash_id ) VALUES ( ? );', ( ( master_hash_id, ) for master_hash_id in master_hash_ids ) )
             
         
         Data.Print( 'Update OK. ' + Data.ToHumanInt( total_definition_rows ) + ' definition rows and ' + Data.ToHumanInt( total_content_rows ) + ' content rows in ' + Data.ToHumanInt( len( updates ) ) + ' update files.' )
         
-        return update_hashes
+        return ( update_hashes, binary_update_hashes )
         
     
     def _RepositoryDeleteFiles( self, service_id, account_id, service_hash_ids ):
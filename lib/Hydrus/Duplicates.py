@@ -5,7 +5,53 @@ from . import HydrusData
 from . import HydrusExceptions
 from . import HydrusGlobals as HG
 from . import HydrusSerialisable
+import struct
+import threading
 
+NUMPY_OK = False
+
+# the biggest xor matrix, in cells, we will make when searching many phashes at once
+PHASH_INDEX_BLOCK_CELLS = 8 * 1024 * 1024
+
+try:
+    
+    import numpy
+    
+    NUMPY_OK = True
+    
+except:
+    
+    print( 'Could not import numpy--the similar files index will not be available.' )
+    
+
+if NUMPY_OK:
+    
+    BYTE_POPCOUNTS = numpy.array( [ bin( i ).count( '1' ) for i in range( 256 ) ], dtype = numpy.uint8 )
+    
+
+def ConvertPHashesToNumPy( phashes ):
+    
+    # phashes are stored big-endian, so we read them that way and then go native so the xor is cheap
+    
+    return numpy.frombuffer( b''.join( phashes ), dtype = '>u8' ).astype( numpy.uint64 )
+    
+def GetNumPyHammingDistances( phashes_array, phash ):
+    
+    ( phash_int, ) = struct.unpack( '!Q', phash )
+    
+    xors = numpy.bitwise_xor( phashes_array, numpy.uint64( phash_int ) )
+    
+    return GetNumPyPopCounts( xors )
+    
+def GetNumPyPopCounts( uint64_array ):
+    
+    if hasattr( numpy, 'bitwise_count' ):
+        
+        return numpy.bitwise_count( uint64_array )
+        
+    
+    return BYTE_POPCOUNTS[ uint64_array.view( numpy.uint8 ) ].reshape( uint64_array.shape + ( 8, ) ).sum( axis = -1, dtype = numpy.uint8 )
+    
 class DuplicateActionOptions( HydrusSerialisable.SerialisableBase ):
     
     SERIALISABLE_TYPE = HydrusSerialisable.SERIALISABLE_TYPE_DUPLICATE_ACTION_OPTIONS
@@ -388,3 +434,214 @@ class DuplicateActionOptions( HydrusSerialisable.SerialisableBase ):
         
     
 HydrusSerialisable.SERIALISABLE_TYPES_TO_OBJECT_TYPES[ HydrusSerialisable.SERIALISABLE_TYPE_DUPLICATE_ACTION_OPTIONS ] = DuplicateActionOptions
+
+class PHashIndex( object ):
+    
+    # an in-memory copy of every phash that is mapped to a file, for brute-force xor/popcount searching
+    # it is filled lazily by the db and kept in sync by phash association/disassociation, with changes consolidated on the next search
+    
+    def __init__( self ):
+        
+        self._lock = threading.Lock()
+        
+        self._loaded = False
+        
+        self._phash_ids = None
+        self._phashes = None
+        
+        self._pending_phash_ids_to_phashes = {}
+        self._pending_removee_phash_ids = set()
+        
+    
+    def _Consolidate( self ):
+        
+        if len( self._pending_phash_ids_to_phashes ) > 0:
+            
+            new_phash_ids = numpy.fromiter( self._pending_phash_ids_to_phashes.keys(), dtype = numpy.int64, count = len( self._pending_phash_ids_to_phashes ) )
+            new_phashes = ConvertPHashesToNumPy( self._pending_phash_ids_to_phashes.values() )
+            
+            self._phash_ids = numpy.concatenate( ( self._phash_ids, new_phash_ids ) )
+            self._phashes = numpy.concatenate( ( self._phashes, new_phashes ) )
+            
+            self._pending_phash_ids_to_phashes = {}
+            
+        
+        if len( self._pending_removee_phash_ids ) > 0:
+            
+            removee_phash_ids = numpy.fromiter( self._pending_removee_phash_ids, dtype = numpy.int64, count = len( self._pending_removee_phash_ids ) )
+            
+            keep = numpy.isin( self._phash_ids, removee_phash_ids, invert = True )
+            
+            self._phash_ids = self._phash_ids[ keep ]
+            self._phashes = self._phashes[ keep ]
+            
+            self._pending_removee_phash_ids = set()
+            
+        
+    
+    def AddPHashes( self, rows ):
+        
+        with self._lock:
+            
+            if not self._loaded:
+                
+                return
+                
+            
+            for ( phash_id, phash ) in rows:
+                
+                if phash_id in self._pending_removee_phash_ids:
+                    
+                    self._pending_removee_phash_ids.discard( phash_id )
+                    
+                else:
+                    
+                    self._pending_phash_ids_to_phashes[ phash_id ] = phash
+                    
+                
+            
+        
+    
+    def GetNumPHashes( self ):
+        
+        with self._lock:
+            
+            if not self._loaded:
+                
+                return 0
+                
+            
+            self._Consolidate()
+            
+            return len( self._phash_ids )
+            
+        
+    
+    def IsLoaded( self ):
+        
+        with self._lock:
+            
+            return self._loaded
+            
+        
+    
+    def RemovePHashIds( self, phash_ids ):
+        
+        with self._lock:
+            
+            if not self._loaded:
+                
+                return
+                
+            
+            for phash_id in phash_ids:
+                
+                if phash_id in self._pending_phash_ids_to_phashes:
+                    
+                    del self._pending_phash_ids_to_phashes[ phash_id ]
+                    
+                else:
+                    
+                    self._pending_removee_phash_ids.add( phash_id )
+                    
+                
+            
+        
+    
+    def Reset( self ):
+        
+        with self._lock:
+            
+            self._loaded = False
+            
+            self._phash_ids = None
+            self._phashes = None
+            
+            self._pending_phash_ids_to_phashes = {}
+            self._pending_removee_phash_ids = set()
+            
+        
+    
+    def Search( self, phash, max_hamming_distance ):
+        
+        with self._lock:
+            
+            if not self._loaded:
+                
+                raise HydrusExceptions.DataMissing( 'The similar files index is not loaded!' )
+                
+            
+            self._Consolidate()
+            
+            if len( self._phash_ids ) == 0:
+                
+                return []
+                
+            
+            distances = GetNumPyHammingDistances( self._phashes, phash )
+            
+            return self._phash_ids[ distances <= max_hamming_distance ].tolist()
+            
+        
+    
+    def SearchMany( self, phashes, max_hamming_distance ):
+        
+        # returns a list of similar phash_id lists, one for each given phash
+        # we do a block of phashes at a time against the whole index as one big xor matrix
+        
+        with self._lock:
+            
+            if not self._loaded:
+                
+                raise HydrusExceptions.DataMissing( 'The similar files index is not loaded!' )
+                
+            
+            self._Consolidate()
+            
+            results = [ [] for phash in phashes ]
+            
+            num_indexed = len( self._phash_ids )
+            
+            if num_indexed == 0 or len( phashes ) == 0:
+                
+                return results
+                
+            
+            search_phashes = ConvertPHashesToNumPy( phashes )
+            
+            block_size = max( 1, PHASH_INDEX_BLOCK_CELLS // num_indexed )
+            
+            for block_start in range( 0, len( search_phashes ), block_size ):
+                
+                block = search_phashes[ block_start : block_start + block_size ]
+                
+                xors = numpy.bitwise_xor( block[ :, None ], self._phashes[ None, : ] )
+                
+                ( search_indices, indexed_indices ) = numpy.nonzero( GetNumPyPopCounts( xors ) <= max_hamming_distance )
+                
+                similar_phash_ids = self._phash_ids[ indexed_indices ].tolist()
+                
+                for ( search_index, similar_phash_id ) in zip( search_indices.tolist(), similar_phash_ids ):
+                    
+                    results[ block_start + search_index ].append( similar_phash_id )
+                    
+                
+            
+            return results
+            
+        
+    
+    def SetPHashes( self, rows ):
+        
+        with self._lock:
+            
+            self._phash_ids = numpy.fromiter( ( phash_id for ( phash_id, phash ) in rows ), dtype = numpy.int64, count = len( rows ) )
+            self._phashes = ConvertPHashesToNumPy( [ phash for ( phash_id, phash ) in rows ] )
+            
+            self._pending_phash_ids_to_phashes = {}
+            self._pending_removee_phash_ids = set()
+            
+            self._loaded = True
+            
+        
+    
@@ -13,6 +13,7 @@ class DataMissing( HydrusException ): pass
 
 class DBException( HydrusException ): pass
 class DBAccessException( HydrusException ): pass
+class DBWriterRequiredException( DBException ): pass
 class FileMissingException( HydrusException ): pass
 class SerialisationException( HydrusException ): pass
 class NameException( HydrusException ): pass
@@ -1,13 +1,341 @@
+import concurrent.futures
 import gc
+from . import HydrusConstants as HC
 from . import HydrusData
 from . import HydrusExceptions
 from . import HydrusGlobals as HG
+from . import HydrusPaths
 import os
+import shutil
+import sqlite3
 
 REGENERATE_FILE_DATA_JOB_COMPLETE = 0
 REGENERATE_FILE_DATA_JOB_FORCE_THUMBNAIL = 1
 REGENERATE_FILE_DATA_JOB_REFIT_THUMBNAIL = 2
 
+CLIENT_FILES_BACKUP_MANIFEST_FILENAME = 'client_files_backup.db'
+CLIENT_FILES_BACKUP_COPY_BATCH_SIZE = 256
+CLIENT_FILES_BACKUP_ORPHAN_BATCH_SIZE = 256
+CLIENT_FILES_BACKUP_NUM_THREADS = 4
+
+def BackupClientFiles( snapshot_db, combined_local_file_service_id, client_files_dir, dest_dir, text_update_hook = None, is_cancelled_hook = None ):
+    
+    # a manifest in the backup dir records every file we have dealt with, so we only look at what the db says was imported since last time
+    # the old mirror had to walk and stat millions of files on both sides to find out nothing had changed
+    
+    dest_client_files_dir = os.path.join( dest_dir, 'client_files' )
+    
+    HydrusPaths.MakeSureDirectoryExists( dest_dir )
+    
+    manifest_path = os.path.join( dest_dir, CLIENT_FILES_BACKUP_MANIFEST_FILENAME )
+    
+    manifest_db = sqlite3.connect( manifest_path, isolation_level = None )
+    
+    try:
+        
+        manifest_c = manifest_db.cursor()
+        
+        # size is null if the file was missing or could not be copied
+        manifest_c.execute( 'CREATE TABLE IF NOT EXISTS files ( hash BLOB PRIMARY KEY, mime INTEGER, timestamp INTEGER, size INTEGER, mtime INTEGER, thumbnail_size INTEGER, thumbnail_mtime INTEGER );' )
+        manifest_c.execute( 'CREATE TABLE IF NOT EXISTS backup_info ( next_timestamp INTEGER, needs_sweep INTEGER_BOOLEAN );' )
+        
+        if manifest_c.execute( 'SELECT 1 FROM backup_info;' ).fetchone() is None:
+            
+            # a backup made before the manifest existed may have files we no longer have, so the first run sweeps the dest once
+            needs_sweep = os.path.exists( dest_client_files_dir )
+            
+            manifest_c.execute( 'INSERT INTO backup_info ( next_timestamp, needs_sweep ) VALUES ( ?, ? );', ( 0, needs_sweep ) )
+            
+        
+        for prefix in HydrusData.IterateHexPrefixes():
+            
+            HydrusPaths.MakeSureDirectoryExists( os.path.join( dest_client_files_dir, 'f' + prefix ) )
+            HydrusPaths.MakeSureDirectoryExists( os.path.join( dest_client_files_dir, 't' + prefix ) )
+            
+        
+        snapshot_c = snapshot_db.cursor()
+        
+        ( next_timestamp, needs_sweep ) = manifest_c.execute( 'SELECT next_timestamp, needs_sweep FROM backup_info;' ).fetchone()
+        
+        next_timestamp = _BackupClientFilesCopyNew( snapshot_c, manifest_c, combined_local_file_service_id, client_files_dir, dest_client_files_dir, next_timestamp, text_update_hook, is_cancelled_hook )
+        
+        ( num_current, ) = snapshot_c.execute( 'SELECT COUNT( * ) FROM current_files WHERE service_id = ?;', ( combined_local_file_service_id, ) ).fetchone()
+        ( num_in_manifest, ) = manifest_c.execute( 'SELECT COUNT( * ) FROM files;' ).fetchone()
+        
+        if num_in_manifest != num_current:
+            
+            _BackupClientFilesDeleteOrphans( snapshot_c, manifest_c, combined_local_file_service_id, dest_client_files_dir, text_update_hook, is_cancelled_hook )
+            
+            ( num_in_manifest, ) = manifest_c.execute( 'SELECT COUNT( * ) FROM files;' ).fetchone()
+            
+            if num_in_manifest < num_current:
+                
+                # some current files were added with a timestamp older than our last run, so catch them up with a full pass
+                next_timestamp = _BackupClientFilesCopyNew( snapshot_c, manifest_c, combined_local_file_service_id, client_files_dir, dest_client_files_dir, 0, text_update_hook, is_cancelled_hook )
+                
+            
+        
+        if needs_sweep:
+            
+            _BackupClientFilesSweep( manifest_c, dest_client_files_dir, text_update_hook, is_cancelled_hook )
+            
+            manifest_c.execute( 'UPDATE backup_info SET needs_sweep = ?;', ( False, ) )
+            
+        
+    finally:
+        
+        manifest_db.close()
+        
+    
+def _BackupClientFilesCopy( source_path, dest_path ):
+    
+    # returns the source's ( size, mtime ), None if it is missing, or raises if it could not be copied
+    
+    try:
+        
+        source_stat = os.stat( source_path )
+        
+    except FileNotFoundError:
+        
+        return None
+        
+    
+    try:
+        
+        dest_stat = os.stat( dest_path )
+        
+        if dest_stat.st_size == source_stat.st_size and int( dest_stat.st_mtime ) == int( source_stat.st_mtime ):
+            
+            return ( source_stat.st_size, int( source_stat.st_mtime ) )
+            
+        
+        HydrusPaths.MakeFileWritable( dest_path )
+        
+    except FileNotFoundError:
+        
+        pass
+        
+    
+    shutil.copy2( source_path, dest_path )
+    
+    return ( source_stat.st_size, int( source_stat.st_mtime ) )
+    
+def _BackupClientFilesCopyNew( snapshot_c, manifest_c, combined_local_file_service_id, client_files_dir, dest_client_files_dir, next_timestamp, text_update_hook, is_cancelled_hook ):
+    
+    # files are done in import order and committed a batch at a time, so a cancelled or failed run picks up where it left off
+    # the next run starts at the earliest file that failed, and skips everything already in the manifest
+    
+    def work_callable( row ):
+        
+        ( hash, mime, timestamp ) = row
+        
+        hash_encoded = hash.hex()
+        
+        relative_path = os.path.join( 'f' + hash_encoded[:2], hash_encoded + HC.mime_ext_lookup[ mime ] )
+        
+        try:
+            
+            file_result = _BackupClientFilesCopy( os.path.join( client_files_dir, relative_path ), os.path.join( dest_client_files_dir, relative_path ) )
+            
+        except Exception as e:
+            
+            HydrusData.ShowText( 'Trying to back up the file ' + hash_encoded + ' caused the following problem:' )
+            
+            HydrusData.ShowException( e )
+            
+            return ( row, None, None, True )
+            
+        
+        thumbnail_result = None
+        
+        if mime in HC.MIMES_WITH_THUMBNAILS:
+            
+            relative_path = os.path.join( 't' + hash_encoded[:2], hash_encoded + '.thumbnail' )
+            
+            try:
+                
+                thumbnail_result = _BackupClientFilesCopy( os.path.join( client_files_dir, relative_path ), os.path.join( dest_client_files_dir, relative_path ) )
+                
+            except Exception as e:
+                
+                # a thumbnail can always be regenerated, so it is not worth holding the backup up over
+                
+                HydrusData.PrintException( e )
+                
+            
+        
+        return ( row, file_result, thumbnail_result, False )
+        
+    
+    failed_timestamp = None
+    num_done = 0
+    
+    cursor = snapshot_c.execute( 'SELECT hash, mime, timestamp FROM current_files NATURAL JOIN files_info NATURAL JOIN hashes WHERE service_id = ? AND timestamp >= ? ORDER BY timestamp ASC;', ( combined_local_file_service_id, next_timestamp ) )
+    
+    with concurrent.futures.ThreadPoolExecutor( max_workers = CLIENT_FILES_BACKUP_NUM_THREADS ) as executor:
+        
+        while True:
+            
+            if is_cancelled_hook is not None and is_cancelled_hook():
+                
+                raise HydrusExceptions.CancelledException( 'Backup cancelled!' )
+                
+            
+            rows = cursor.fetchmany( CLIENT_FILES_BACKUP_COPY_BATCH_SIZE )
+            
+            if len( rows ) == 0:
+                
+                break
+                
+            
+            hashes = [ hash for ( hash, mime, timestamp ) in rows ]
+            
+            already_done = { hash for ( hash, ) in manifest_c.execute( 'SELECT hash FROM files WHERE size IS NOT NULL AND hash IN ' + _BackupClientFilesSplayPlaceholders( hashes ) + ';', [ sqlite3.Binary( hash ) for hash in hashes ] ) }
+            
+            rows_to_do = [ row for row in rows if row[0] not in already_done ]
+            
+            inserts = []
+            
+            for ( row, file_result, thumbnail_result, failed ) in executor.map( work_callable, rows_to_do ):
+                
+                ( hash, mime, timestamp ) = row
+                
+                if failed:
+                    
+                    if failed_timestamp is None:
+                        
+                        failed_timestamp = timestamp
+                        
+                    
+                    file_result = None
+                    
+                
+                ( size, mtime ) = file_result if file_result is not None else ( None, None )
+                ( thumbnail_size, thumbnail_mtime ) = thumbnail_result if thumbnail_result is not None else ( None, None )
+                
+                inserts.append( ( sqlite3.Binary( hash ), mime, timestamp, size, mtime, thumbnail_size, thumbnail_mtime ) )
+                
+            
+            next_timestamp = rows[-1][2] if failed_timestamp is None else failed_timestamp
+            
+            manifest_c.execute( 'BEGIN IMMEDIATE;' )
+            
+            manifest_c.executemany( 'REPLACE INTO files ( hash, mime, timestamp, size, mtime, thumbnail_size, thumbnail_mtime ) VALUES ( ?, ?, ?, ?, ?, ?, ? );', inserts )
+            
+            manifest_c.execute( 'UPDATE backup_info SET next_timestamp = ?;', ( next_timestamp, ) )
+            
+            manifest_c.execute( 'COMMIT;' )
+            
+            num_done += len( rows )
+            
+            if text_update_hook is not None:
+                
+                text_update_hook( 'backing up files: ' + HydrusData.ToHumanInt( num_done ) + ' new files checked' )
+                
+            
+        
+    
+    return next_timestamp
+    
+def _BackupClientFilesDeleteOrphans( snapshot_c, manifest_c, combined_local_file_service_id, dest_client_files_dir, text_update_hook, is_cancelled_hook ):
+    
+    # goes through the manifest a bounded batch at a time, removing what the client no longer has
+    
+    last_hash = b''
+    num_deleted = 0
+    
+    while True:
+        
+        if is_cancelled_hook is not None and is_cancelled_hook():
+            
+            raise HydrusExceptions.CancelledException( 'Backup cancelled!' )
+            
+        
+        rows = manifest_c.execute( 'SELECT hash, mime FROM files WHERE hash > ? ORDER BY hash ASC LIMIT ?;', ( sqlite3.Binary( last_hash ), CLIENT_FILES_BACKUP_ORPHAN_BATCH_SIZE ) ).fetchall()
+        
+        if len( rows ) == 0:
+            
+            break
+            
+        
+        last_hash = rows[-1][0]
+        
+        hashes = [ hash for ( hash, mime ) in rows ]
+        
+        current_hashes = { hash for ( hash, ) in snapshot_c.execute( 'SELECT hash FROM hashes NATURAL JOIN current_files WHERE service_id = ? AND hash IN ' + _BackupClientFilesSplayPlaceholders( hashes ) + ';', [ combined_local_file_service_id ] + [ sqlite3.Binary( hash ) for hash in hashes ] ) }
+        
+        orphan_rows = [ ( hash, mime ) for ( hash, mime ) in rows if hash not in current_hashes ]
+        
+        if len( orphan_rows ) == 0:
+            
+            continue
+            
+        
+        for ( hash, mime ) in orphan_rows:
+            
+            hash_encoded = hash.hex()
+            
+            HydrusPaths.DeletePath( os.path.join( dest_client_files_dir, 'f' + hash_encoded[:2], hash_encoded + HC.mime_ext_lookup[ mime ] ) )
+            HydrusPaths.DeletePath( os.path.join( dest_client_files_dir, 't' + hash_encoded[:2], hash_encoded + '.thumbnail' ) )
+            
+        
+        manifest_c.executemany( 'DELETE FROM files WHERE hash = ?;', ( ( sqlite3.Binary( hash ), ) for ( hash, mime ) in orphan_rows ) )
+        
+        num_deleted += len( orphan_rows )
+        
+        if text_update_hook is not None:
+            
+            text_update_hook( 'backing up files: ' + HydrusData.ToHumanInt( num_deleted ) + ' deleted files removed' )
+            
+        
+    
+def _BackupClientFilesSplayPlaceholders( xs ):
+    
+    return '( ' + ', '.join( '?' for x in xs ) + ' )'
+    
+def _BackupClientFilesSweep( manifest_c, dest_client_files_dir, text_update_hook, is_cancelled_hook ):
+    
+    # one walk of the dest to clear out anything a pre-manifest backup left behind
+    
+    for prefix in HydrusData.IterateHexPrefixes():
+        
+        for prefix_type in ( 'f', 't' ):
+            
+            if is_cancelled_hook is not None and is_cancelled_hook():
+                
+                raise HydrusExceptions.CancelledException( 'Backup cancelled!' )
+                
+            
+            dir_path = os.path.join( dest_client_files_dir, prefix_type + prefix )
+            
+            if text_update_hook is not None:
+                
+                text_update_hook( 'backing up files: cleaning ' + dir_path )
+                
+            
+            for filename in os.listdir( dir_path ):
+                
+                path = os.path.join( dir_path, filename )
+                
+                try:
+                    
+                    hash = bytes.fromhex( filename.split( '.', 1 )[0] )
+                    
+                except ValueError:
+                    
+                    HydrusPaths.DeletePath( path )
+                    
+                    continue
+                    
+                
+                if manifest_c.execute( 'SELECT 1 FROM files WHERE hash = ?;', ( sqlite3.Binary( hash ), ) ).fetchone() is None:
+                    
+                    HydrusPaths.DeletePath( path )
+                    
+                
+            
+        
+    
 def GetAllPaths( raw_paths, do_human_sort = True ):
     
     file_paths = []
@@ -34,7 +34,9 @@ daemon_report_mode = False
 force_idle_mode = False
 no_page_limit_mode = False
 thumbnail_debug_mode = False
+bs4_html_parsing_mode = False
 server_busy = False
+server_backup_running = False
 
 do_idle_shutdown_work = False
 shutdown_complete = False
@@ -1,3 +1,4 @@
+import array
 import bisect
 import collections
 from . import ClientConstants as CC
@@ -19,6 +20,10 @@ from . import HydrusGlobals as HG
 from . import HydrusSerialisable
 import itertools
 
+# shared by every tags manager for 'no tags here'. tag id arrays are only ever replaced, never changed in place
+
+EMPTY_TAG_IDS = array.array( 'I' )
+
 def FlattenMedia( media_list ):
     
     flat_media = []
@@ -2477,33 +2482,117 @@ class TagsManagerSimple( object ):
     
     def __init__( self, service_keys_to_statuses_to_tags ):
         
-        self._service_keys_to_statuses_to_tags = service_keys_to_statuses_to_tags
+        # service_key : status : sorted array of interned tag ids
+        # arrays are never changed in place, so duplicates can share them
+        
+        self._service_keys_to_statuses_to_tag_ids = {}
+        
+        for ( service_key, statuses_to_tags ) in list( service_keys_to_statuses_to_tags.items() ):
+            
+            self._service_keys_to_statuses_to_tag_ids[ service_key ] = { status : HydrusTags.InternTags( tags ) for ( status, tags ) in list( statuses_to_tags.items() ) if len( tags ) > 0 }
+            
         
         self._combined_namespaces_cache = None
         
     
-    def _RecalcCombinedIfNeeded( self ):
+    def _AddTagId( self, service_key, status, tag_id ):
         
-        pass
+        statuses_to_tag_ids = self._service_keys_to_statuses_to_tag_ids.setdefault( service_key, {} )
         
-    
-    def Duplicate( self ):
+        tag_ids = statuses_to_tag_ids.get( status, EMPTY_TAG_IDS )
         
-        dupe_service_keys_to_statuses_to_tags = collections.defaultdict( HydrusData.default_dict_set )
+        i = bisect.bisect_left( tag_ids, tag_id )
         
-        for ( service_key, statuses_to_tags ) in list(self._service_keys_to_statuses_to_tags.items()):
+        if i < len( tag_ids ) and tag_ids[ i ] == tag_id:
             
-            dupe_statuses_to_tags = HydrusData.default_dict_set()
+            return
             
-            for ( status, tags ) in list(statuses_to_tags.items()):
+        
+        new_tag_ids = array.array( 'I', tag_ids )
+        
+        new_tag_ids.insert( i, tag_id )
+        
+        statuses_to_tag_ids[ status ] = new_tag_ids
+        
+    
+    def _DiscardTagId( self, service_key, status, tag_id ):
+        
+        if service_key not in self._service_keys_to_statuses_to_tag_ids:
+            
+            return
+            
+        
+        statuses_to_tag_ids = self._service_keys_to_statuses_to_tag_ids[ service_key ]
+        
+        tag_ids = statuses_to_tag_ids.get( status, EMPTY_TAG_IDS )
+        
+        i = bisect.bisect_left( tag_ids, tag_id )
+        
+        if i < len( tag_ids ) and tag_ids[ i ] == tag_id:
+            
+            if len( tag_ids ) == 1:
                 
-                dupe_statuses_to_tags[ status ] = set( tags )
+                del statuses_to_tag_ids[ status ]
+                
+            else:
+                
+                new_tag_ids = array.array( 'I', tag_ids )
+                
+                del new_tag_ids[ i ]
+                
+                statuses_to_tag_ids[ status ] = new_tag_ids
                 
             
-            dupe_service_keys_to_statuses_to_tags[ service_key ] = dupe_statuses_to_tags
+        
+    
+    def _GetCombinedCurrentAndPending( self ):
+        
+        self._RecalcCombinedIfNeeded()
+        
+        return self._GetTags( CC.COMBINED_TAG_SERVICE_KEY, HC.CONTENT_STATUS_CURRENT ).union( self._GetTags( CC.COMBINED_TAG_SERVICE_KEY, HC.CONTENT_STATUS_PENDING ) )
+        
+    
+    def _GetTagIds( self, service_key, status ):
+        
+        if service_key not in self._service_keys_to_statuses_to_tag_ids:
+            
+            return EMPTY_TAG_IDS
+            
+        
+        return self._service_keys_to_statuses_to_tag_ids[ service_key ].get( status, EMPTY_TAG_IDS )
+        
+    
+    def _GetTags( self, service_key, status ):
+        
+        if service_key == CC.COMBINED_TAG_SERVICE_KEY:
             
+            self._RecalcCombinedIfNeeded()
+            
+        
+        return HydrusTags.GetInternedTags( self._GetTagIds( service_key, status ) )
+        
+    
+    def _HasTagId( self, service_key, status, tag_id ):
+        
+        tag_ids = self._GetTagIds( service_key, status )
+        
+        i = bisect.bisect_left( tag_ids, tag_id )
+        
+        return i < len( tag_ids ) and tag_ids[ i ] == tag_id
+        
+    
+    def _RecalcCombinedIfNeeded( self ):
+        
+        pass
+        
+    
+    def Duplicate( self ):
         
-        return TagsManagerSimple( dupe_service_keys_to_statuses_to_tags )
+        dupe = TagsManagerSimple( {} )
+        
+        dupe._service_keys_to_statuses_to_tag_ids = { service_key : dict( statuses_to_tag_ids ) for ( service_key, statuses_to_tag_ids ) in list( self._service_keys_to_statuses_to_tag_ids.items() ) }
+        
+        return dupe
         
     
     def GetCombinedNamespaces( self, namespaces ):
@@ -2511,13 +2600,8 @@ class TagsManagerSimple( object ):
         self._RecalcCombinedIfNeeded()
         
         if self._combined_namespaces_cache is None:
-    
-            combined_statuses_to_tags = self._service_keys_to_statuses_to_tags[ CC.COMBINED_TAG_SERVICE_KEY ]
-            
-            combined_current = combined_statuses_to_tags[ HC.CONTENT_STATUS_CURRENT ]
-            combined_pending = combined_statuses_to_tags[ HC.CONTENT_STATUS_PENDING ]
             
-            pairs = ( HydrusTags.SplitTag( tag ) for tag in combined_current.union( combined_pending ) )
+            pairs = ( HydrusTags.SplitTag( tag ) for tag in self._GetCombinedCurrentAndPending() )
             
             self._combined_namespaces_cache = HydrusData.BuildKeyToSetDict( ( namespace, subtag ) for ( namespace, subtag ) in pairs if namespace != '' )
             
@@ -2529,14 +2613,7 @@ class TagsManagerSimple( object ):
     
     def GetComparableNamespaceSlice( self, namespaces ):
         
-        self._RecalcCombinedIfNeeded()
-        
-        combined_statuses_to_tags = self._service_keys_to_statuses_to_tags[ CC.COMBINED_TAG_SERVICE_KEY ]
-        
-        combined_current = combined_statuses_to_tags[ HC.CONTENT_STATUS_CURRENT ]
-        combined_pending = combined_statuses_to_tags[ HC.CONTENT_STATUS_PENDING ]
-        
-        combined = combined_current.union( combined_pending )
+        combined = self._GetCombinedCurrentAndPending()
         
         pairs = [ HydrusTags.SplitTag( tag ) for tag in combined ]
         
@@ -2556,14 +2633,7 @@ class TagsManagerSimple( object ):
     
     def GetCurrent( self, service_key = CC.COMBINED_TAG_SERVICE_KEY ):
         
-        if service_key == CC.COMBINED_TAG_SERVICE_KEY:
-            
-            self._RecalcCombinedIfNeeded()
-            
-        
-        statuses_to_tags = self._service_keys_to_statuses_to_tags[ service_key ]
-        
-        return statuses_to_tags[ HC.CONTENT_STATUS_CURRENT ]
+        return self._GetTags( service_key, HC.CONTENT_STATUS_CURRENT )
         
     
     def GetCurrentAndPending( self, service_key = CC.COMBINED_TAG_SERVICE_KEY ):
@@ -2573,26 +2643,12 @@ class TagsManagerSimple( object ):
     
     def GetDeleted( self, service_key = CC.COMBINED_TAG_SERVICE_KEY ):
         
-        if service_key == CC.COMBINED_TAG_SERVICE_KEY:
-            
-            self._RecalcCombinedIfNeeded()
-            
-        
-        statuses_to_tags = self._service_keys_to_statuses_to_tags[ service_key ]
-        
-        return statuses_to_tags[ HC.CONTENT_STATUS_DELETED ]
+        return self._GetTags( service_key, HC.CONTENT_STATUS_DELETED )
         
     
     def GetNamespaceSlice( self, namespaces ):
         
-        self._RecalcCombinedIfNeeded()
-        
-        combined_statuses_to_tags = self._service_keys_to_statuses_to_tags[ CC.COMBINED_TAG_SERVICE_KEY ]
-        
-        combined_current = combined_statuses_to_tags[ HC.CONTENT_STATUS_CURRENT ]
-        combined_pending = combined_statuses_to_tags[ HC.CONTENT_STATUS_PENDING ]
-        
-        combined = combined_current.union( combined_pending )
+        combined = self._GetCombinedCurrentAndPending()
         
         slice = { tag for tag in combined if True in ( tag.startswith( namespace + ':' ) for namespace in namespaces ) }
         
@@ -2603,26 +2659,12 @@ class TagsManagerSimple( object ):
     
     def GetPending( self, service_key = CC.COMBINED_TAG_SERVICE_KEY ):
         
-        if service_key == CC.COMBINED_TAG_SERVICE_KEY:
-            
-            self._RecalcCombinedIfNeeded()
-            
-        
-        statuses_to_tags = self._service_keys_to_statuses_to_tags[ service_key ]
-        
-        return statuses_to_tags[ HC.CONTENT_STATUS_PENDING ]
+        return self._GetTags( service_key, HC.CONTENT_STATUS_PENDING )
         
     
     def GetPetitioned( self, service_key = CC.COMBINED_TAG_SERVICE_KEY ):
         
-        if service_key == CC.COMBINED_TAG_SERVICE_KEY:
-            
-            self._RecalcCombinedIfNeeded()
-            
-        
-        statuses_to_tags = self._service_keys_to_statuses_to_tags[ service_key ]
-        
-        return statuses_to_tags[ HC.CONTENT_STATUS_PETITIONED ]
+        return self._GetTags( service_key, HC.CONTENT_STATUS_PETITIONED )
         
     
 class TagsManager( TagsManagerSimple ):
@@ -2642,24 +2684,24 @@ class TagsManager( TagsManagerSimple ):
             
             siblings_manager = HG.client_controller.tag_siblings_manager
             
-            combined_statuses_to_tags = collections.defaultdict( set )
+            combined_statuses_to_tag_ids = collections.defaultdict( set )
             
-            for ( service_key, statuses_to_tags ) in list(self._service_keys_to_statuses_to_tags.items()):
+            for ( service_key, statuses_to_tag_ids ) in list( self._service_keys_to_statuses_to_tag_ids.items() ):
                 
                 if service_key == CC.COMBINED_TAG_SERVICE_KEY:
                     
                     continue
                     
                 
-                statuses_to_tags = siblings_manager.CollapseStatusesToTags( service_key, statuses_to_tags )
+                statuses_to_tag_ids = siblings_manager.CollapseStatusesToTagIds( service_key, statuses_to_tag_ids )
                 
-                combined_statuses_to_tags[ HC.CONTENT_STATUS_CURRENT ].update( statuses_to_tags[ HC.CONTENT_STATUS_CURRENT ] )
-                combined_statuses_to_tags[ HC.CONTENT_STATUS_PENDING ].update( statuses_to_tags[ HC.CONTENT_STATUS_PENDING ] )
-                combined_statuses_to_tags[ HC.CONTENT_STATUS_PETITIONED ].update( statuses_to_tags[ HC.CONTENT_STATUS_PETITIONED ] )
-                combined_statuses_to_tags[ HC.CONTENT_STATUS_DELETED ].update( statuses_to_tags[ HC.CONTENT_STATUS_DELETED ] )
+                for ( status, tag_ids ) in list( statuses_to_tag_ids.items() ):
+                    
+                    combined_statuses_to_tag_ids[ status ].update( tag_ids )
+                    
                 
             
-            self._service_keys_to_statuses_to_tags[ CC.COMBINED_TAG_SERVICE_KEY ] = combined_statuses_to_tags
+            self._service_keys_to_statuses_to_tag_ids[ CC.COMBINED_TAG_SERVICE_KEY ] = { status : array.array( 'I', sorted( combined_statuses_to_tag_ids[ status ] ) ) for status in ( HC.CONTENT_STATUS_CURRENT, HC.CONTENT_STATUS_PENDING, HC.CONTENT_STATUS_PETITIONED, HC.CONTENT_STATUS_DELETED ) }
             
             self._combined_namespaces_cache = None
             
@@ -2669,12 +2711,17 @@ class TagsManager( TagsManagerSimple ):
     
     def DeletePending( self, service_key ):
         
-        statuses_to_tags = self._service_keys_to_statuses_to_tags[ service_key ]
+        if service_key not in self._service_keys_to_statuses_to_tag_ids:
+            
+            return
+            
+        
+        statuses_to_tag_ids = self._service_keys_to_statuses_to_tag_ids[ service_key ]
         
-        if len( statuses_to_tags[ HC.CONTENT_STATUS_PENDING ] ) + len( statuses_to_tags[ HC.CONTENT_STATUS_PETITIONED ] ) > 0:
+        if HC.CONTENT_STATUS_PENDING in statuses_to_tag_ids or HC.CONTENT_STATUS_PETITIONED in statuses_to_tag_ids:
             
-            statuses_to_tags[ HC.CONTENT_STATUS_PENDING ] = set()
-            statuses_to_tags[ HC.CONTENT_STATUS_PETITIONED ] = set()
+            statuses_to_tag_ids.pop( HC.CONTENT_STATUS_PENDING, None )
+            statuses_to_tag_ids.pop( HC.CONTENT_STATUS_PETITIONED, None )
             
             self._combined_is_calculated = False
             
@@ -2682,21 +2729,11 @@ class TagsManager( TagsManagerSimple ):
     
     def Duplicate( self ):
         
-        dupe_service_keys_to_statuses_to_tags = collections.defaultdict( HydrusData.default_dict_set )
+        dupe = TagsManager( {} )
         
-        for ( service_key, statuses_to_tags ) in list(self._service_keys_to_statuses_to_tags.items()):
-            
-            dupe_statuses_to_tags = HydrusData.default_dict_set()
-            
-            for ( status, tags ) in list(statuses_to_tags.items()):
-                
-                dupe_statuses_to_tags[ status ] = set( tags )
-                
-            
-            dupe_service_keys_to_statuses_to_tags[ service_key ] = dupe_statuses_to_tags
-            
+        dupe._service_keys_to_statuses_to_tag_ids = { service_key : dict( statuses_to_tag_ids ) for ( service_key, statuses_to_tag_ids ) in list( self._service_keys_to_statuses_to_tag_ids.items() ) }
         
-        return TagsManager( dupe_service_keys_to_statuses_to_tags )
+        return dupe
         
     
     def GetNumTags( self, service_key, include_current_tags = True, include_pending_tags = False ):
@@ -2708,10 +2745,8 @@ class TagsManager( TagsManagerSimple ):
         
         num_tags = 0
         
-        statuses_to_tags = self.GetStatusesToTags( service_key )
-        
-        if include_current_tags: num_tags += len( statuses_to_tags[ HC.CONTENT_STATUS_CURRENT ] )
-        if include_pending_tags: num_tags += len( statuses_to_tags[ HC.CONTENT_STATUS_PENDING ] )
+        if include_current_tags: num_tags += len( self._GetTagIds( service_key, HC.CONTENT_STATUS_CURRENT ) )
+        if include_pending_tags: num_tags += len( self._GetTagIds( service_key, HC.CONTENT_STATUS_PENDING ) )
         
         return num_tags
         
@@ -2720,7 +2755,14 @@ class TagsManager( TagsManagerSimple ):
         
         self._RecalcCombinedIfNeeded()
         
-        return self._service_keys_to_statuses_to_tags
+        service_keys_to_statuses_to_tags = collections.defaultdict( HydrusData.default_dict_set )
+        
+        for service_key in list( self._service_keys_to_statuses_to_tag_ids.keys() ):
+            
+            service_keys_to_statuses_to_tags[ service_key ] = self.GetStatusesToTags( service_key )
+            
+        
+        return service_keys_to_statuses_to_tags
         
     
     def GetStatusesToTags( self, service_key ):
@@ -2730,16 +2772,31 @@ class TagsManager( TagsManagerSimple ):
             self._RecalcCombinedIfNeeded()
             
         
-        return self._service_keys_to_statuses_to_tags[ service_key ]
+        statuses_to_tags = HydrusData.default_dict_set()
+        
+        if service_key in self._service_keys_to_statuses_to_tag_ids:
+            
+            for ( status, tag_ids ) in list( self._service_keys_to_statuses_to_tag_ids[ service_key ].items() ):
+                
+                statuses_to_tags[ status ] = HydrusTags.GetInternedTags( tag_ids )
+                
+            
+        
+        return statuses_to_tags
         
     
     def HasTag( self, tag ):
         
-        self._RecalcCombinedIfNeeded()
+        tag_id = HydrusTags.GetInternedTagId( tag )
+        
+        if tag_id is None:
+            
+            return False
+            
         
-        combined_statuses_to_tags = self._service_keys_to_statuses_to_tags[ CC.COMBINED_TAG_SERVICE_KEY ]
+        self._RecalcCombinedIfNeeded()
         
-        return tag in combined_statuses_to_tags[ HC.CONTENT_STATUS_CURRENT ] or tag in combined_statuses_to_tags[ HC.CONTENT_STATUS_PENDING ]
+        return self._HasTagId( CC.COMBINED_TAG_SERVICE_KEY, HC.CONTENT_STATUS_CURRENT, tag_id ) or self._HasTagId( CC.COMBINED_TAG_SERVICE_KEY, HC.CONTENT_STATUS_PENDING, tag_id )
         
     
     def NewSiblings( self ):
@@ -2749,47 +2806,47 @@ class TagsManager( TagsManagerSimple ):
     
     def ProcessContentUpdate( self, service_key, content_update ):
         
-        statuses_to_tags = self._service_keys_to_statuses_to_tags[ service_key ]
-        
         ( data_type, action, row ) = content_update.ToTuple()
         
         ( tag, hashes ) = row
         
+        tag_id = HydrusTags.InternTag( tag )
+        
         if action == HC.CONTENT_UPDATE_ADD:
             
-            statuses_to_tags[ HC.CONTENT_STATUS_CURRENT ].add( tag )
+            self._AddTagId( service_key, HC.CONTENT_STATUS_CURRENT, tag_id )
             
-            statuses_to_tags[ HC.CONTENT_STATUS_DELETED ].discard( tag )
-            statuses_to_tags[ HC.CONTENT_STATUS_PENDING ].discard( tag )
+            self._DiscardTagId( service_key, HC.CONTENT_STATUS_DELETED, tag_id )
+            self._DiscardTagId( service_key, HC.CONTENT_STATUS_PENDING, tag_id )
             
         elif action == HC.CONTENT_UPDATE_DELETE:
             
-            statuses_to_tags[ HC.CONTENT_STATUS_DELETED ].add( tag )
+            self._AddTagId( service_key, HC.CONTENT_STATUS_DELETED, tag_id )
             
-            statuses_to_tags[ HC.CONTENT_STATUS_CURRENT ].discard( tag )
-            statuses_to_tags[ HC.CONTENT_STATUS_PETITIONED ].discard( tag )
+            self._DiscardTagId( service_key, HC.CONTENT_STATUS_CURRENT, tag_id )
+            self._DiscardTagId( service_key, HC.CONTENT_STATUS_PETITIONED, tag_id )
             
         elif action == HC.CONTENT_UPDATE_PEND:
             
-            if tag not in statuses_to_tags[ HC.CONTENT_STATUS_CURRENT ]:
+            if not self._HasTagId( service_key, HC.CONTENT_STATUS_CURRENT, tag_id ):
                 
-                statuses_to_tags[ HC.CONTENT_STATUS_PENDING ].add( tag )
+                self._AddTagId( service_key, HC.CONTENT_STATUS_PENDING, tag_id )
                 
             
         elif action == HC.CONTENT_UPDATE_RESCIND_PEND:
             
-            statuses_to_tags[ HC.CONTENT_STATUS_PENDING ].discard( tag )
+            self._DiscardTagId( service_key, HC.CONTENT_STATUS_PENDING, tag_id )
             
         elif action == HC.CONTENT_UPDATE_PETITION:
             
-            if tag in statuses_to_tags[ HC.CONTENT_STATUS_CURRENT ]:
+            if self._HasTagId( service_key, HC.CONTENT_STATUS_CURRENT, tag_id ):
                 
-                statuses_to_tags[ HC.CONTENT_STATUS_PETITIONED ].add( tag )
+                self._AddTagId( service_key, HC.CONTENT_STATUS_PETITIONED, tag_id )
                 
             
         elif action == HC.CONTENT_UPDATE_RESCIND_PETITION:
             
-            statuses_to_tags[ HC.CONTENT_STATUS_PETITIONED ].discard( tag )
+            self._DiscardTagId( service_key, HC.CONTENT_STATUS_PETITIONED, tag_id )
             
         
         self._combined_is_calculated = False
@@ -2797,9 +2854,9 @@ class TagsManager( TagsManagerSimple ):
     
     def ResetService( self, service_key ):
         
-        if service_key in self._service_keys_to_statuses_to_tags:
+        if service_key in self._service_keys_to_statuses_to_tag_ids:
             
-            del self._service_keys_to_statuses_to_tags[ service_key ]
+            del self._service_keys_to_statuses_to_tag_ids[ service_key ]
             
             self._combined_is_calculated = False
             
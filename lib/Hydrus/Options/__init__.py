@@ -200,6 +200,8 @@ class ClientOptions( HydrusSerialisable.SerialisableBase ):
         
         self._dictionary[ 'integers' ][ 'max_simultaneous_subscriptions' ] = 1
         
+        self._dictionary[ 'integers' ][ 'num_import_workers' ] = 4
+        
         self._dictionary[ 'integers' ][ 'gallery_page_wait_period_pages' ] = 15
         self._dictionary[ 'integers' ][ 'gallery_page_wait_period_subscriptions' ] = 5
         self._dictionary[ 'integers' ][ 'watcher_page_wait_period' ] = 5
@@ -1,4 +1,10 @@
+import array
+from . import HydrusExceptions
+import itertools
 import json
+import operator
+import struct
+import sys
 import zlib
 
 LZ4_OK = False
@@ -95,8 +101,44 @@ SERIALISABLE_TYPE_SERVICE_KEYS_TO_TAGS = 77
 
 SERIALISABLE_TYPES_TO_OBJECT_TYPES = {}
 
+# the binary network format is: prefix, format version, serialisable type, serialisable version, then a zlib-compressed payload the object writes itself
+# zlib streams start with 0x78 and lz4 blocks start with their size, so the prefix cannot be mistaken for the older json formats
+
+NETWORK_BYTES_BINARY_PREFIX = b'\x00hydrus binary'
+NETWORK_BYTES_BINARY_FORMAT_VERSION = 1
+NETWORK_BYTES_BINARY_HEADER_FORMAT = '<BHH'
+NETWORK_BYTES_BINARY_COMPRESSION_LEVEL = 6
+
+INTEGER_ARRAY_TYPECODES = [ ( 'B', 2 ** 8 - 1 ), ( 'H', 2 ** 16 - 1 ), ( 'I', 2 ** 32 - 1 ), ( 'Q', 2 ** 64 - 1 ) ]
+INTEGER_ARRAY_HEADER_FORMAT = '<cQ'
+
+def CreateFromBinaryNetworkBytes( network_bytes ):
+    
+    header_start = len( NETWORK_BYTES_BINARY_PREFIX )
+    payload_start = header_start + struct.calcsize( NETWORK_BYTES_BINARY_HEADER_FORMAT )
+    
+    ( format_version, serialisable_type, version ) = struct.unpack_from( NETWORK_BYTES_BINARY_HEADER_FORMAT, network_bytes, header_start )
+    
+    if format_version != NETWORK_BYTES_BINARY_FORMAT_VERSION:
+        
+        raise HydrusExceptions.SerialisationException( 'Did not understand binary format version ' + str( format_version ) + '! Maybe this client is out of date?' )
+        
+    
+    binary_info = zlib.decompress( network_bytes[ payload_start : ] )
+    
+    obj = SERIALISABLE_TYPES_TO_OBJECT_TYPES[ serialisable_type ]()
+    
+    obj.InitialiseFromBinarySerialisableInfo( version, binary_info )
+    
+    return obj
+    
 def CreateFromNetworkBytes( network_string ):
     
+    if network_string.startswith( NETWORK_BYTES_BINARY_PREFIX ):
+        
+        return CreateFromBinaryNetworkBytes( network_string )
+        
+    
     try:
         
         obj_bytes = zlib.decompress( network_string )
@@ -157,11 +199,125 @@ def GetNonDupeName( original_name, disallowed_names ):
     
     return non_dupe_name
     
+def PackBytesList( byte_strings ):
+    
+    return PackIntegers( [ len( byte_string ) for byte_string in byte_strings ] ) + b''.join( byte_strings )
+    
+def PackIntegers( integers ):
+    
+    # a fixed-width little-endian array, as narrow as the biggest value allows
+    
+    integers = list( integers )
+    
+    max_integer = max( integers ) if len( integers ) > 0 else 0
+    
+    for ( typecode, max_value ) in INTEGER_ARRAY_TYPECODES:
+        
+        if max_integer <= max_value:
+            
+            break
+            
+        
+    
+    integer_array = array.array( typecode, integers )
+    
+    if sys.byteorder == 'big':
+        
+        integer_array.byteswap()
+        
+    
+    return struct.pack( INTEGER_ARRAY_HEADER_FORMAT, typecode.encode( 'ascii' ), len( integer_array ) ) + integer_array.tobytes()
+    
+def PackSortedIntegerLists( integer_lists ):
+    
+    # many sorted lists in one array, each delta-encoded from its own start
+    
+    lengths = []
+    all_deltas = []
+    
+    for integers in integer_lists:
+        
+        integers = sorted( integers )
+        
+        lengths.append( len( integers ) )
+        all_deltas.extend( map( operator.sub, integers, [ 0 ] + integers[ : -1 ] ) )
+        
+    
+    return PackIntegers( lengths ) + PackIntegers( all_deltas )
+    
+def PackSortedIntegers( integers ):
+    
+    # sorted ids delta-encode to small numbers, which makes for a narrow array that compresses well
+    
+    integers = sorted( integers )
+    
+    deltas = list( map( operator.sub, integers, [ 0 ] + integers[ : -1 ] ) )
+    
+    return PackIntegers( deltas )
+    
 def SetNonDupeName( obj, disallowed_names ):
     
     non_dupe_name = GetNonDupeName( obj.GetName(), disallowed_names )
     
     obj.SetName( non_dupe_name )
+    
+def UnpackBytesList( data, offset ):
+    
+    ( lengths, offset ) = UnpackIntegers( data, offset )
+    
+    byte_strings = []
+    
+    for length in lengths:
+        
+        byte_strings.append( bytes( data[ offset : offset + length ] ) )
+        
+        offset += length
+        
+    
+    return ( byte_strings, offset )
+    
+def UnpackIntegers( data, offset ):
+    
+    ( typecode, num_integers ) = struct.unpack_from( INTEGER_ARRAY_HEADER_FORMAT, data, offset )
+    
+    offset += struct.calcsize( INTEGER_ARRAY_HEADER_FORMAT )
+    
+    integer_array = array.array( typecode.decode( 'ascii' ) )
+    
+    end = offset + num_integers * integer_array.itemsize
+    
+    integer_array.frombytes( memoryview( data )[ offset : end ] )
+    
+    if sys.byteorder == 'big':
+        
+        integer_array.byteswap()
+        
+    
+    return ( integer_array.tolist(), end )
+    
+def UnpackSortedIntegerLists( data, offset ):
+    
+    ( lengths, offset ) = UnpackIntegers( data, offset )
+    ( all_deltas, offset ) = UnpackIntegers( data, offset )
+    
+    integer_lists = []
+    
+    start = 0
+    
+    for length in lengths:
+        
+        integer_lists.append( list( itertools.accumulate( all_deltas[ start : start + length ] ) ) )
+        
+        start += length
+        
+    
+    return ( integer_lists, offset )
+    
+def UnpackSortedIntegers( data, offset ):
+    
+    ( deltas, offset ) = UnpackIntegers( data, offset )
+    
+    return ( list( itertools.accumulate( deltas ) ), offset )
 
 class SerialisableBase( object ):
     
@@ -169,11 +325,21 @@ class SerialisableBase( object ):
     SERIALISABLE_NAME = 'Base Serialisable Object'
     SERIALISABLE_VERSION = 1
     
+    def _GetBinarySerialisableInfo( self ):
+        
+        raise NotImplementedError()
+        
+    
     def _GetSerialisableInfo( self ):
         
         raise NotImplementedError()
         
     
+    def _InitialiseFromBinarySerialisableInfo( self, binary_info ):
+        
+        raise NotImplementedError()
+        
+    
     def _InitialiseFromSerialisableInfo( self, serialisable_info ):
         
         raise NotImplementedError()
@@ -184,6 +350,13 @@ class SerialisableBase( object ):
         return old_serialisable_info
         
     
+    def DumpToBinaryNetworkBytes( self ):
+        
+        header = NETWORK_BYTES_BINARY_PREFIX + struct.pack( NETWORK_BYTES_BINARY_HEADER_FORMAT, NETWORK_BYTES_BINARY_FORMAT_VERSION, self.SERIALISABLE_TYPE, self.SERIALISABLE_VERSION )
+        
+        return header + zlib.compress( self._GetBinarySerialisableInfo(), NETWORK_BYTES_BINARY_COMPRESSION_LEVEL )
+        
+    
     def DumpToNetworkBytes( self ):
         
         obj_string = self.DumpToString()
@@ -222,6 +395,18 @@ class SerialisableBase( object ):
         return ( self.SERIALISABLE_TYPE, self.SERIALISABLE_VERSION, serialisable_info )
         
     
+    def InitialiseFromBinarySerialisableInfo( self, version, binary_info ):
+        
+        # the binary formats have no update path--a version bump should mean a new binary format version
+        
+        if version != self.SERIALISABLE_VERSION:
+            
+            raise HydrusExceptions.SerialisationException( 'Could not load a binary ' + self.SERIALISABLE_NAME + ' of version ' + str( version ) + '!' )
+            
+        
+        self._InitialiseFromBinarySerialisableInfo( binary_info )
+        
+    
     def InitialiseFromSerialisableInfo( self, version, serialisable_info ):
         
         while version < self.SERIALISABLE_VERSION:
@@ -26,7 +26,7 @@ LOCAL_BOORU_BYTE_PARAMS = { 'share_key', 'hash' }
 LOCAL_BOORU_STRING_PARAMS = set()
 LOCAL_BOORU_JSON_PARAMS = set()
 
-CLIENT_API_INT_PARAMS = { 'file_id' }
+CLIENT_API_INT_PARAMS = { 'file_id', 'file_id_cursor', 'num_file_ids' }
 CLIENT_API_BYTE_PARAMS = { 'hash' }
 CLIENT_API_STRING_PARAMS = { 'name', 'url' }
 CLIENT_API_JSON_PARAMS = { 'basic_permissions', 'system_inbox', 'system_archive', 'tags', 'file_ids', 'hashes', 'only_return_identifiers' }
@@ -1198,11 +1198,49 @@ class HydrusResourceClientAPIRestrictedGetFilesSearchFiles( HydrusResourceClient
         
         file_search_context = ClientSearch.FileSearchContext( file_service_key = CC.LOCAL_FILE_SERVICE_KEY, tag_service_key = CC.COMBINED_TAG_SERVICE_KEY, predicates = predicates )
         
-        hash_ids = HG.client_controller.Read( 'file_query_ids', file_search_context )
-        
-        request.client_api_permissions.SetLastSearchResults( hash_ids )
-        
-        body_dict = { 'file_ids' : list( hash_ids ) }
+        if 'file_id_cursor' in request.parsed_request_args or 'num_file_ids' in request.parsed_request_args:
+            
+            file_id_cursor = None
+            num_file_ids = None
+            
+            if 'file_id_cursor' in request.parsed_request_args:
+                
+                file_id_cursor = request.parsed_request_args[ 'file_id_cursor' ]
+                
+            
+            if 'num_file_ids' in request.parsed_request_args:
+                
+                num_file_ids = request.parsed_request_args[ 'num_file_ids' ]
+                
+                if num_file_ids < 1:
+                    
+                    raise HydrusExceptions.BadRequestException( '"num_file_ids" has to be at least 1!' )
+                    
+                
+            
+            ( hash_ids, next_file_id_cursor ) = HG.client_controller.Read( 'file_query_ids_page', file_search_context, file_id_cursor = file_id_cursor, num_file_ids = num_file_ids )
+            
+            # later pages add to what the key may see, the first page starts over
+            
+            if file_id_cursor is None:
+                
+                request.client_api_permissions.SetLastSearchResults( hash_ids )
+                
+            else:
+                
+                request.client_api_permissions.AddLastSearchResults( hash_ids )
+                
+            
+            body_dict = { 'file_ids' : list( hash_ids ), 'next_file_id_cursor' : next_file_id_cursor }
+            
+        else:
+            
+            hash_ids = HG.client_controller.Read( 'file_query_ids', file_search_context )
+            
+            request.client_api_permissions.SetLastSearchResults( hash_ids )
+            
+            body_dict = { 'file_ids' : list( hash_ids ) }
+            
         
         body = json.dumps( body_dict )
         
@@ -9,6 +9,7 @@ import http.cookies
 from twisted.internet import reactor, defer
 from twisted.internet.threads import deferToThread
 
+from twisted.web import http
 from twisted.web.server import NOT_DONE_YET
 from twisted.web.resource import Resource
 from twisted.web.static import File as FileResource, NoRangeStaticProducer
@@ -130,18 +131,60 @@ class HydrusResource( Resource ):
             ( base, filename ) = os.path.split( path )
             content_disposition = 'inline; filename="' + filename + '"'
             
-            request.setHeader( 'Content-Type', str( content_type ) )
-            request.setHeader( 'Content-Length', str( content_length ) )
             request.setHeader( 'Content-Disposition', str( content_disposition ) )
             request.setHeader( 'Expires', time.strftime( '%a, %d %b %Y %H:%M:%S GMT', time.gmtime( time.time() + 86400 * 365 ) ) )
             request.setHeader( 'Cache-Control', 'max-age={}'.format( 86400 * 365 ) )
             
-            fileObject = open( path, 'rb' )
-            
-            producer = NoRangeStaticProducer( request, fileObject )
-            producer.start()
-            
-            do_finish = False
+            if status_code == 200:
+                last_modified = int( os.path.getmtime( path ) )
+                
+                # files and thumbnails are named by their hash, so this is a strong etag for free
+                etag = '"{}-{:x}-{:x}"'.format( filename, size, last_modified )
+                
+                request.setHeader( 'Accept-Ranges', 'bytes' )
+                request.setHeader( 'ETag', etag )
+                request.setHeader( 'Last-Modified', http.datetimeToString( last_modified ) )
+                
+                if self._isNotModified( request, etag, last_modified ):
+                    request.setResponseCode( 304 )
+                    
+                    self._reportRequestUsed( request )
+                    
+                    request.finish()
+                    
+                    return
+                    
+                # twisted's static file resource does Range, including multipart/byteranges, and sets the 200/206/416 and Content-* headers
+                file_resource = FileResource( path, defaultType = content_type )
+                file_resource.type = content_type
+                file_resource.encoding = None
+                
+                fileObject = open( path, 'rb' )
+                
+                producer = file_resource.makeProducer( request, fileObject )
+                
+                content_lengths = request.responseHeaders.getRawHeaders( 'Content-Length' )
+                
+                if content_lengths is not None:
+                    content_length = int( content_lengths[0] )
+                    
+            else:
+                request.setHeader( 'Content-Type', str( content_type ) )
+                request.setHeader( 'Content-Length', str( content_length ) )
+                
+                fileObject = open( path, 'rb' )
+                
+                producer = NoRangeStaticProducer( request, fileObject )
+                
+            if request.method == b'HEAD':
+                fileObject.close()
+                
+                content_length = 0
+                
+            else:
+                producer.start()
+                
+                do_finish = False
             
         elif response_context.HasBody():
             mime = response_context.GetMime()
@@ -275,6 +318,35 @@ class HydrusResource( Resource ):
         return request
         
     
+    def _isNotModified( self, request, etag, last_modified ):
+        if request.method not in ( b'GET', b'HEAD' ):
+            return False
+        
+        # If-None-Match wins over If-Modified-Since when both are present
+        if request.requestHeaders.hasHeader( 'If-None-Match' ):
+            if_none_match = ','.join( request.requestHeaders.getRawHeaders( 'If-None-Match' ) )
+            
+            tags = { tag.strip() for tag in if_none_match.split( ',' ) }
+            
+            # a weak comparison is fine for GET and HEAD
+            tags = { tag[2:] if tag.startswith( 'W/' ) else tag for tag in tags }
+            
+            return etag in tags or '*' in tags
+            
+        if request.requestHeaders.hasHeader( 'If-Modified-Since' ):
+            if_modified_since = request.requestHeaders.getRawHeaders( 'If-Modified-Since' )[0]
+            
+            try:
+                modified_since = http.stringToDatetime( if_modified_since )
+                
+            except:
+                return False
+                
+            return last_modified <= modified_since
+            
+        return False
+        
+    
     def _parseHydrusNetworkAccessKey( self, request ):
         if not request.requestHeaders.hasHeader( 'Hydrus-Key' ):
             raise Exceptions.MissingCredentialsException( 'No hydrus key header found!' )
@@ -313,6 +385,7 @@ class HydrusResource( Resource ):
         
         if self._threadDoGETJob.__func__ != Resource._threadDoGETJob:
             allowed_methods.append( 'GET' )
+            allowed_methods.append( 'HEAD' )
             
         if self._threadDoPOSTJob.__func__ != Resource._threadDoPOSTJob:
             allowed_methods.append( 'POST' )
@@ -377,6 +450,11 @@ class HydrusResource( Resource ):
         return NOT_DONE_YET
         
     
+    def render_HEAD( self, request ):
+        # the GET pipeline sets all the headers, and the file producer is never started for HEAD
+        return self.render_GET( request )
+        
+    
     def render_OPTIONS( self, request ):
         request.setHeader( 'Server', self._server_version_string )
         
@@ -737,7 +815,7 @@ class HydrusResourceBusyCheck( HydrusServerResources.Resource ):
         request.setResponseCode( 200 )
         request.setHeader( 'Server', self._server_version_string )
         
-        if HG.server_busy:
+        if HG.server_busy or HG.server_backup_running:
             return b'1'
             
         else:
@@ -1171,9 +1249,26 @@ class HydrusResourceRestrictedUpdate( HydrusResourceRestricted ):
         if not self._service.HasUpdateHash( update_hash ):
             raise HydrusExceptions.NotFoundException( 'This update hash does not exist on this service!' )
             
-        path = ServerFiles.GetFilePath( update_hash )
+        binary_update_hash = self._service.GetBinaryUpdateHash( update_hash )
         
-        response_context = HydrusServerResources.ResponseContext( 200, mime = HC.APPLICATION_OCTET_STREAM, path = path )
+        if binary_update_hash is None:
+            path = ServerFiles.GetFilePath( update_hash )
+            
+            response_context = HydrusServerResources.ResponseContext( 200, mime = HC.APPLICATION_OCTET_STREAM, path = path )
+            
+        else:
+            # this client did not ask for binary updates, so it gets the json conversion it has the hash for
+            
+            path = ServerFiles.GetFilePath( binary_update_hash )
+            
+            with open( path, 'rb' ) as f:
+                binary_update_bytes = f.read()
+                
+            
+            body = HydrusNetwork.ConvertBinaryUpdateToNetworkBytes( binary_update_bytes )
+            
+            response_context = HydrusServerResources.ResponseContext( 200, mime = HC.APPLICATION_OCTET_STREAM, body = body )
+            
         
         return response_context
         
@@ -1207,7 +1302,9 @@ class HydrusResourceRestrictedMetadataUpdate( HydrusResourceRestricted ):
         
         since = request.parsed_request_args[ 'since' ]
         
-        metadata_slice = self._service.GetMetadataSlice( since )
+        binary_updates = 'binary_updates' in request.parsed_request_args and request.parsed_request_args[ 'binary_updates' ] == 1
+        
+        metadata_slice = self._service.GetMetadataSlice( since, binary_updates = binary_updates )
         
         body = HydrusNetwork.DumpHydrusArgsToNetworkBytes( { 'metadata_slice' : metadata_slice } )
         
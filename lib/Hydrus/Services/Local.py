@@ -13,6 +13,7 @@ from . import HydrusGlobals as HG
 from . import HydrusNetwork
 from . import HydrusNetworking
 from . import HydrusSerialisable
+from . import HydrusThreading
 import json
 import os
 import threading
@@ -1071,6 +1072,8 @@ class ServiceRestricted( ServiceRemote ):
     
 class ServiceRepository( ServiceRestricted ):
     
+    NUM_UPDATES_TO_DOWNLOAD_AT_ONCE = 4
+    
     def __init__( self, service_key, service_type, name, dictionary = None ):
         
         ServiceRestricted.__init__( self, service_key, service_type, name, dictionary = dictionary )
@@ -1141,6 +1144,55 @@ class ServiceRepository( ServiceRestricted ):
         self._tag_archive_sync = dict( dictionary[ 'tag_archive_sync' ] )
         
     
+    def _SyncDownloadUpdate( self, update_hash ):
+        
+        # this runs on a worker thread, so it reports its problems back rather than acting on them
+        
+        try:
+            
+            update_network_string = self.Request( HC.GET, 'update', { 'update_hash' : update_hash } )
+            
+        except HydrusExceptions.CancelledException as e:
+            
+            return ( 'cancelled', e )
+            
+        except HydrusExceptions.NetworkException as e:
+            
+            return ( 'network error', e )
+            
+        
+        update_network_string_hash = hashlib.sha256( update_network_string ).digest()
+        
+        if update_network_string_hash != update_hash:
+            
+            return ( 'bad hash', None )
+            
+        
+        try:
+            
+            update = HydrusSerialisable.CreateFromNetworkBytes( update_network_string )
+            
+        except Exception as e:
+            
+            return ( 'unparseable', e )
+            
+        
+        if isinstance( update, HydrusNetwork.DefinitionsUpdate ):
+            
+            mime = HC.APPLICATION_HYDRUS_UPDATE_DEFINITIONS
+            
+        elif isinstance( update, HydrusNetwork.ContentUpdate ):
+            
+            mime = HC.APPLICATION_HYDRUS_UPDATE_CONTENT
+            
+        else:
+            
+            return ( 'not an update', repr( update ) )
+            
+        
+        return ( 'ok', ( update_network_string, mime ) )
+        
+    
     def CanDoIdleShutdownWork( self ):
         
         with self._lock:
@@ -1243,7 +1295,7 @@ class ServiceRepository( ServiceRestricted ):
                 
                 self.SyncDownloadMetadata()
                 
-                self.SyncDownloadUpdates( stop_time )
+                self.SyncDownloadUpdates( stop_time, only_process_when_idle = only_process_when_idle )
                 
                 self.SyncProcessUpdates( only_process_when_idle, stop_time )
                 
@@ -1267,7 +1319,7 @@ class ServiceRepository( ServiceRestricted ):
             
         
     
-    def SyncDownloadUpdates( self, stop_time ):
+    def SyncDownloadUpdates( self, stop_time, only_process_when_idle = False ):
         
         with self._lock:
             
@@ -1286,6 +1338,57 @@ class ServiceRepository( ServiceRestricted ):
             
             job_key = ClientThreading.JobKey( cancellable = True, stop_time = stop_time )
             
+            # several updates download, hash-check and parse at once on the thread pool while this thread imports them in order
+            # meanwhile, a processing thread works through whatever contiguous updates are in, so a big sync takes the longest of those jobs, not their sum
+            
+            condition = threading.Condition()
+            hashes_to_results = {}
+            num_downloading = [ 0 ]
+            
+            def do_download( update_hash ):
+                
+                result = self._SyncDownloadUpdate( update_hash )
+                
+                with condition:
+                    
+                    num_downloading[0] -= 1
+                    
+                    hashes_to_results[ update_hash ] = result
+                    
+                    condition.notify_all()
+                    
+                
+            
+            downloading_done = threading.Event()
+            processing_done = threading.Event()
+            new_updates_imported = threading.Event()
+            
+            def do_processing():
+                
+                try:
+                    
+                    while not downloading_done.is_set():
+                        
+                        new_updates_imported.wait( 5 )
+                        
+                        if new_updates_imported.is_set() and not downloading_done.is_set():
+                            
+                            new_updates_imported.clear()
+                            
+                            self.SyncProcessUpdates( only_process_when_idle, stop_time )
+                            
+                        
+                    
+                finally:
+                    
+                    processing_done.set()
+                    
+                
+            
+            HG.client_controller.CallToThreadWithPriority( HydrusThreading.THREAD_POOL_PRIORITY_MAINTENANCE, do_processing )
+            
+            next_index_to_download = 0
+            
             try:
                 
                 job_key.SetVariable( 'popup_title', name + ' sync: downloading updates' )
@@ -1300,48 +1403,68 @@ class ServiceRepository( ServiceRestricted ):
                     job_key.SetVariable( 'popup_text_1', status )
                     job_key.SetVariable( 'popup_gauge_1', ( i + 1, len( update_hashes ) ) )
                     
-                    with self._lock:
+                    with condition:
                         
-                        if not self._CanSyncDownload():
+                        while next_index_to_download < len( update_hashes ) and next_index_to_download < i + self.NUM_UPDATES_TO_DOWNLOAD_AT_ONCE:
                             
-                            return
+                            num_downloading[0] += 1
+                            
+                            HG.client_controller.CallToThreadWithPriority( HydrusThreading.THREAD_POOL_PRIORITY_NETWORK, do_download, update_hashes[ next_index_to_download ] )
+                            
+                            next_index_to_download += 1
                             
                         
                     
-                    ( i_paused, should_quit ) = job_key.WaitIfNeeded()
-                    
-                    if should_quit:
+                    while True:
                         
                         with self._lock:
                             
-                            self._DelayFutureRequests( 'download was recently cancelled', 3 * 60 )
+                            if not self._CanSyncDownload():
+                                
+                                return
+                                
                             
                         
-                        return
+                        ( i_paused, should_quit ) = job_key.WaitIfNeeded()
                         
-                    
-                    try:
+                        if should_quit:
+                            
+                            with self._lock:
+                                
+                                self._DelayFutureRequests( 'download was recently cancelled', 3 * 60 )
+                                
+                            
+                            return
+                            
                         
-                        update_network_string = self.Request( HC.GET, 'update', { 'update_hash' : update_hash } )
+                        with condition:
+                            
+                            if update_hash in hashes_to_results:
+                                
+                                ( result_type, result_data ) = hashes_to_results.pop( update_hash )
+                                
+                                break
+                                
+                            
+                            condition.wait( 1.0 )
+                            
                         
-                    except HydrusExceptions.CancelledException as e:
+                    
+                    if result_type == 'cancelled':
                         
-                        self._DelayFutureRequests( str( e ) )
+                        self._DelayFutureRequests( str( result_data ) )
                         
                         return
                         
-                    except HydrusExceptions.NetworkException as e:
+                    elif result_type == 'network error':
                         
                         HydrusData.Print( 'Attempting to download an update for ' + name + ' resulted in a network error:' )
                         
-                        HydrusData.Print( e )
+                        HydrusData.Print( result_data )
                         
                         return
                         
-                    
-                    update_network_string_hash = hashlib.sha256( update_network_string ).digest()
-                    
-                    if update_network_string_hash != update_hash:
+                    elif result_type == 'bad hash':
                         
                         # this is the weird update problem, seems to be network related
                         # throwing a whole hullabaloo about it only caused problems, as the real fix was 'unpause it, try again'
@@ -1353,12 +1476,7 @@ class ServiceRepository( ServiceRestricted ):
                         
                         return
                         
-                    
-                    try:
-                        
-                        update = HydrusSerialisable.CreateFromNetworkBytes( update_network_string )
-                        
-                    except Exception as e:
+                    elif result_type == 'unparseable':
                         
                         with self._lock:
                             
@@ -1373,20 +1491,11 @@ class ServiceRepository( ServiceRestricted ):
                         
                         HydrusData.ShowText( message )
                         
-                        HydrusData.ShowException( e )
+                        HydrusData.ShowException( result_data )
                         
                         return
                         
-                    
-                    if isinstance( update, HydrusNetwork.DefinitionsUpdate ):
-                        
-                        mime = HC.APPLICATION_HYDRUS_UPDATE_DEFINITIONS
-                        
-                    elif isinstance( update, HydrusNetwork.ContentUpdate ):
-                        
-                        mime = HC.APPLICATION_HYDRUS_UPDATE_CONTENT
-                        
-                    else:
+                    elif result_type == 'not an update':
                         
                         with self._lock:
                             
@@ -1395,7 +1504,7 @@ class ServiceRepository( ServiceRestricted ):
                             self._DealWithFundamentalNetworkError()
                             
                         
-                        message = 'Update ' + update_hash.hex() + ' downloaded from the ' + self._name + ' was not a valid update--it was a ' + repr( update ) + '! This is a serious error!'
+                        message = 'Update ' + update_hash.hex() + ' downloaded from the ' + self._name + ' was not a valid update--it was a ' + result_data + '! This is a serious error!'
                         message += os.linesep * 2
                         message += 'The repository has been paused for now. Please look into what could be wrong and report this to the hydrus dev.'
                         
@@ -1404,6 +1513,8 @@ class ServiceRepository( ServiceRestricted ):
                         return
                         
                     
+                    ( update_network_string, mime ) = result_data
+                    
                     try:
                         
                         HG.client_controller.WriteSynchronous( 'import_update', update_network_string, update_hash, mime )
@@ -1426,12 +1537,21 @@ class ServiceRepository( ServiceRestricted ):
                         return
                         
                     
+                    new_updates_imported.set()
+                    
                 
                 job_key.SetVariable( 'popup_text_1', 'finished' )
                 job_key.DeleteVariable( 'popup_gauge_1' )
                 
             finally:
                 
+                downloading_done.set()
+                new_updates_imported.set()
+                
+                # any in-flight downloads just finish into a dict nothing reads, but we should not start a second processing job under the one still running
+                
+                processing_done.wait()
+                
                 job_key.Finish()
                 job_key.Delete( 5 )
                 
@@ -1460,7 +1580,7 @@ class ServiceRepository( ServiceRestricted ):
             
             try:
                 
-                response = self.Request( HC.GET, 'metadata', { 'since' : next_update_index } )
+                response = self.Request( HC.GET, 'metadata', { 'since' : next_update_index, 'binary_updates' : 1 } )
                 
                 metadata_slice = response[ 'metadata_slice' ]
                 
@@ -1,3 +1,4 @@
+import array
 import collections
 from . import HydrusConstants as HC
 import itertools
@@ -11,6 +12,14 @@ import re
 from . import HydrusGlobals as HG
 from . import HydrusText
 
+# process-wide tag string table. media tags managers store these small ids rather than their own references to tag strings
+# ids are never reused, so the table only grows with the number of different tags seen this session
+
+TAG_INTERN_LOCK = threading.Lock()
+
+TAGS_TO_INTERNED_IDS = {}
+INTERNED_IDS_TO_TAGS = []
+
 def CensorshipMatch( tag, censorships ):
     
     for censorship in censorships:
@@ -169,6 +178,51 @@ def FilterNamespaces( tags, namespaces ):
     
     return result
     
+def GetInternedTag( tag_id ):
+    
+    return INTERNED_IDS_TO_TAGS[ tag_id ]
+    
+def GetInternedTagId( tag ):
+    
+    # for lookups, so a tag we have never seen does not get added to the table
+    
+    return TAGS_TO_INTERNED_IDS.get( tag, None )
+    
+def GetInternedTags( tag_ids ):
+    
+    ids_to_tags = INTERNED_IDS_TO_TAGS
+    
+    return { ids_to_tags[ tag_id ] for tag_id in tag_ids }
+    
+def InternTag( tag ):
+    
+    tag_id = TAGS_TO_INTERNED_IDS.get( tag, None )
+    
+    if tag_id is None:
+        
+        with TAG_INTERN_LOCK:
+            
+            if tag not in TAGS_TO_INTERNED_IDS:
+                
+                # append first, so a reader that gets the id from the dict can always look it up
+                
+                INTERNED_IDS_TO_TAGS.append( tag )
+                
+                TAGS_TO_INTERNED_IDS[ tag ] = len( INTERNED_IDS_TO_TAGS ) - 1
+                
+            
+            tag_id = TAGS_TO_INTERNED_IDS[ tag ]
+            
+        
+    
+    return tag_id
+    
+def InternTags( tags ):
+    
+    # a sorted array of ids is a tenth of the size of a set of strings, and bisect gives us membership
+    
+    return array.array( 'I', sorted( { InternTag( tag ) for tag in tags } ) )
+    
 def SortNumericTags( tags ):
     
     tags = list( tags )
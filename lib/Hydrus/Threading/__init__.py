@@ -15,6 +15,29 @@ NEXT_THREAD_CLEAROUT = 0
 THREADS_TO_THREAD_INFO = {}
 THREAD_INFO_LOCK = threading.Lock()
 
+THREAD_POOL_PRIORITY_UI = 0
+THREAD_POOL_PRIORITY_NETWORK = 1
+THREAD_POOL_PRIORITY_IMPORT = 2
+THREAD_POOL_PRIORITY_MAINTENANCE = 3
+
+thread_pool_priority_string_lookup = {}
+
+thread_pool_priority_string_lookup[ THREAD_POOL_PRIORITY_UI ] = 'ui'
+thread_pool_priority_string_lookup[ THREAD_POOL_PRIORITY_NETWORK ] = 'network'
+thread_pool_priority_string_lookup[ THREAD_POOL_PRIORITY_IMPORT ] = 'import'
+thread_pool_priority_string_lookup[ THREAD_POOL_PRIORITY_MAINTENANCE ] = 'maintenance'
+
+# priority : ( max workers, weight )
+# a priority never has more than its max workers going at once, so a flood of imports cannot eat the threads a gui read needs
+# when a free worker has a choice, a second of queueing counts weight times as much, so everything gets served eventually
+
+DEFAULT_THREAD_POOL_PRIORITIES = {}
+
+DEFAULT_THREAD_POOL_PRIORITIES[ THREAD_POOL_PRIORITY_UI ] = ( 32, 8 )
+DEFAULT_THREAD_POOL_PRIORITIES[ THREAD_POOL_PRIORITY_NETWORK ] = ( 32, 4 )
+DEFAULT_THREAD_POOL_PRIORITIES[ THREAD_POOL_PRIORITY_IMPORT ] = ( 16, 2 )
+DEFAULT_THREAD_POOL_PRIORITIES[ THREAD_POOL_PRIORITY_MAINTENANCE ] = ( 8, 1 )
+
 def CheckIfThreadShuttingDown():
     
     if IsThreadShuttingDown():
@@ -369,6 +392,380 @@ class THREADCallToThread( DAEMON ):
             
         
     
+class THREADPoolWorker( DAEMON ):
+    
+    def __init__( self, controller, thread_pool, name, overflow_job = None ):
+        
+        DAEMON.__init__( self, controller, name )
+        
+        self._thread_pool = thread_pool
+        self._overflow_job = overflow_job
+        self._is_overflow_worker = overflow_job is not None
+        
+        self._callable = None
+        
+    
+    def _DoJob( self, callable, args, kwargs ):
+        
+        self._DoPreCall()
+        
+        # the pool can have us do a job inline while we are in the middle of another
+        previous_callable = self._callable
+        
+        try:
+            
+            self._callable = ( callable, args, kwargs )
+            
+            callable( *args, **kwargs )
+            
+        except HydrusExceptions.ShutdownException:
+            
+            raise
+            
+        except Exception as e:
+            
+            HydrusData.Print( traceback.format_exc() )
+            
+            HydrusData.ShowException( e )
+            
+        finally:
+            
+            self._callable = previous_callable
+            
+        
+    
+    def CurrentlyWorking( self ):
+        
+        return self._callable is not None
+        
+    
+    def DoJobInline( self, callable, args, kwargs ):
+        
+        self._DoJob( callable, args, kwargs )
+        
+    
+    def GetCurrentJobSummary( self ):
+        
+        return self._callable
+        
+    
+    def IsOverflowWorker( self ):
+        
+        return self._is_overflow_worker
+        
+    
+    def run( self ):
+        
+        try:
+            
+            if self._overflow_job is not None:
+                
+                # a pool job is waiting on this one and its priority is full up, so we run outside the limits and then go away
+                
+                ( priority, callable, args, kwargs ) = self._overflow_job
+                
+                self._overflow_job = None
+                
+                self._DoJob( callable, args, kwargs )
+                
+                return
+                
+            
+            while True:
+                
+                job = self._thread_pool.GetNextJob()
+                
+                if job is None:
+                    
+                    return
+                    
+                
+                ( priority, callable, args, kwargs ) = job
+                
+                try:
+                    
+                    self._DoJob( callable, args, kwargs )
+                    
+                finally:
+                    
+                    self._thread_pool.JobDone( priority )
+                    
+                
+                del callable
+                del job
+                
+            
+        except HydrusExceptions.ShutdownException:
+            
+            return
+            
+        finally:
+            
+            self._thread_pool.WorkerExiting( self )
+            
+        
+    
+class ThreadPool( object ):
+    
+    def __init__( self, controller, name, priorities = None ):
+        
+        if priorities is None:
+            
+            priorities = DEFAULT_THREAD_POOL_PRIORITIES
+            
+        
+        self._controller = controller
+        self._name = name
+        
+        self._priorities_to_max_workers = { priority : max_workers for ( priority, ( max_workers, weight ) ) in priorities.items() }
+        self._priorities_to_weights = { priority : weight for ( priority, ( max_workers, weight ) ) in priorities.items() }
+        
+        self._max_workers = sum( self._priorities_to_max_workers.values() )
+        
+        self._lock = threading.Lock()
+        self._condition = threading.Condition( self._lock )
+        
+        self._priorities_to_queues = { priority : collections.deque() for priority in priorities }
+        
+        self._priorities_to_num_working = collections.Counter()
+        
+        self._workers = []
+        self._num_idle_workers = 0
+        self._num_overflow_workers = 0
+        self._max_overflow_workers = 8
+        
+        self._priorities_to_num_jobs_started = collections.Counter()
+        self._priorities_to_total_wait_time = collections.Counter()
+        self._priorities_to_max_wait_time = collections.Counter()
+        
+        self._worker_idle_timeout = 60
+        
+    
+    def _GetNumStartableJobs( self ):
+        
+        num_startable = 0
+        
+        for ( priority, job_queue ) in self._priorities_to_queues.items():
+            
+            num_startable += min( len( job_queue ), self._priorities_to_max_workers[ priority ] - self._priorities_to_num_working[ priority ] )
+            
+        
+        return num_startable
+        
+    
+    def _PopNextJob( self ):
+        
+        now = HydrusData.GetNowPrecise()
+        
+        best_score = None
+        best_priority = None
+        
+        for ( priority, job_queue ) in self._priorities_to_queues.items():
+            
+            if len( job_queue ) == 0 or self._priorities_to_num_working[ priority ] >= self._priorities_to_max_workers[ priority ]:
+                
+                continue
+                
+            
+            ( callable, args, kwargs, time_queued ) = job_queue[0]
+            
+            score = ( 1.0 + now - time_queued ) * self._priorities_to_weights[ priority ]
+            
+            if best_score is None or score > best_score:
+                
+                best_score = score
+                best_priority = priority
+                
+            
+        
+        if best_priority is None:
+            
+            return None
+            
+        
+        ( callable, args, kwargs, time_queued ) = self._priorities_to_queues[ best_priority ].popleft()
+        
+        self._ReportJobStarted( best_priority, now - time_queued )
+        
+        self._priorities_to_num_working[ best_priority ] += 1
+        
+        return ( best_priority, callable, args, kwargs )
+        
+    
+    def _ReportJobStarted( self, priority, wait_time ):
+        
+        self._priorities_to_num_jobs_started[ priority ] += 1
+        self._priorities_to_total_wait_time[ priority ] += wait_time
+        self._priorities_to_max_wait_time[ priority ] = max( self._priorities_to_max_wait_time[ priority ], wait_time )
+        
+    
+    def GetNextJob( self ):
+        
+        with self._lock:
+            
+            idle_since = HydrusData.GetNow()
+            
+            while True:
+                
+                job = self._PopNextJob()
+                
+                if job is not None:
+                    
+                    return job
+                    
+                
+                if HydrusData.TimeHasPassed( idle_since + self._worker_idle_timeout ):
+                    
+                    return None
+                    
+                
+                self._num_idle_workers += 1
+                
+                try:
+                    
+                    self._condition.wait( 1.0 )
+                    
+                finally:
+                    
+                    self._num_idle_workers -= 1
+                    
+                
+                CheckIfThreadShuttingDown()
+                
+            
+        
+    
+    def GetNumWorking( self ):
+        
+        with self._lock:
+            
+            return sum( self._priorities_to_num_working.values() )
+            
+        
+    
+    def GetPrettyJobSummary( self ):
+        
+        with self._lock:
+            
+            lines = [ self._name + ': ' + HydrusData.ToHumanInt( len( self._workers ) ) + ' threads' ]
+            
+            for ( priority, job_queue ) in sorted( self._priorities_to_queues.items() ):
+                
+                num_jobs_started = self._priorities_to_num_jobs_started[ priority ]
+                
+                if num_jobs_started == 0:
+                    
+                    average_wait_time = 0.0
+                    
+                else:
+                    
+                    average_wait_time = self._priorities_to_total_wait_time[ priority ] / num_jobs_started
+                    
+                
+                line = '{}: {}/{} working, {} queued, {} jobs started, average wait {}, max wait {}'.format( thread_pool_priority_string_lookup[ priority ], HydrusData.ToHumanInt( self._priorities_to_num_working[ priority ] ), HydrusData.ToHumanInt( self._priorities_to_max_workers[ priority ] ), HydrusData.ToHumanInt( len( job_queue ) ), HydrusData.ToHumanInt( num_jobs_started ), HydrusData.TimeDeltaToPrettyTimeDelta( average_wait_time ), HydrusData.TimeDeltaToPrettyTimeDelta( self._priorities_to_max_wait_time[ priority ] ) )
+                
+                lines.append( line )
+                
+            
+            return os.linesep.join( lines )
+            
+        
+    
+    def GetQueueDepths( self ):
+        
+        with self._lock:
+            
+            return { priority : len( job_queue ) for ( priority, job_queue ) in self._priorities_to_queues.items() }
+            
+        
+    
+    def GetWorkers( self ):
+        
+        with self._lock:
+            
+            return list( self._workers )
+            
+        
+    
+    def JobDone( self, priority ):
+        
+        with self._lock:
+            
+            self._priorities_to_num_working[ priority ] -= 1
+            
+        
+    
+    def Put( self, priority, callable, *args, **kwargs ):
+        
+        calling_thread = threading.current_thread()
+        
+        with self._lock:
+            
+            calling_from_the_thread_pool = calling_thread in self._workers
+            
+            if calling_from_the_thread_pool and self._priorities_to_num_working[ priority ] >= self._priorities_to_max_workers[ priority ]:
+                
+                # the caller may be waiting on this job, so queueing it behind the caller's own priority could deadlock
+                
+                self._ReportJobStarted( priority, 0.0 )
+                
+                if self._num_overflow_workers < self._max_overflow_workers:
+                    
+                    worker = THREADPoolWorker( self._controller, self, self._name, overflow_job = ( priority, callable, args, kwargs ) )
+                    
+                    self._workers.append( worker )
+                    
+                    self._num_overflow_workers += 1
+                    
+                    worker.start()
+                    
+                    return
+                    
+                
+                # there are already plenty of overflow threads, so the caller will do the job itself once we are out of the lock
+                
+            else:
+                
+                job_queue = self._priorities_to_queues[ priority ]
+                
+                job_queue.append( ( callable, args, kwargs, HydrusData.GetNowPrecise() ) )
+                
+                if self._GetNumStartableJobs() > self._num_idle_workers and len( self._workers ) < self._max_workers:
+                    
+                    worker = THREADPoolWorker( self._controller, self, self._name )
+                    
+                    self._workers.append( worker )
+                    
+                    worker.start()
+                    
+                else:
+                    
+                    self._condition.notify()
+                    
+                
+                return
+                
+            
+        
+        calling_thread.DoJobInline( callable, args, kwargs )
+        
+    
+    def WorkerExiting( self, worker ):
+        
+        with self._lock:
+            
+            if worker in self._workers:
+                
+                self._workers.remove( worker )
+                
+                if worker.IsOverflowWorker():
+                    
+                    self._num_overflow_workers -= 1
+                    
+                
+            
+        
+    
 class JobScheduler( threading.Thread ):
     
     def __init__( self, controller ):
@@ -630,6 +1027,7 @@ class SchedulableJob( object ):
         self._next_work_time = HydrusData.GetNowFloat() + initial_delay
         
         self._thread_slot_type = None
+        self._thread_pool_priority = THREAD_POOL_PRIORITY_UI
         
         self._work_lock = threading.Lock()
         
@@ -649,7 +1047,7 @@ class SchedulableJob( object ):
     
     def _BootWorker( self ):
         
-        self._controller.CallToThread( self.Work )
+        self._controller.CallToThreadWithPriority( self._thread_pool_priority, self.Work )
         
     
     def Cancel( self ):
@@ -689,6 +1087,11 @@ class SchedulableJob( object ):
         self.Wake()
         
     
+    def SetThreadPoolPriority( self, priority ):
+        
+        self._thread_pool_priority = priority
+        
+    
     def SetThreadSlotType( self, thread_type ):
         
         self._thread_slot_type = thread_type
@@ -5,6 +5,7 @@ from . import ClientNetworkingDomain
 from . import HydrusConstants as HC
 from . import HydrusData
 from . import HydrusExceptions
+from . import HydrusFileHandling
 from . import HydrusGlobals as HG
 from . import HydrusNetworking
 from . import HydrusThreading
@@ -116,6 +117,7 @@ class NetworkJob( object ):
         self._body = body
         self._referral_url = referral_url
         self._temp_path = temp_path
+        self._temp_path_hashes = None
         
         self._files = None
         self._for_login = False
@@ -707,6 +709,14 @@ class NetworkJob( object ):
             
         
     
+    def GetTempPathHashes( self ):
+        
+        with self._lock:
+            
+            return self._temp_path_hashes
+            
+        
+    
     def GetTotalDataUsed( self ):
         
         with self._lock:
@@ -945,7 +955,18 @@ class NetworkJob( object ):
                             
                             with open( self._temp_path, 'wb' ) as f:
                                 
-                                self._ReadResponse( response, f )
+                                # hash as we write, so the import does not have to read the whole file back again
+                                hashing_stream = HydrusFileHandling.FileHashingStream( f )
+                                
+                                self._ReadResponse( response, hashing_stream )
+                                
+                            
+                            if not self._IsCancelled():
+                                
+                                with self._lock:
+                                    
+                                    self._temp_path_hashes = hashing_stream.GetHashes()
+                                    
                                 
                             
                         
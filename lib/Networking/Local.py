@@ -8,6 +8,7 @@ from . import HydrusNetwork
 from . import HydrusNetworking
 from . import HydrusPaths
 from . import HydrusSerialisable
+from . import HydrusThreading
 import itertools
 import os
 import random
@@ -164,7 +165,7 @@ class NetworkEngine( object ):
                         
                         validation_process = job.GenerateValidationPopupProcess()
                         
-                        self.controller.CallToThread( validation_process.Start )
+                        self.controller.CallToThreadWithPriority( HydrusThreading.THREAD_POOL_PRIORITY_NETWORK, validation_process.Start )
                         
                         self._current_validation_process = validation_process
                         
@@ -246,7 +247,7 @@ class NetworkEngine( object ):
                     return
                     
                 
-                self.controller.CallToThread( login_process.Start )
+                self.controller.CallToThreadWithPriority( HydrusThreading.THREAD_POOL_PRIORITY_NETWORK, login_process.Start )
                 
                 self._current_login_process = login_process
                 
@@ -312,7 +313,7 @@ class NetworkEngine( object ):
                         return True
                         
                     
-                    self.controller.CallToThread( login_process.Start )
+                    self.controller.CallToThreadWithPriority( HydrusThreading.THREAD_POOL_PRIORITY_NETWORK, login_process.Start )
                     
                     self._current_login_process = login_process
                     
@@ -395,7 +396,7 @@ class NetworkEngine( object ):
                     
                     self._active_domains_counter[ job.GetSecondLevelDomain() ] += 1
                     
-                    self.controller.CallToThread( job.Start )
+                    self.controller.CallToThreadWithPriority( HydrusThreading.THREAD_POOL_PRIORITY_NETWORK, job.Start )
                     
                     self._jobs_running.append( job )
                     
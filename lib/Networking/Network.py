@@ -5,10 +5,12 @@ from . import HydrusExceptions
 from . import HydrusGlobals as HG
 from . import HydrusNetworking
 from . import HydrusSerialisable
+import json
+import struct
 import threading
 import urllib
 
-INT_PARAMS = { 'expires', 'num', 'since', 'content_type', 'action', 'status' }
+INT_PARAMS = { 'expires', 'num', 'since', 'content_type', 'action', 'status', 'binary_updates' }
 BYTE_PARAMS = { 'access_key', 'account_type_key', 'subject_account_key', 'hash', 'registration_key', 'subject_hash', 'update_hash' }
 STRING_PARAMS = { 'subject_tag' }
 JSON_PARAMS = set()
@@ -38,6 +40,7 @@ def GenerateDefaultServiceDictionary( service_type ):
             metadata.AppendUpdate( update_hashes, begin, end, next_update_due )
             
             dictionary[ 'metadata' ] = metadata
+            dictionary[ 'binary_update_hashes' ] = HydrusSerialisable.SerialisableBytesDictionary()
             
             if service_type == HC.FILE_REPOSITORY:
                 
@@ -118,6 +121,15 @@ def GetPossiblePermissions( service_type ):
     
     return permissions
     
+def ConvertBinaryUpdateToNetworkBytes( binary_update_network_bytes ):
+    
+    # the server stores updates in the binary format and converts them for clients that cannot read it
+    # the conversion is deterministic, so the hash it has when the update is created is the hash it has when it is served
+    
+    update = HydrusSerialisable.CreateFromNetworkBytes( binary_update_network_bytes )
+    
+    return update.DumpToNetworkBytes()
+    
 def DumpHydrusArgsToNetworkBytes( args ):
     
     if not isinstance( args, HydrusSerialisable.SerialisableBase ):
@@ -1208,6 +1220,35 @@ class ContentUpdate( HydrusSerialisable.SerialisableBase ):
         self._content_data = {}
         
     
+    def _GetBinarySerialisableInfo( self ):
+        
+        blocks = []
+        
+        for ( content_type, actions_to_datas ) in self._content_data.items():
+            
+            for ( action, data ) in actions_to_datas.items():
+                
+                block = struct.pack( '<HH', content_type, action )
+                
+                if content_type == HC.CONTENT_TYPE_MAPPINGS:
+                    
+                    # the bulk of any big update, so ( tag_id, hash_ids ) rows get packed id arrays
+                    
+                    block += HydrusSerialisable.PackIntegers( [ tag_id for ( tag_id, hash_ids ) in data ] )
+                    block += HydrusSerialisable.PackSortedIntegerLists( [ hash_ids for ( tag_id, hash_ids ) in data ] )
+                    
+                else:
+                    
+                    block += HydrusSerialisable.PackBytesList( [ bytes( json.dumps( data ), 'utf-8' ) ] )
+                    
+                
+                blocks.append( block )
+                
+            
+        
+        return struct.pack( '<I', len( blocks ) ) + b''.join( blocks )
+        
+    
     def _GetContent( self, content_type, action ):
         
         if content_type in self._content_data:
@@ -1235,6 +1276,41 @@ class ContentUpdate( HydrusSerialisable.SerialisableBase ):
         return serialisable_info
         
     
+    def _InitialiseFromBinarySerialisableInfo( self, binary_info ):
+        
+        ( num_blocks, ) = struct.unpack_from( '<I', binary_info, 0 )
+        
+        offset = struct.calcsize( '<I' )
+        
+        for i in range( num_blocks ):
+            
+            ( content_type, action ) = struct.unpack_from( '<HH', binary_info, offset )
+            
+            offset += struct.calcsize( '<HH' )
+            
+            if content_type == HC.CONTENT_TYPE_MAPPINGS:
+                
+                ( tag_ids, offset ) = HydrusSerialisable.UnpackIntegers( binary_info, offset )
+                ( hash_id_lists, offset ) = HydrusSerialisable.UnpackSortedIntegerLists( binary_info, offset )
+                
+                data = list( zip( tag_ids, hash_id_lists ) )
+                
+            else:
+                
+                ( ( data_bytes, ), offset ) = HydrusSerialisable.UnpackBytesList( binary_info, offset )
+                
+                data = json.loads( str( data_bytes, 'utf-8' ) )
+                
+            
+            if content_type not in self._content_data:
+                
+                self._content_data[ content_type ] = {}
+                
+            
+            self._content_data[ content_type ][ action ] = data
+            
+        
+    
     def _InitialiseFromSerialisableInfo( self, serialisable_info ):
         
         for ( content_type, serialisable_actions_to_datas ) in serialisable_info:
@@ -1520,6 +1596,19 @@ class DefinitionsUpdate( HydrusSerialisable.SerialisableBase ):
         self._tag_ids_to_tags = {}
         
     
+    def _GetBinarySerialisableInfo( self ):
+        
+        hash_items = sorted( self._hash_ids_to_hashes.items() )
+        tag_items = sorted( self._tag_ids_to_tags.items() )
+        
+        binary_info = HydrusSerialisable.PackSortedIntegers( [ hash_id for ( hash_id, hash ) in hash_items ] )
+        binary_info += HydrusSerialisable.PackBytesList( [ hash for ( hash_id, hash ) in hash_items ] )
+        binary_info += HydrusSerialisable.PackSortedIntegers( [ tag_id for ( tag_id, tag ) in tag_items ] )
+        binary_info += HydrusSerialisable.PackBytesList( [ tag.encode( 'utf-8', 'surrogatepass' ) for ( tag_id, tag ) in tag_items ] )
+        
+        return binary_info
+        
+    
     def _GetSerialisableInfo( self ):
         
         serialisable_info = []
@@ -1537,6 +1626,19 @@ class DefinitionsUpdate( HydrusSerialisable.SerialisableBase ):
         return serialisable_info
         
     
+    def _InitialiseFromBinarySerialisableInfo( self, binary_info ):
+        
+        offset = 0
+        
+        ( hash_ids, offset ) = HydrusSerialisable.UnpackSortedIntegers( binary_info, offset )
+        ( hashes, offset ) = HydrusSerialisable.UnpackBytesList( binary_info, offset )
+        ( tag_ids, offset ) = HydrusSerialisable.UnpackSortedIntegers( binary_info, offset )
+        ( encoded_tags, offset ) = HydrusSerialisable.UnpackBytesList( binary_info, offset )
+        
+        self._hash_ids_to_hashes = dict( zip( hash_ids, hashes ) )
+        self._tag_ids_to_tags = { tag_id : str( encoded_tag, 'utf-8', 'surrogatepass' ) for ( tag_id, encoded_tag ) in zip( tag_ids, encoded_tags ) }
+        
+    
     def _InitialiseFromSerialisableInfo( self, serialisable_info ):
         
         for ( definition_type, definitions ) in serialisable_info:
@@ -1737,12 +1839,17 @@ class Metadata( HydrusSerialisable.SerialisableBase ):
             
         
     
-    def GetSlice( self, from_update_index ):
+    def GetSlice( self, from_update_index, update_hashes_to_replacements = None ):
         
         with self._lock:
             
             metadata = { update_index : row for ( update_index, row ) in list(self._metadata.items()) if update_index >= from_update_index }
             
+            if update_hashes_to_replacements is not None:
+                
+                metadata = { update_index : ( [ update_hashes_to_replacements.get( update_hash, update_hash ) for update_hash in update_hashes ], begin, end ) for ( update_index, ( update_hashes, begin, end ) ) in list( metadata.items() ) }
+                
+            
             return Metadata( metadata, self._next_update_due )
             
         
@@ -2213,6 +2320,7 @@ class ServerServiceRepository( ServerServiceRestricted ):
         dictionary = ServerServiceRestricted._GetSerialisableDictionary( self )
         
         dictionary[ 'metadata' ] = self._metadata
+        dictionary[ 'binary_update_hashes' ] = HydrusSerialisable.SerialisableBytesDictionary( self._update_hashes_to_binary_update_hashes )
         
         return dictionary
         
@@ -2223,12 +2331,40 @@ class ServerServiceRepository( ServerServiceRestricted ):
         
         self._metadata = dictionary[ 'metadata' ]
         
+        # metadata lists the hashes of the json updates older clients read. the server stores binary versions of updates made since, under these hashes
+        
+        if 'binary_update_hashes' in dictionary:
+            
+            self._update_hashes_to_binary_update_hashes = dict( dictionary[ 'binary_update_hashes' ] )
+            
+        else:
+            
+            self._update_hashes_to_binary_update_hashes = {}
+            
+        
+        self._binary_update_hashes = set( self._update_hashes_to_binary_update_hashes.values() )
+        
+    
+    def GetBinaryUpdateHash( self, update_hash ):
+        
+        with self._lock:
+            
+            return self._update_hashes_to_binary_update_hashes.get( update_hash, None )
+            
+        
     
-    def GetMetadataSlice( self, from_update_index ):
+    def GetMetadataSlice( self, from_update_index, binary_updates = False ):
         
         with self._lock:
             
-            return self._metadata.GetSlice( from_update_index )
+            if binary_updates:
+                
+                return self._metadata.GetSlice( from_update_index, update_hashes_to_replacements = self._update_hashes_to_binary_update_hashes )
+                
+            else:
+                
+                return self._metadata.GetSlice( from_update_index )
+                
             
         
     
@@ -2236,7 +2372,7 @@ class ServerServiceRepository( ServerServiceRestricted ):
         
         with self._lock:
             
-            return self._metadata.HasUpdateHash( update_hash )
+            return self._metadata.HasUpdateHash( update_hash ) or update_hash in self._binary_update_hashes
             
         
     
@@ -2262,7 +2398,7 @@ class ServerServiceRepository( ServerServiceRestricted ):
                 
                 end = begin + HC.UPDATE_DURATION
                 
-                update_hashes = HG.server_controller.WriteSynchronous( 'create_update', service_key, begin, end )
+                ( update_hashes, binary_update_hashes ) = HG.server_controller.WriteSynchronous( 'create_update', service_key, begin, end )
                 
                 next_update_due = end + HC.UPDATE_DURATION + 1
                 
@@ -2270,6 +2406,9 @@ class ServerServiceRepository( ServerServiceRestricted ):
                     
                     self._metadata.AppendUpdate( update_hashes, begin, end, next_update_due )
                     
+                    self._update_hashes_to_binary_update_hashes.update( list( zip( update_hashes, binary_update_hashes ) ) )
+                    self._binary_update_hashes.update( binary_update_hashes )
+                    
                     update_due = self._metadata.UpdateDue()
                     
                 
@@ -1073,6 +1073,48 @@ class TestClientAPI( unittest.TestCase ):
         
         self.assertEqual( d, expected_answer )
         
+        # search files paged
+        
+        HG.test_controller.SetRead( 'file_query_ids_page', ( [ 1, 2, 3 ], 3 ) )
+        
+        path = '/get_files/search_files?tags={}&num_file_ids=3'.format( urllib.parse.quote( json.dumps( tags ) ) )
+        
+        connection.request( 'GET', path, headers = headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 200 )
+        
+        text = str( data, 'utf-8' )
+        
+        d = json.loads( text )
+        
+        expected_answer = { 'file_ids' : [ 1, 2, 3 ], 'next_file_id_cursor' : 3 }
+        
+        self.assertEqual( d, expected_answer )
+        
+        HG.test_controller.SetRead( 'file_query_ids_page', ( [ 4, 5, 10 ], None ) )
+        
+        path = '/get_files/search_files?tags={}&num_file_ids=3&file_id_cursor=3'.format( urllib.parse.quote( json.dumps( tags ) ) )
+        
+        connection.request( 'GET', path, headers = headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 200 )
+        
+        text = str( data, 'utf-8' )
+        
+        d = json.loads( text )
+        
+        expected_answer = { 'file_ids' : [ 4, 5, 10 ], 'next_file_id_cursor' : None }
+        
+        self.assertEqual( d, expected_answer )
+        
         # some file search param parsing
         
         class PretendRequest( object ):
@@ -1508,6 +1550,99 @@ class TestClientAPI( unittest.TestCase ):
         
         self.assertEqual( hashlib.sha256( data ).digest(), hash )
         
+        file_data = data
+        etag = response.getheader( 'ETag' )
+        last_modified = response.getheader( 'Last-Modified' )
+        
+        self.assertEqual( response.getheader( 'Accept-Ranges' ), 'bytes' )
+        self.assertIn( hash_hex, etag )
+        
+        # range
+        
+        range_headers = dict( headers )
+        
+        range_headers[ 'Range' ] = 'bytes=10-19'
+        
+        connection.request( 'GET', path, headers = range_headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 206 )
+        
+        self.assertEqual( data, file_data[ 10 : 20 ] )
+        self.assertEqual( response.getheader( 'Content-Range' ), 'bytes 10-19/{}'.format( len( file_data ) ) )
+        
+        # multipart range
+        
+        range_headers[ 'Range' ] = 'bytes=0-4,20-24'
+        
+        connection.request( 'GET', path, headers = range_headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 206 )
+        
+        self.assertTrue( response.getheader( 'Content-Type' ).startswith( 'multipart/byteranges' ) )
+        self.assertIn( file_data[ 0 : 5 ], data )
+        self.assertIn( file_data[ 20 : 25 ], data )
+        
+        # not modified
+        
+        cache_headers = dict( headers )
+        
+        cache_headers[ 'If-None-Match' ] = etag
+        
+        connection.request( 'GET', path, headers = cache_headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 304 )
+        
+        self.assertEqual( data, b'' )
+        
+        cache_headers = dict( headers )
+        
+        cache_headers[ 'If-Modified-Since' ] = last_modified
+        
+        connection.request( 'GET', path, headers = cache_headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 304 )
+        
+        cache_headers[ 'If-None-Match' ] = '"some other file"'
+        
+        connection.request( 'GET', path, headers = cache_headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 200 )
+        
+        self.assertEqual( data, file_data )
+        
+        # head
+        
+        connection.request( 'HEAD', path, headers = headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 200 )
+        
+        self.assertEqual( data, b'' )
+        self.assertEqual( response.getheader( 'Content-Length' ), str( len( file_data ) ) )
+        
         #
         
         path = '/get_files/thumbnail?hash={}'.format( hash_hex )
@@ -0,0 +1,191 @@
+from . import ClientCaches
+from . import HydrusConstants as HC
+from . import HydrusExceptions
+from . import HydrusGlobals as HG
+import os
+import shutil
+import unittest
+
+class FakeData( object ):
+    
+    def __init__( self, size ):
+        
+        self._size = size
+        
+    
+    def GetEstimatedMemoryFootprint( self ):
+        
+        return self._size
+        
+    
+
+class FakeMedia( object ):
+    
+    def __init__( self ):
+        
+        self._hash = os.urandom( 32 )
+        
+    
+    def GetDuration( self ): return None
+    def GetHash( self ): return self._hash
+    def GetMime( self ): return HC.IMAGE_PNG
+    def GetNumFrames( self ): return None
+    def GetResolution( self ): return ( 200, 200 )
+    
+class TestClientFilesManager( unittest.TestCase ):
+    
+    def test_thumbnail_batch( self ):
+        
+        client_files_manager = HG.test_controller.client_files_manager
+        
+        ( good_media_1, missing_media, broken_media, good_media_2 ) = medias = [ FakeMedia() for i in range( 4 ) ]
+        
+        for media in ( good_media_1, good_media_2 ):
+            
+            path = client_files_manager.GetFilePath( media.GetHash(), media.GetMime(), check_file_exists = False )
+            
+            shutil.copy2( os.path.join( HC.STATIC_DIR, 'hydrus.png' ), path )
+            
+        
+        path = client_files_manager.GetFilePath( broken_media.GetHash(), broken_media.GetMime(), check_file_exists = False )
+        
+        with open( path, 'wb' ) as f:
+            
+            f.write( b'this is not a png' )
+            
+        
+        # a missing file and a broken one in the middle of the batch should not stop the files either side of them
+        
+        ( successes, failures ) = client_files_manager._GenerateThumbnailBytesBatch( medias )
+        
+        self.assertEqual( { media for ( media, thumbnail_bytes ) in successes }, { good_media_1, good_media_2 } )
+        
+        for ( media, thumbnail_bytes ) in successes:
+            
+            self.assertGreater( len( thumbnail_bytes ), 0 )
+            
+        
+        self.assertEqual( { media for ( media, e ) in failures }, { missing_media, broken_media } )
+        
+        for ( media, e ) in failures:
+            
+            self.assertIsInstance( e, HydrusExceptions.FileMissingException )
+            
+        
+        # the missing file is caught before it is ever sent to a worker, so it comes first
+        
+        self.assertIs( failures[0][0], missing_media )
+        
+    
+class TestDataCache( unittest.TestCase ):
+    
+    def _GetCache( self, segmented = True ):
+        
+        return ClientCaches.DataCache( HG.test_controller, 100, segmented = segmented )
+        
+    
+    def test_eviction_order( self ):
+        
+        data_cache = self._GetCache( segmented = False )
+        
+        for i in range( 5 ):
+            
+            data_cache.AddData( i, FakeData( 20 ) )
+            
+        
+        data_cache.GetData( 0 )
+        
+        data_cache.AddData( 5, FakeData( 20 ) )
+        
+        self.assertTrue( data_cache.HasData( 0 ) )
+        self.assertFalse( data_cache.HasData( 1 ) )
+        
+        data_cache.AddData( 6, FakeData( 40 ) )
+        
+        self.assertTrue( data_cache.HasData( 0 ) )
+        self.assertFalse( data_cache.HasData( 2 ) )
+        self.assertFalse( data_cache.HasData( 3 ) )
+        self.assertTrue( data_cache.HasData( 4 ) )
+        
+        ( num_hits, num_misses, num_evictions, num_rejections ) = data_cache.GetStats()
+        
+        self.assertEqual( num_evictions, 3 )
+        
+        data_cache.AddData( 7, FakeData( 101 ) )
+        
+        self.assertFalse( data_cache.HasData( 7 ) )
+        self.assertEqual( data_cache.GetStats()[3], 1 )
+        
+    
+    def test_large_item_spares_protected( self ):
+        
+        data_cache = self._GetCache()
+        
+        for i in range( 4 ):
+            
+            data_cache.AddData( i, FakeData( 20 ) )
+            
+            data_cache.GetData( i )
+            
+        
+        # 80 bytes protected, so probationary only has 20 to offer
+        
+        data_cache.AddData( 'big', FakeData( 60 ) )
+        
+        self.assertFalse( data_cache.HasData( 'big' ) )
+        
+        for i in range( 4 ):
+            
+            self.assertTrue( data_cache.HasData( i ) )
+            
+        
+        self.assertEqual( data_cache.GetStats()[2:], ( 0, 1 ) )
+        
+        # a new item that fits in probationary pushes out the probationary lru, never protected
+        
+        data_cache.AddData( 'a', FakeData( 20 ) )
+        data_cache.AddData( 'b', FakeData( 20 ) )
+        
+        self.assertFalse( data_cache.HasData( 'a' ) )
+        self.assertTrue( data_cache.HasData( 'b' ) )
+        
+        for i in range( 4 ):
+            
+            self.assertTrue( data_cache.HasData( i ) )
+            
+        
+    
+    def test_promotion_and_demotion( self ):
+        
+        data_cache = self._GetCache()
+        
+        data_cache.AddData( 'a', FakeData( 30 ) )
+        data_cache.AddData( 'b', FakeData( 30 ) )
+        data_cache.AddData( 'c', FakeData( 30 ) )
+        
+        # a second hit promotes a and b
+        
+        data_cache.GetData( 'a' )
+        data_cache.GetData( 'b' )
+        
+        # c was only seen once, so it goes before the older but protected a
+        
+        data_cache.AddData( 'd', FakeData( 30 ) )
+        
+        self.assertTrue( data_cache.HasData( 'a' ) )
+        self.assertTrue( data_cache.HasData( 'b' ) )
+        self.assertFalse( data_cache.HasData( 'c' ) )
+        self.assertTrue( data_cache.HasData( 'd' ) )
+        
+        # promoting d puts protected over 80 bytes, so the protected lru, a, is demoted back to probationary
+        
+        data_cache.GetData( 'd' )
+        
+        data_cache.AddData( 'e', FakeData( 30 ) )
+        
+        self.assertFalse( data_cache.HasData( 'a' ) )
+        self.assertTrue( data_cache.HasData( 'b' ) )
+        self.assertTrue( data_cache.HasData( 'd' ) )
+        self.assertTrue( data_cache.HasData( 'e' ) )
+        
+    
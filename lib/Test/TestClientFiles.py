@@ -0,0 +1,326 @@
+from . import ClientFiles
+from . import HydrusConstants as HC
+from . import HydrusData
+from . import HydrusPaths
+import hashlib
+import os
+import shutil
+import sqlite3
+import unittest
+
+COMBINED_LOCAL_FILE_SERVICE_ID = 3
+
+class TestBackupClientFiles( unittest.TestCase ):
+    
+    def setUp( self ):
+        
+        self._test_dir = HydrusPaths.GetTempDir()
+        
+        self._client_files_dir = os.path.join( self._test_dir, 'client_files' )
+        self._dest_dir = os.path.join( self._test_dir, 'backup' )
+        self._dest_client_files_dir = os.path.join( self._dest_dir, 'client_files' )
+        
+        for prefix in HydrusData.IterateHexPrefixes():
+            
+            HydrusPaths.MakeSureDirectoryExists( os.path.join( self._client_files_dir, 'f' + prefix ) )
+            HydrusPaths.MakeSureDirectoryExists( os.path.join( self._client_files_dir, 't' + prefix ) )
+            
+        
+        # just the parts of the client schema the backup reads
+        
+        self._snapshot_db = sqlite3.connect( ':memory:', isolation_level = None )
+        
+        self._snapshot_db.execute( 'CREATE TABLE hashes ( hash_id INTEGER PRIMARY KEY, hash BLOB_BYTES UNIQUE );' )
+        self._snapshot_db.execute( 'CREATE TABLE current_files ( service_id INTEGER, hash_id INTEGER, timestamp INTEGER, PRIMARY KEY ( service_id, hash_id ) );' )
+        self._snapshot_db.execute( 'CREATE TABLE files_info ( hash_id INTEGER PRIMARY KEY, size INTEGER, mime INTEGER );' )
+        
+        self._copied_paths = []
+        
+        self._original_copy = ClientFiles._BackupClientFilesCopy
+        
+        ClientFiles._BackupClientFilesCopy = self._RecordingCopy
+        
+        self._fail_paths = set()
+        
+    
+    def tearDown( self ):
+        
+        ClientFiles._BackupClientFilesCopy = self._original_copy
+        
+        self._snapshot_db.close()
+        
+        shutil.rmtree( self._test_dir, ignore_errors = True )
+        
+    
+    def _AddFile( self, timestamp, mime = HC.IMAGE_PNG ):
+        
+        file_bytes = os.urandom( 64 )
+        
+        hash = hashlib.sha256( file_bytes ).digest()
+        
+        with open( self._GetPath( self._client_files_dir, hash, mime ), 'wb' ) as f:
+            
+            f.write( file_bytes )
+            
+        
+        with open( self._GetThumbnailPath( self._client_files_dir, hash ), 'wb' ) as f:
+            
+            f.write( file_bytes[ : 16 ] )
+            
+        
+        hash_id = self._snapshot_db.execute( 'INSERT INTO hashes ( hash ) VALUES ( ? );', ( sqlite3.Binary( hash ), ) ).lastrowid
+        
+        self._snapshot_db.execute( 'INSERT INTO files_info ( hash_id, size, mime ) VALUES ( ?, ?, ? );', ( hash_id, len( file_bytes ), mime ) )
+        self._snapshot_db.execute( 'INSERT INTO current_files ( service_id, hash_id, timestamp ) VALUES ( ?, ?, ? );', ( COMBINED_LOCAL_FILE_SERVICE_ID, hash_id, timestamp ) )
+        
+        return hash
+        
+    
+    def _Backup( self ):
+        
+        self._copied_paths = []
+        
+        ClientFiles.BackupClientFiles( self._snapshot_db, COMBINED_LOCAL_FILE_SERVICE_ID, self._client_files_dir, self._dest_dir )
+        
+    
+    def _DeleteFile( self, hash ):
+        
+        self._snapshot_db.execute( 'DELETE FROM current_files WHERE hash_id = ( SELECT hash_id FROM hashes WHERE hash = ? );', ( sqlite3.Binary( hash ), ) )
+        
+    
+    def _GetManifestRows( self ):
+        
+        manifest_db = sqlite3.connect( os.path.join( self._dest_dir, ClientFiles.CLIENT_FILES_BACKUP_MANIFEST_FILENAME ) )
+        
+        try:
+            
+            hashes_to_sizes = { bytes( hash ) : size for ( hash, size ) in manifest_db.execute( 'SELECT hash, size FROM files;' ) }
+            
+            ( next_timestamp, needs_sweep ) = manifest_db.execute( 'SELECT next_timestamp, needs_sweep FROM backup_info;' ).fetchone()
+            
+        finally:
+            
+            manifest_db.close()
+            
+        
+        return ( hashes_to_sizes, next_timestamp, needs_sweep )
+        
+    
+    def _GetPath( self, client_files_dir, hash, mime = HC.IMAGE_PNG ):
+        
+        return os.path.join( client_files_dir, 'f' + hash.hex()[:2], hash.hex() + HC.mime_ext_lookup[ mime ] )
+        
+    
+    def _GetThumbnailPath( self, client_files_dir, hash ):
+        
+        return os.path.join( client_files_dir, 't' + hash.hex()[:2], hash.hex() + '.thumbnail' )
+        
+    
+    def _IsBackedUp( self, hash ):
+        
+        for ( source_path, dest_path ) in ( ( self._GetPath( self._client_files_dir, hash ), self._GetPath( self._dest_client_files_dir, hash ) ), ( self._GetThumbnailPath( self._client_files_dir, hash ), self._GetThumbnailPath( self._dest_client_files_dir, hash ) ) ):
+            
+            if not os.path.exists( dest_path ):
+                
+                return False
+                
+            
+            with open( source_path, 'rb' ) as f:
+                
+                source_bytes = f.read()
+                
+            
+            with open( dest_path, 'rb' ) as f:
+                
+                if f.read() != source_bytes:
+                    
+                    return False
+                    
+                
+            
+        
+        return True
+        
+    
+    def _RecordingCopy( self, source_path, dest_path ):
+        
+        if source_path in self._fail_paths:
+            
+            raise Exception( 'Could not copy ' + source_path + '!' )
+            
+        
+        self._copied_paths.append( source_path )
+        
+        return self._original_copy( source_path, dest_path )
+        
+    
+    def test_first_run_sweep( self ):
+        
+        hash = self._AddFile( 1 )
+        
+        # a backup from before the manifest, with a file the client has since deleted and some junk
+        
+        stray_hash = hashlib.sha256( b'stray' ).digest()
+        
+        stray_paths = [ self._GetPath( self._dest_client_files_dir, stray_hash ), self._GetThumbnailPath( self._dest_client_files_dir, stray_hash ), os.path.join( self._dest_client_files_dir, 'f00', 'not a hash.txt' ) ]
+        
+        for path in stray_paths:
+            
+            HydrusPaths.MakeSureDirectoryExists( os.path.dirname( path ) )
+            
+            with open( path, 'wb' ) as f:
+                
+                f.write( b'stray' )
+                
+            
+        
+        self._Backup()
+        
+        self.assertTrue( self._IsBackedUp( hash ) )
+        
+        for path in stray_paths:
+            
+            self.assertFalse( os.path.exists( path ) )
+            
+        
+        ( hashes_to_sizes, next_timestamp, needs_sweep ) = self._GetManifestRows()
+        
+        self.assertFalse( needs_sweep )
+        
+        # the sweep only happens once
+        
+        with open( stray_paths[0], 'wb' ) as f:
+            
+            f.write( b'stray' )
+            
+        
+        self._Backup()
+        
+        self.assertTrue( os.path.exists( stray_paths[0] ) )
+        
+    
+    def test_incremental_copy( self ):
+        
+        hash_1 = self._AddFile( 1 )
+        hash_2 = self._AddFile( 2 )
+        
+        self._Backup()
+        
+        self.assertTrue( self._IsBackedUp( hash_1 ) )
+        self.assertTrue( self._IsBackedUp( hash_2 ) )
+        
+        ( hashes_to_sizes, next_timestamp, needs_sweep ) = self._GetManifestRows()
+        
+        self.assertEqual( set( hashes_to_sizes.keys() ), { hash_1, hash_2 } )
+        self.assertEqual( next_timestamp, 2 )
+        
+        # nothing new, so nothing is copied
+        
+        self._Backup()
+        
+        self.assertEqual( self._copied_paths, [] )
+        
+        # only the new file is looked at
+        
+        hash_3 = self._AddFile( 3 )
+        
+        self._Backup()
+        
+        self.assertEqual( set( self._copied_paths ), { self._GetPath( self._client_files_dir, hash_3 ), self._GetThumbnailPath( self._client_files_dir, hash_3 ) } )
+        self.assertTrue( self._IsBackedUp( hash_3 ) )
+        
+        ( hashes_to_sizes, next_timestamp, needs_sweep ) = self._GetManifestRows()
+        
+        self.assertEqual( next_timestamp, 3 )
+        
+        # a file imported with an old timestamp leaves the counts out, which triggers a full catch-up pass
+        
+        hash_0 = self._AddFile( 0 )
+        
+        self._Backup()
+        
+        self.assertIn( self._GetPath( self._client_files_dir, hash_0 ), self._copied_paths )
+        self.assertTrue( self._IsBackedUp( hash_0 ) )
+        
+        ( hashes_to_sizes, next_timestamp, needs_sweep ) = self._GetManifestRows()
+        
+        self.assertEqual( len( hashes_to_sizes ), 4 )
+        
+    
+    def test_orphan_deletion( self ):
+        
+        hash_1 = self._AddFile( 1 )
+        hash_2 = self._AddFile( 2 )
+        
+        self._Backup()
+        
+        self._DeleteFile( hash_1 )
+        
+        self._Backup()
+        
+        self.assertFalse( os.path.exists( self._GetPath( self._dest_client_files_dir, hash_1 ) ) )
+        self.assertFalse( os.path.exists( self._GetThumbnailPath( self._dest_client_files_dir, hash_1 ) ) )
+        self.assertTrue( self._IsBackedUp( hash_2 ) )
+        
+        ( hashes_to_sizes, next_timestamp, needs_sweep ) = self._GetManifestRows()
+        
+        self.assertEqual( set( hashes_to_sizes.keys() ), { hash_2 } )
+        
+        # when the counts match, the orphan pass is skipped
+        
+        hash_3 = self._AddFile( 3 )
+        
+        original_delete_orphans = ClientFiles._BackupClientFilesDeleteOrphans
+        
+        def delete_orphans( *args ):
+            
+            raise Exception( 'The orphan pass should not have run!' )
+            
+        
+        ClientFiles._BackupClientFilesDeleteOrphans = delete_orphans
+        
+        try:
+            
+            self._Backup()
+            
+        finally:
+            
+            ClientFiles._BackupClientFilesDeleteOrphans = original_delete_orphans
+            
+        
+        self.assertTrue( self._IsBackedUp( hash_3 ) )
+        
+    
+    def test_resume_after_failure( self ):
+        
+        hash_1 = self._AddFile( 1 )
+        hash_2 = self._AddFile( 2 )
+        hash_3 = self._AddFile( 3 )
+        
+        self._fail_paths.add( self._GetPath( self._client_files_dir, hash_2 ) )
+        
+        self._Backup()
+        
+        self.assertTrue( self._IsBackedUp( hash_1 ) )
+        self.assertFalse( os.path.exists( self._GetPath( self._dest_client_files_dir, hash_2 ) ) )
+        self.assertTrue( self._IsBackedUp( hash_3 ) )
+        
+        ( hashes_to_sizes, next_timestamp, needs_sweep ) = self._GetManifestRows()
+        
+        # the failed file is recorded with no size, and the next run starts from it
+        
+        self.assertIsNone( hashes_to_sizes[ hash_2 ] )
+        self.assertEqual( next_timestamp, 2 )
+        
+        self._fail_paths = set()
+        
+        self._Backup()
+        
+        self.assertEqual( set( self._copied_paths ), { self._GetPath( self._client_files_dir, hash_2 ), self._GetThumbnailPath( self._client_files_dir, hash_2 ) } )
+        self.assertTrue( self._IsBackedUp( hash_2 ) )
+        
+        ( hashes_to_sizes, next_timestamp, needs_sweep ) = self._GetManifestRows()
+        
+        self.assertIsNotNone( hashes_to_sizes[ hash_2 ] )
+        self.assertEqual( next_timestamp, 3 )
+        
\ No newline at end of file
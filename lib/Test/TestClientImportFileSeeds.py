@@ -0,0 +1,170 @@
+from . import ClientConstants as CC
+from . import ClientImportFileSeeds
+import unittest
+
+class TestFileSeedCache( unittest.TestCase ):
+    
+    def _CheckIndices( self, file_seed_cache, expected_file_seeds ):
+        
+        self.assertEqual( file_seed_cache.GetFileSeeds(), expected_file_seeds )
+        
+        for ( index, file_seed ) in enumerate( expected_file_seeds ):
+            
+            self.assertEqual( file_seed_cache.GetFileSeedIndex( file_seed ), index )
+            
+        
+        for status in ( CC.STATUS_UNKNOWN, CC.STATUS_ERROR, CC.STATUS_SUCCESSFUL_AND_NEW ):
+            
+            status_file_seeds = [ file_seed for file_seed in expected_file_seeds if file_seed.status == status ]
+            
+            self.assertEqual( file_seed_cache.GetFileSeeds( status ), status_file_seeds )
+            self.assertEqual( file_seed_cache.GetFileSeedCount( status ), len( status_file_seeds ) )
+            
+            if len( status_file_seeds ) == 0:
+                
+                self.assertEqual( file_seed_cache.GetNextFileSeed( status ), None )
+                
+            else:
+                
+                self.assertEqual( file_seed_cache.GetNextFileSeed( status ), status_file_seeds[0] )
+                
+            
+            self.assertEqual( file_seed_cache.GetNextFileSeeds( status, 2 ), status_file_seeds[:2] )
+            
+        
+        source_timestamps = [ file_seed.source_time for file_seed in expected_file_seeds ]
+        
+        if len( source_timestamps ) > 0:
+            
+            self.assertEqual( file_seed_cache.GetEarliestSourceTime(), min( source_timestamps ) )
+            self.assertEqual( file_seed_cache.GetLatestSourceTime(), max( source_timestamps ) )
+            
+        
+        self.assertEqual( file_seed_cache.GetNumNewFilesSince( 500 ), len( [ source_timestamp for source_timestamp in source_timestamps if source_timestamp >= 500 ] ) )
+        
+    
+    def _GetFileSeeds( self, num_file_seeds ):
+        
+        file_seeds = []
+        
+        for i in range( num_file_seeds ):
+            
+            file_seed = ClientImportFileSeeds.FileSeed( ClientImportFileSeeds.FILE_SEED_TYPE_HDD, 'file {}'.format( i ) )
+            
+            file_seed.source_time = 1000 - ( i * 100 )
+            
+            file_seeds.append( file_seed )
+            
+        
+        return file_seeds
+        
+    
+    def test_add_and_remove( self ):
+        
+        file_seed_cache = ClientImportFileSeeds.FileSeedCache()
+        
+        file_seeds = self._GetFileSeeds( 8 )
+        
+        file_seeds[1].SetStatus( CC.STATUS_ERROR )
+        file_seeds[4].SetStatus( CC.STATUS_SUCCESSFUL_AND_NEW )
+        
+        self.assertEqual( file_seed_cache.AddFileSeeds( file_seeds[:6] ), 6 )
+        
+        self._CheckIndices( file_seed_cache, file_seeds[:6] )
+        
+        # dupes are skipped
+        
+        self.assertEqual( file_seed_cache.AddFileSeeds( file_seeds[4:] ), 2 )
+        
+        self._CheckIndices( file_seed_cache, file_seeds )
+        
+        file_seed_cache.RemoveFileSeeds( ( file_seeds[0], file_seeds[4], file_seeds[5] ) )
+        
+        expected_file_seeds = [ file_seeds[1], file_seeds[2], file_seeds[3], file_seeds[6], file_seeds[7] ]
+        
+        self._CheckIndices( file_seed_cache, expected_file_seeds )
+        
+        file_seed_cache.RemoveFileSeedsByStatus( ( CC.STATUS_ERROR, ) )
+        
+        self._CheckIndices( file_seed_cache, expected_file_seeds[1:] )
+        
+        file_seed_cache.RemoveFileSeeds( expected_file_seeds )
+        
+        self._CheckIndices( file_seed_cache, [] )
+        
+    
+    def test_reorder( self ):
+        
+        file_seed_cache = ClientImportFileSeeds.FileSeedCache()
+        
+        file_seeds = self._GetFileSeeds( 8 )
+        
+        file_seeds[2].SetStatus( CC.STATUS_ERROR )
+        file_seeds[3].SetStatus( CC.STATUS_SUCCESSFUL_AND_NEW )
+        
+        file_seed_cache.AddFileSeeds( file_seeds[:5] )
+        
+        file_seed_cache.AdvanceFileSeed( file_seeds[3] )
+        
+        expected_file_seeds = [ file_seeds[0], file_seeds[1], file_seeds[3], file_seeds[2], file_seeds[4] ]
+        
+        self._CheckIndices( file_seed_cache, expected_file_seeds )
+        
+        # the ends do not move
+        
+        file_seed_cache.AdvanceFileSeed( file_seeds[0] )
+        file_seed_cache.DelayFileSeed( file_seeds[4] )
+        
+        self._CheckIndices( file_seed_cache, expected_file_seeds )
+        
+        file_seed_cache.DelayFileSeed( file_seeds[0] )
+        
+        expected_file_seeds = [ file_seeds[1], file_seeds[0], file_seeds[3], file_seeds[2], file_seeds[4] ]
+        
+        self._CheckIndices( file_seed_cache, expected_file_seeds )
+        
+        self.assertEqual( file_seed_cache.InsertFileSeeds( 2, file_seeds[5:] + [ file_seeds[0] ] ), 3 )
+        
+        expected_file_seeds = [ file_seeds[1], file_seeds[0], file_seeds[5], file_seeds[6], file_seeds[7], file_seeds[3], file_seeds[2], file_seeds[4] ]
+        
+        self._CheckIndices( file_seed_cache, expected_file_seeds )
+        
+    
+    def test_status_change( self ):
+        
+        file_seed_cache = ClientImportFileSeeds.FileSeedCache()
+        
+        file_seeds = self._GetFileSeeds( 5 )
+        
+        file_seed_cache.AddFileSeeds( file_seeds )
+        
+        file_seeds[0].SetStatus( CC.STATUS_SUCCESSFUL_AND_NEW )
+        file_seeds[0].source_time = 50
+        
+        file_seed_cache.NotifyFileSeedsUpdated( ( file_seeds[0], ) )
+        
+        self._CheckIndices( file_seed_cache, file_seeds )
+        
+        file_seed_cache.RetryFailures()
+        
+        self._CheckIndices( file_seed_cache, file_seeds )
+        
+        # nothing tells the cache about these, but it should still find them
+        
+        file_seeds[1].SetStatus( CC.STATUS_ERROR )
+        
+        self.assertEqual( file_seed_cache.GetNextFileSeed( CC.STATUS_UNKNOWN ), file_seeds[2] )
+        self.assertEqual( file_seed_cache.GetNextFileSeed( CC.STATUS_ERROR ), file_seeds[1] )
+        
+        file_seeds[3].SetStatus( CC.STATUS_ERROR )
+        file_seeds[4].SetStatus( CC.STATUS_ERROR )
+        
+        self.assertEqual( file_seed_cache.GetNextFileSeeds( CC.STATUS_ERROR, 5 ), [ file_seeds[1], file_seeds[3], file_seeds[4] ] )
+        
+        file_seed_cache.RetryFailures()
+        
+        self._CheckIndices( file_seed_cache, file_seeds )
+        
+        self.assertEqual( file_seed_cache.GetNextFileSeed( CC.STATUS_UNKNOWN ), file_seeds[1] )
+        
+    
@@ -0,0 +1,208 @@
+from . import ClientParsing
+import unittest
+
+TEST_HTML = '''<!DOCTYPE html>
+<html>
+<head>
+<title>test page</title>
+<link rel="next" href="/posts?page=2">
+</head>
+<body>
+<div id="content" class="post  main">
+<ul id="tag-list">
+<li class="tag-type-series"><a class="search-tag" href="/posts?tags=blue_sky">blue sky</a> <span class="post-count">123</span></li>
+<li class="tag-type-general"><a class="search-tag wiki" rel="tag nofollow" href="/posts?tags=sea&amp;page=1">sky &amp; sea</a> <span class="post-count">45</span></li>
+</ul>
+<picture><source srcset="/thumb.webp"><img src="/thumb.jpg" alt='the "thumb"'></picture>
+<p class="note">first line<br>second line<wbr>third</p>
+<table class="highres">
+<tr><th>size</th><td><a href="/data/file.png">1.2MB</a></td></tr>
+<tr><th>source</th><td><span>  </span><b>artist</b></td></tr>
+</table>
+</div>
+<div id="paginator" class="post"><a href="/posts?page=1">previous</a> <a href="/posts?page=2">next page</a></div>
+</body>
+</html>'''
+
+@unittest.skipUnless( ClientParsing.LXML_IS_OK, 'lxml is not available, so there is only one html engine to test' )
+class TestHTMLParsingEngines( unittest.TestCase ):
+    
+    def _GetFormula( self, tag_rules, content_to_fetch = ClientParsing.HTML_CONTENT_ATTRIBUTE, attribute_to_fetch = 'href' ):
+        
+        return ClientParsing.ParseFormulaHTML( tag_rules = tag_rules, content_to_fetch = content_to_fetch, attribute_to_fetch = attribute_to_fetch )
+        
+    
+    def _Parse( self, formula ):
+        
+        # every formula here should be one the lxml engine can take, or this is not testing it
+        
+        self.assertIsNotNone( formula._GetCompiledXPaths() )
+        
+        lxml_results = formula.Parse( { 'html_parsing_engine' : ClientParsing.HTML_PARSING_ENGINE_LXML }, TEST_HTML )
+        bs4_results = formula.Parse( { 'html_parsing_engine' : ClientParsing.HTML_PARSING_ENGINE_BS4 }, TEST_HTML )
+        
+        self.assertEqual( lxml_results, bs4_results )
+        
+        return bs4_results
+        
+    
+    def test_ascending( self ):
+        
+        rules = [ ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'b' ) ]
+        
+        rules.append( ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_ASCENDING, tag_name = 'table', tag_depth = 1 ) )
+        
+        self.assertEqual( self._Parse( self._GetFormula( rules, attribute_to_fetch = 'class' ) ), [ 'highres' ] )
+        
+        # no tag name counts every parent on the way up
+        
+        rules[1] = ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_ASCENDING, tag_name = None, tag_depth = 5 )
+        
+        self.assertEqual( self._Parse( self._GetFormula( rules, attribute_to_fetch = 'id' ) ), [ 'content' ] )
+        
+        # running out of tree finds nothing
+        
+        rules[1] = ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_ASCENDING, tag_name = 'div', tag_depth = 2 )
+        
+        self.assertEqual( self._Parse( self._GetFormula( rules, attribute_to_fetch = 'id' ) ), [] )
+        
+    
+    def test_attribute_matching( self ):
+        
+        rule = ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'a', tag_attributes = { 'class' : 'search-tag' } )
+        
+        self.assertEqual( self._Parse( self._GetFormula( [ rule ] ) ), [ '/posts?tags=blue_sky', '/posts?tags=sea&page=1' ] )
+        
+        # a multi-valued attribute matches any single value or the whole list
+        
+        rule = ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'a', tag_attributes = { 'class' : 'search-tag wiki' } )
+        
+        self.assertEqual( self._Parse( self._GetFormula( [ rule ] ) ), [ '/posts?tags=sea&page=1' ] )
+        
+        rule = ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'a', tag_attributes = { 'rel' : 'nofollow' } )
+        
+        self.assertEqual( self._Parse( self._GetFormula( [ rule ] ) ), [ '/posts?tags=sea&page=1' ] )
+        
+        rule = ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'link', tag_attributes = { 'rel' : 'next' } )
+        
+        self.assertEqual( self._Parse( self._GetFormula( [ rule ] ) ), [ '/posts?page=2' ] )
+        
+        # a whole-list match is on the normalised value, and the result comes back normalised too
+        
+        rule = ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = None, tag_attributes = { 'class' : 'post main' } )
+        
+        self.assertEqual( self._Parse( self._GetFormula( [ rule ], attribute_to_fetch = 'class' ) ), [ 'post main' ] )
+        
+        rule = ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'div', tag_attributes = { 'class' : 'post' } )
+        
+        self.assertEqual( self._Parse( self._GetFormula( [ rule ], attribute_to_fetch = 'id' ) ), [ 'content', 'paginator' ] )
+        
+        # plain attributes are exact matches
+        
+        rule = ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'div', tag_attributes = { 'id' : 'pagin' } )
+        
+        self.assertEqual( self._Parse( self._GetFormula( [ rule ], attribute_to_fetch = 'id' ) ), [] )
+        
+    
+    def test_content( self ):
+        
+        rules = [ ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'li' ) ]
+        
+        rules.append( ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'a' ) )
+        
+        self.assertEqual( self._Parse( self._GetFormula( rules, content_to_fetch = ClientParsing.HTML_CONTENT_STRING ) ), [ 'blue sky', 'sky & sea' ] )
+        
+        # the first string is the first non-empty one, even if it is only whitespace
+        
+        rules = [ ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'td', tag_index = 1 ) ]
+        
+        self.assertEqual( self._Parse( self._GetFormula( rules, content_to_fetch = ClientParsing.HTML_CONTENT_STRING ) ), [ '  ' ] )
+        
+        # html output does not percent-encode urls, and keeps text and tails in place
+        
+        rules = [ ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'li', tag_index = 1 ) ]
+        
+        expected_html = '<li class="tag-type-general"><a class="search-tag wiki" href="/posts?tags=sea&amp;page=1" rel="tag nofollow">sky &amp; sea</a> <span class="post-count">45</span></li>'
+        
+        self.assertEqual( self._Parse( self._GetFormula( rules, content_to_fetch = ClientParsing.HTML_CONTENT_HTML ) ), [ expected_html ] )
+        
+        # a missing attribute is skipped, not an error
+        
+        rules = [ ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'a' ) ]
+        
+        self.assertEqual( self._Parse( self._GetFormula( rules, attribute_to_fetch = 'rel' ) ), [ 'tag nofollow' ] )
+        
+    
+    def test_implied_tbody( self ):
+        
+        rules = [ ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'table', tag_attributes = { 'class' : 'highres' } ) ]
+        
+        rules.append( ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'tbody' ) )
+        rules.append( ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'a' ) )
+        
+        self.assertEqual( self._Parse( self._GetFormula( rules ) ), [ '/data/file.png' ] )
+        
+        rules = [ ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'a', tag_attributes = { 'href' : '/data/file.png' } ) ]
+        
+        rules.append( ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_ASCENDING, tag_name = None, tag_depth = 4 ) )
+        
+        self.assertEqual( self._Parse( self._GetFormula( rules, attribute_to_fetch = 'class' ) ), [ 'highres' ] )
+        
+    
+    def test_tag_index( self ):
+        
+        rule = ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'a', tag_index = 2 )
+        
+        self.assertEqual( self._Parse( self._GetFormula( [ rule ] ) ), [ '/data/file.png' ] )
+        
+        rule = ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'a', tag_index = 10 )
+        
+        self.assertEqual( self._Parse( self._GetFormula( [ rule ] ) ), [] )
+        
+        # the index applies per node, not to the combined results
+        
+        rules = [ ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'li' ) ]
+        
+        rules.append( ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'span', tag_index = 0 ) )
+        
+        self.assertEqual( self._Parse( self._GetFormula( rules, content_to_fetch = ClientParsing.HTML_CONTENT_STRING ) ), [ '123', '45' ] )
+        
+    
+    def test_tag_string( self ):
+        
+        string_match = ClientParsing.StringMatch( match_type = ClientParsing.STRING_MATCH_FIXED, match_value = 'next page', example_string = 'next page' )
+        
+        rule = ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'a', should_test_tag_string = True, tag_string_string_match = string_match )
+        
+        self.assertEqual( self._Parse( self._GetFormula( [ rule ] ) ), [ '/posts?page=2' ] )
+        
+        # the string tested is the first one in the tag, not the whole text
+        
+        string_match = ClientParsing.StringMatch( match_type = ClientParsing.STRING_MATCH_FIXED, match_value = 'source', example_string = 'source' )
+        
+        rules = [ ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'tr', should_test_tag_string = True, tag_string_string_match = string_match ) ]
+        
+        rules.append( ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'b' ) )
+        
+        self.assertEqual( self._Parse( self._GetFormula( rules, content_to_fetch = ClientParsing.HTML_CONTENT_STRING ) ), [ 'artist' ] )
+        
+    
+    def test_void_elements( self ):
+        
+        # lxml does not know source or wbr, and would otherwise nest what follows them inside them
+        
+        rules = [ ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'img' ) ]
+        
+        rules.append( ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_ASCENDING, tag_name = None, tag_depth = 1 ) )
+        
+        self.assertEqual( self._Parse( self._GetFormula( rules, content_to_fetch = ClientParsing.HTML_CONTENT_HTML ) ), [ '<picture><source srcset="/thumb.webp"/><img alt=\'the "thumb"\' src="/thumb.jpg"/></picture>' ] )
+        
+        rules = [ ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'p', tag_attributes = { 'class' : 'note' } ) ]
+        
+        self.assertEqual( self._Parse( self._GetFormula( rules, content_to_fetch = ClientParsing.HTML_CONTENT_HTML ) ), [ '<p class="note">first line<br/>second line<wbr/>third</p>' ] )
+        
+        rules.append( ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'wbr' ) )
+        
+        self.assertEqual( self._Parse( self._GetFormula( rules, content_to_fetch = ClientParsing.HTML_CONTENT_STRING ) ), [] )
+        
+    
\ No newline at end of file
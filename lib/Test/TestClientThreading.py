@@ -3,6 +3,8 @@ from . import ClientThreading
 from . import HydrusConstants as HC
 from . import HydrusExceptions
 from . import HydrusGlobals as HG
+from . import HydrusThreading
+import collections
 import os
 import threading
 import time
@@ -227,3 +229,156 @@ class TestFileRWLock( unittest.TestCase ):
                 
             
         
+    
+class TestThreadPool( unittest.TestCase ):
+    
+    def test_priority_limits( self ):
+        
+        priorities = {}
+        
+        priorities[ HydrusThreading.THREAD_POOL_PRIORITY_UI ] = ( 2, 8 )
+        priorities[ HydrusThreading.THREAD_POOL_PRIORITY_MAINTENANCE ] = ( 1, 1 )
+        
+        thread_pool = HydrusThreading.ThreadPool( HG.test_controller, 'test pool', priorities = priorities )
+        
+        condition = threading.Condition()
+        release = threading.Event()
+        
+        num_working = collections.Counter()
+        max_num_working = collections.Counter()
+        
+        result_list = []
+        
+        def do_it( priority, name ):
+            
+            with condition:
+                
+                num_working[ priority ] += 1
+                max_num_working[ priority ] = max( max_num_working[ priority ], num_working[ priority ] )
+                
+                condition.notify_all()
+                
+            
+            release.wait( 5 )
+            
+            with condition:
+                
+                num_working[ priority ] -= 1
+                
+                result_list.append( name )
+                
+                condition.notify_all()
+                
+            
+        
+        for i in range( 4 ):
+            
+            thread_pool.Put( HydrusThreading.THREAD_POOL_PRIORITY_MAINTENANCE, do_it, HydrusThreading.THREAD_POOL_PRIORITY_MAINTENANCE, 'maintenance {}'.format( i ) )
+            
+        
+        for i in range( 4 ):
+            
+            thread_pool.Put( HydrusThreading.THREAD_POOL_PRIORITY_UI, do_it, HydrusThreading.THREAD_POOL_PRIORITY_UI, 'ui {}'.format( i ) )
+            
+        
+        # the ui jobs do not wait behind the maintenance queue
+        
+        with condition:
+            
+            ui_started = condition.wait_for( lambda: num_working[ HydrusThreading.THREAD_POOL_PRIORITY_UI ] == 2, 5 )
+            
+        
+        self.assertTrue( ui_started )
+        
+        release.set()
+        
+        with condition:
+            
+            all_done = condition.wait_for( lambda: len( result_list ) == 8, 5 )
+            
+        
+        self.assertTrue( all_done )
+        
+        self.assertEqual( max_num_working[ HydrusThreading.THREAD_POOL_PRIORITY_UI ], 2 )
+        self.assertEqual( max_num_working[ HydrusThreading.THREAD_POOL_PRIORITY_MAINTENANCE ], 1 )
+        
+        self.assertEqual( thread_pool.GetQueueDepths(), { HydrusThreading.THREAD_POOL_PRIORITY_UI : 0, HydrusThreading.THREAD_POOL_PRIORITY_MAINTENANCE : 0 } )
+        
+    
+    def test_nested_call_when_full( self ):
+        
+        priorities = {}
+        
+        priorities[ HydrusThreading.THREAD_POOL_PRIORITY_UI ] = ( 1, 8 )
+        
+        thread_pool = HydrusThreading.ThreadPool( HG.test_controller, 'test pool', priorities = priorities )
+        
+        inner_done = threading.Event()
+        outer_done = threading.Event()
+        result_list = []
+        
+        def outer():
+            
+            thread_pool.Put( HydrusThreading.THREAD_POOL_PRIORITY_UI, inner_done.set )
+            
+            result_list.append( inner_done.wait( 5 ) )
+            
+            outer_done.set()
+            
+        
+        thread_pool.Put( HydrusThreading.THREAD_POOL_PRIORITY_UI, outer )
+        
+        self.assertTrue( outer_done.wait( 5 ) )
+        
+        self.assertEqual( result_list, [ True ] )
+        
+    
+    def test_nested_call_overflow_limit( self ):
+        
+        priorities = {}
+        
+        priorities[ HydrusThreading.THREAD_POOL_PRIORITY_UI ] = ( 1, 8 )
+        
+        thread_pool = HydrusThreading.ThreadPool( HG.test_controller, 'test pool', priorities = priorities )
+        
+        thread_pool._max_overflow_workers = 1
+        
+        release = threading.Event()
+        outer_done = threading.Event()
+        result_list = []
+        
+        def inner( name ):
+            
+            result_list.append( ( name, threading.current_thread() ) )
+            
+            release.wait( 5 )
+            
+        
+        def outer():
+            
+            # the first gets the only overflow thread, so the second has to run right here
+            
+            thread_pool.Put( HydrusThreading.THREAD_POOL_PRIORITY_UI, inner, 'overflow' )
+            
+            release.set()
+            
+            thread_pool.Put( HydrusThreading.THREAD_POOL_PRIORITY_UI, inner, 'inline' )
+            
+            result_list.append( ( 'outer', threading.current_thread() ) )
+            
+            outer_done.set()
+            
+        
+        thread_pool.Put( HydrusThreading.THREAD_POOL_PRIORITY_UI, outer )
+        
+        self.assertTrue( outer_done.wait( 5 ) )
+        
+        names_to_threads = dict( result_list )
+        
+        self.assertIs( names_to_threads[ 'inline' ], names_to_threads[ 'outer' ] )
+        
+        names = [ name for ( name, thread ) in result_list ]
+        
+        self.assertLess( names.index( 'inline' ), names.index( 'outer' ) )
+        
+    
@@ -28,14 +28,18 @@ from . import HydrusSessions
 from . import HydrusTags
 from . import HydrusThreading
 from . import TestClientAPI
+from . import TestClientCaches
 from . import TestClientConstants
 from . import TestClientDaemons
 from . import TestClientData
+from . import TestClientFiles
 from . import TestClientImageHandling
+from . import TestClientImportFileSeeds
 from . import TestClientImportOptions
 from . import TestClientImportSubscriptions
 from . import TestClientListBoxes
 from . import TestClientNetworking
+from . import TestClientParsing
 from . import TestClientThreading
 from . import TestDialogs
 from . import TestDB
@@ -86,6 +90,11 @@ class MockController( object ):
         return HG.test_controller.CallToThread( callable, *args, **kwargs )
         
     
+    def CallToThreadWithPriority( self, priority, callable, *args, **kwargs ):
+        
+        return HG.test_controller.CallToThread( callable, *args, **kwargs )
+        
+    
     def JustWokeFromSleep( self ):
         
         return False
@@ -416,6 +425,11 @@ class Controller( object ):
     
     CallToThreadLongRunning = CallToThread
     
+    def CallToThreadWithPriority( self, priority, callable, *args, **kwargs ):
+        
+        self.CallToThread( callable, *args, **kwargs )
+        
+    
     def CallLater( self, initial_delay, func, *args, **kwargs ):
         
         call = HydrusData.Call( func, *args, **kwargs )
@@ -608,9 +622,11 @@ class Controller( object ):
             
         if run_all or self.only_run == 'data':
             
+            suites.append( unittest.TestLoader().loadTestsFromModule( TestClientCaches ) )
             suites.append( unittest.TestLoader().loadTestsFromModule( TestClientConstants ) )
             suites.append( unittest.TestLoader().loadTestsFromModule( TestClientData ) )
             suites.append( unittest.TestLoader().loadTestsFromModule( TestClientImportOptions ) )
+            suites.append( unittest.TestLoader().loadTestsFromModule( TestClientParsing ) )
             suites.append( unittest.TestLoader().loadTestsFromModule( TestClientThreading ) )
             suites.append( unittest.TestLoader().loadTestsFromModule( TestFunctions ) )
             suites.append( unittest.TestLoader().loadTestsFromModule( TestHydrusSerialisable ) )
@@ -619,6 +635,7 @@ class Controller( object ):
             
         if run_all or self.only_run == 'db':
             
+            suites.append( unittest.TestLoader().loadTestsFromModule( TestClientFiles ) )
             suites.append( unittest.TestLoader().loadTestsFromModule( TestDB ) )
             
         if run_all or self.only_run == 'networking':
@@ -628,6 +645,7 @@ class Controller( object ):
             
         if run_all or self.only_run == 'import':
             
+            suites.append( unittest.TestLoader().loadTestsFromModule( TestClientImportFileSeeds ) )
             suites.append( unittest.TestLoader().loadTestsFromModule( TestClientImportSubscriptions ) )
             
         if run_all or self.only_run == 'image':
@@ -11,6 +11,8 @@ from . import ClientImporting
 from . import ClientImportLocal
 from . import ClientImportOptions
 from . import ClientImportFileSeeds
+from . import ClientImportSubscriptions
+from . import ClientMedia
 from . import ClientRatings
 from . import ClientSearch
 from . import ClientServices
@@ -18,11 +20,15 @@ from . import ClientTags
 import collections
 from . import HydrusConstants as HC
 from . import HydrusData
+from . import HydrusDB
 from . import HydrusExceptions
+from . import HydrusPaths
 from . import HydrusVideoHandling
 from . import HydrusGlobals as HG
 from . import HydrusNetwork
 from . import HydrusSerialisable
+from . import HydrusTagArchive
+import hashlib
 import itertools
 import os
 from . import ServerDB
@@ -203,6 +209,63 @@ class TestClientDB( unittest.TestCase ):
         [ result ] = self._read( 'serialisable_named', HydrusSerialisable.SERIALISABLE_TYPE_EXPORT_FOLDER )
         
         self.assertEqual( result.GetName(), export_folder.GetName() )
+        self.assertEqual( result.GetManifestKey(), export_folder.GetManifestKey() )
+        
+        #
+        
+        manifest_key = export_folder.GetManifestKey()
+        
+        ( new_hash_ids, vanished_rows, manifest_was_empty ) = self._read( 'export_folder_manifest_delta', manifest_key, [ 3, 1, 2 ] )
+        
+        self.assertEqual( new_hash_ids, [ 1, 2, 3 ] )
+        self.assertEqual( vanished_rows, [] )
+        self.assertTrue( manifest_was_empty )
+        
+        self._write( 'export_folder_manifest', manifest_key, [ ( 1, 'a' ), ( 2, 'b' ) ], () )
+        
+        ( new_hash_ids, vanished_rows, manifest_was_empty ) = self._read( 'export_folder_manifest_delta', manifest_key, [ 2, 3 ] )
+        
+        self.assertEqual( new_hash_ids, [ 3 ] )
+        self.assertEqual( vanished_rows, [ ( 1, 'a' ) ] )
+        self.assertFalse( manifest_was_empty )
+        
+        self.assertEqual( self._read( 'export_folder_manifest_claimed_paths', manifest_key, [ 'a', 'b', 'c' ] ), { 'a', 'b' } )
+        
+        self._write( 'export_folder_manifest', manifest_key, [ ( 3, 'c' ) ], [ 1 ] )
+        
+        ( new_hash_ids, vanished_rows, manifest_was_empty ) = self._read( 'export_folder_manifest_delta', manifest_key, [ 2, 3 ] )
+        
+        self.assertEqual( new_hash_ids, [] )
+        self.assertEqual( vanished_rows, [] )
+        
+        # an edited folder starts a fresh manifest
+        
+        edited_export_folder = ClientExporting.ExportFolder( 'test path', export_type = HC.EXPORT_FOLDER_TYPE_SYNCHRONISE, file_search_context = file_search_context, period = 3600, phrase = '{hash}' )
+        
+        self._write( 'serialisable', edited_export_folder )
+        
+        ( new_hash_ids, vanished_rows, manifest_was_empty ) = self._read( 'export_folder_manifest_delta', manifest_key, [ 2, 3 ] )
+        
+        self.assertEqual( new_hash_ids, [ 2, 3 ] )
+        self.assertTrue( manifest_was_empty )
+        
+        # an overwrite that brings the folder back keeps its manifest, and a delete clears it
+        
+        new_manifest_key = edited_export_folder.GetManifestKey()
+        
+        self._write( 'export_folder_manifest', new_manifest_key, [ ( 2, 'b' ) ], () )
+        
+        self._write( 'serialisables_overwrite', [ HydrusSerialisable.SERIALISABLE_TYPE_EXPORT_FOLDER ], [ edited_export_folder ] )
+        
+        ( new_hash_ids, vanished_rows, manifest_was_empty ) = self._read( 'export_folder_manifest_delta', new_manifest_key, [ 2 ] )
+        
+        self.assertFalse( manifest_was_empty )
+        
+        self._write( 'delete_serialisable_named', HydrusSerialisable.SERIALISABLE_TYPE_EXPORT_FOLDER, 'test path' )
+        
+        ( new_hash_ids, vanished_rows, manifest_was_empty ) = self._read( 'export_folder_manifest_delta', new_manifest_key, [ 2 ] )
+        
+        self.assertTrue( manifest_was_empty )
         
     
     def test_file_query_ids( self ):
@@ -409,6 +472,31 @@ class TestClientDB( unittest.TestCase ):
         
         #
         
+        sort_by = ClientMedia.MediaSort( ( 'system', CC.SORT_FILES_BY_IMPORT_TIME ), CC.SORT_DESC )
+        
+        for ( predicates, result ) in [ ( [ ClientSearch.Predicate( HC.PREDICATE_TYPE_SYSTEM_LIMIT, 1 ) ], 1 ), ( [ ClientSearch.Predicate( HC.PREDICATE_TYPE_SYSTEM_LIMIT, 0 ) ], 0 ), ( [ ClientSearch.Predicate( HC.PREDICATE_TYPE_SYSTEM_INBOX ), ClientSearch.Predicate( HC.PREDICATE_TYPE_SYSTEM_LIMIT, 10 ) ], 1 ), ( [ ClientSearch.Predicate( HC.PREDICATE_TYPE_SYSTEM_ARCHIVE ), ClientSearch.Predicate( HC.PREDICATE_TYPE_SYSTEM_LIMIT, 10 ) ], 0 ), ( [ ClientSearch.Predicate( HC.PREDICATE_TYPE_TAG, 'car' ), ClientSearch.Predicate( HC.PREDICATE_TYPE_SYSTEM_LIMIT, 10 ) ], 0 ) ]:
+            
+            search_context = ClientSearch.FileSearchContext( file_service_key = CC.LOCAL_FILE_SERVICE_KEY, predicates = predicates )
+            
+            file_query_ids = self._read( 'file_query_ids', search_context, sort_by = sort_by )
+            
+            self.assertEqual( len( file_query_ids ), result )
+            
+        
+        search_context = ClientSearch.FileSearchContext( file_service_key = CC.LOCAL_FILE_SERVICE_KEY, predicates = [ ClientSearch.Predicate( HC.PREDICATE_TYPE_SYSTEM_EVERYTHING ) ] )
+        
+        ( file_query_ids, next_file_id_cursor ) = self._read( 'file_query_ids_page', search_context, num_file_ids = 1 )
+        
+        self.assertEqual( len( file_query_ids ), 1 )
+        self.assertEqual( next_file_id_cursor, None )
+        
+        ( file_query_ids, next_file_id_cursor ) = self._read( 'file_query_ids_page', search_context, file_id_cursor = file_query_ids[0], num_file_ids = 1 )
+        
+        self.assertEqual( file_query_ids, [] )
+        self.assertEqual( next_file_id_cursor, None )
+        
+        #
+        
         service_keys_to_content_updates = {}
         
         service_keys_to_content_updates[ CC.COMBINED_LOCAL_FILE_SERVICE_KEY ] = ( HydrusData.ContentUpdate( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_ARCHIVE, ( hash, ) ), )
@@ -617,6 +705,194 @@ class TestClientDB( unittest.TestCase ):
         run_system_predicate_tests( tests )
         
     
+    def test_file_query_ids_page( self ):
+        
+        TestClientDB._clear_db()
+        
+        paths = [ os.path.join( HC.STATIC_DIR, 'testing', 'muh_jpg.jpg' ), os.path.join( HC.STATIC_DIR, 'testing', 'muh_png.png' ), os.path.join( HC.STATIC_DIR, 'hydrus.png' ) ]
+        
+        file_import_jobs = []
+        
+        for path in paths:
+            
+            file_import_job = ClientImportFileSeeds.FileImportJob( path )
+            
+            file_import_job.GenerateHashAndStatus()
+            
+            file_import_job.GenerateInfo()
+            
+            file_import_jobs.append( file_import_job )
+            
+        
+        self._write( 'import_files', file_import_jobs )
+        
+        search_context = ClientSearch.FileSearchContext( file_service_key = CC.LOCAL_FILE_SERVICE_KEY, predicates = [ ClientSearch.Predicate( HC.PREDICATE_TYPE_SYSTEM_EVERYTHING ) ] )
+        
+        all_hash_ids = sorted( self._read( 'file_query_ids', search_context ) )
+        
+        self.assertEqual( len( all_hash_ids ), 3 )
+        
+        ( page_hash_ids, next_file_id_cursor ) = self._read( 'file_query_ids_page', search_context, num_file_ids = 2 )
+        
+        self.assertEqual( page_hash_ids, all_hash_ids[ : 2 ] )
+        self.assertEqual( next_file_id_cursor, all_hash_ids[ 1 ] )
+        
+        # the continuing page comes from the first page's result, but a file that has since left the domain is dropped
+        
+        last_hash = self._read( 'hash_ids_to_hashes', hash_ids = [ all_hash_ids[ -1 ] ] )[ all_hash_ids[ -1 ] ]
+        
+        self._write( 'content_updates', { CC.LOCAL_FILE_SERVICE_KEY : [ HydrusData.ContentUpdate( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_DELETE, ( last_hash, ) ) ] } )
+        
+        ( page_hash_ids, next_file_id_cursor ) = self._read( 'file_query_ids_page', search_context, file_id_cursor = next_file_id_cursor, num_file_ids = 2 )
+        
+        self.assertEqual( page_hash_ids, [] )
+        self.assertEqual( next_file_id_cursor, None )
+        
+        # a new first page is a new search
+        
+        ( page_hash_ids, next_file_id_cursor ) = self._read( 'file_query_ids_page', search_context, num_file_ids = 2 )
+        
+        self.assertEqual( page_hash_ids, all_hash_ids[ : 2 ] )
+        self.assertEqual( next_file_id_cursor, None )
+        
+        # the cache holds the most recently used searches, and serving a page counts as a use
+        
+        db = TestClientDB._db
+        
+        db.QUERY_PAGE_RESULTS_MAX_ENTRIES = 2
+        
+        try:
+            
+            search_contexts = [ ClientSearch.FileSearchContext( file_service_key = CC.LOCAL_FILE_SERVICE_KEY, predicates = [ ClientSearch.Predicate( HC.PREDICATE_TYPE_SYSTEM_SIZE, ( '>', num_bytes, HydrusData.ConvertUnitToInt( 'B' ) ) ) ] ) for num_bytes in ( 0, 1, 2 ) ]
+            
+            search_keys = [ search_context.DumpToString() for search_context in search_contexts ]
+            
+            ( page_hash_ids, next_file_id_cursor ) = self._read( 'file_query_ids_page', search_contexts[0], num_file_ids = 1 )
+            
+            self.assertEqual( page_hash_ids, all_hash_ids[ : 1 ] )
+            
+            self._read( 'file_query_ids_page', search_contexts[1], num_file_ids = 1 )
+            
+            with db._query_page_results_cache_lock:
+                
+                ( sorted_hash_ids, timestamp ) = db._query_page_results_cache[ search_keys[0] ]
+                
+                self.assertEqual( sorted_hash_ids.typecode, 'I' )
+                
+                db._query_page_results_cache[ search_keys[0] ] = ( sorted_hash_ids, timestamp - 100 )
+                
+            
+            ( page_hash_ids, next_file_id_cursor ) = self._read( 'file_query_ids_page', search_contexts[0], file_id_cursor = next_file_id_cursor, num_file_ids = 1 )
+            
+            self.assertEqual( page_hash_ids, all_hash_ids[ 1 : 2 ] )
+            
+            with db._query_page_results_cache_lock:
+                
+                ( sorted_hash_ids, refreshed_timestamp ) = db._query_page_results_cache[ search_keys[0] ]
+                
+                self.assertGreater( refreshed_timestamp, timestamp - 100 )
+                
+            
+            # the continued search is now the fresher one, so the next new search pushes out the other
+            
+            self._read( 'file_query_ids_page', search_contexts[2], num_file_ids = 1 )
+            
+            with db._query_page_results_cache_lock:
+                
+                self.assertEqual( list( db._query_page_results_cache.keys() ), [ search_keys[0], search_keys[2] ] )
+                
+            
+        finally:
+            
+            del db.QUERY_PAGE_RESULTS_MAX_ENTRIES
+            
+        
+    
+    def test_file_query_planning( self ):
+        
+        TestClientDB._clear_db()
+        
+        paths = [ os.path.join( HC.STATIC_DIR, 'testing', 'muh_jpg.jpg' ), os.path.join( HC.STATIC_DIR, 'testing', 'muh_png.png' ), os.path.join( HC.STATIC_DIR, 'hydrus.png' ), os.path.join( HC.STATIC_DIR, 'hydrus_small.png' ) ]
+        
+        file_import_jobs = []
+        
+        for path in paths:
+            
+            file_import_job = ClientImportFileSeeds.FileImportJob( path )
+            
+            file_import_job.GenerateHashAndStatus()
+            
+            file_import_job.GenerateInfo()
+            
+            file_import_jobs.append( file_import_job )
+            
+        
+        self._write( 'import_files', file_import_jobs )
+        
+        ( hash_a, hash_b, hash_c, hash_d ) = [ file_import_job.GetHash() for file_import_job in file_import_jobs ]
+        
+        content_updates = []
+        
+        content_updates.append( HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'common', ( hash_a, hash_b, hash_c, hash_d ) ) ) )
+        content_updates.append( HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'series:mid', ( hash_a, hash_b ) ) ) )
+        content_updates.append( HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'rare', ( hash_a, ) ) ) )
+        
+        self._write( 'content_updates', { CC.LOCAL_TAG_SERVICE_KEY : content_updates } )
+        
+        self._write( 'content_updates', { CC.COMBINED_LOCAL_FILE_SERVICE_KEY : [ HydrusData.ContentUpdate( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_ARCHIVE, ( hash_a, hash_c, hash_d ) ) ] } )
+        
+        def get_hash_ids( predicates ):
+            
+            search_context = ClientSearch.FileSearchContext( file_service_key = CC.LOCAL_FILE_SERVICE_KEY, tag_service_key = CC.LOCAL_TAG_SERVICE_KEY, predicates = predicates )
+            
+            return set( self._read( 'file_query_ids', search_context ) )
+            
+        
+        common_pred = ClientSearch.Predicate( HC.PREDICATE_TYPE_TAG, 'common' )
+        mid_pred = ClientSearch.Predicate( HC.PREDICATE_TYPE_TAG, 'mid' )
+        rare_pred = ClientSearch.Predicate( HC.PREDICATE_TYPE_TAG, 'rare' )
+        inbox_pred = ClientSearch.Predicate( HC.PREDICATE_TYPE_SYSTEM_INBOX )
+        
+        all_ids = get_hash_ids( [ common_pred ] )
+        a_ids = get_hash_ids( [ rare_pred ] )
+        
+        self.assertEqual( len( all_ids ), 4 )
+        self.assertEqual( len( a_ids ), 1 )
+        
+        # the unnamespaced tag is estimated over every namespace, so it sits between the others
+        
+        ab_ids = get_hash_ids( [ mid_pred ] )
+        
+        self.assertEqual( len( ab_ids ), 2 )
+        
+        b_ids = ab_ids.difference( a_ids )
+        
+        # whichever tag starts the search, the result is the intersection
+        
+        self.assertEqual( get_hash_ids( [ common_pred, rare_pred ] ), a_ids )
+        self.assertEqual( get_hash_ids( [ rare_pred, common_pred ] ), a_ids )
+        self.assertEqual( get_hash_ids( [ common_pred, mid_pred, rare_pred ] ), a_ids )
+        self.assertEqual( get_hash_ids( [ common_pred, mid_pred ] ), ab_ids )
+        
+        # the inbox is smaller than 'common', so it starts that search. it is not smaller than 'rare', so that one starts with the tag
+        
+        self.assertEqual( get_hash_ids( [ inbox_pred ] ), b_ids )
+        self.assertEqual( get_hash_ids( [ inbox_pred, common_pred ] ), b_ids )
+        self.assertEqual( get_hash_ids( [ inbox_pred, rare_pred ] ), set() )
+        
+        # and the inbox cache follows archive and inbox changes
+        
+        self._write( 'content_updates', { CC.COMBINED_LOCAL_FILE_SERVICE_KEY : [ HydrusData.ContentUpdate( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_INBOX, ( hash_a, ) ) ] } )
+        
+        self.assertEqual( get_hash_ids( [ inbox_pred, common_pred ] ), ab_ids )
+        self.assertEqual( get_hash_ids( [ inbox_pred, rare_pred ] ), a_ids )
+        
+        self._write( 'content_updates', { CC.COMBINED_LOCAL_FILE_SERVICE_KEY : [ HydrusData.ContentUpdate( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_ARCHIVE, ( hash_a, hash_b ) ) ] } )
+        
+        self.assertEqual( get_hash_ids( [ inbox_pred ] ), set() )
+        self.assertEqual( get_hash_ids( [ inbox_pred, common_pred ] ), set() )
+        
+    
     def test_file_system_predicates( self ):
         
         TestClientDB._clear_db()
@@ -864,6 +1140,27 @@ class TestClientDB( unittest.TestCase ):
             self.assertEqual( mr_num_words, num_words )
             
         
+        path = os.path.join( HC.STATIC_DIR, 'testing', 'muh_jpg.jpg' )
+        
+        file_import_jobs = []
+        
+        for i in range( 2 ):
+            
+            file_import_job = ClientImportFileSeeds.FileImportJob( path )
+            
+            file_import_job.GenerateHashAndStatus()
+            
+            file_import_job.GenerateInfo()
+            
+            file_import_jobs.append( file_import_job )
+            
+        
+        ( ( status_1, note_1 ), ( status_2, note_2 ) ) = self._write( 'import_files', file_import_jobs )
+        
+        # the first triggers the 'it is missing from db' hook again, the second is caught as a dupe within the batch
+        self.assertEqual( status_1, CC.STATUS_SUCCESSFUL_AND_NEW )
+        self.assertEqual( status_2, CC.STATUS_SUCCESSFUL_BUT_REDUNDANT )
+        
     
     def test_import_folders( self ):
         
@@ -1078,6 +1375,165 @@ class TestClientDB( unittest.TestCase ):
         # we can do more testing when I add repo service to this testing framework
         
     
+    def test_online_backup( self ):
+        
+        TestClientDB._clear_db()
+        
+        db = TestClientDB._db
+        
+        hash = b'\xadm5\x99\xa6\xc4\x89\xa5u\xeb\x19\xc0&\xfa\xce\x97\xa9\xcdey\xe7G(\xb0\xce\x94\xa6\x01\xd22\xf3\xc3'
+        
+        path = os.path.join( HC.STATIC_DIR, 'hydrus.png' )
+        
+        file_import_job = ClientImportFileSeeds.FileImportJob( path )
+        
+        file_import_job.GenerateHashAndStatus()
+        
+        file_import_job.GenerateInfo()
+        
+        self._write( 'import_file', file_import_job )
+        
+        # the snapshot is taken on the db thread, between jobs, as the real backup does it
+        
+        original_write = db._Write
+        
+        def snapshot_write( action, *args, **kwargs ):
+            
+            if action == 'test_snapshot':
+                
+                return db._OpenBackupSnapshot()
+                
+            else:
+                
+                return original_write( action, *args, **kwargs )
+                
+            
+        
+        def take_snapshot():
+            
+            db._Write = snapshot_write
+            
+            try:
+                
+                return self._write( 'test_snapshot' )
+                
+            finally:
+                
+                db._Write = original_write
+                
+            
+        
+        def check_backup_is_pre_write():
+            
+            for filename in db._db_filenames.values():
+                
+                backup_db = sqlite3.connect( os.path.join( backup_path, filename ) )
+                
+                try:
+                    
+                    self.assertEqual( backup_db.execute( 'PRAGMA integrity_check;' ).fetchone(), ( 'ok', ) )
+                    
+                    if filename == db._db_filenames[ 'main' ]:
+                        
+                        self.assertEqual( backup_db.execute( 'SELECT COUNT( * ) FROM file_inbox;' ).fetchone(), ( 1, ) )
+                        
+                    elif filename == db._db_filenames[ 'external_master' ]:
+                        
+                        self.assertIsNone( backup_db.execute( 'SELECT 1 FROM subtags WHERE subtag = ?;', ( 'online backup', ) ).fetchone() )
+                        
+                    
+                finally:
+                    
+                    backup_db.close()
+                    
+                
+            
+        
+        backup_path = os.path.join( TestController.DB_DIR, 'online_backup' )
+        
+        HydrusPaths.MakeSureDirectoryExists( backup_path )
+        
+        original_backup_pages_per_step = HydrusDB.BACKUP_PAGES_PER_STEP
+        
+        # a page at a time, so the write lands partway through the first file
+        
+        HydrusDB.BACKUP_PAGES_PER_STEP = 1
+        
+        try:
+            
+            snapshot_db = take_snapshot()
+            
+            writes_during_copy = []
+            
+            def text_update_hook( text ):
+                
+                if len( writes_during_copy ) == 0:
+                    
+                    service_keys_to_content_updates = {}
+                    
+                    service_keys_to_content_updates[ CC.COMBINED_LOCAL_FILE_SERVICE_KEY ] = [ HydrusData.ContentUpdate( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_ARCHIVE, ( hash, ) ) ]
+                    service_keys_to_content_updates[ CC.LOCAL_TAG_SERVICE_KEY ] = [ HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'online backup', ( hash, ) ) ) ]
+                    
+                    self._write( 'content_updates', service_keys_to_content_updates )
+                    
+                    # a pool read has the write committed first, so this is in the db files before the copy carries on
+                    
+                    self.assertFalse( self._read( 'in_inbox', hash ) )
+                    
+                    self.assertFalse( db._finished_job_writes_uncommitted )
+                    
+                    writes_during_copy.append( text )
+                    
+                
+            
+            try:
+                
+                HydrusDB.BackupDBSnapshot( snapshot_db, db._db_filenames, backup_path, text_update_hook = text_update_hook )
+                
+            finally:
+                
+                snapshot_db.close()
+                
+            
+            self.assertEqual( len( writes_during_copy ), 1 )
+            
+            check_backup_is_pre_write()
+            
+            # a cancelled backup rolls its copy back, leaving the previous one as it was
+            
+            snapshot_db = take_snapshot()
+            
+            num_steps = []
+            
+            def is_cancelled_hook():
+                
+                num_steps.append( None )
+                
+                return len( num_steps ) > 2
+                
+            
+            try:
+                
+                with self.assertRaises( HydrusExceptions.CancelledException ):
+                    
+                    HydrusDB.BackupDBSnapshot( snapshot_db, db._db_filenames, backup_path, is_cancelled_hook = is_cancelled_hook )
+                    
+                
+            finally:
+                
+                snapshot_db.close()
+                
+            
+            check_backup_is_pre_write()
+            
+        finally:
+            
+            HydrusDB.BACKUP_PAGES_PER_STEP = original_backup_pages_per_step
+            
+            shutil.rmtree( backup_path, ignore_errors = True )
+            
+        
+    
     def test_pending( self ):
         
         service_key = HydrusData.GenerateKey()
@@ -1131,11 +1587,297 @@ class TestClientDB( unittest.TestCase ):
         self.assertTrue( result, ( pixiv_id, password ) )
         
     
-    def test_repo_downloads( self ):
+    def test_read_pool( self ):
         
-        result = self._read( 'downloads' )
+        TestClientDB._clear_db()
         
-        self.assertEqual( result, set() )
+        db = TestClientDB._db
+        
+        self.assertGreater( db._read_pool_size, 0 )
+        
+        hash = b'\xadm5\x99\xa6\xc4\x89\xa5u\xeb\x19\xc0&\xfa\xce\x97\xa9\xcdey\xe7G(\xb0\xce\x94\xa6\x01\xd22\xf3\xc3'
+        
+        path = os.path.join( HC.STATIC_DIR, 'hydrus.png' )
+        
+        # a pool read has the writer commit a finished write so it can see it
+        
+        file_import_job = ClientImportFileSeeds.FileImportJob( path )
+        
+        file_import_job.GenerateHashAndStatus()
+        
+        file_import_job.GenerateInfo()
+        
+        self._write( 'import_file', file_import_job )
+        
+        self.assertTrue( db._finished_job_writes_uncommitted )
+        
+        self.assertTrue( self._read( 'in_inbox', hash ) )
+        
+        self.assertFalse( db._finished_job_writes_uncommitted )
+        
+        content_update = HydrusData.ContentUpdate( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_ARCHIVE, ( hash, ) )
+        
+        self._write( 'content_updates', { CC.COMBINED_LOCAL_FILE_SERVICE_KEY : [ content_update ] } )
+        
+        self.assertFalse( self._read( 'in_inbox', hash ) )
+        
+        #
+        
+        write_started = threading.Event()
+        write_release = threading.Event()
+        
+        original_write = db._Write
+        
+        def blocking_write( action, *args, **kwargs ):
+            
+            if action == 'test_block':
+                
+                write_started.set()
+                
+                write_release.wait( 10 )
+                
+            else:
+                
+                return original_write( action, *args, **kwargs )
+                
+            
+        
+        db._Write = blocking_write
+        
+        try:
+            
+            db.Write( 'test_block', False )
+            
+            self.assertTrue( write_started.wait( 10 ) )
+            
+            # a running write does not hold up pool reads
+            
+            self.assertFalse( self._read( 'in_inbox', hash ) )
+            
+            self.assertTrue( db._currently_doing_job )
+            
+            # but a queued one does, so the read sees it
+            
+            db.Write( 'test_block', False )
+            
+            results = []
+            
+            def do_read():
+                
+                results.append( self._read( 'in_inbox', hash ) )
+                
+            
+            read_thread = threading.Thread( target = do_read )
+            
+            read_thread.start()
+            
+            time.sleep( 0.5 )
+            
+            self.assertEqual( results, [] )
+            
+            write_release.set()
+            
+            read_thread.join( 10 )
+            
+            self.assertEqual( results, [ False ] )
+            
+        finally:
+            
+            write_release.set()
+            
+            db._Write = original_write
+            
+        
+        #
+        
+        pool_events = []
+        
+        original_pause = db._PauseReadPool
+        original_resume = db._ResumeReadPool
+        
+        def pause_read_pool():
+            
+            original_pause()
+            
+            pool_events.append( ( 'pause', db._read_pool_num_connections ) )
+            
+        
+        def resume_read_pool():
+            
+            pool_events.append( ( 'resume', db._read_pool_num_connections ) )
+            
+            original_resume()
+            
+        
+        db._PauseReadPool = pause_read_pool
+        db._ResumeReadPool = resume_read_pool
+        
+        def check_pool_paused_around( func ):
+            
+            del pool_events[:]
+            
+            func()
+            
+            self.assertEqual( pool_events[0], ( 'pause', 0 ) )
+            self.assertEqual( pool_events[-1], ( 'resume', 0 ) )
+            
+            self.assertFalse( db._read_pool_paused )
+            
+            self.assertFalse( self._read( 'in_inbox', hash ) )
+            
+            self.assertGreater( db._read_pool_num_connections, 0 )
+            
+        
+        backup_path = os.path.join( TestController.DB_DIR, 'read_pool_backup' )
+        
+        try:
+            
+            check_pool_paused_around( lambda: self._write( 'vacuum', force_vacuum = True ) )
+            
+            # an online backup leaves the pool running, so check the offline one
+            
+            db._CanBackupOnline = lambda: False
+            
+            check_pool_paused_around( lambda: self._write( 'backup', backup_path ) )
+            
+        finally:
+            
+            db._PauseReadPool = original_pause
+            db._ResumeReadPool = original_resume
+            
+            db.__dict__.pop( '_CanBackupOnline', None )
+            
+            shutil.rmtree( backup_path, ignore_errors = True )
+            
+        
+    
+    def test_repository_mappings_processing( self ):
+        
+        TestClientDB._clear_db()
+        
+        bulk_service_key = HydrusData.GenerateKey()
+        per_row_service_key = HydrusData.GenerateKey()
+        
+        services = self._read( 'services' )
+        
+        services.append( ClientServices.GenerateService( bulk_service_key, HC.TAG_REPOSITORY, 'bulk tag repo' ) )
+        services.append( ClientServices.GenerateService( per_row_service_key, HC.TAG_REPOSITORY, 'per row tag repo' ) )
+        
+        self._write( 'update_services', services )
+        
+        #
+        
+        hashes = [ HydrusData.GenerateKey() for i in range( 20 ) ]
+        tags = [ 'a', 'series:b', 'c', 'character:c' ]
+        
+        definitions_update = HydrusNetwork.DefinitionsUpdate()
+        
+        for ( i, hash ) in enumerate( hashes ):
+            
+            definitions_update.AddRow( ( HC.DEFINITIONS_TYPE_HASHES, i + 100, hash ) )
+            
+        
+        for ( i, tag ) in enumerate( tags ):
+            
+            definitions_update.AddRow( ( HC.DEFINITIONS_TYPE_TAGS, i + 10, tag ) )
+            
+        
+        content_update = HydrusNetwork.ContentUpdate()
+        
+        content_update.AddRow( ( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 10, list( range( 100, 120 ) ) ) ) )
+        content_update.AddRow( ( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 11, list( range( 100, 110 ) ) ) ) )
+        content_update.AddRow( ( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 12, list( range( 105, 115 ) ) ) ) )
+        content_update.AddRow( ( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 13, [ 103, 112 ] ) ) )
+        
+        metadata = HydrusNetwork.Metadata()
+        
+        update_hashes = []
+        
+        for ( update, mime ) in ( ( definitions_update, HC.APPLICATION_HYDRUS_UPDATE_DEFINITIONS ), ( content_update, HC.APPLICATION_HYDRUS_UPDATE_CONTENT ) ):
+            
+            update_network_bytes = update.DumpToNetworkBytes()
+            
+            update_hash = hashlib.sha256( update_network_bytes ).digest()
+            
+            self._write( 'import_update', update_network_bytes, update_hash, mime )
+            
+            update_hashes.append( update_hash )
+            
+        
+        metadata.AppendUpdate( update_hashes, HydrusData.GetNow() - 101000, HydrusData.GetNow() - 1000, HydrusData.GetNow() + 100000 )
+        
+        # the pending mappings are all in the update, so processing should clear them
+        
+        for service_key in ( bulk_service_key, per_row_service_key ):
+            
+            content_updates = []
+            
+            content_updates.append( HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_PEND, ( 'a', hashes[ : 3 ] ) ) )
+            content_updates.append( HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_PEND, ( 'c', hashes[ 10 : 15 ] ) ) )
+            
+            self._write( 'content_updates', { service_key : content_updates } )
+            
+            self._write( 'associate_repository_update_hashes', service_key, metadata )
+            
+            # read it now so the cached numbers have to be kept up to date through processing
+            
+            self._read( 'service_info', service_key )
+            
+        
+        # the same update goes through the set-based path on one service and the per-tag path on the other
+        
+        TestClientDB._db.BULK_MAPPINGS_THRESHOLD = 1
+        
+        try:
+            
+            self._write( 'process_repository', bulk_service_key )
+            
+        finally:
+            
+            del TestClientDB._db.BULK_MAPPINGS_THRESHOLD
+            
+        
+        self._write( 'process_repository', per_row_service_key )
+        
+        def get_state( service_key ):
+            
+            tags_to_hash_ids = {}
+            tags_to_counts = {}
+            
+            for tag in tags + [ 'b' ]:
+                
+                search_context = ClientSearch.FileSearchContext( file_service_key = CC.COMBINED_FILE_SERVICE_KEY, tag_service_key = service_key, predicates = [ ClientSearch.Predicate( HC.PREDICATE_TYPE_TAG, tag ) ] )
+                
+                tags_to_hash_ids[ tag ] = set( self._read( 'file_query_ids', search_context ) )
+                
+                predicates = self._read( 'autocomplete_predicates', tag_service_key = service_key, search_text = tag, exact_match = True )
+                
+                tags_to_counts[ tag ] = sorted( ( ( predicate.GetValue(), predicate.GetCount( HC.CONTENT_STATUS_CURRENT ), predicate.GetCount( HC.CONTENT_STATUS_PENDING ) ) for predicate in predicates ) )
+                
+            
+            service_info = self._read( 'service_info', service_key )
+            
+            return ( tags_to_hash_ids, tags_to_counts, service_info )
+            
+        
+        ( bulk_tags_to_hash_ids, bulk_tags_to_counts, bulk_service_info ) = get_state( bulk_service_key )
+        ( per_row_tags_to_hash_ids, per_row_tags_to_counts, per_row_service_info ) = get_state( per_row_service_key )
+        
+        self.assertEqual( bulk_tags_to_hash_ids, per_row_tags_to_hash_ids )
+        self.assertEqual( bulk_tags_to_counts, per_row_tags_to_counts )
+        self.assertEqual( bulk_service_info, per_row_service_info )
+        
+        self.assertEqual( len( bulk_tags_to_hash_ids[ 'a' ] ), 20 )
+        self.assertEqual( len( bulk_tags_to_hash_ids[ 'c' ] ), 11 )
+        self.assertEqual( bulk_tags_to_counts[ 'a' ], [ ( 'a', 20, 0 ) ] )
+        self.assertEqual( bulk_service_info[ HC.SERVICE_INFO_NUM_MAPPINGS ], 42 )
+        
+    
+    def test_repo_downloads( self ):
+        
+        result = self._read( 'downloads' )
+        
+        self.assertEqual( result, set() )
         
         #
         
@@ -1254,6 +1996,87 @@ class TestClientDB( unittest.TestCase ):
             
         
     
+    def test_subscriptions( self ):
+        
+        sub = ClientImportSubscriptions.Subscription( 'test sub' )
+        
+        query = ClientImportSubscriptions.SubscriptionQuery( 'test query' )
+        
+        ( name, gug_key_and_name, queries, checker_options, initial_file_limit, periodic_file_limit, paused, file_import_options, tag_import_options, no_work_until, no_work_until_reason ) = sub.ToTuple()
+        
+        sub.SetTuple( gug_key_and_name, [ query ], checker_options, initial_file_limit, periodic_file_limit, paused, file_import_options, tag_import_options, no_work_until )
+        
+        file_seed_cache = query.GetFileSeedCache()
+        
+        file_seed_cache_key = file_seed_cache.GetFileSeedCacheKey()
+        
+        file_seeds = [ ClientImportFileSeeds.FileSeed( ClientImportFileSeeds.FILE_SEED_TYPE_HDD, os.path.join( TestController.DB_DIR, 'file {}'.format( i ) ) ) for i in range( 5 ) ]
+        
+        file_seed_cache.AddFileSeeds( file_seeds )
+        
+        self._write( 'serialisable', sub )
+        
+        self.assertEqual( self._read( 'file_seed_cache_file_seeds', file_seed_cache_key ), file_seeds )
+        
+        # the loaded query only holds a reference and the status counts
+        
+        loaded_sub = self._read( 'serialisable_named', HydrusSerialisable.SERIALISABLE_TYPE_SUBSCRIPTION, 'test sub' )
+        
+        ( loaded_query, ) = loaded_sub.GetQueries()
+        
+        loaded_file_seed_cache = loaded_query.GetFileSeedCache()
+        
+        self.assertEqual( loaded_file_seed_cache.GetFileSeedCacheKey(), file_seed_cache_key )
+        self.assertEqual( len( loaded_file_seed_cache ), 5 )
+        self.assertEqual( loaded_file_seed_cache.GetFileSeedCount( CC.STATUS_UNKNOWN ), 5 )
+        
+        #
+        
+        file_seeds[0].SetStatus( CC.STATUS_ERROR )
+        
+        file_seed_cache.NotifyFileSeedsUpdated( ( file_seeds[0], ) )
+        
+        file_seed_cache.RemoveFileSeeds( ( file_seeds[4], ) )
+        
+        self._write( 'serialisable', sub )
+        
+        result = self._read( 'file_seed_cache_file_seeds', file_seed_cache_key )
+        
+        self.assertEqual( result, file_seeds[:4] )
+        self.assertEqual( result[0].status, CC.STATUS_ERROR )
+        
+        loaded_sub = self._read( 'serialisable_named', HydrusSerialisable.SERIALISABLE_TYPE_SUBSCRIPTION, 'test sub' )
+        
+        ( loaded_query, ) = loaded_sub.GetQueries()
+        
+        self.assertEqual( loaded_query.GetFileSeedCache().GetStatusesToCounts(), { CC.STATUS_UNKNOWN : 3, CC.STATUS_ERROR : 1 } )
+        
+        # a copy gets its own rows, so it outlives the original
+        
+        dupe_sub = sub.Duplicate()
+        
+        dupe_sub.SetName( 'test sub copy' )
+        
+        ( dupe_query, ) = dupe_sub.GetQueries()
+        
+        dupe_file_seed_cache_key = dupe_query.GetFileSeedCache().GetFileSeedCacheKey()
+        
+        self.assertNotEqual( dupe_file_seed_cache_key, file_seed_cache_key )
+        
+        self._write( 'serialisable', dupe_sub )
+        
+        #
+        
+        self._write( 'delete_serialisable_named', HydrusSerialisable.SERIALISABLE_TYPE_SUBSCRIPTION, 'test sub' )
+        
+        self.assertEqual( self._read( 'file_seed_cache_file_seeds', file_seed_cache_key ), [] )
+        self.assertEqual( self._read( 'file_seed_cache_file_seeds', dupe_file_seed_cache_key ), file_seeds[:4] )
+        
+        self._write( 'delete_serialisable_named', HydrusSerialisable.SERIALISABLE_TYPE_SUBSCRIPTION, 'test sub copy' )
+        
+        self.assertEqual( self._read( 'file_seed_cache_file_seeds', dupe_file_seed_cache_key ), [] )
+        
+    
 class TestServerDB( unittest.TestCase ):
     
     def _read( self, action, *args, **kwargs ): return TestServerDB._db.Read( action, *args, **kwargs )
@@ -1413,6 +2236,165 @@ class TestServerDB( unittest.TestCase ):
         self.assertEqual( set( result ), { self._tag_service_key, self._file_service_key } )
         
     
+    def test_sync_to_tag_archive( self ):
+        
+        TestClientDB._clear_db()
+        
+        tag_repo_service_key = HydrusData.GenerateKey()
+        
+        services = self._read( 'services' )
+        
+        old_services = list( services )
+        
+        services.append( ClientServices.GenerateService( tag_repo_service_key, HC.TAG_REPOSITORY, 'tag archive sync repo' ) )
+        
+        self._write( 'update_services', services )
+        
+        #
+        
+        hashes = []
+        md5s = []
+        
+        for filename in ( 'muh_jpg.jpg', 'muh_png.png' ):
+            
+            path = os.path.join( HC.STATIC_DIR, 'testing', filename )
+            
+            file_import_job = ClientImportFileSeeds.FileImportJob( path )
+            
+            file_import_job.GenerateHashAndStatus()
+            
+            file_import_job.GenerateInfo()
+            
+            self._write( 'import_file', file_import_job )
+            
+            hashes.append( file_import_job.GetHash() )
+            
+            with open( path, 'rb' ) as f:
+                
+                md5s.append( hashlib.md5( f.read() ).digest() )
+                
+            
+        
+        ( hash_1, hash_2 ) = hashes
+        
+        hta_path = os.path.join( TestController.DB_DIR, 'sync_test.db' )
+        
+        hta = HydrusTagArchive.HydrusTagArchive( hta_path )
+        
+        hta.SetHashType( HydrusTagArchive.HASH_TYPE_MD5 )
+        
+        hta.AddMappings( md5s[0], ( 'series:test', 'plain', 'creator:someone' ) )
+        hta.AddMappings( md5s[1], ( 'plain', 'character:samus' ) )
+        
+        # a file we do not have
+        
+        hta.AddMappings( os.urandom( 16 ), ( 'series:test', 'plain' ) )
+        
+        def get_tags_managers():
+            
+            media_results = self._read( 'media_results', hashes )
+            
+            hashes_to_tags_managers = { media_result.GetHash() : media_result.GetTagsManager() for media_result in media_results }
+            
+            return ( hashes_to_tags_managers[ hash_1 ], hashes_to_tags_managers[ hash_2 ] )
+            
+        
+        # namespace filter on the local tag service
+        
+        self._write( 'sync_to_tag_archive', hta_path, CC.LOCAL_TAG_SERVICE_KEY, CC.LOCAL_FILE_SERVICE_KEY, True, [ None, 'series' ] )
+        
+        ( tags_manager_1, tags_manager_2 ) = get_tags_managers()
+        
+        self.assertEqual( tags_manager_1.GetCurrent( CC.LOCAL_TAG_SERVICE_KEY ), { 'series:test', 'plain' } )
+        self.assertEqual( tags_manager_2.GetCurrent( CC.LOCAL_TAG_SERVICE_KEY ), { 'plain' } )
+        
+        self._write( 'sync_to_tag_archive', hta_path, CC.LOCAL_TAG_SERVICE_KEY, CC.LOCAL_FILE_SERVICE_KEY, False, [ 'series' ] )
+        
+        ( tags_manager_1, tags_manager_2 ) = get_tags_managers()
+        
+        self.assertEqual( tags_manager_1.GetCurrent( CC.LOCAL_TAG_SERVICE_KEY ), { 'plain' } )
+        self.assertEqual( tags_manager_2.GetCurrent( CC.LOCAL_TAG_SERVICE_KEY ), { 'plain' } )
+        
+        # adding to a repository pends, removing petitions
+        
+        self._write( 'sync_to_tag_archive', hta_path, tag_repo_service_key, CC.COMBINED_FILE_SERVICE_KEY, True, [ 'character' ] )
+        
+        ( tags_manager_1, tags_manager_2 ) = get_tags_managers()
+        
+        self.assertEqual( tags_manager_1.GetPending( tag_repo_service_key ), set() )
+        self.assertEqual( tags_manager_2.GetPending( tag_repo_service_key ), { 'character:samus' } )
+        
+        content_updates = [ HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'plain', hashes ) ) ]
+        
+        self._write( 'content_updates', { tag_repo_service_key : content_updates } )
+        
+        self._write( 'sync_to_tag_archive', hta_path, tag_repo_service_key, CC.COMBINED_FILE_SERVICE_KEY, False, [ None ] )
+        
+        ( tags_manager_1, tags_manager_2 ) = get_tags_managers()
+        
+        self.assertEqual( tags_manager_1.GetPetitioned( tag_repo_service_key ), { 'plain' } )
+        self.assertEqual( tags_manager_2.GetPetitioned( tag_repo_service_key ), { 'plain' } )
+        self.assertEqual( tags_manager_2.GetPending( tag_repo_service_key ), { 'character:samus' } )
+        
+        #
+        
+        self._write( 'update_services', old_services )
+        
+    
+    def test_tag_archive_sync_on_import( self ):
+        
+        TestClientDB._clear_db()
+        
+        path = os.path.join( HC.STATIC_DIR, 'hydrus.png' )
+        
+        with open( path, 'rb' ) as f:
+            
+            md5 = hashlib.md5( f.read() ).digest()
+            
+        
+        hta_path = os.path.join( TestController.DB_DIR, 'import_sync_test.db' )
+        
+        hta = HydrusTagArchive.HydrusTagArchive( hta_path )
+        
+        hta.SetHashType( HydrusTagArchive.HASH_TYPE_MD5 )
+        
+        hta.AddMappings( md5, ( 'series:test', 'plain' ) )
+        
+        services = self._read( 'services' )
+        
+        old_services = list( services )
+        
+        ( local_tag_service, ) = [ service for service in services if service.GetServiceKey() == CC.LOCAL_TAG_SERVICE_KEY ]
+        
+        ( service_key, service_type, name, dictionary ) = local_tag_service.ToTuple()
+        
+        dictionary[ 'tag_archive_sync' ] = [ ( hta_path, [ 'series' ] ) ]
+        
+        services = [ service for service in services if service.GetServiceKey() != CC.LOCAL_TAG_SERVICE_KEY ]
+        
+        services.append( ClientServices.GenerateService( service_key, service_type, name, dictionary ) )
+        
+        self._write( 'update_services', services )
+        
+        #
+        
+        file_import_job = ClientImportFileSeeds.FileImportJob( path )
+        
+        file_import_job.GenerateHashAndStatus()
+        
+        file_import_job.GenerateInfo()
+        
+        self._write( 'import_files', ( file_import_job, ) )
+        
+        ( media_result, ) = self._read( 'media_results', ( file_import_job.GetHash(), ) )
+        
+        self.assertEqual( media_result.GetTagsManager().GetCurrent( CC.LOCAL_TAG_SERVICE_KEY ), { 'series:test' } )
+        
+        #
+        
+        self._write( 'update_services', old_services )
+        
+    
     def test_server( self ):
         
         self._test_init_server_admin()
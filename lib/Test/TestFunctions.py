@@ -1,6 +1,7 @@
 import collections
 from . import HydrusConstants as HC
 from . import ClientData
+from . import ClientDuplicates
 from . import ClientTags
 import os
 import unittest
@@ -52,3 +53,47 @@ class TestFunctions( unittest.TestCase ):
         self.assertEqual( i_pretty, '123,456,789' )
         
     
+class TestPHashIndex( unittest.TestCase ):
+    
+    def test_search( self ):
+        
+        if not ClientDuplicates.NUMPY_OK:
+            
+            return
+            
+        
+        rows = [ ( phash_id, os.urandom( 8 ) ) for phash_id in range( 1, 1001 ) ]
+        
+        phash_index = ClientDuplicates.PHashIndex()
+        
+        phash_index.SetPHashes( rows )
+        
+        ( search_phash_id, search_phash ) = rows[ 50 ]
+        
+        for max_hamming_distance in ( 0, 4, 16, 28 ):
+            
+            expected_phash_ids = { phash_id for ( phash_id, phash ) in rows if HydrusData.Get64BitHammingDistance( search_phash, phash ) <= max_hamming_distance }
+            
+            self.assertEqual( set( phash_index.Search( search_phash, max_hamming_distance ) ), expected_phash_ids )
+            
+        
+        search_phashes = [ phash for ( phash_id, phash ) in rows[ : 20 ] ]
+        
+        similar_phash_ids_lists = phash_index.SearchMany( search_phashes, 20 )
+        
+        for ( search_phash, similar_phash_ids ) in zip( search_phashes, similar_phash_ids_lists ):
+            
+            self.assertEqual( set( similar_phash_ids ), set( phash_index.Search( search_phash, 20 ) ) )
+            
+        
+        phash_index.AddPHashes( [ ( 5000, search_phash ) ] )
+        phash_index.RemovePHashIds( [ search_phash_id ] )
+        
+        self.assertEqual( phash_index.Search( search_phash, 0 ), [ 5000 ] )
+        self.assertEqual( phash_index.GetNumPHashes(), 1000 )
+        
+        phash_index.Reset()
+        
+        self.assertFalse( phash_index.IsLoaded() )
+        
+    
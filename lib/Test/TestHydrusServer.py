@@ -11,6 +11,7 @@ from . import HydrusConstants as HC
 from . import HydrusEncryption
 from . import HydrusNetwork
 from . import HydrusPaths
+from . import HydrusSerialisable
 from . import HydrusServer
 from . import HydrusServerResources
 from . import HydrusText
@@ -394,6 +395,11 @@ class TestServer( unittest.TestCase ):
         
         self.assertEqual( response, definitions_update_network_bytes )
         
+        binary_definitions_update = HydrusSerialisable.CreateFromNetworkBytes( definitions_update.DumpToBinaryNetworkBytes() )
+        
+        self.assertEqual( binary_definitions_update.GetHashIdsToHashes(), definitions_update.GetHashIdsToHashes() )
+        self.assertEqual( binary_definitions_update.GetTagIdsToTags(), definitions_update.GetTagIdsToTags() )
+        
         # content
         
         rows = [ ( random.randint( 100, 1000 ), [ random.randint( 100, 1000 ) for i in range( 50 ) ] ) for j in range( 20 ) ]
@@ -423,6 +429,11 @@ class TestServer( unittest.TestCase ):
         
         self.assertEqual( response, content_update_network_bytes )
         
+        binary_content_update = HydrusSerialisable.CreateFromNetworkBytes( content_update.DumpToBinaryNetworkBytes() )
+        
+        self.assertEqual( [ ( tag_id, sorted( hash_ids ) ) for ( tag_id, hash_ids ) in binary_content_update.GetNewMappings() ], [ ( tag_id, sorted( hash_ids ) ) for ( tag_id, hash_ids ) in content_update.GetNewMappings() ] )
+        self.assertEqual( binary_content_update.GetNumRows(), content_update.GetNumRows() )
+        
         # metadata
         
         metadata = HydrusNetwork.Metadata()
@@ -435,6 +446,18 @@ class TestServer( unittest.TestCase ):
         
         self.assertEqual( response[ 'metadata_slice' ].GetSerialisableTuple(), metadata.GetSerialisableTuple() )
         
+        # the slice keeps the version 1 layout, so a client from before binary updates reads it the same way
+        
+        ( serialisable_type, serialisable_version, serialisable_info ) = response[ 'metadata_slice' ].GetSerialisableTuple()
+        
+        self.assertEqual( serialisable_version, 1 )
+        
+        ( serialisable_metadata, next_update_due ) = serialisable_info
+        
+        [ ( update_index, encoded_update_hashes, begin, end ) ] = serialisable_metadata
+        
+        self.assertEqual( [ bytes.fromhex( encoded_update_hash ) for encoded_update_hash in encoded_update_hashes ], [ definitions_update_hash, content_update_hash ] )
+        
         # post content
         
         raise NotImplementedError()
@@ -454,6 +477,82 @@ class TestServer( unittest.TestCase ):
         self.assertEqual( update.GetHashes(), written_update.GetHashes() )
         '''
     
+    def _test_repo_update_formats( self, service, serverside_service ):
+        
+        rows = [ ( random.randint( 100, 1000 ), [ random.randint( 100, 1000 ) for i in range( 50 ) ] ) for j in range( 20 ) ]
+        
+        content_update = HydrusNetwork.ContentUpdate()
+        
+        for row in rows:
+            
+            content_update.AddRow( ( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, row ) )
+            
+        
+        # the server stores the binary update and knows the hash of its json conversion
+        
+        binary_update_network_bytes = content_update.DumpToBinaryNetworkBytes()
+        
+        binary_update_hash = hashlib.sha256( binary_update_network_bytes ).digest()
+        
+        update_network_bytes = HydrusNetwork.ConvertBinaryUpdateToNetworkBytes( binary_update_network_bytes )
+        
+        update_hash = hashlib.sha256( update_network_bytes ).digest()
+        
+        path = ServerFiles.GetExpectedFilePath( binary_update_hash )
+        
+        HydrusPaths.MakeSureDirectoryExists( os.path.dirname( path ) )
+        
+        with open( path, 'wb' ) as f:
+            
+            f.write( binary_update_network_bytes )
+            
+        
+        metadata = HydrusNetwork.Metadata()
+        
+        metadata.AppendUpdate( [ update_hash ], HydrusData.GetNow() - 101000, HydrusData.GetNow() - 1000, HydrusData.GetNow() + 100000 )
+        
+        serverside_service._metadata = metadata
+        serverside_service._update_hashes_to_binary_update_hashes = { update_hash : binary_update_hash }
+        serverside_service._binary_update_hashes = { binary_update_hash }
+        
+        try:
+            
+            # a client that does not ask for binary updates gets json, under the hashes it checks it against
+            
+            response = service.Request( HC.GET, 'metadata', { 'since' : 0 } )
+            
+            self.assertEqual( response[ 'metadata_slice' ].GetUpdateHashes( 0 ), [ update_hash ] )
+            
+            response = service.Request( HC.GET, 'update', { 'update_hash' : update_hash } )
+            
+            self.assertEqual( hashlib.sha256( response ).digest(), update_hash )
+            self.assertFalse( response.startswith( HydrusSerialisable.NETWORK_BYTES_BINARY_PREFIX ) )
+            
+            json_content_update = HydrusSerialisable.CreateFromNetworkBytes( response )
+            
+            self.assertEqual( [ ( tag_id, sorted( hash_ids ) ) for ( tag_id, hash_ids ) in json_content_update.GetNewMappings() ], [ ( tag_id, sorted( hash_ids ) ) for ( tag_id, hash_ids ) in content_update.GetNewMappings() ] )
+            
+            # a client that asks for them gets the stored binary update
+            
+            response = service.Request( HC.GET, 'metadata', { 'since' : 0, 'binary_updates' : 1 } )
+            
+            self.assertEqual( response[ 'metadata_slice' ].GetUpdateHashes( 0 ), [ binary_update_hash ] )
+            
+            response = service.Request( HC.GET, 'update', { 'update_hash' : binary_update_hash } )
+            
+            self.assertEqual( response, binary_update_network_bytes )
+            
+            binary_content_update = HydrusSerialisable.CreateFromNetworkBytes( response )
+            
+            self.assertEqual( [ ( tag_id, sorted( hash_ids ) ) for ( tag_id, hash_ids ) in binary_content_update.GetNewMappings() ], [ ( tag_id, sorted( hash_ids ) ) for ( tag_id, hash_ids ) in content_update.GetNewMappings() ] )
+            
+        finally:
+            
+            try: os.remove( path )
+            except: pass
+            
+        
+    
     def _test_restricted( self, service ):
         
         # access_key
@@ -585,6 +684,7 @@ class TestServer( unittest.TestCase ):
         
         self._test_basics( host, port )
         self._test_restricted( self._clientside_tag_service )
+        self._test_repo_update_formats( self._clientside_tag_service, self._serverside_tag_service )
         # broke since service rewrite
         #self._test_repo( self._clientside_tag_service )
         #self._test_tag_repo( self._clientside_tag_service )
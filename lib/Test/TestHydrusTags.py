@@ -137,6 +137,23 @@ class TestTagsManager( unittest.TestCase ):
         self.assertEqual( self._other_tags_manager.GetPetitioned( self._pending_service_key ), set() )
         
     
+    def test_duplicate( self ):
+        
+        dupe = self._tags_manager.Duplicate()
+        
+        self.assertEqual( dupe.GetServiceKeysToStatusesToTags(), self._tags_manager.GetServiceKeysToStatusesToTags() )
+        
+        content_update = HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'dupe only', { HydrusData.GenerateKey() } ) )
+        
+        dupe.ProcessContentUpdate( self._first_key, content_update )
+        
+        self.assertIn( 'dupe only', dupe.GetCurrent( self._first_key ) )
+        self.assertNotIn( 'dupe only', self._tags_manager.GetCurrent( self._first_key ) )
+        
+        self.assertTrue( dupe.HasTag( 'dupe only' ) )
+        self.assertFalse( self._tags_manager.HasTag( 'dupe only' ) )
+        
+    
     def test_get_current( self ):
         
         self.assertEqual( self._tags_manager.GetCurrent( self._first_key ), { 'current', '\u2835', 'creator:tsutomu nihei', 'series:blame!', 'title:test title', 'volume:3', 'chapter:2', 'page:1' } )
@@ -829,6 +846,12 @@ class TestTagSiblings( unittest.TestCase ):
         self.assertEqual( set( self._tag_siblings_manager.CollapseTags( self._first_key, [ 'chain_a', 'chain_b' ] ) ), set( [ 'chain_c' ] ) )
         self.assertEqual( set( self._tag_siblings_manager.CollapseTags( self._first_key, [ 'chain_a', 'chain_b', 'chain_c' ] ) ), set( [ 'chain_c' ] ) )
         
+        statuses_to_tag_ids = { HC.CONTENT_STATUS_CURRENT : HydrusTags.InternTags( [ 'chain_a', 'chain_b', 'chain_c' ] ) }
+        
+        collapsed = self._tag_siblings_manager.CollapseStatusesToTagIds( self._first_key, statuses_to_tag_ids )
+        
+        self.assertEqual( HydrusTags.GetInternedTags( collapsed[ HC.CONTENT_STATUS_CURRENT ] ), { 'chain_c' } )
+        
     
     def test_current( self ):
         